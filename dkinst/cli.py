@@ -6,9 +6,10 @@ import argparse
 from pathlib import Path
 import subprocess
 import os
-from typing import Literal
+from typing import Callable, Literal
 import shlex
 import json
+import difflib
 import tempfile
 import time
 
@@ -26,7 +27,12 @@ from . import __version__
 from .installers._base import BaseInstaller
 from .installers import _base
 from . import installers
-from .installers.helpers.infra import system, permissions, folders
+from .installers.helpers.infra import system, permissions, folders, journal, tracing, metrics, versions
+from . import planner
+from . import profiles
+from .registry import InstallerRegistry
+from . import prefetch
+from . import state_store
 
 
 console = Console()
@@ -39,6 +45,21 @@ _ELEVATE_BOOTSTRAP_FILE = str(Path(tempfile.gettempdir()) / "dkinst_elevate_boot
 _ELEVATE_BOOTSTRAP_FILE_MAX_AGE_SEC = 10 * 60
 
 
+# Set by the daemon (dkinst/daemon.py) while it serves commands.
+_DAEMON_MODE: bool = False
+# Run ID of the run that is being resumed by 'dkinst resume', so elevation re-executes the resume.
+_RESUME_RUN_ID: str | None = None
+
+
+class ElevationRefusedError(Exception):
+    pass
+
+
+# Separates the installer arguments from the installer names: dkinst install <installer> -- <args>
+ARGS_SEPARATOR: str = "--"
+# Similarity from which an unknown token after the installer name is taken for a misspelled installer name.
+TYPO_CUTOFF: float = 0.85
+
 # Short aliases for top-level commands
 COMMAND_ALIASES: dict[str, str] = {
     "i": "install",
@@ -140,16 +161,61 @@ def _normalize_argv(argv: list[str]) -> list[str]:
       dkinst up foo       -> dkinst upgrade foo
       dkinst un foo       -> dkinst uninstall foo
       dkinst a            -> dkinst available
+
+    The installer arguments separator is kept for the dispatch (argparse drops the first '--' after the name):
+      dkinst install foo -- bar   -> dkinst install foo -- -- bar
     """
     if argv and argv[0] in COMMAND_ALIASES:
         argv = [COMMAND_ALIASES[argv[0]]] + argv[1:]
+    if len(argv) > 2 and argv[0] in planner.PLAN_METHODS and argv[2] == ARGS_SEPARATOR:
+        argv = argv[:2] + [ARGS_SEPARATOR] + argv[2:]
     return argv
 
 
+def _check_targets(
+        method: str,
+        installer_name: str,
+        extras: list[str],
+        installer_names: list[str]
+) -> str | None:
+    """
+    Check the tokens after the installer name of 'install/upgrade/uninstall', that are either
+    more installer names or arguments of the installer, so a typo in a name isn't passed as an argument.
+
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param installer_name: The first installer name.
+    :param extras: The tokens after it, without the '--' separator.
+    :param installer_names: All the installer names.
+    :return: Error message, or None if the tokens are fine.
+    """
+    unknown: list[str] = [token for token in extras if token not in installer_names]
+    hint: str = (f"To pass arguments to the installer, put them after '--': "
+                 f"dkinst {method} {installer_name} -- {' '.join(extras)}")
+    if unknown and len(unknown) < len(extras):
+        return f"No installer found with the name(s): {unknown}. {hint}"
+    for token in unknown:
+        close: list[str] = difflib.get_close_matches(token, installer_names, n=1, cutoff=TYPO_CUTOFF)
+        if close:
+            return f"No installer found with the name: [{token}], did you mean [{close[0]}]? {hint}"
+    return None
+
+
 class DkinstCompleter(Completer):
-    def __init__(self, subcommands: list[str], installer_names: list[str]):
+    def __init__(
+            self,
+            subcommands: list[str],
+            installer_names: list[str],
+            meta_provider: Callable[[str], str] | None = None
+    ):
+        """
+        :param subcommands: Top-level subcommand names.
+        :param installer_names: Installer names.
+        :param meta_provider: Optional callable that returns a short description of an installer name
+            (installed / update pending), shown next to the completion.
+        """
         self.subcommands = subcommands
         self.installer_names = installer_names
+        self.meta_provider = meta_provider
 
     def get_completions(self, document, complete_event):
         text = document.text_before_cursor
@@ -173,6 +239,7 @@ class DkinstCompleter(Completer):
         normalized_first = COMMAND_ALIASES.get(first_word, first_word)
 
         candidates: list[str] = []
+        installer_candidates: bool = False
 
         if token_index == 0:
             # Completing the first word: include both full commands and aliases
@@ -182,10 +249,17 @@ class DkinstCompleter(Completer):
         elif token_index == 1 and normalized_first in _base.ALL_METHODS:
             # Completing the second word after install/upgrade/uninstall/manual
             candidates = [name for name in self.installer_names if name.startswith(prefix)]
+            installer_candidates = True
+
+        elif token_index >= 2 and normalized_first in planner.PLAN_METHODS:
+            # Several installers in one command: dkinst install <installer1> <installer2> ...
+            candidates = [name for name in self.installer_names if name.startswith(prefix)]
+            installer_candidates = True
 
         for cand in candidates:
+            meta: str = self.meta_provider(cand) if installer_candidates and self.meta_provider else ""
             # Replace just the current word (prefix) with the full candidate
-            yield Completion(cand, start_position=-len(prefix))
+            yield Completion(cand, start_position=-len(prefix), display_meta=meta or None)
 
 
 def _installer_name_completer(prefix, parsed_args, **kwargs):
@@ -225,7 +299,8 @@ def _get_installers() -> list[BaseInstaller]:
 
 def cmd_available(
         prefix: str | None = None,
-        show_all: bool = False
+        show_all: bool = False,
+        registry: InstallerRegistry | None = None,
 ) -> None:
     """List known installers with metadata.
 
@@ -241,7 +316,8 @@ def cmd_available(
     table.add_column("Methods")
     table.add_column("Manual Arguments")
 
-    installers_list: list[BaseInstaller] = _get_installers()
+    registry = registry or InstallerRegistry(_get_installers)
+    installers_list: list[BaseInstaller] = registry.installers
 
     # Ensure platforms are initialized before filtering/printing
     for inst in installers_list:
@@ -262,8 +338,8 @@ def cmd_available(
         ]
 
     for installer in installers_list:
-        methods = _base.get_known_methods(installer)
-        manual_args = _base._extract_helper_args(installer, methods)
+        methods = registry.known_methods(installer)
+        manual_args = registry.helper_args(installer)
         table.add_row(
             installer.name,
             ", ".join(installer.platforms) or "—",
@@ -274,189 +350,6 @@ def cmd_available(
     console.print(table)
 
 
-def _run_dependencies(
-    installer: BaseInstaller,
-    installers_map: dict[str, BaseInstaller],
-    method: Literal["install", "uninstall", "upgrade"] = "install",
-    done: set[str] | None = None,
-    stack: list[str] | None = None,
-    top_level_reexec_argv: list[str] | None = None,
-) -> tuple[int, set[str]]:
-    """
-    Recursively resolve `installer.dependencies` (list of installer names or
-    installer objects) before running `installer` itself.
-
-    Behaviour by top-level method
-    -----------------------------
-    * install: dependencies use their 'install' method (no-op if already installed)
-    * upgrade: dependencies use 'upgrade' if installed, otherwise 'install'
-    * uninstall: dependencies are ignored
-
-    :param installer: The installer whose dependencies to install.
-    :param installers_map: A map of installer name -> installer instance.
-    :param method: The method for which dependencies are being resolved.
-    :param done: Set of already installed dependency names.
-    :param stack: Current dependency resolution stack (for circular dep detection).
-    :param top_level_reexec_argv: If provided, the original argv of the top-level command that triggered this resolution.
-        This is used for re-execing with elevated privileges on platforms that require it.
-
-    :return: (return code, set of installed dependency names)
-    """
-    done = done or set()
-    stack = stack or []
-
-    # We never cascade uninstalls to dependencies.
-    if method == "uninstall":
-        return 0, done
-
-    deps = getattr(installer, "dependencies", []) or []
-    for dep in deps:
-        # Accept either a name ("brew") or an installer instance/class with .name
-        dep_name = dep if isinstance(dep, str) else getattr(dep, "name", str(dep))
-
-        if dep_name in done:
-            continue
-        if dep_name in stack:
-            console.print(
-                f"Detected circular dependency: {' -> '.join(stack + [dep_name])}",
-                style="red", markup=False
-            )
-            return 1, done
-
-        dep_inst = installers_map.get(dep_name)
-        if dep_inst is None:
-            console.print(
-                f"Dependency [{dep_name}] referenced by [{installer.name}] was not found.",
-                style="red", markup=False
-            )
-            return 1, done
-
-        # Platform check for the dependency
-        dep_inst._platforms_known()
-        current_platform = system.get_platform()
-        if current_platform not in dep_inst.platforms:
-            console.print(
-                f"Dependency [{dep_name}] does not support your platform [{current_platform}].",
-                style="red", markup=False
-            )
-            return 1, done
-
-        is_installed = dep_inst.is_installed()
-        known_methods: list[str] = _base.get_known_methods(dep_inst)
-
-        # Work out which method we actually want to call on this dependency.
-        if method == "install":
-            # For install we only need the dependency to exist; if it's
-            # already installed we leave it alone.
-            if is_installed:
-                console.print(
-                    f"Dependency [{dep_name}] is already installed. Skipping.",
-                    style="cyan",
-                    markup=False,
-                )
-                done.add(dep_name)
-                continue
-
-            if "install" not in known_methods:
-                console.print(
-                    f"Dependency [{dep_name}] has no 'install' method.",
-                    style="red",
-                    markup=False,
-                )
-                return 1, done
-
-            dep_method_name: Literal["install", "uninstall", "upgrade"] = "install"
-
-        elif method == "upgrade":
-            # On upgrade:
-            #   * if the dependency is installed, prefer its 'upgrade' method
-            #     and fall back to 'install' if needed.
-            #   * if the dependency is NOT installed, use 'instal'`.
-            if is_installed:
-                if "upgrade" in known_methods:
-                    dep_method_name = "upgrade"
-                else:
-                    console.print(
-                        f"Dependency [{dep_name}] doesn't have 'upgrade' method.",
-                        style="red",
-                        markup=False,
-                    )
-                    return 1, done
-            else:
-                # Not installed: install instead of upgrade.
-                if "install" not in known_methods:
-                    console.print(
-                        f"Dependency [{dep_name}] is not installed and has no 'install' method.",
-                        style="red",
-                        markup=False,
-                    )
-                    return 1, done
-                dep_method_name = "install"
-        else:
-            # Shouldn't happen because we early-return for "uninstall"
-            continue
-
-        # Admin check for the dependency if required on this platform.
-        reexec = top_level_reexec_argv or [dep_method_name, dep_inst.name]
-        rc = _require_admin_if_needed(dep_inst, method=dep_method_name, reexec_argv=reexec)
-        if rc != 0:
-            return rc, done
-
-        # Recurse first so deep deps resolve in correct order. We keep passing
-        # the *top-level* method ("install"/"upgrade") so all transitive
-        # dependencies follow the same policy.
-        rc, _ = _run_dependencies(
-            dep_inst, installers_map, method, done, stack + [dep_name],
-            top_level_reexec_argv=top_level_reexec_argv)
-        if rc != 0:
-            return rc, done
-
-        # Finally, actually run the chosen method on the dependency
-        verb = (
-            "Installing"
-            if dep_method_name == "install"
-            else "Upgrading"
-            if dep_method_name == "upgrade"
-            else f"Running '{dep_method_name}' for"
-        )
-        console.print(
-            f"{verb} dependency [{dep_name}] for [{installer.name}]…",
-            style="green",
-            markup=False,
-        )
-
-        dep_func = getattr(dep_inst, dep_method_name)
-        result = dep_func()
-
-        # Support installers that return either an int rc or a subprocess.CompletedProcess-like object.
-        rc = getattr(result, "returncode", result)
-        if rc is None:
-            console.print(
-                f"Dependency [{dep_name}] command did not return an exit code.",
-                style="red",
-                markup=False,
-            )
-            return 1, done
-        if not isinstance(rc, int):
-            console.print(
-                f"Dependency [{dep_name}] command returned invalid exit code: {rc!r}",
-                style="red",
-                markup=False,
-            )
-            return 1, done
-        if rc != 0:
-            console.print(
-                f"Dependency [{dep_name}] Command failed with exit code {rc}. Exiting.",
-                style="red",
-                markup=False,
-            )
-            return rc, done
-
-        done.add(dep_name)
-
-    return 0, done
-
-
 def _require_admin_if_needed(
         installer: BaseInstaller,
         method: Literal["install", "uninstall", "upgrade"] = "install",
@@ -465,50 +358,51 @@ def _require_admin_if_needed(
     """
     Enforce admin privileges when requested by the installer.
 
-    If we need to elevate on Windows while currently running with no CLI args
-    (interactive mode), we stash the attempted argv in an env var so the elevated
-    session can execute it automatically before entering interactive mode.
-
-    installer.admins can be:
-
-      - A dict mapping platform -> list of methods that require admin.
-        Example:
-            {
-                "windows": ["install", "upgrade"],
-                "debian": ["install"],
-            }
-
-      - (Legacy) a list of platforms, meaning all methods require admin on
-        those platforms.
+    installer.admins is a dict mapping platform -> list of methods that require admin.
+    Example:
+        {
+            "windows": ["install", "upgrade"],
+            "debian": ["install"],
+        }
 
     Returns 0 if ok; non-zero to abort.
     """
-    admins = getattr(installer, 'admins', None)
-    if not admins:
+    if not planner.needs_admin(installer, method):
         return 0
 
-    current_platform = system.get_platform()
-    needs_admin = False
+    return _elevate(reexec_argv or [str(method), installer.name])
 
-    if isinstance(admins, dict):
-        methods_for_platform = admins.get(current_platform) or []
-        # Allow either string or list
-        if isinstance(methods_for_platform, str):
-            methods_for_platform = [methods_for_platform]
-        methods_for_platform = [m.lower() for m in methods_for_platform]
 
-        if str(method).lower() in methods_for_platform:
-            needs_admin = True
-    else:
-        raise ValueError(f"installer.admins has unsupported type: {type(admins)}")
+def _get_elevated_env() -> dict[str, str]:
+    """
+    :return: Environment variables for the elevated process. It runs as root or as another admin,
+        its journals must be written to the directory of the invoking user for 'dkinst resume'.
+    """
+    # Created by the invoking user, so the journal directory stays writable for that user.
+    os.makedirs(journal.JOURNAL_DIR, exist_ok=True)
+    return {journal.JOURNAL_DIR_ENV: journal.JOURNAL_DIR}
 
-    if not needs_admin:
-        return 0
 
+def _elevate(reexec_argv: list[str]) -> int:
+    """
+    Re-execute the current command with admin privileges.
+
+    If we need to elevate on Windows while currently running with no CLI args
+    (interactive mode), we stash the attempted argv in an env var so the elevated
+    session can execute it automatically before entering interactive mode.
+
+    :param reexec_argv: The dkinst arguments of the command that requires admin.
+    :return: 0 if already admin; non-zero to abort.
+    """
     # If we require admin but already have it, we're fine
     if permissions.is_admin():
         return 0
 
+    # A non-elevated daemon can't elevate on behalf of the client, the client runs the command locally.
+    if _DAEMON_MODE:
+        raise ElevationRefusedError("This action requires administrator privileges.")
+
+    current_platform = system.get_platform()
     console.print('This action requires administrator privileges. Upgrading...', style='yellow')
 
     if current_platform == 'debian':
@@ -522,12 +416,12 @@ def _require_admin_if_needed(
                 pass
 
         # Auto-elevate; this never returns on success
-        permissions.ensure_root_or_reexec_debian()
+        permissions.ensure_root_or_reexec_debian(env=_get_elevated_env())
 
         # If we get here, sudo failed
         venv = os.environ.get('VIRTUAL_ENV', None)
         if venv:
-            print(f'Try: sudo "{venv}/bin/dkinst" {method} {installer.name}')
+            print(f'Try: sudo "{venv}/bin/dkinst" {shlex.join(reexec_argv)}')
     elif current_platform == 'windows':
         # If we're about to re-launch into an elevated *interactive* session (no args),
         # bootstrap it by telling the elevated process what to run first.
@@ -542,7 +436,7 @@ def _require_admin_if_needed(
 
         print("Will try to relaunch with elevated privileges...")
         # Auto-elevate via UAC; this will exit on success
-        permissions.ensure_admin_or_reexec_windows()
+        permissions.ensure_admin_or_reexec_windows(env=_get_elevated_env())
 
         # If we get here, elevation failed or was cancelled. Clean up any bootstrap file
         # so a later elevated interactive start doesn't accidentally replay it.
@@ -561,6 +455,310 @@ def _require_admin_if_needed(
     return 1
 
 
+def _run_plan(
+        method: Literal["install", "uninstall", "upgrade"],
+        targets: list[tuple[str, list[str]]],
+        registry: InstallerRegistry,
+        reexec_argv: list[str],
+) -> int:
+    """
+    Resolve all the targets and their dependencies into one plan, elevate once if any step
+    requires admin, then execute the whole plan.
+
+    :param method: The method requested for the targets.
+    :param targets: List of (installer name, extra arguments) tuples.
+    :param registry: Installer registry of the session.
+    :param reexec_argv: The dkinst arguments of the command, used for elevation re-exec.
+    :return: Exit code.
+    """
+    try:
+        plan: planner.Plan = planner.resolve_plan(
+            method, targets, registry.installers_map, is_installed=registry.is_installed)
+    except planner.PlanError as e:
+        console.print(str(e), style='red', markup=False)
+        return 1
+
+    if plan.needs_admin:
+        # The elevated process continues the resumed run, not a new one.
+        rc = _elevate(["resume", _RESUME_RUN_ID] if _RESUME_RUN_ID else reexec_argv)
+        if rc != 0:
+            return rc
+
+    # Journal of the run, so a failed run can be continued with 'dkinst resume'.
+    run_journal: journal.Journal | None = journal.get_active()
+    owns_journal: bool = run_journal is None
+    if owns_journal:
+        try:
+            run_journal = journal.new_journal(reexec_argv)
+        except OSError as e:
+            console.print(f"Can't create the run journal, 'resume' won't be available: {e}", style="yellow", markup=False)
+            run_journal = None
+        journal.set_active(run_journal)
+
+    rc: int = 1
+    try:
+        rc = planner.execute_plan(plan)
+        return rc
+    finally:
+        registry.invalidate([step.name for step in plan.runnable_steps])
+        if owns_journal:
+            journal.set_active(None)
+        if run_journal is not None:
+            run_journal.finish(rc)
+            if rc != 0:
+                console.print(
+                    f"The run was journaled. Continue from the failed step with: dkinst resume {run_journal.run_id}",
+                    style="yellow", markup=False)
+
+
+def cmd_resume(
+        run_id: str | None,
+        parser: argparse.ArgumentParser,
+        registry: InstallerRegistry | None = None
+) -> int:
+    """
+    Execute the command of a failed run again, skipping the steps that were completed and still verify.
+
+    :param run_id: Run ID of the failed run, 'list' to list the failed runs, 'help' for help.
+        If None, the latest failed run is resumed.
+    :param parser: The dkinst argument parser.
+    :param registry: Installer registry of the session.
+    :return: Exit code.
+    """
+    if run_id == "help":
+        print(journal.__doc__)
+        return 0
+
+    journals: list[journal.Journal] = journal.list_journals()
+    if run_id == "list":
+        if not journals:
+            console.print("No failed runs to resume.", style="cyan", markup=False)
+            return 0
+
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Run ID", style="bold")
+        table.add_column("Command")
+        table.add_column("Completed steps")
+        table.add_column("Failed step")
+        for j in journals:
+            completed: int = sum(1 for step in j.steps.values() if step.get("status") == journal.STATUS_COMPLETED)
+            table.add_row(j.run_id, shlex.join(j.argv), str(completed), j.data.get("failed_step") or "—")
+        console.print(table)
+        return 0
+
+    if run_id is None:
+        if not journals:
+            console.print("No failed runs to resume.", style="cyan", markup=False)
+            return 0
+        run_journal = journals[0]
+    else:
+        try:
+            run_journal = journal.load_journal(run_id)
+        except journal.JournalError as e:
+            console.print(str(e), style="red", markup=False)
+            return 1
+
+    argv: list[str] = _normalize_argv(run_journal.argv)
+    if not argv or argv[0] not in planner.PLAN_METHODS:
+        console.print(f"The run [{run_journal.run_id}] can't be resumed: {run_journal.argv!r}", style="red", markup=False)
+        return 1
+
+    console.print(
+        f"Resuming [{run_journal.run_id}]: dkinst {shlex.join(argv)}", style="cyan", markup=False)
+
+    try:
+        namespace = parser.parse_args(argv)
+    except SystemExit:
+        return 2
+
+    run_journal.resuming = True
+    run_journal.data["status"] = journal.STATUS_RUNNING
+    previous = journal.set_active(run_journal)
+    global _RESUME_RUN_ID
+    _RESUME_RUN_ID = run_journal.run_id
+    try:
+        return _dispatch(namespace, parser, registry)
+    finally:
+        _RESUME_RUN_ID = None
+        journal.set_active(previous)
+
+
+def cmd_rollback(
+        name: str | None,
+        registry: InstallerRegistry | None = None,
+) -> int:
+    """
+    Switch an installer that installs side-by-side versions back to the version that was active before.
+    Only the 'current' link of the installation folder is switched, nothing is downloaded or copied.
+
+    :param name: Installer name.
+    :param registry: Installer registry of the session.
+    :return: Exit code.
+    """
+    if not name or name == "help":
+        print(
+            "Usage:\n"
+            "  dkinst rollback <installer>\n"
+            "\n"
+            "Notes:\n"
+            f"  • Works for the installers that keep their versions side by side in '<installation folder>\\{versions.VERSIONS_DIR_NAME}',\n"
+            f"    with '<installation folder>\\{versions.CURRENT_LINK_NAME}' linked to the active one.\n"
+            "  • The active version and the one before it are kept. Running rollback again switches back."
+        )
+        return 0 if name == "help" else 1
+
+    registry = registry or InstallerRegistry(_get_installers)
+    inst = registry.installers_map.get(name)
+    if inst is None:
+        console.print(f"Unknown installer: [{name}]", style='red', markup=False)
+        return 1
+
+    current_version: str | None = versions.get_current_version(inst.dir_path)
+    if current_version is None:
+        console.print(f"The installer [{inst.name}] has no side-by-side versions in: {inst.dir_path}", style='red',
+                      markup=False)
+        return 1
+
+    try:
+        rolled_back_version: str = versions.rollback(inst.dir_path)
+    except (versions.VersionsError, OSError) as e:
+        console.print(str(e), style='red', markup=False)
+        return 1
+    finally:
+        # The installed version changed outside of the install methods, the next check probes it live.
+        state_store.get_store().forget(inst.name)
+        registry.invalidate([inst.name])
+
+    console.print(f"[{inst.name}] rolled back from [{current_version}] to [{rolled_back_version}].", style='green',
+                  markup=False)
+    return 0
+
+
+def cmd_status(
+        prefix: str | None = None,
+        registry: InstallerRegistry | None = None,
+) -> None:
+    """
+    Print the installed state, installed version and latest version of the installers of the current platform.
+    In the interactive console the states are usually already prefetched in the background.
+
+    :param prefix: Show only the installers whose name starts with the prefix.
+    :param registry: Installer registry of the session.
+    """
+    registry = registry or InstallerRegistry(_get_installers)
+    current_platform: str = system.get_platform()
+    installers_list: list[BaseInstaller] = [
+        inst for inst in registry.installers
+        if current_platform in inst.platforms and (not prefix or inst.name.lower().startswith(prefix.lower()))
+    ]
+
+    states = prefetch.probe_states(registry, installers_list)
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Name", style="bold")
+    table.add_column("Installed")
+    table.add_column("Version")
+    table.add_column("Latest")
+
+    for inst in installers_list:
+        state = states.get(inst.name)
+        if state is None:
+            table.add_row(inst.name, "error", "—", "—", style="red")
+            continue
+        table.add_row(
+            inst.name,
+            "yes" if state.installed else "no",
+            state.installed_version or "—",
+            state.latest_version or "—",
+            style="yellow" if state.update_available else (None if state.installed else "dim"),
+        )
+
+    console.print(table)
+    if prefetch.is_offline():
+        console.print("Offline mode: latest versions were not checked.", style="cyan", markup=False)
+
+
+def cmd_plan(
+        method: str | None,
+        names: list[str],
+        registry: InstallerRegistry | None = None,
+) -> int:
+    """
+    Print the resolved plan of a command without executing anything: dependency order, no-op steps,
+    admin requirements, download sizes and time estimates from the run history.
+
+    :param method: install, upgrade or uninstall.
+    :param names: Installer names.
+    :return: Exit code.
+    """
+    if method not in planner.PLAN_METHODS or not names or names == ["help"]:
+        print(
+            "Usage:\n"
+            "  dkinst plan <install|upgrade|uninstall> <installer> [<installer> ...]\n"
+            "\n"
+            "Notes:\n"
+            "  • Nothing is installed, the installers are only probed with 'is_installed'.\n"
+            "  • Download sizes use HTTP HEAD for the installers that report their download URLs.\n"
+            "  • Time estimates are the median of the previous successful runs on this machine."
+        )
+        return 0 if method is None or method == "help" or names == ["help"] else 1
+
+    registry = registry or InstallerRegistry(_get_installers)
+    try:
+        plan: planner.Plan = planner.resolve_plan(
+            method, [(name, []) for name in names], registry.installers_map,
+            is_installed=registry.is_installed, probe_targets=True)
+    except planner.PlanError as e:
+        console.print(str(e), style='red', markup=False)
+        return 1
+
+    planner.print_plan(planner.estimate_plan(plan))
+    return 0
+
+
+def cmd_apply(
+        profile_path: str | None,
+        registry: InstallerRegistry | None = None,
+) -> int:
+    """
+    Converge the machine to a profile: only the items that differ from the current state
+    are installed/upgraded/uninstalled, independent items run concurrently.
+
+    :param profile_path: Path to the profile TOML file.
+    :return: Exit code.
+    """
+    if not profile_path or profile_path == "help":
+        print("Usage:\n  dkinst apply <profile.toml>\n" + profiles.PROFILE_EXAMPLE)
+        return 0
+
+    registry = registry or InstallerRegistry(_get_installers)
+    installers_map: dict = registry.installers_map
+    probe_cache: dict[str, bool] = {}
+
+    try:
+        profile: profiles.Profile = profiles.load_profile(profile_path)
+        diffs: list[profiles.ItemDiff] = profiles.diff_profile(profile, installers_map, probe_cache)
+        profiles.print_diff(diffs)
+        steps: list[profiles.ConvergeStep] = profiles.build_converge_steps(diffs, installers_map, probe_cache)
+    except (profiles.ProfileError, planner.PlanError) as e:
+        console.print(str(e), style='red', markup=False)
+        return 1
+
+    if not steps:
+        console.print("The machine already matches the profile.", style='green', markup=False)
+        return 0
+
+    if any(step.needs_admin for step in steps):
+        rc = _elevate(["apply", os.path.abspath(profile_path)])
+        if rc != 0:
+            return rc
+
+    try:
+        return profiles.converge(steps, workers=profile.workers)
+    finally:
+        registry.invalidate([step.name for step in steps])
+
+
 def _get_subcommands_from_parser(parser: argparse.ArgumentParser) -> list[str]:
     """
     Return the list of top-level subcommand names from an argparse parser.
@@ -573,8 +771,23 @@ def _get_subcommands_from_parser(parser: argparse.ArgumentParser) -> list[str]:
 
 
 def _interactive_console(parser: argparse.ArgumentParser) -> int:
-    installers_list = _get_installers()
-    installer_names = [i.name for i in installers_list]
+    # One registry for the whole session, so the commands don't rebuild the installers and helper parsers.
+    registry = InstallerRegistry(_get_installers)
+
+    # Warm the installed states and latest versions in the background while the prompt is idle.
+    prefetcher = prefetch.Prefetcher(registry)
+    try:
+        return _interactive_loop(parser, registry, prefetcher)
+    finally:
+        prefetcher.cancel()
+
+
+def _interactive_loop(
+        parser: argparse.ArgumentParser,
+        registry: InstallerRegistry,
+        prefetcher: prefetch.Prefetcher
+) -> int:
+    installer_names = registry.names
 
     # Dynamically grab all subcommand names from the parser
     subcommands: list[str] = _get_subcommands_from_parser(parser)
@@ -587,9 +800,13 @@ def _interactive_console(parser: argparse.ArgumentParser) -> int:
 
     if PromptSession is not None:
         session = PromptSession(
-            completer=DkinstCompleter(subcommands, installer_names),
+            completer=DkinstCompleter(
+                subcommands, installer_names,
+                meta_provider=lambda name: prefetch.describe_state(registry.get_state(name))),
             complete_while_typing=False,  # or True if you like
         )
+        # Start after the session was created, so the prompt output isn't wrapped by the prefetch stream proxy.
+        prefetcher.start()
 
         while True:
             try:
@@ -619,7 +836,9 @@ def _interactive_console(parser: argparse.ArgumentParser) -> int:
             except SystemExit:
                 continue
 
-            rc = _dispatch(namespace, parser)
+            # No background probes while the command runs, they would compete with its installers.
+            with prefetcher.paused():
+                rc = _dispatch(namespace, parser, registry)
             if rc is None:
                 console.print(
                     "Internal error: command did not return an exit code.",
@@ -646,6 +865,7 @@ def _interactive_console(parser: argparse.ArgumentParser) -> int:
         console.print(
             "[yellow]prompt_toolkit not installed; TAB completion is disabled.[/yellow]"
         )
+        prefetcher.start()
         while True:
             try:
                 line = console.input("[bold magenta]dkinst> [/bold magenta]").strip()
@@ -672,7 +892,9 @@ def _interactive_console(parser: argparse.ArgumentParser) -> int:
             except SystemExit:
                 continue
 
-            rc = _dispatch(namespace, parser)
+            # No background probes while the command runs, they would compete with its installers.
+            with prefetcher.paused():
+                rc = _dispatch(namespace, parser, registry)
             if rc is None:
                 console.print(
                     "Internal error: command did not return an exit code.",
@@ -699,10 +921,27 @@ def _interactive_console(parser: argparse.ArgumentParser) -> int:
     return 0
 
 
+@tracing.traced(
+    "dispatch",
+    attributes=lambda namespace, *args, **kwargs: {
+        "command": namespace.sub, "script": getattr(namespace, "script", None)},
+    result_attributes=lambda rc: {"rc": rc})
 def _dispatch(
         namespace: argparse.Namespace,
-        parser: argparse.ArgumentParser
+        parser: argparse.ArgumentParser,
+        registry: InstallerRegistry | None = None,
 ) -> int:
+    """
+    Execute a parsed command.
+
+    :param namespace: Parsed arguments.
+    :param parser: The dkinst argument parser.
+    :param registry: Installer registry of the session (interactive console, daemon).
+        If not provided, a new one is created for this command.
+    :return: Exit code.
+    """
+    registry = registry or InstallerRegistry(_get_installers)
+
     if namespace.sub == "help":
         parser.print_help()
         return 0
@@ -719,7 +958,11 @@ def _dispatch(
             else:
                 prefix = scope_or_prefix
 
-        cmd_available(prefix=prefix, show_all=show_all)
+        cmd_available(prefix=prefix, show_all=show_all, registry=registry)
+        return 0
+
+    if namespace.sub == "status":
+        cmd_status(prefix=getattr(namespace, "prefix", None), registry=registry)
         return 0
 
     if namespace.sub == "edit-config":
@@ -740,6 +983,22 @@ def _dispatch(
         from .installers.helpers.infra import prereqs_uninstall
         return prereqs_uninstall_mod._cmd_uninstall_prereqs()
 
+    if namespace.sub == "daemon":
+        from . import daemon
+        return daemon.cmd_daemon(getattr(namespace, "action", None))
+
+    if namespace.sub == "plan":
+        return cmd_plan(getattr(namespace, "method", None), getattr(namespace, "names", None) or [], registry)
+
+    if namespace.sub == "resume":
+        return cmd_resume(getattr(namespace, "run_id", None), parser, registry)
+
+    if namespace.sub == "apply":
+        return cmd_apply(getattr(namespace, "profile", None), registry)
+
+    if namespace.sub == "rollback":
+        return cmd_rollback(getattr(namespace, "name", None), registry)
+
     # Methods from the Known Methods list
     if namespace.sub in _base.ALL_METHODS:
         method: Literal["install", "uninstall", "upgrade"] = namespace.sub
@@ -753,16 +1012,38 @@ def _dispatch(
         installer_name: str = namespace.script
         extras: list = namespace.installer_args or []
 
-        # Build a single map of installer instances so dependency resolution
-        # uses the same instances.
-        installers_list: list = _get_installers()
-        installers_map: dict = {i.name: i for i in installers_list}
-
-        for inst in installers_list:
-            # Find the provided installer.
-            if inst.name != installer_name:
-                continue
+        # The whole command (targets and dependencies) uses the same instances of the registry.
+        installers_map: dict = registry.installers_map
+
+        # Explicit installer arguments: dkinst install <installer> -- <args>
+        explicit_args: bool = method in planner.PLAN_METHODS and bool(extras) and extras[0] == ARGS_SEPARATOR
+        if explicit_args:
+            extras = extras[1:]
+
+        # Several installers in one command: dkinst install <installer1> <installer2> ...
+        # Only when every token is an installer name, otherwise the tokens are extras of the first installer.
+        # Tokens that look like installer names must be all names, the installer arguments go after '--'.
+        if method in planner.PLAN_METHODS and extras and not explicit_args and installer_name in installers_map:
+            error: str | None = _check_targets(method, installer_name, extras, list(installers_map))
+            if error:
+                console.print(error, style='red', markup=False)
+                return 1
+        if (
+                method in planner.PLAN_METHODS
+                and extras
+                and not explicit_args
+                and all(name in installers_map for name in [installer_name, *extras])
+        ):
+            names: list[str] = [installer_name, *extras]
+            return _run_plan(
+                method,
+                [(name, []) for name in names],
+                registry,
+                reexec_argv=[str(method), *names],
+            )
 
+        inst = installers_map.get(installer_name)
+        if inst is not None:
             inst._platforms_known()
 
             # Now check if the current platform is supported by this installer.
@@ -772,30 +1053,28 @@ def _dispatch(
                               style='red', markup=False)
                 return 1
 
-            # Enforce admin privileges for this method when requested, unless the user is just asking for help.
-            if 'help' not in extras:
-                attempted_argv = [str(method), inst.name, *extras]
-                rc = _require_admin_if_needed(inst, method, reexec_argv=attempted_argv)
-                if rc != 0:
-                    return rc
-
             # Processing the 'manual' method.
             if method == 'manual':
-                installer_methods = _base.get_known_methods(inst)
+                # Enforce admin privileges for this method when requested, unless the user is just asking for help.
+                if 'help' not in extras:
+                    attempted_argv = [str(method), inst.name, *extras]
+                    rc = _require_admin_if_needed(inst, method, reexec_argv=attempted_argv)
+                    if rc != 0:
+                        return rc
+
+                installer_methods = registry.known_methods(inst)
                 if 'manual' not in installer_methods:
                     console.print(f"No 'manual' method available for the installer: [{inst.name}]", style='red',
                                   markup=False)
                     return 1
 
-                # Use the helper parser for this installer, if available
-                helper_parser = _base._get_helper_parser(inst, installer_methods)
+                # Use the cached helper parser for this installer, if available.
+                # Its program name already includes the installer name.
+                helper_parser = registry.helper_parser(inst)
                 if helper_parser is None:
                     console.print(f"No manual argparser available for [{inst.name}].", style='red', markup=False)
                     return 1
 
-                # Change the command line program name to include the installer name.
-                helper_parser.prog = f"{helper_parser.prog} {method} {inst.name}"
-
                 # Output help of specific installer helper parser
                 if (
                         # Installer-specific help: [dkinst <method> <installer> help]
@@ -817,39 +1096,27 @@ def _dispatch(
                     return 2
                 # If your installers accept kwargs:
                 target_helper = inst.helper
-                return target_helper.main(**vars(parsed))
+                try:
+                    return target_helper.main(**vars(parsed))
+                finally:
+                    folders.track(inst.dir_path)
+                    # The state after a manual run is unknown, the next check probes it live.
+                    state_store.get_store().forget(inst.name)
+                    registry.invalidate([inst.name])
 
             # For all the other methods that aren't manual.
             if len(extras) == 1 and extras[0] == "help":
                 inst._show_help(method)
                 return 0
 
-            # For 'install' and 'upgrade', resolve dependencies first
-            if method in ("install", "upgrade"):
-                attempted_argv = [str(method), inst.name, *extras]
-                rc, all_dependencies = _run_dependencies(
-                    inst,
-                    installers_map,
-                    method=method,
-                    top_level_reexec_argv=attempted_argv,
-                )
-                if rc != 0:
-                    return rc
-
-                if all_dependencies:
-                    console.print(
-                        f"All dependencies for [{inst.name}] are installed. Proceeding to main installer…",
-                        style="cyan",
-                        markup=False,
-                    )
-
-            # Normal execution: call method and pass through extras (if any)
-            target = getattr(inst, method)
-
-            if extras:
-                return target(*extras)
-            else:
-                return target()
+            # Dependencies are resolved together with the installer, so admin rights are checked
+            # and requested once for the whole plan.
+            return _run_plan(
+                method,
+                [(inst.name, list(extras))],
+                registry,
+                reexec_argv=[str(method), inst.name, *([ARGS_SEPARATOR] if explicit_args else []), *extras],
+            )
 
         console.print(f"No installer found with the name: [{installer_name}]", style='red', markup=False)
         return 0
@@ -865,6 +1132,8 @@ def _make_parser() -> argparse.ArgumentParser:
         "\n"
         "Arguments:\n"
         "  install <installer>          Install the script with the given name.\n"
+        "  install <installer> <installer> ...\n"
+        "                               Install several scripts with one shared dependency plan and a single elevation.\n"
         "       i <installer>           (alias for install)\n"
         "  upgrade  <installer>         Update the script with the given name.\n"
         "       up <installer>          (alias for upgrade)\n"
@@ -881,6 +1150,29 @@ def _make_parser() -> argparse.ArgumentParser:
         "  available all                List installers for all platforms.\n"
         "       a                       (alias for available)\n"
         "       a all                   (example with alias for available all)\n"
+        "  status [prefix]              Show installed state, installed and latest versions of the installers.\n"
+        "  --offline                    As the first argument: don't look up latest versions online.\n"
+        "                               Example: dkinst --offline (interactive console), dkinst --offline status\n"
+        "  --trace <file.json>          As the first argument: write timed spans of the run (dependency probes,\n"
+        "                               installs, commands, downloads, MSI runs) in Chrome trace format.\n"
+        "                               Open the file in chrome://tracing or https://ui.perfetto.dev.\n"
+        "                               Example: dkinst --trace out.json install tesseract_ocr\n"
+        "  plan <method> <installer> ...\n"
+        "                               Show the resolved plan of install/upgrade/uninstall without executing it:\n"
+        "                               dependency order, no-op steps, admin rights, download sizes and time estimates.\n"
+        "  apply <profile.toml>         Converge the machine to a profile of installers, args and versions.\n"
+        "                               Only the installers that differ are installed/upgraded/uninstalled.\n"
+        "  apply help                   Show the profile format.\n"
+        "  resume [run_id]              Continue a failed install/upgrade/uninstall run from the failed step.\n"
+        "                               Completed dependencies, downloads and build phases are skipped.\n"
+        "                               Default: the latest failed run.\n"
+        "  resume list                  List the failed runs that can be resumed.\n"
+        "  rollback <installer>         Switch an installer with side-by-side versions back to the previous version.\n"
+        "                               Example: dkinst rollback snappy_driver_lite\n"
+        "  daemon                       Opt-in: serve dkinst from a warm background process in the foreground.\n"
+        "                               While it runs, dkinst commands are forwarded to it and start instantly.\n"
+        "  daemon status                Show if the daemon is running.\n"
+        "  daemon stop                  Stop the daemon.\n"
         "  edit-config                  Open the configuration file in the default editor.\n"
         "                               You can change the base installation path here.\n"
         "  prereqs                      Install prerequisites for dkinst. Run this after installing or updating dkinst.\n"
@@ -948,6 +1240,56 @@ def _make_parser() -> argparse.ArgumentParser:
     )
     available_arg.completer = _available_scope_or_prefix_completer
 
+    status_parser = sub.add_parser("status")
+    status_arg = status_parser.add_argument(
+        "prefix",
+        nargs="?",
+        help="optional: installer name prefix",
+    )
+    status_arg.completer = _installer_name_completer
+
+    plan_parser = sub.add_parser("plan")
+    plan_parser.add_argument(
+        "method",
+        nargs="?",
+        help="install, upgrade or uninstall",
+    )
+    plan_names_arg = plan_parser.add_argument(
+        "names",
+        nargs="*",
+        help="installer names",
+    )
+    plan_names_arg.completer = _installer_name_completer
+
+    apply_parser = sub.add_parser("apply")
+    apply_parser.add_argument(
+        "profile",
+        nargs="?",
+        help="path to the profile TOML file, or 'help' to show the profile format",
+    )
+
+    resume_parser = sub.add_parser("resume")
+    resume_parser.add_argument(
+        "run_id",
+        nargs="?",
+        help="run ID of the failed run (default: the latest), 'list' to list the failed runs, or 'help'",
+    )
+
+    rollback_parser = sub.add_parser("rollback")
+    rollback_arg = rollback_parser.add_argument(
+        "name",
+        nargs="?",
+        help="installer name or 'help'",
+    )
+    rollback_arg.completer = _installer_name_completer
+
+    daemon_parser = sub.add_parser("daemon")
+    daemon_parser.add_argument(
+        "action",
+        nargs="?",
+        help="'start' (default) to serve in the foreground, 'status', 'stop' or 'help'",
+    )
+
     sub.add_parser("edit-config")
     sub.add_parser("prereqs")
     sub.add_parser("prereqs-uninstall")
@@ -974,14 +1316,64 @@ def main(argv: list[str] | None = None) -> int:
     dkinst uninstall <script>  [extra args passed through]
     """
 
-    # Remove empty folders in config dir on Windows.
-    folders.remove_empty_portable_folders()
-
     parser: argparse.ArgumentParser = _make_parser()          # builds the ArgumentParser shown earlier
 
     if argv is None:
         argv = sys.argv[1:]
 
+    argv, trace_path = _pop_global_options(argv)
+    if trace_path:
+        tracing.enable()
+    # Opt-in, see 'metrics_dir' in config.toml.
+    metrics.start_run(shlex.join(argv) if argv else "interactive")
+    rc: int = 1
+    try:
+        rc = _main(parser, argv)
+        return rc
+    finally:
+        # Remove the empty portable folders on Windows, only the ones touched in this run
+        # unless the portable root changed since the last run.
+        folders.remove_empty_portable_folders()
+        metrics.finish_run(rc if isinstance(rc, int) else 1)
+        if trace_path:
+            _write_trace(trace_path)
+
+
+def _pop_global_options(argv: list[str]) -> tuple[list[str], str | None]:
+    """
+    Handle the global options that come before the command: '--offline' and '--trace <file>'.
+
+    :param argv: dkinst arguments.
+    :return: (the arguments without the global options, path of the trace file or None).
+    """
+    argv = list(argv)
+    trace_path: str | None = None
+    while argv and argv[0] in ("--offline", "--trace"):
+        option: str = argv.pop(0)
+        if option == "--offline":
+            os.environ[prefetch.OFFLINE_ENV] = "1"
+        elif argv:
+            trace_path = os.path.abspath(argv.pop(0))
+        else:
+            console.print("--trace requires a file path, tracing is disabled.", style="yellow", markup=False)
+    return argv, trace_path
+
+
+def _write_trace(trace_path: str) -> None:
+    tracing.disable()
+    try:
+        tracing.write_chrome_trace(trace_path)
+    except OSError as e:
+        console.print(f"Failed to write the trace to [{trace_path}]: {e}", style="red", markup=False)
+        return
+    console.print(f"Trace written to [{trace_path}]. Open it in chrome://tracing or https://ui.perfetto.dev",
+                  style="cyan", markup=False)
+
+
+def _main(
+        parser: argparse.ArgumentParser,
+        argv: list[str]
+) -> int:
     # If no arguments, enter interactive console instead of printing help
     if not argv:
         bootstrap_argv = _pop_elevate_bootstrap()
@@ -991,7 +1383,6 @@ def main(argv: list[str] | None = None) -> int:
             try:
                 namespace = parser.parse_args(bootstrap_argv)
             except SystemExit:
-                folders.remove_empty_portable_folders()
                 return 2
 
             rc = _dispatch(namespace, parser)
@@ -1001,7 +1392,6 @@ def main(argv: list[str] | None = None) -> int:
                     style="red",
                     markup=False,
                 )
-                folders.remove_empty_portable_folders()
                 return 1
             if not isinstance(rc, int):
                 console.print(
@@ -1009,24 +1399,18 @@ def main(argv: list[str] | None = None) -> int:
                     style="red",
                     markup=False,
                 )
-                folders.remove_empty_portable_folders()
                 return 1
             if rc != 0:
-                folders.remove_empty_portable_folders()
                 return rc
 
-        rc: int = _interactive_console(parser)
-        folders.remove_empty_portable_folders()
-        return rc
+        return _interactive_console(parser)
 
     # Map short aliases to the full subcommand before argparse sees them
     argv = _normalize_argv(argv)
 
     # Normal one-shot CLI mode
     namespace = parser.parse_args(argv)
-    rc: int = _dispatch(namespace, parser)
-    folders.remove_empty_portable_folders()
-    return rc
+    return _dispatch(namespace, parser)
 
 
 if __name__ == "__main__":
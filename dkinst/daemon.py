@@ -0,0 +1,518 @@
+"""
+Opt-in warm daemon for dkinst.
+
+'dkinst daemon' keeps one Python process with the installers, the argument parser and the caches loaded.
+While it runs, the 'dkinst' command is a thin client: it forwards argv over a Unix socket
+(a named pipe on Windows), streams the output back and exits with the exit code of the command.
+
+This module is imported by the 'dkinst' entry point before anything else, so the client part
+uses only the standard library. The server part imports the CLI lazily.
+
+Usage:
+    dkinst daemon              # Serve in the foreground, Ctrl+C to stop.
+    dkinst daemon status
+    dkinst daemon stop
+
+    DKINST_NO_DAEMON=1 dkinst install git     # Bypass the daemon for a single command.
+
+Notes:
+- If the daemon isn't elevated, it refuses commands that require admin rights and the client
+  runs them locally, so elevation works exactly as without the daemon.
+- Interactive mode, 'daemon', 'update_version', 'prereqs', 'prereqs-uninstall' and 'edit-config'
+  always run locally.
+- The forwarded commands run with the environment of the client, restored after the command.
+- The forwarded commands have no stdin, 'input()' prompts get EOF. So when stdin is a terminal,
+  the commands that can prompt ('PROMPTING_COMMANDS') run locally.
+- Ctrl+C in the client cancels the command in the daemon, like it would interrupt a local run, exit code 130.
+"""
+import io
+import json
+import os
+import secrets
+import shlex
+import sys
+import threading
+import _thread
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+from . import __version__
+from .history import STATE_DIR
+
+
+NO_DAEMON_ENV: str = "DKINST_NO_DAEMON"
+STATE_FILE: str = str(Path(STATE_DIR) / "daemon.json")
+UNIX_SOCKET_PATH: str = str(Path(STATE_DIR) / "daemon.sock")
+# Commands that are always executed by the client process.
+LOCAL_COMMANDS: list[str] = [
+    "daemon", "update_version", "uv", "prereqs", "prereqs-uninstall", "edit-config"]
+# Commands that run installer methods, which may prompt with 'input()'. They run locally when stdin is a terminal.
+PROMPTING_COMMANDS: set[str] = {
+    "install", "upgrade", "uninstall", "manual", "apply", "resume", "i", "up", "un", "m"}
+# Global options before the command, with the number of values each one takes.
+GLOBAL_OPTIONS: dict[str, int] = {"--offline": 0, "--trace": 1}
+
+# Message types, first byte of every message from the daemon.
+MSG_OUTPUT: bytes = b"o"
+MSG_EXIT: bytes = b"x"
+MSG_FALLBACK: bytes = b"f"
+# Request of the client while its command runs: stop the command.
+CANCEL_COMMAND: str = "cancel"
+# Exit code of a command interrupted by Ctrl+C.
+INTERRUPTED_EXIT_CODE: int = 130
+# Wait for the output of the background processes that still hold the output pipe after the command exited.
+OUTPUT_DRAIN_TIMEOUT: float = 5.0
+
+
+def _get_address() -> tuple[str, str]:
+    """
+    :return: (address, family) for multiprocessing.connection.
+    """
+    if os.name == "nt":
+        user: str = os.environ.get("USERNAME", "user")
+        return rf"\\.\pipe\dkinst-daemon-{user}", "AF_PIPE"
+    return UNIX_SOCKET_PATH, "AF_UNIX"
+
+
+def read_state() -> dict | None:
+    """
+    Read the state file of the running daemon.
+
+    :return: Dict with 'address', 'family', 'authkey', 'pid', 'admin' and 'version', or None if there is no daemon.
+    """
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(state, dict) or state.get("version") != __version__:
+        # A daemon of another dkinst version would run stale code.
+        return None
+    return state
+
+
+def _connect(state: dict):
+    return Client(state["address"], family=state["family"], authkey=bytes.fromhex(state["authkey"]))
+
+
+def _get_command(argv: list[str]) -> str | None:
+    """
+    :return: The command of the dkinst arguments, after the global options.
+    """
+    index: int = 0
+    while index < len(argv) and argv[index] in GLOBAL_OPTIONS:
+        index += 1 + GLOBAL_OPTIONS[argv[index]]
+    return argv[index] if index < len(argv) else None
+
+
+def _can_prompt(command: str) -> bool:
+    """
+    :return: True if the command may ask the user for input, which the daemon can't forward.
+    """
+    return command in PROMPTING_COMMANDS
+
+
+def forward(argv: list[str]) -> int | None:
+    """
+    Forward the command to the daemon and stream its output.
+
+    :param argv: dkinst arguments, without the program name.
+    :return: Exit code of the command, or None if it must be executed locally
+        (no daemon, stale daemon, or the daemon refused the command).
+    """
+    command: str | None = _get_command(argv)
+    if command is None or command in LOCAL_COMMANDS or os.environ.get(NO_DAEMON_ENV) == "1":
+        return None
+    if sys.stdin is not None and sys.stdin.isatty() and _can_prompt(command):
+        # A prompt of the command would get EOF in the daemon, the user can answer it locally.
+        return None
+
+    state: dict | None = read_state()
+    if state is None:
+        return None
+
+    try:
+        conn = _connect(state)
+    except Exception:
+        # Stale state file, the daemon isn't running.
+        return None
+
+    out = sys.stdout.buffer
+    with conn:
+        try:
+            conn.send_bytes(json.dumps({
+                "command": "run", "argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}).encode("utf-8"))
+            while True:
+                message: bytes = conn.recv_bytes()
+                kind, payload = message[:1], message[1:]
+                if kind == MSG_OUTPUT:
+                    out.write(payload)
+                    out.flush()
+                elif kind == MSG_EXIT:
+                    return int(json.loads(payload)["rc"])
+                elif kind == MSG_FALLBACK:
+                    return None
+        except (EOFError, OSError):
+            print("Connection to the dkinst daemon was lost.", file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            try:
+                conn.send_bytes(json.dumps({"command": CANCEL_COMMAND}).encode("utf-8"))
+            except (EOFError, OSError):
+                pass
+            print("Cancelled.", file=sys.stderr)
+            return INTERRUPTED_EXIT_CODE
+
+
+def client_main() -> int:
+    """Entry point of the 'dkinst' command: forward to the daemon if it runs, otherwise run the CLI."""
+    try:
+        rc: int | None = forward(sys.argv[1:])
+    except KeyboardInterrupt:
+        # Before the command was sent to the daemon.
+        return INTERRUPTED_EXIT_CODE
+    if rc is not None:
+        return rc
+
+    from .cli import main
+    return main()
+
+
+def _send_control(command: str) -> dict | None:
+    state: dict | None = read_state()
+    if state is None:
+        return None
+    try:
+        with _connect(state) as conn:
+            conn.send_bytes(json.dumps({"command": command}).encode("utf-8"))
+            return json.loads(conn.recv_bytes()[1:])
+    except Exception:
+        return None
+
+
+def status() -> int:
+    reply = _send_control("status")
+    if reply is None:
+        print("dkinst daemon is not running.")
+        return 1
+    print(
+        f"dkinst daemon is running: pid {reply['pid']}, "
+        f"{'elevated' if reply['admin'] else 'not elevated'}, "
+        f"{reply['commands']} commands served.")
+    return 0
+
+
+def stop() -> int:
+    reply = _send_control("stop")
+    if reply is None:
+        print("dkinst daemon is not running.")
+        return 1
+    print(f"dkinst daemon [{reply['pid']}] stopped.")
+    return 0
+
+
+class _CapturedOutput:
+    """
+    Redirect the process stdout/stderr file descriptors (including the output of child processes)
+    to a pipe and send everything that is written to the connection.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self._saved_fds: tuple[int, int] | None = None
+        self._saved_stdin = None
+        self._read_fd: int | None = None
+        self._pump: threading.Thread | None = None
+
+    def _pump_output(self) -> None:
+        while True:
+            chunk: bytes = os.read(self._read_fd, 65536)
+            if not chunk:
+                break
+            try:
+                self.conn.send_bytes(MSG_OUTPUT + chunk)
+            except OSError:
+                # Client disconnected, keep draining the pipe so the command doesn't block.
+                pass
+        os.close(self._read_fd)
+
+    def __enter__(self) -> "_CapturedOutput":
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        self._read_fd, write_fd = os.pipe()
+        self._saved_fds = (os.dup(1), os.dup(2))
+        os.dup2(write_fd, 1)
+        os.dup2(write_fd, 2)
+        os.close(write_fd)
+
+        self._saved_stdin = sys.stdin
+        sys.stdin = io.StringIO("")
+
+        self._pump = threading.Thread(target=self._pump_output, daemon=True)
+        self._pump.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.stdin = self._saved_stdin
+
+        # Restoring the descriptors closes the write end of the pipe, the pump gets EOF.
+        os.dup2(self._saved_fds[0], 1)
+        os.dup2(self._saved_fds[1], 2)
+        os.close(self._saved_fds[0])
+        os.close(self._saved_fds[1])
+        self._pump.join(OUTPUT_DRAIN_TIMEOUT)
+
+
+def _write_state(state: dict) -> None:
+    os.makedirs(STATE_DIR, mode=0o700, exist_ok=True)
+    fd = os.open(STATE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def _remove_state(pid: int) -> None:
+    state: dict | None = read_state()
+    if state is not None and state.get("pid") != pid:
+        # Another daemon took over.
+        return
+    for path in (STATE_FILE, UNIX_SOCKET_PATH):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def serve() -> int:
+    """
+    Run the daemon in the foreground. Commands are executed one at a time, in the daemon process.
+
+    :return: Exit code.
+    """
+    from . import cli
+    from .registry import InstallerRegistry
+    from .installers.helpers.infra import permissions
+
+    reply = _send_control("status")
+    if reply is not None:
+        print(f"dkinst daemon is already running: pid {reply['pid']}.")
+        return 1
+
+    address, family = _get_address()
+    if family == "AF_UNIX":
+        os.makedirs(STATE_DIR, mode=0o700, exist_ok=True)
+        try:
+            # Leftover of a daemon that was killed.
+            os.remove(address)
+        except OSError:
+            pass
+
+    authkey: bytes = secrets.token_bytes(32)
+    is_admin: bool = permissions.is_admin()
+    pid: int = os.getpid()
+
+    # Warm up: parser, installer modules and instances.
+    parser = cli._make_parser()
+    registry = InstallerRegistry(cli._get_installers)
+    registry.installers
+    cli._DAEMON_MODE = True
+
+    listener = Listener(address, family=family, authkey=authkey)
+    if family == "AF_UNIX":
+        os.chmod(address, 0o600)
+
+    _write_state({
+        "address": address,
+        "family": family,
+        "authkey": authkey.hex(),
+        "pid": pid,
+        "admin": is_admin,
+        "version": __version__,
+    })
+
+    commands_served: int = 0
+    print(f"dkinst daemon [{pid}] is listening on {address} ({'elevated' if is_admin else 'not elevated'}). "
+          f"Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError):
+                # Failed authentication or broken client.
+                continue
+
+            with conn:
+                try:
+                    request: dict = json.loads(conn.recv_bytes())
+                except (OSError, EOFError, ValueError):
+                    continue
+
+                command = request.get("command")
+                if command == "status":
+                    conn.send_bytes(MSG_EXIT + json.dumps(
+                        {"pid": pid, "admin": is_admin, "commands": commands_served}).encode("utf-8"))
+                    continue
+                if command == "stop":
+                    conn.send_bytes(MSG_EXIT + json.dumps({"pid": pid}).encode("utf-8"))
+                    break
+                if command != "run":
+                    continue
+
+                commands_served += 1
+                try:
+                    _handle_run(conn, cli, parser, registry, request)
+                except (OSError, EOFError):
+                    # The client disconnected.
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cli._DAEMON_MODE = False
+        listener.close()
+        _remove_state(pid)
+
+    print(f"dkinst daemon [{pid}] stopped.")
+    return 0
+
+
+def _handle_run(conn, cli, parser, registry, request: dict) -> None:
+    previous_cwd: str = os.getcwd()
+    try:
+        os.chdir(request.get("cwd") or previous_cwd)
+    except OSError:
+        pass
+
+    # The environment of the client and the global options apply only to this command.
+    previous_env: dict[str, str] = dict(os.environ)
+    env = request.get("env")
+    if isinstance(env, dict):
+        _set_environ(env)
+    argv, trace_path = cli._pop_global_options(list(request.get("argv", [])))
+    argv = cli._normalize_argv(argv)
+    if not argv or argv[0] in LOCAL_COMMANDS:
+        _set_environ(previous_env)
+        os.chdir(previous_cwd)
+        conn.send_bytes(MSG_FALLBACK)
+        return
+
+    rc: int | None = None
+    fallback: bool = False
+    watcher = _CancelWatcher(conn)
+    try:
+        with _CapturedOutput(conn):
+            if trace_path:
+                cli.tracing.enable()
+            cli.metrics.start_run(shlex.join(argv))
+            try:
+                watcher.start()
+                try:
+                    namespace = parser.parse_args(argv)
+                    rc = cli._dispatch(namespace, parser, registry)
+                    cli.folders.remove_empty_portable_folders()
+                finally:
+                    # Inside the 'try', a cancel that arrived while the command was finishing is still caught.
+                    watcher.stop()
+            except KeyboardInterrupt:
+                print("Cancelled.", file=sys.stderr)
+                rc = INTERRUPTED_EXIT_CODE
+            except cli.ElevationRefusedError:
+                fallback = True
+            except SystemExit as e:
+                # argparse errors and explicit exits.
+                rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception as e:
+                print(f"Internal error in dkinst daemon: {e!r}", file=sys.stderr)
+                rc = 1
+            finally:
+                if fallback:
+                    # The client executes the command and writes its metrics.
+                    cli.metrics.discard_run()
+                else:
+                    cli.metrics.finish_run(rc if isinstance(rc, int) else 1)
+                if trace_path and not fallback:
+                    cli._write_trace(trace_path)
+                cli.tracing.disable()
+    finally:
+        _set_environ(previous_env)
+        os.chdir(previous_cwd)
+
+    if fallback:
+        conn.send_bytes(MSG_FALLBACK)
+        return
+
+    if not isinstance(rc, int):
+        rc = 1
+    conn.send_bytes(MSG_EXIT + json.dumps({"rc": rc}).encode("utf-8"))
+
+
+class _CancelWatcher:
+    """
+    Read the client connection while a command runs. A cancel request of the client, or the client
+    disconnecting, interrupts the command in the main thread with KeyboardInterrupt, like Ctrl+C of a local run.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._running: bool = False
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        with self._lock:
+            self._running = True
+        self._thread = threading.Thread(target=self._watch, name="dkinst-daemon-cancel", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            self._running = False
+
+    def _watch(self) -> None:
+        while True:
+            try:
+                if not self._conn.poll(0.2):
+                    with self._lock:
+                        if not self._running:
+                            return
+                    continue
+                try:
+                    request = json.loads(self._conn.recv_bytes())
+                except ValueError:
+                    continue
+                if not isinstance(request, dict) or request.get("command") != CANCEL_COMMAND:
+                    continue
+            except (OSError, EOFError):
+                # The client is gone, nobody waits for the result.
+                pass
+            with self._lock:
+                if self._running:
+                    self._running = False
+                    _thread.interrupt_main()
+            return
+
+
+def _set_environ(env: dict[str, str]) -> None:
+    """Replace the process environment, only the variables that differ are touched."""
+    for name in [name for name in os.environ if name not in env]:
+        os.environ.pop(name, None)
+    for name, value in env.items():
+        if os.environ.get(name) != value:
+            os.environ[name] = str(value)
+
+
+def cmd_daemon(action: str | None) -> int:
+    """
+    :param action: None or 'start' to serve in the foreground, 'status', 'stop' or 'help'.
+    :return: Exit code.
+    """
+    if action in (None, "start"):
+        return serve()
+    if action == "status":
+        return status()
+    if action == "stop":
+        return stop()
+
+    print(__doc__)
+    return 0 if action == "help" else 1
@@ -0,0 +1,122 @@
+"""Run history of installer methods, used for time estimates in 'dkinst plan'."""
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+STATE_DIR: str = str(Path.home() / ".dkinst")
+HISTORY_FILE: str = str(Path(STATE_DIR) / "run_history.json")
+# Number of latest successful runs kept per installer method.
+MAX_SAMPLES: int = 10
+
+
+_LOCK = threading.Lock()
+
+
+def load_history(file_path: str | None = None) -> dict:
+    """
+    Load the run history.
+
+    :param file_path: Path to the history file. Default is 'HISTORY_FILE'.
+    :return: Dict: {installer_name: {method: [duration_seconds, ...]}}. Empty dict if there is no history.
+    """
+    file_path = file_path or HISTORY_FILE
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def record_run(
+        installer_name: str,
+        method: str,
+        duration: float,
+        rc: int = 0,
+        file_path: str | None = None
+) -> None:
+    """
+    Best-effort: add the duration of a successful run to the history. Failed runs aren't used for estimates.
+
+    :param installer_name: Installer name.
+    :param method: The method that was executed.
+    :param duration: Duration in seconds.
+    :param rc: Exit code of the run.
+    :param file_path: Path to the history file. Default is 'HISTORY_FILE'.
+    """
+    if rc != 0:
+        return
+
+    file_path = file_path or HISTORY_FILE
+    with _LOCK:
+        history: dict = load_history(file_path)
+        samples: list = history.setdefault(installer_name, {}).setdefault(method, [])
+        samples.append(round(float(duration), 3))
+        del samples[:-MAX_SAMPLES]
+
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            # Write to a temp file and replace, so a crash never leaves a half-written history.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(history, f)
+            os.replace(tmp_path, file_path)
+        except OSError:
+            pass
+
+
+def estimate_duration(
+        history: dict,
+        installer_name: str,
+        method: str
+) -> float | None:
+    """
+    Estimate the duration of an installer method from the history.
+
+    :param history: Result of 'load_history'.
+    :param installer_name: Installer name.
+    :param method: Method name.
+    :return: Median duration in seconds, or None if the method was never recorded.
+    """
+    samples = history.get(installer_name, {}).get(method, [])
+    if not samples:
+        return None
+    return float(statistics.median(samples))
+
+
+class RunTimer:
+    """
+    Context manager that records the duration of a run into the history.
+
+    Usage:
+        with history.RunTimer("git", "install") as timer:
+            timer.rc = installer.install()
+    """
+    def __init__(
+            self,
+            installer_name: str,
+            method: str,
+            file_path: str | None = None
+    ):
+        self.installer_name: str = installer_name
+        self.method: str = method
+        self.file_path: str | None = file_path
+        self.rc: int = 1
+        self._start: float = 0.0
+
+    def __enter__(self) -> "RunTimer":
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            record_run(
+                self.installer_name, self.method, time.monotonic() - self._start, self.rc, self.file_path)
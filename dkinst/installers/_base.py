@@ -7,6 +7,7 @@ from typing import Literal
 
 
 INSTALLATION_PATH_PORTABLE_WINDOWS: str = "C:\\dkinst"      # Installation path for portable files on Windows that don't have a default location.
+METRICS_DIR: str = ""       # Directory for the run metrics files, empty to disable. See 'infra/metrics.py'.
 
 KNOWN_SUPPORTED_PLATFORMS: list[str] = ["windows", "debian"]
 
@@ -46,6 +47,11 @@ class BaseInstaller:
         # Admin rights are required for windows with methods of "install" and "upgrade", and for debian with method of "install" only.
         self.admins: dict = {}
 
+        # True if the installer can run concurrently with other installers in 'dkinst apply'.
+        # By default, installers hold the system installer lock of the platform (apt/dpkg, msiexec), since they
+        # use it, prompt with 'input()' or change 'os.environ["PATH"]'. Set it only for installers that do none of these.
+        self.parallel_safe: bool = False
+
         self.base_path: str = INSTALLATION_PATH_PORTABLE_WINDOWS
         # Path to the installation directory of the installed application, if applicable. Example: Path(self.base_path) / self.name
         self.dir_path: str = str(Path(self.base_path) / self.name)
@@ -68,6 +74,62 @@ class BaseInstaller:
         """
         raise NotImplementedError("Subclasses should implement this method.")
 
+    def _get_installed_version(self) -> str | None:
+        """
+        Get the version of the installed application, if the installer can query it.
+        Used by 'dkinst apply' to compare the installed version with the profile version.
+
+        :return: Version string, or None if not installed or the installer can't query it.
+        """
+        return None
+
+    def _get_latest_version(self) -> str | None:
+        """
+        Get the latest available version of the application, if the installer can query it.
+        Used to show pending updates in 'dkinst status' and the interactive console.
+
+        :return: Version string, or None if the installer can't query it.
+        """
+        return None
+
+    def _get_fingerprint(self) -> str | None:
+        """
+        Get a cheap fingerprint of the installation (executable mtime/size, dpkg info file, etc.),
+        that changes when the application is installed, upgraded or removed.
+        While it matches the stored one, 'is_installed()' isn't probed again, see 'state_store.py'.
+        Implement it only for installers with expensive 'is_installed()' probes.
+
+        :return: Fingerprint string, or None to always probe 'is_installed()'.
+        """
+        return None
+
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        """
+        Get the package manager IDs that the method installs/upgrades/uninstalls, like {"winget": ["Git.Git"]}.
+        Used by 'execute_plan' to run the packages of several steps with one package manager command,
+        see 'wingets.method_packages'.
+
+        :param method: The method that will be executed.
+        :return: Dict of package manager -> package IDs, empty if the method doesn't use a package manager.
+        """
+        return {}
+
+    def _get_download_urls(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> list[str]:
+        """
+        Get the URLs of the files that the method downloads, if they are known in advance.
+        Used by 'dkinst plan' to estimate the download size with HTTP HEAD requests.
+
+        :param method: The method that will be executed.
+        :return: List of URLs, empty if unknown.
+        """
+        return []
+
     @staticmethod
     def _show_help(
             method: Literal["install", "uninstall", "upgrade"]
@@ -97,11 +159,15 @@ class BaseInstaller:
                 "  dkinst install help",
                 "  dkinst install <installer> help",
                 "  dkinst install <installer> [args...]",
+                "  dkinst install <installer> -- [args...]",
+                "  dkinst install <installer> <installer> ...",
                 "",
                 "Notes:",
                 "  • Use `dkinst available` to see all installers.",
                 "  • `install <installer> help` shows details for that installer’s install flow.",
                 "  • Extra [args...] are passed to the installer/its helper if supported.",
+                "  • Several installers share one dependency plan and admin rights are requested once.",
+                "  • An unknown name next to installer names is an error, use `--` to pass it as an argument.",
             ]
         elif m == "uninstall":
             lines += [
@@ -109,6 +175,8 @@ class BaseInstaller:
                 "  dkinst uninstall help",
                 "  dkinst uninstall <installer> help",
                 "  dkinst uninstall <installer> [args...]",
+                "  dkinst uninstall <installer> -- [args...]",
+                "  dkinst uninstall <installer> <installer> ...",
                 "",
                 "Notes:",
                 "  • Some installers support silent removal flags; check per-installer help.",
@@ -120,6 +188,8 @@ class BaseInstaller:
                 "  dkinst upgrade help",
                 "  dkinst upgrade <installer> help",
                 "  dkinst upgrade <installer> [args...]",
+                "  dkinst upgrade <installer> -- [args...]",
+                "  dkinst upgrade <installer> <installer> ...",
                 "",
                 "Notes:",
                 "  • If an installer doesn’t support in-place upgrades, it may reinstall.",
@@ -189,8 +259,9 @@ def assign_base_paths_from_config() -> None:
     with open(str(config_path), "rb") as f:
         config_content: dict = tomllib.load(f)
 
-    global INSTALLATION_PATH_PORTABLE_WINDOWS
+    global INSTALLATION_PATH_PORTABLE_WINDOWS, METRICS_DIR
     INSTALLATION_PATH_PORTABLE_WINDOWS = config_content["windows_portable_installation_dir"]
+    METRICS_DIR = config_content.get("metrics_dir", "")
 assign_base_paths_from_config()
 
 
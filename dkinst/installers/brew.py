@@ -1,4 +1,3 @@
-import shutil
 from typing import Literal
 import os
 import subprocess
@@ -6,7 +5,7 @@ import subprocess
 from rich.console import Console
 
 from . import _base
-from .helpers.infra import commands
+from .helpers.infra import commands, executables
 
 
 console = Console()
@@ -27,7 +26,7 @@ class Brew(_base.BaseInstaller):
         return install_brew()
 
     def is_installed(self) -> bool:
-        return shutil.which("brew") is not None
+        return executables.which("brew") is not None
 
     def _show_help(
             self,
@@ -37,6 +37,12 @@ class Chocolatey(_base.BaseInstaller):
     def is_installed(self) -> bool:
         return chocolatey_installer.is_choco_installed()
 
+    def _get_installed_version(self) -> str | None:
+        return chocolatey_installer.get_choco_version_local()
+
+    def _get_latest_version(self) -> str | None:
+        return chocolatey_installer.get_choco_version_remote()
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
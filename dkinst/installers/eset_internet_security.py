@@ -34,6 +34,16 @@ class QTorrent(_base.BaseInstaller):
     ) -> int:
         return eset_installer.main(uninstall=True, installer_dir=self.dir_path, force=force)
 
+    def _get_download_urls(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> list[str]:
+        if method != "install":
+            return []
+        if eset_installer._get_system_architecture_bits() == 64:
+            return [eset_installer.ESET_DOWNLOAD_URL_64]
+        return [eset_installer.ESET_DOWNLOAD_URL_32]
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
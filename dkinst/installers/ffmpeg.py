@@ -4,6 +4,7 @@ from typing import Literal
 
 from . import _base
 from . helpers import ffmpeg_manager
+from .helpers.infra import wingets
 
 
 class FFMPEG(_base.BaseInstaller):
@@ -29,6 +30,20 @@ class FFMPEG(_base.BaseInstaller):
     ) -> int:
         return ffmpeg_manager.main(uninstall_full_winget=True)
 
+    def is_installed(self) -> bool:
+        return wingets.is_package_installed(ffmpeg_manager.WINGET_PACKAGE_ID_FULL)
+
+    def _get_installed_version(self) -> str | None:
+        return wingets.get_installed_version(ffmpeg_manager.WINGET_PACKAGE_ID_FULL)
+
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        if method == "upgrade":
+            return {}
+        return {"winget": [ffmpeg_manager.WINGET_PACKAGE_ID_FULL]}
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
@@ -1,12 +1,11 @@
 from typing import Literal
-import shutil
 import subprocess
 import os
 
 from rich.console import Console
 
 from . import _base
-from .helpers.infra import chocos
+from .helpers.infra import chocos, executables
 
 
 console = Console()
@@ -20,8 +19,8 @@ class Git(_base.BaseInstaller):
     def __init__(self):
         super().__init__(__file__)
         self.description: str = "Git Installer"
-        self.version: str = "1.0.0"
-        # Initial.
+        self.version: str = "1.0.1"
+        # Added batched package IDs.
         self.platforms: list = ["windows"]
         self.dependencies: list = ["chocolatey"]
 
@@ -36,7 +35,7 @@ class Git(_base.BaseInstaller):
         if rc != 0:
             return rc
 
-        if not shutil.which("refreshenv"):
+        if not executables.which("refreshenv"):
             console.print(f"[red]Cannot find 'refreshenv' command to refresh environment variables.[/red]")
             return 1
 
@@ -96,7 +95,15 @@ class Git(_base.BaseInstaller):
 
 
     def is_installed(self) -> bool:
-        return shutil.which("git") is not None
+        return executables.which("git") is not None
+
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        if method == "uninstall":
+            return {"choco": [CHOCO_PACKAGE_NAME, CHOCO_PACKAGE_DEPENDENCY_NAME]}
+        return {"choco": [CHOCO_PACKAGE_NAME]}
 
     def _show_help(
             self,
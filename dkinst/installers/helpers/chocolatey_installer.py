@@ -11,11 +11,11 @@ if os.name == "nt":
     import winreg
 
 from .infra.printing import printc
-from .infra import permissions, registrys
+from .infra import permissions, registrys, chocos, executables
 
 
-VERSION: str = "1.1.0"
-"""Added uninstall and fixed install"""
+VERSION: str = "1.1.1"
+"""Local version is read from the chocolatey package nuspec, without starting choco"""
 
 
 API_URL = "https://community.chocolatey.org/api/v2/package/chocolatey"
@@ -26,7 +26,7 @@ def is_choco_installed() -> bool:
     Check if choco command exists.
     """
     print("Checking if chocolatey is installed...")
-    file_path: str = shutil.which("choco")
+    file_path: str = executables.which("choco")
     if file_path:
         print(f"chocolatey is installed at: {file_path}")
         return True
@@ -53,6 +53,10 @@ def get_choco_version_local() -> str | None:
     if not is_choco_installed():
         return None
 
+    version: str | None = chocos.get_chocolatey_version()
+    if version:
+        return version
+
     result = subprocess.run(
         ["choco", "--version"],
         stdout=subprocess.PIPE,
@@ -65,7 +69,7 @@ def get_choco_version_local() -> str | None:
         print(result.stderr.strip(), file=sys.stderr)
         return None
 
-    return result.stdout.strip()
+    return chocos.parse_version_output(result.stdout) or result.stdout.strip()
 
 
 def get_choco_version_remote() -> str:
@@ -103,7 +107,7 @@ def _locate_choco_exe() -> str | None:
     Priority:
       1. %ChocolateyInstall%\\bin
       2. %ProgramData%\\chocolatey\\bin
-      3. Last resort: whatever shutil.which("choco") sees
+      3. Last resort: whatever executables.which("choco") sees
     """
     candidates: list[str] = []
 
@@ -130,7 +134,7 @@ def _locate_choco_exe() -> str | None:
             return exe
 
     # Last resort: current process PATH (may already be correct if PATH was set before)
-    exe = shutil.which("choco")
+    exe = executables.which("choco")
     return exe
 
 
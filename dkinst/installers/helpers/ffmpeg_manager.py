@@ -10,8 +10,8 @@ console = Console()
 
 SCRIPT_NAME: str = "FFMPEG Manager"
 AUTHOR: str = "Denis Kras"
-VERSION: str = "1.0.0"
-RELEASE_COMMENT: str = "Initial version."
+VERSION: str = "1.0.1"
+RELEASE_COMMENT: str = "Return the exit code of the WinGet calls, batched WinGet results are reused."
 
 
 """
@@ -74,17 +74,17 @@ def main(
         return 1
 
     if install_full_winget:
-        return wingets.install_package(WINGET_PACKAGE_ID_FULL)
+        return wingets.install_package(WINGET_PACKAGE_ID_FULL)[0]
     if install_essentials_winget:
-        return wingets.install_package(WINGET_PACKAGE_ID_ESSENTIALS)
+        return wingets.install_package(WINGET_PACKAGE_ID_ESSENTIALS)[0]
     if install_shared_winget:
-        return wingets.install_package(WINGET_PACKAGE_ID_SHARED)
+        return wingets.install_package(WINGET_PACKAGE_ID_SHARED)[0]
     if uninstall_full_winget:
-        return wingets.uninstall_package(WINGET_PACKAGE_ID_FULL)
+        return wingets.uninstall_package(WINGET_PACKAGE_ID_FULL)[0]
     if uninstall_essentials_winget:
-        return wingets.uninstall_package(WINGET_PACKAGE_ID_ESSENTIALS)
+        return wingets.uninstall_package(WINGET_PACKAGE_ID_ESSENTIALS)[0]
     if uninstall_shared_winget:
-        return wingets.uninstall_package(WINGET_PACKAGE_ID_SHARED)
+        return wingets.uninstall_package(WINGET_PACKAGE_ID_SHARED)[0]
 
     return 0
 
@@ -1,3 +1,25 @@
+"""
+Chocolatey layer.
+
+The installed packages are read in bulk: the '.nuspec' files of the Chocolatey 'lib' directory are parsed
+into a package ID -> version index ('get_snapshot'), without starting choco. The index is read again when
+the 'lib' directory changes or after 'SNAPSHOT_TTL_SECONDS', since a session (daemon, interactive console)
+outlives the changes made by other tools.
+If the 'lib' directory can't be read, one 'choco list --limit-output' call is parsed instead.
+Several packages are installed/upgraded/uninstalled with one choco process ('method_packages'),
+the results are kept for the run, so the per-installer calls of the batched packages don't spawn choco again.
+
+The command and the install directory are taken from 'CHOCO_COMMAND' and 'get_install_dir', so the parsing
+and batching can be exercised on Linux with fixture outputs or a fake 'choco' shim.
+"""
+import os
+import re
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
 from rich.console import Console
 
 from .commands import run_package_manager_command
@@ -6,46 +28,323 @@ from .commands import run_package_manager_command
 console = Console()
 
 
-def install_package(package_id: str) -> tuple[int, str]:
-    console.print(f"[cyan]Installing Chocolatey package: {package_id}[/cyan]")
+CHOCO_COMMAND: list[str] = ["choco"]
+DEFAULT_INSTALL_DIR: str = r"C:\ProgramData\chocolatey"
+METHOD_ACTIONS: dict[str, str] = {
+    "install": "Installation",
+    "upgrade": "Upgrade",
+    "uninstall": "Uninstallation",
+}
+# The snapshot is taken again after this time, also when the 'lib' directory didn't change (e.g. an upgrade).
+SNAPSHOT_TTL_SECONDS: float = 5 * 60
 
-    return run_package_manager_command(
-        [
-            "choco",
-            "install",
-            package_id,
-            "-y",            # accept all prompts
-            # "--no-progress", # cleaner output (esp. in CI)
-        ],
-        action="Installation",
-    )
 
+_LOCK = threading.RLock()
+# Package ID lower -> (package ID, version).
+_SNAPSHOT: dict[str, tuple[str, str | None]] | None = None
+# (time.monotonic() of the snapshot, mtime_ns of the 'lib' directory then or None).
+_SNAPSHOT_STAMP: tuple[float, int | None] = (0.0, None)
+# (method, package ID lower) -> exit code of a batched run in this process.
+_BATCH_RESULTS: dict[tuple[str, str], int] = {}
 
-def upgrade_package(package_id: str) -> tuple[int, str]:
-    console.print(f"[cyan]Upgrading Chocolatey package: {package_id}[/cyan]")
 
-    return run_package_manager_command(
-        [
-            "choco",
-            "upgrade",
-            package_id,
-            "-y",
-            # "--no-progress",
-        ],
-        action="Upgrade",
-    )
+def get_install_dir() -> str:
+    """:return: The Chocolatey install directory, '%ChocolateyInstall%' or the default one."""
+    return os.environ.get("ChocolateyInstall", DEFAULT_INSTALL_DIR)
+
+
+def parse_limit_output(text: str) -> dict[str, str | None]:
+    """
+    Parse the output of 'choco list --limit-output': one 'id|version' line per package.
+
+    :param text: Output of the command.
+    :return: Dict of package ID -> version.
+    """
+    packages: dict[str, str | None] = {}
+    for line in text.splitlines():
+        parts: list[str] = line.strip().split("|")
+        if len(parts) < 2 or not parts[0] or " " in parts[0]:
+            continue
+        packages[parts[0]] = parts[1] or None
+    return packages
+
+
+def parse_nuspec(text: str) -> tuple[str, str | None] | None:
+    """
+    Parse the package ID and version of a '.nuspec' file. The namespace of the schema differs between
+    package versions, so the elements are matched by their local name.
+
+    :param text: Content of the '.nuspec' file.
+    :return: (package ID, version), or None if the file has no ID.
+    """
+    try:
+        root = ET.fromstring(text)
+    except ET.ParseError:
+        return None
+
+    values: dict[str, str] = {}
+    for element in root.iter():
+        local_name: str = element.tag.rsplit("}", 1)[-1]
+        if local_name in ("id", "version") and local_name not in values and element.text:
+            values[local_name] = element.text.strip()
+
+    if not values.get("id"):
+        return None
+    return values["id"], values.get("version")
+
+
+def read_lib_packages(lib_dir: str) -> dict[str, str | None] | None:
+    """
+    Read the installed packages from the '.nuspec' files of the Chocolatey 'lib' directory, one pass, no choco process.
+    Package directories without a readable '.nuspec' (e.g. a broken install) are skipped.
+
+    :param lib_dir: Path to the 'lib' directory.
+    :return: Dict of package ID -> version, or None if the directory can't be read.
+    """
+    try:
+        entries = list(os.scandir(lib_dir))
+    except OSError:
+        return None
+
+    packages: dict[str, str | None] = {}
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        nuspec_path: Path = Path(entry.path) / f"{entry.name}.nuspec"
+        try:
+            parsed = parse_nuspec(nuspec_path.read_text(encoding="utf-8-sig"))
+        except OSError:
+            continue
+        if parsed:
+            packages[parsed[0]] = parsed[1]
+    return packages
+
+
+def _run_capture(args: list[str]) -> tuple[int, str]:
+    try:
+        result = subprocess.run(
+            CHOCO_COMMAND + args, capture_output=True, text=True, encoding="utf-8", errors="replace",
+            stdin=subprocess.DEVNULL)
+    except (FileNotFoundError, OSError):
+        return 1, ""
+    return result.returncode, result.stdout
+
+
+def take_snapshot() -> dict[str, str | None] | None:
+    """
+    Read all the installed packages: the 'lib' directory, or one 'choco list' call if it can't be read.
+
+    :return: Dict of package ID -> version, or None if Chocolatey isn't available.
+    """
+    packages = read_lib_packages(str(Path(get_install_dir()) / "lib"))
+    if packages is not None:
+        return packages
+
+    # Chocolatey 1.x lists the remote packages without '--local-only', 2.x removed the option.
+    rc, output = _run_capture(["--version"])
+    if rc != 0:
+        return None
+    args: list[str] = ["list", "--limit-output"]
+    if (parse_version_output(output) or "").startswith(("0.", "1.")):
+        args.append("--local-only")
+
+    rc, output = _run_capture(args)
+    if rc != 0:
+        return None
+    return parse_limit_output(output)
+
+
+def _get_lib_mtime_ns() -> int | None:
+    try:
+        return os.stat(Path(get_install_dir()) / "lib").st_mtime_ns
+    except OSError:
+        return None
+
+
+def _is_snapshot_stale() -> bool:
+    taken_at, lib_mtime_ns = _SNAPSHOT_STAMP
+    return time.monotonic() - taken_at > SNAPSHOT_TTL_SECONDS or _get_lib_mtime_ns() != lib_mtime_ns
+
+
+def get_snapshot(refresh: bool = False) -> dict[str, tuple[str, str | None]]:
+    """
+    :param refresh: Take a new snapshot instead of the cached one.
+    :return: Dict of installed package ID lower -> (package ID, version). Empty if Chocolatey isn't available.
+        The cached snapshot is used until the 'lib' directory changes or 'SNAPSHOT_TTL_SECONDS' pass.
+    """
+    global _SNAPSHOT, _SNAPSHOT_STAMP
+    with _LOCK:
+        if _SNAPSHOT is None or refresh or _is_snapshot_stale():
+            lib_mtime_ns: int | None = _get_lib_mtime_ns()
+            packages = take_snapshot() or {}
+            _SNAPSHOT = {package_id.lower(): (package_id, version) for package_id, version in packages.items()}
+            _SNAPSHOT_STAMP = (time.monotonic(), lib_mtime_ns)
+        return _SNAPSHOT
+
+
+def invalidate_snapshot() -> None:
+    """Drop the cached snapshot and batch results, e.g. after packages were changed outside of this module."""
+    global _SNAPSHOT
+    with _LOCK:
+        _SNAPSHOT = None
+        _BATCH_RESULTS.clear()
+
+
+def is_package_installed(package_id: str) -> bool:
+    """Check in the snapshot of the run if the package is installed (case-insensitive ID)."""
+    return package_id.lower() in get_snapshot()
+
+
+def get_installed_version(package_id: str) -> str | None:
+    """:return: The installed version from the snapshot of the run, None if not installed or unknown."""
+    found = get_snapshot().get(package_id.lower())
+    return found[1] if found else None
+
+
+def _update_snapshot(
+        method: str,
+        package_ids: list[str],
+        rc: int
+) -> None:
+    if rc != 0:
+        return
+    with _LOCK:
+        if _SNAPSHOT is None:
+            return
+        for package_id in package_ids:
+            if method == "uninstall":
+                _SNAPSHOT.pop(package_id.lower(), None)
+            else:
+                # The new version is unknown until the next snapshot.
+                _SNAPSHOT[package_id.lower()] = (package_id, None)
+
+
+def build_command(
+        method: str,
+        package_ids: list[str]
+) -> list[str]:
+    """
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param package_ids: Package IDs, choco accepts several packages in one command.
+    :return: Command list.
+    """
+    return CHOCO_COMMAND + [
+        method,
+        *package_ids,
+        "-y",            # accept all prompts
+        # "--no-progress", # cleaner output (esp. in CI)
+    ]
+
+
+def _method_package(
+        method: str,
+        package_id: str,
+        message: str
+) -> tuple[int, str]:
+    batched_rc: int | None = _BATCH_RESULTS.get((method, package_id.lower()))
+    if batched_rc is not None:
+        console.print(f"[cyan]Chocolatey package: {package_id} was processed in a batch, rc: {batched_rc}[/cyan]")
+        return batched_rc, ""
+
+    console.print(f"[cyan]{message}: {package_id}[/cyan]")
+    rc, output = run_package_manager_command(build_command(method, [package_id]), action=METHOD_ACTIONS[method])
+    _update_snapshot(method, [package_id], rc)
+    return rc, output
+
+
+def install_package(package_id: str) -> tuple[int, str]:
+    return _method_package("install", package_id, "Installing Chocolatey package")
+
+
+def upgrade_package(package_id: str) -> tuple[int, str]:
+    return _method_package("upgrade", package_id, "Upgrading Chocolatey package")
 
 
 def uninstall_package(package_id: str) -> tuple[int, str]:
-    console.print(f"[cyan]Uninstalling Chocolatey package: {package_id}[/cyan]")
-
-    return run_package_manager_command(
-        [
-            "choco",
-            "uninstall",
-            package_id,
-            "-y",
-            # "--no-progress",
-        ],
-        action="Uninstallation",
-    )
+    return _method_package("uninstall", package_id, "Uninstalling Chocolatey package")
+
+
+def plan_batch(
+        method: str,
+        package_ids: list[str],
+        snapshot: dict[str, tuple[str, str | None]]
+) -> tuple[list[str], list[str]]:
+    """
+    Split the packages of a method into already-done ones and the ones to run in one choco command.
+
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param package_ids: Package IDs.
+    :param snapshot: Installed packages, see 'get_snapshot'.
+    :return: (IDs with nothing to do, IDs to run).
+    """
+    unique_ids: list[str] = list(dict.fromkeys(package_ids))
+    if method == "install":
+        skipped = [package_id for package_id in unique_ids if package_id.lower() in snapshot]
+    elif method == "uninstall":
+        skipped = [package_id for package_id in unique_ids if package_id.lower() not in snapshot]
+    else:
+        skipped = []
+    return skipped, [package_id for package_id in unique_ids if package_id not in skipped]
+
+
+def method_packages(
+        method: str,
+        package_ids: list[str]
+) -> dict[str, int]:
+    """
+    Install/upgrade/uninstall several packages with one choco process: packages that are already
+    in the wanted state are skipped by the snapshot, the rest run as one command.
+    The results are kept for the run, so later 'install_package/upgrade_package/uninstall_package'
+    calls of the same IDs return them without running choco.
+
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param package_ids: Package IDs.
+    :return: Dict of package ID -> exit code.
+    """
+    skipped, to_run = plan_batch(method, package_ids, get_snapshot())
+    results: dict[str, int] = {package_id: 0 for package_id in skipped}
+    for package_id in skipped:
+        console.print(f"[cyan]Chocolatey package: {package_id} needs no {method}. Skipping.[/cyan]")
+
+    if to_run:
+        console.print(f"[cyan]{METHOD_ACTIONS[method]} of Chocolatey packages: {', '.join(to_run)}[/cyan]")
+        rc, _ = run_package_manager_command(build_command(method, to_run), action=METHOD_ACTIONS[method])
+        if rc == 0 or len(to_run) == 1:
+            results.update({package_id: rc for package_id in to_run})
+            _update_snapshot(method, to_run, rc)
+        else:
+            # choco fails the whole command if any package failed, find out which packages made it.
+            # The ones in an unknown state get no result, so they are processed again by their own call.
+            snapshot = get_snapshot(refresh=True)
+            for package_id in to_run:
+                installed: bool = package_id.lower() in snapshot
+                if (method == "install" and installed) or (method == "uninstall" and not installed):
+                    results[package_id] = 0
+
+    with _LOCK:
+        for package_id, rc in results.items():
+            _BATCH_RESULTS[(method, package_id.lower())] = rc
+    return results
+
+
+def get_chocolatey_version() -> str | None:
+    """
+    Read the Chocolatey version from the '.nuspec' of the 'chocolatey' package, no choco process.
+    The file is read directly and not from the snapshot, since Chocolatey upgrades itself outside this module.
+
+    :return: Version string, None if the file can't be read.
+    """
+    nuspec_path: Path = Path(get_install_dir()) / "lib" / "chocolatey" / "chocolatey.nuspec"
+    try:
+        parsed = parse_nuspec(nuspec_path.read_text(encoding="utf-8-sig"))
+    except OSError:
+        return None
+    return parsed[1] if parsed else None
+
+
+def parse_version_output(text: str) -> str | None:
+    """:return: The version from 'choco --version' output, which may have warning lines before it."""
+    for line in reversed(text.splitlines()):
+        if re.fullmatch(r"\d+(\.\d+)+\S*", line.strip()):
+            return line.strip()
+    return None
@@ -9,10 +9,16 @@ import textwrap
 
 from rich.console import Console
 
+from . import tracing
+
 
 console = Console()
 
 
+@tracing.traced(
+    "run_command", category="command",
+    attributes=lambda cmd, *args, **kwargs: {"cmd": cmd if isinstance(cmd, str) else shlex.join(cmd)},
+    result_attributes=lambda result: {"rc": result[0]})
 def run_command_stream_and_return_output(
     cmd: list[str] | str,
     stream: bool = True,
@@ -108,6 +114,9 @@ def run_command_stream_and_return_output(
     return returncode, output
 
 
+@tracing.traced(
+    "bash_script", category="command",
+    attributes=lambda script_lines, *args, **kwargs: {"lines": sum(line.count("\n") + 1 for line in script_lines)})
 def execute_bash_script_string(
         script_lines: list[str]
 ):
@@ -0,0 +1,516 @@
+"""
+Streaming downloads with hashing, and download-and-extract without an intermediate archive file.
+
+The SHA-256 of a download is computed from the chunks as they arrive, so there is no second read of the file.
+'download_and_extract' extracts the entries while the archive is downloading, into a staging folder that is
+moved into the target directory once the hash is checked: tar archives with 'tarfile' stream mode, zip archives with a forward-only reader of the local
+file headers (stored and deflated entries, the ones release archives use). A zip that can't be read
+forward (encrypted entries, other compression methods, stored entries with a data descriptor) is downloaded
+to a temporary file and its entries are extracted by several threads instead.
+
+Usage:
+    from .infra import downloads
+
+    result: downloads.DownloadResult = downloads.download_and_extract(url, target_directory)
+    print(result.sha256, result.files)
+"""
+import fnmatch
+import hashlib
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+
+from . import metrics, tracing
+
+
+CHUNK_SIZE: int = 1024 * 1024
+TIMEOUT_SECONDS: int = 60
+EXTRACT_WORKERS: int = 4
+# Prefix of the staging folder that 'download_and_extract' creates in the target directory.
+STAGING_PREFIX: str = ".dkinst_extract_"
+
+GITHUB_LATEST_RELEASE_API_URL: str = "https://api.github.com/repos/{user_name}/{repo_name}/releases/latest"
+
+ARCHIVE_FORMAT_ZIP: str = "zip"
+ARCHIVE_FORMAT_TAR: str = "tar"
+TAR_SUFFIXES: tuple[str, ...] = (".tar", ".tar.gz", ".tgz", ".tar.xz", ".txz", ".tar.bz2", ".tbz2")
+
+_ZIP_LOCAL_HEADER_SIGNATURE: bytes = b"PK\x03\x04"
+_ZIP_DATA_DESCRIPTOR_SIGNATURE: bytes = b"PK\x07\x08"
+_ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_ZIP64_EXTRA_ID: int = 0x0001
+_ZIP_FLAG_ENCRYPTED: int = 0x0001
+_ZIP_FLAG_DATA_DESCRIPTOR: int = 0x0008
+_ZIP_FLAG_UTF8: int = 0x0800
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ChecksumMismatchError(DownloadError):
+    pass
+
+
+class _NotStreamableError(Exception):
+    pass
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    sha256: str
+    size: int
+    # Path of the downloaded file, None if the archive was extracted without one.
+    file_path: str | None = None
+    # Paths of the extracted files.
+    files: list[str] = field(default_factory=list)
+
+
+class _HashingStream:
+    """Read-only file object over the body of a response, that hashes and counts the bytes as they are read."""
+    def __init__(self, response: requests.Response):
+        self._chunks = response.iter_content(CHUNK_SIZE)
+        self._buffer: bytearray = bytearray()
+        self._eof: bool = False
+        self.hash = hashlib.sha256()
+        self.size: int = 0
+
+    def _fill(self, size: int) -> None:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk: bytes | None = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                break
+            self.hash.update(chunk)
+            self.size += len(chunk)
+            self._buffer += chunk
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            self._fill(-1)
+            size = len(self._buffer)
+        elif not self._buffer:
+            # One chunk is enough for the callers that read in blocks.
+            self._fill(1)
+        size = min(size, len(self._buffer))
+        data: bytes = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read_full(self, size: int) -> bytes:
+        """:return: 'size' bytes, fewer only at the end of the body."""
+        self._fill(size)
+        return self.read(size)
+
+    def read_exact(self, size: int) -> bytes:
+        data: bytes = self.read_full(size)
+        if len(data) < size:
+            raise DownloadError("The download ended in the middle of an archive entry.")
+        return data
+
+    def unread(self, data: bytes) -> None:
+        """Put back bytes that were read past the end of an entry."""
+        self._buffer[:0] = data
+
+    def drain(self) -> None:
+        """Read the rest of the body, so the hash covers the whole file."""
+        while self.read(CHUNK_SIZE):
+            pass
+
+
+def get_archive_format(file_name: str) -> str | None:
+    """:return: 'ARCHIVE_FORMAT_ZIP', 'ARCHIVE_FORMAT_TAR' or None, by the file name suffix."""
+    file_name = file_name.lower().split("?", 1)[0]
+    if file_name.endswith(".zip"):
+        return ARCHIVE_FORMAT_ZIP
+    if file_name.endswith(TAR_SUFFIXES):
+        return ARCHIVE_FORMAT_TAR
+    return None
+
+
+def _open_response(
+        url: str,
+        headers: dict[str, str] | None = None
+) -> requests.Response:
+    try:
+        response: requests.Response = requests.get(url, headers=headers, stream=True, timeout=TIMEOUT_SECONDS)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        raise DownloadError(f"Failed to download [{url}]: {e}") from e
+    return response
+
+
+def _check_sha256(
+        sha256: str,
+        expected_sha256: str | None,
+        url: str
+) -> None:
+    if expected_sha256 and sha256.lower() != expected_sha256.lower():
+        raise ChecksumMismatchError(f"SHA-256 of [{url}] is [{sha256}], expected [{expected_sha256}].")
+
+
+def _get_safe_path(
+        target_directory: str,
+        name: str
+) -> str:
+    """:return: Path of an archive entry in the target directory. Absolute paths and '..' aren't allowed."""
+    name = name.replace("\\", "/")
+    parts: list[str] = [part for part in name.split("/") if part not in ("", ".")]
+    if name.startswith("/") or (parts and ":" in parts[0]) or ".." in parts:
+        raise DownloadError(f"Unsafe path in the archive: {name}")
+    return os.path.join(target_directory, *parts)
+
+
+def _read_zip_entry_header(stream: _HashingStream) -> tuple[str, int, int, int, int, bool] | None:
+    """:return: (name, flags, method, crc, compressed size, zip64), None at the central directory."""
+    signature: bytes = stream.read_full(4)
+    if signature != _ZIP_LOCAL_HEADER_SIGNATURE:
+        stream.unread(signature)
+        return None
+
+    (_, _, flags, method, _, _, crc, compressed_size, _, name_length, extra_length) = _ZIP_LOCAL_HEADER.unpack(
+        signature + stream.read_exact(_ZIP_LOCAL_HEADER.size - 4))
+    raw_name: bytes = stream.read_exact(name_length)
+    extra: bytes = stream.read_exact(extra_length)
+    name: str = raw_name.decode("utf-8" if flags & _ZIP_FLAG_UTF8 else "cp437")
+
+    zip64: bool = False
+    offset: int = 0
+    while offset + 4 <= len(extra):
+        header_id, data_size = struct.unpack_from("<HH", extra, offset)
+        if header_id == _ZIP64_EXTRA_ID:
+            zip64 = True
+            if compressed_size == 0xFFFFFFFF and data_size >= 16:
+                # Uncompressed size comes first, then compressed size.
+                compressed_size = struct.unpack_from("<Q", extra, offset + 12)[0]
+        offset += 4 + data_size
+    return name, flags, method, crc, compressed_size, zip64
+
+
+def _extract_zip_stream(
+        stream: _HashingStream,
+        target_directory: str
+) -> list[str]:
+    """
+    Extract a zip archive from a forward-only stream, using the local file headers.
+
+    :raises _NotStreamableError: An entry that can't be extracted without the central directory.
+    """
+    files: list[str] = []
+    while True:
+        header = _read_zip_entry_header(stream)
+        if header is None:
+            break
+        name, flags, method, crc, compressed_size, zip64 = header
+        has_data_descriptor: bool = bool(flags & _ZIP_FLAG_DATA_DESCRIPTOR)
+        if flags & _ZIP_FLAG_ENCRYPTED or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise _NotStreamableError(name)
+        if method == zipfile.ZIP_STORED and has_data_descriptor and compressed_size == 0:
+            # The end of a stored entry is known only from the central directory.
+            raise _NotStreamableError(name)
+
+        entry_path: str = _get_safe_path(target_directory, name)
+        is_directory: bool = name.endswith(("/", "\\"))
+        if is_directory:
+            os.makedirs(entry_path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        actual_crc: int = 0
+        # Directory entries can have data too, like an empty deflate stream, it is read and dropped.
+        with open(os.devnull if is_directory else entry_path, "wb") as f:
+            if method == zipfile.ZIP_DEFLATED:
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                while not decompressor.eof:
+                    chunk: bytes = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        raise DownloadError(f"The download ended in the middle of [{name}].")
+                    data: bytes = decompressor.decompress(chunk)
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    f.write(data)
+                # The deflate stream knows its end, the rest belongs to the next header.
+                stream.unread(decompressor.unused_data)
+            else:
+                remaining: int = compressed_size
+                while remaining:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise DownloadError(f"The download ended in the middle of [{name}].")
+                    actual_crc = zlib.crc32(chunk, actual_crc)
+                    f.write(chunk)
+                    remaining -= len(chunk)
+        if not is_directory:
+            files.append(entry_path)
+
+        if has_data_descriptor:
+            signature: bytes = stream.read_exact(4)
+            if signature == _ZIP_DATA_DESCRIPTOR_SIGNATURE:
+                signature = stream.read_exact(4)
+            crc = struct.unpack("<I", signature)[0]
+            stream.read_exact(16 if zip64 else 8)
+        if actual_crc != crc:
+            raise DownloadError(f"CRC mismatch of [{name}] in the archive.")
+
+    # Central directory, it repeats the headers that were already read.
+    stream.drain()
+    return files
+
+
+def _extract_tar_stream(
+        stream: _HashingStream,
+        target_directory: str
+) -> list[str]:
+    files: list[str] = []
+    with tarfile.open(fileobj=stream, mode="r|*") as tar:
+        for member in tar:
+            tar.extract(member, target_directory, filter="data")
+            if member.isfile():
+                files.append(_get_safe_path(target_directory, member.name))
+    stream.drain()
+    return files
+
+
+def _extract_zip_members(
+        archive_path: str,
+        names: list[str],
+        target_directory: str
+) -> None:
+    # Each thread has its own handle, 'ZipFile' reads aren't shared between threads.
+    with zipfile.ZipFile(archive_path) as archive:
+        for name in names:
+            archive.extract(name, target_directory)
+
+
+def extract_zip_parallel(
+        archive_path: str,
+        target_directory: str,
+        workers: int = EXTRACT_WORKERS
+) -> list[str]:
+    """
+    Extract a zip archive file with several threads, the entries are split between them by size.
+
+    :param archive_path: Path of the zip file.
+    :param target_directory: Directory to extract to.
+    :param workers: Number of threads.
+    :return: Paths of the extracted files.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        members: list[zipfile.ZipInfo] = archive.infolist()
+
+    file_members: list[zipfile.ZipInfo] = sorted(
+        (member for member in members if not member.is_dir()), key=lambda member: member.file_size, reverse=True)
+    for member in members:
+        if member.is_dir():
+            os.makedirs(_get_safe_path(target_directory, member.filename), exist_ok=True)
+
+    # Largest first, each to the least loaded worker.
+    groups: list[list[str]] = [[] for _ in range(max(1, min(workers, len(file_members))))]
+    loads: list[int] = [0] * len(groups)
+    for member in file_members:
+        index: int = loads.index(min(loads))
+        groups[index].append(member.filename)
+        loads[index] += member.file_size
+
+    with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="dkinst-unzip") as executor:
+        for future in [
+                executor.submit(_extract_zip_members, archive_path, names, target_directory) for names in groups]:
+            future.result()
+    return [_get_safe_path(target_directory, member.filename) for member in file_members]
+
+
+@tracing.traced(
+    "download", category="network",
+    attributes=lambda url, *args, **kwargs: {"url": url},
+    result_attributes=lambda result: {"bytes": result.size})
+def download(
+        url: str,
+        target_directory: str,
+        file_name: str | None = None,
+        expected_sha256: str | None = None,
+        headers: dict[str, str] | None = None
+) -> DownloadResult:
+    """
+    Download a file, computing its SHA-256 while it is written.
+
+    :param url: File URL.
+    :param target_directory: Directory to download to.
+    :param file_name: File name, default is the last part of the URL.
+    :param expected_sha256: If set, the file is removed and 'ChecksumMismatchError' is raised on a different hash.
+    :param headers: Optional HTTP headers, like 'User-Agent'.
+    :return: DownloadResult with the 'file_path'.
+    """
+    file_name = file_name or os.path.basename(url.split("?", 1)[0])
+    file_path: str = os.path.join(target_directory, file_name)
+    os.makedirs(target_directory, exist_ok=True)
+
+    with _open_response(url, headers) as response:
+        stream = _HashingStream(response)
+        try:
+            with open(file_path, "wb") as f:
+                while chunk := stream.read(CHUNK_SIZE):
+                    f.write(chunk)
+        except requests.RequestException as e:
+            raise DownloadError(f"Failed to download [{url}]: {e}") from e
+
+    metrics.add_download_bytes(stream.size)
+    result = DownloadResult(url=url, sha256=stream.hash.hexdigest(), size=stream.size, file_path=file_path)
+    try:
+        _check_sha256(result.sha256, expected_sha256, url)
+    except ChecksumMismatchError:
+        os.remove(file_path)
+        raise
+    return result
+
+
+@tracing.traced(
+    "download_and_extract", category="network",
+    attributes=lambda url, *args, **kwargs: {"url": url},
+    result_attributes=lambda result: {"bytes": result.size, "files": len(result.files)})
+def download_and_extract(
+        url: str,
+        target_directory: str,
+        archive_format: str | None = None,
+        expected_sha256: str | None = None
+) -> DownloadResult:
+    """
+    Download a zip or tar archive and extract it while it downloads.
+    The archive is extracted into a staging folder inside the target directory, and its files are moved into
+    the target directory only after the SHA-256 of the download was checked. On any error the staging folder
+    is removed, the target directory never gets files of a partial or mismatching download.
+
+    :param url: Archive URL.
+    :param target_directory: Directory to extract to.
+    :param archive_format: 'ARCHIVE_FORMAT_ZIP' or 'ARCHIVE_FORMAT_TAR', default is by the URL suffix.
+    :param expected_sha256: SHA-256 of the archive. The hash is known only at the end of the download,
+        on a mismatch 'ChecksumMismatchError' is raised and nothing is extracted.
+    :return: DownloadResult with the extracted 'files'.
+    """
+    archive_format = archive_format or get_archive_format(url)
+    if archive_format not in (ARCHIVE_FORMAT_ZIP, ARCHIVE_FORMAT_TAR):
+        raise DownloadError(f"Can't extract [{url}] while downloading, only zip and tar archives are supported.")
+    os.makedirs(target_directory, exist_ok=True)
+
+    # Inside the target directory, so the files are moved with renames on the same volume.
+    staging_directory: str = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=target_directory)
+    try:
+        files: list[str] = []
+        streamed: bool = True
+        with _open_response(url) as response:
+            stream = _HashingStream(response)
+            try:
+                if archive_format == ARCHIVE_FORMAT_TAR:
+                    files = _extract_tar_stream(stream, staging_directory)
+                else:
+                    files = _extract_zip_stream(stream, staging_directory)
+            except _NotStreamableError:
+                streamed = False
+            except (requests.RequestException, tarfile.TarError, zlib.error, struct.error) as e:
+                raise DownloadError(f"Failed to download and extract [{url}]: {e}") from e
+        metrics.add_download_bytes(stream.size)
+
+        if streamed:
+            result = DownloadResult(url=url, sha256=stream.hash.hexdigest(), size=stream.size, files=files)
+        else:
+            # A zip entry that can't be read forward, the archive is downloaded again to a file.
+            # The entries that were already extracted are dropped, the fallback starts from an empty staging folder.
+            shutil.rmtree(staging_directory)
+            os.makedirs(staging_directory)
+            temp_directory: str = tempfile.mkdtemp(prefix="dkinst_download_")
+            try:
+                result = download(url, temp_directory)
+                _check_sha256(result.sha256, expected_sha256, url)
+                try:
+                    result.files = extract_zip_parallel(result.file_path, staging_directory)
+                except zipfile.BadZipFile as e:
+                    raise DownloadError(f"Failed to extract [{url}]: {e}") from e
+                result.file_path = None
+            finally:
+                shutil.rmtree(temp_directory, ignore_errors=True)
+
+        _check_sha256(result.sha256, expected_sha256, url)
+        result.files = _move_staged_files(staging_directory, target_directory, result.files)
+    finally:
+        shutil.rmtree(staging_directory, ignore_errors=True)
+    return result
+
+
+def _move_staged_files(
+        staging_directory: str,
+        target_directory: str,
+        files: list[str]
+) -> list[str]:
+    """
+    Move the content of the staging folder into the target directory, replacing the existing files.
+
+    :return: Paths of the extracted files in the target directory.
+    """
+    for directory_path, directory_names, file_names in os.walk(staging_directory):
+        destination_directory: str = os.path.join(
+            target_directory, os.path.relpath(directory_path, staging_directory))
+        for directory_name in directory_names:
+            os.makedirs(os.path.join(destination_directory, directory_name), exist_ok=True)
+        for file_name in file_names:
+            os.replace(os.path.join(directory_path, file_name), os.path.join(destination_directory, file_name))
+    return [
+        os.path.normpath(os.path.join(target_directory, os.path.relpath(file_path, staging_directory)))
+        for file_path in files]
+
+
+def get_github_release_asset(
+        user_name: str,
+        repo_name: str,
+        asset_pattern: str
+) -> tuple[str, str | None]:
+    """
+    Find an asset of the latest GitHub release.
+
+    :param user_name: GitHub user or organization.
+    :param repo_name: Repository name.
+    :param asset_pattern: Glob pattern of the asset name, like '*Dependencies.zip'.
+    :return: (download URL, SHA-256 from the asset digest or None if GitHub didn't publish one).
+    """
+    api_url: str = GITHUB_LATEST_RELEASE_API_URL.format(user_name=user_name, repo_name=repo_name)
+    headers: dict[str, str] = {"Accept": "application/vnd.github+json"}
+    if os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+    try:
+        response: requests.Response = requests.get(api_url, headers=headers, timeout=TIMEOUT_SECONDS)
+        response.raise_for_status()
+        assets: list[dict] = response.json().get("assets", [])
+    except (requests.RequestException, ValueError) as e:
+        raise DownloadError(f"Failed to get the latest release of [{user_name}/{repo_name}]: {e}") from e
+
+    for asset in assets:
+        if fnmatch.fnmatch(asset.get("name", ""), asset_pattern):
+            digest: str = asset.get("digest") or ""
+            sha256: str | None = digest.split(":", 1)[1] if digest.startswith("sha256:") else None
+            return asset["browser_download_url"], sha256
+    raise DownloadError(f"No asset matches [{asset_pattern}] in the latest release of [{user_name}/{repo_name}].")
+
+
+def download_and_extract_github_release(
+        user_name: str,
+        repo_name: str,
+        asset_pattern: str,
+        target_directory: str
+) -> DownloadResult:
+    """
+    'download_and_extract' of an asset of the latest GitHub release, checked against the asset digest.
+
+    :param user_name: GitHub user or organization.
+    :param repo_name: Repository name.
+    :param asset_pattern: Glob pattern of the asset name.
+    :param target_directory: Directory to extract to.
+    :return: DownloadResult with the extracted 'files'.
+    """
+    url, sha256 = get_github_release_asset(user_name, repo_name, asset_pattern)
+    return download_and_extract(url, target_directory, expected_sha256=sha256)
@@ -0,0 +1,156 @@
+"""
+Process-wide index of the executables on PATH, a drop-in replacement of 'shutil.which' for bare command names.
+
+'shutil.which' stats every PATH directory (times every PATHEXT extension on Windows) on each call.
+The index lists each PATH directory once with 'os.scandir', and answers the lookups from memory.
+A directory is listed again when its mtime changes (an executable was added or removed), and the directory
+list is rebuilt when 'os.environ["PATH"]' changes, like after git's install appends its directories.
+The mtimes are checked at most once per 'VALIDATE_INTERVAL_SECONDS', so a status probe over many installers
+pays for one PATH scan.
+
+Usage:
+    from .infra import executables
+
+    git_path: str | None = executables.which("git")
+"""
+import os
+import shutil
+import threading
+import time
+
+
+VALIDATE_INTERVAL_SECONDS: float = 1.0
+
+
+class _DirectoryEntries:
+    def __init__(self, path: str):
+        self.path: str = path
+        self.mtime_ns: int | None = None
+        # Lookup name (lower-case on Windows) -> file name.
+        self.names: dict[str, str] = {}
+
+    def refresh(self) -> None:
+        """List the directory again if its mtime changed."""
+        try:
+            mtime_ns: int | None = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns is not None and mtime_ns == self.mtime_ns:
+            return
+
+        # A new dict is assigned, so concurrent lookups never see a half-filled listing.
+        names: dict[str, str] = {}
+        if mtime_ns is not None:
+            try:
+                with os.scandir(self.path) as entries:
+                    for entry in entries:
+                        names.setdefault(_get_key(entry.name), entry.name)
+            except OSError:
+                names = {}
+        self.names = names
+        self.mtime_ns = mtime_ns
+
+
+class ExecutableIndex:
+    """
+    Index of the executables in the directories of a PATH string.
+
+    :param path_getter: Callable that returns the current PATH, default is 'os.environ["PATH"]'.
+    """
+    def __init__(self, path_getter=None):
+        self._path_getter = path_getter or (lambda: os.environ.get("PATH", os.defpath))
+        self._lock = threading.Lock()
+        self._path_value: str | None = None
+        self._directories: list[_DirectoryEntries] = []
+        self._cache: dict[str, _DirectoryEntries] = {}
+        self._validated_at: float = 0.0
+
+    def invalidate(self) -> None:
+        """Forget all the listings, the next lookup scans PATH again."""
+        with self._lock:
+            self._path_value = None
+            self._directories = []
+            self._cache = {}
+            self._validated_at = 0.0
+
+    def _sync(self) -> None:
+        path_value: str = self._path_getter()
+        now: float = time.monotonic()
+        if path_value == self._path_value and now - self._validated_at < VALIDATE_INTERVAL_SECONDS:
+            return
+
+        if path_value != self._path_value:
+            directories: list[_DirectoryEntries] = []
+            seen: set[str] = set()
+            for directory in path_value.split(os.pathsep):
+                directory = directory.strip('"')
+                if not directory:
+                    continue
+                key: str = os.path.normcase(os.path.abspath(directory))
+                if key in seen:
+                    continue
+                seen.add(key)
+                # Listings of directories that stay on PATH are reused.
+                directories.append(self._cache.get(key) or _DirectoryEntries(directory))
+                self._cache[key] = directories[-1]
+            self._directories = directories
+            self._path_value = path_value
+
+        for directory_entries in self._directories:
+            directory_entries.refresh()
+        self._validated_at = now
+
+    def which(self, name: str) -> str | None:
+        """
+        :param name: Command name, like 'git'. On Windows the PATHEXT extensions are tried, unless the name has one.
+        :return: Full path of the first matching executable on PATH, None if not found.
+        """
+        if os.path.dirname(name):
+            return shutil.which(name)
+
+        candidates: list[str] = _get_candidates(name)
+        with self._lock:
+            self._sync()
+            directories: list[_DirectoryEntries] = list(self._directories)
+
+        for directory_entries in directories:
+            for candidate in candidates:
+                file_name: str | None = directory_entries.names.get(_get_key(candidate))
+                if file_name is None:
+                    continue
+                file_path: str = os.path.join(directory_entries.path, file_name)
+                if _is_executable(file_path):
+                    return file_path
+        return None
+
+
+def _get_key(name: str) -> str:
+    return name.lower() if os.name == "nt" else name
+
+
+def _get_candidates(name: str) -> list[str]:
+    if os.name != "nt":
+        return [name]
+
+    extensions: list[str] = [ext for ext in os.environ.get("PATHEXT", ".COM;.EXE;.BAT;.CMD").split(os.pathsep) if ext]
+    if any(name.lower().endswith(ext.lower()) for ext in extensions):
+        return [name]
+    return [name + ext for ext in extensions]
+
+
+def _is_executable(file_path: str) -> bool:
+    return os.path.exists(file_path) and not os.path.isdir(file_path) and (
+        os.name == "nt" or os.access(file_path, os.X_OK))
+
+
+_INDEX = ExecutableIndex()
+
+
+def which(name: str) -> str | None:
+    """'shutil.which' answered from the process-wide index, see the module docstring."""
+    return _INDEX.which(name)
+
+
+def invalidate() -> None:
+    """Forget the process-wide index, e.g. after an installer added executables to a directory on PATH."""
+    _INDEX.invalidate()
@@ -1,18 +1,216 @@
+"""
+File search in directory trees.
+
+'find_files' walks the tree with 'os.scandir' in one pass for several names/glob patterns, with early exit,
+depth limit, excluded directories and optional parallel traversal of the top-level subtrees.
+'find_file_cached' keeps the found paths of large install roots (like 'C:\\dkinst' or vcpkg trees) in a JSON
+index, so repeat lookups only check that the indexed file still exists.
+"""
+import fnmatch
+import json
 import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+FIND_INDEX_FILE: str = str(Path.home() / ".dkinst" / "find_index.json")
+
+_INDEX_LOCK = threading.Lock()
+
+
+def _normcase(name: str) -> str:
+    return name.lower() if os.name == "nt" else name
+
+
+def _compile_patterns(patterns: list[str]):
+    """
+    :return: Callable(name) -> bool, that matches the exact names with a set and the glob patterns with one regex.
+    """
+    exact_names: set[str] = {_normcase(pattern) for pattern in patterns if not any(c in pattern for c in "*?[")}
+    globs: list[str] = [_normcase(pattern) for pattern in patterns if any(c in pattern for c in "*?[")]
+    glob_regex = re.compile("|".join(fnmatch.translate(pattern) for pattern in globs)) if globs else None
+
+    def matches(name: str) -> bool:
+        name = _normcase(name)
+        return name in exact_names or (glob_regex is not None and glob_regex.match(name) is not None)
+    return matches
+
+
+def _walk(
+        directory_path: str,
+        matches,
+        is_excluded,
+        max_depth: int | None,
+        first_only: bool,
+        start_depth: int = 0,
+        stop: threading.Event | None = None
+) -> list[str]:
+    """
+    Depth-first walk in the order of 'os.walk': the files of a directory are checked before its subdirectories.
+    Symbolic links to directories are not followed. The walk is abandoned when 'stop' is set.
+    """
+    found: list[str] = []
+    stack: list[tuple[str, int]] = [(directory_path, start_depth)]
+    while stack:
+        if stop is not None and stop.is_set():
+            break
+        current_path, depth = stack.pop()
+        subdirectories: list[str] = []
+        try:
+            with os.scandir(current_path) as entries:
+                for entry in entries:
+                    try:
+                        is_directory: bool = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_directory:
+                        if not entry.is_symlink() and not is_excluded(entry.name):
+                            subdirectories.append(entry.path)
+                    elif matches(entry.name):
+                        found.append(entry.path)
+                        if first_only:
+                            return found
+        except OSError:
+            continue
+
+        if max_depth is None or depth < max_depth:
+            stack.extend((subdirectory, depth + 1) for subdirectory in reversed(subdirectories))
+    return found
+
+
+def find_files(
+        directory_path: str,
+        patterns: list[str],
+        max_depth: int | None = None,
+        exclude_dirs: list[str] | None = None,
+        first_only: bool = False,
+        workers: int = 1
+) -> list[str]:
+    """
+    Find files in the directory recursively, in one pass for all the patterns.
+
+    :param directory_path: The directory to search in.
+    :param patterns: File names or glob patterns, like ['tesseract.exe', 'libtesseract*.dll'].
+        Case-insensitive on Windows.
+    :param max_depth: Maximum depth of subdirectories to search, 0 for the directory itself only. None is unlimited.
+    :param exclude_dirs: Directory names or glob patterns to skip with all their content, like ['.git', 'buildtrees'].
+    :param first_only: Stop on the first found file.
+    :param workers: Number of threads that walk the top-level subtrees in parallel. The result order stays
+        the same as of the sequential walk.
+    :return: List of the found file paths.
+    """
+    matches = _compile_patterns(patterns)
+    is_excluded = _compile_patterns(exclude_dirs) if exclude_dirs else (lambda name: False)
+
+    if workers <= 1 or max_depth == 0:
+        return _walk(directory_path, matches, is_excluded, max_depth, first_only)
+
+    # Walk the top level here, the subtrees in the threads.
+    found: list[str] = _walk(directory_path, matches, is_excluded, 0, first_only)
+    if found and first_only:
+        return found
+    try:
+        with os.scandir(directory_path) as entries:
+            subdirectories: list[str] = [
+                entry.path for entry in entries
+                if entry.is_dir() and not entry.is_symlink() and not is_excluded(entry.name)]
+    except OSError:
+        return found
+
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dkinst-find")
+    try:
+        futures = [
+            executor.submit(_walk, subdirectory, matches, is_excluded, max_depth, first_only, 1, stop)
+            for subdirectory in subdirectories]
+        # Collected in the subtree order, so the first found file is the same as of the sequential walk.
+        for future in futures:
+            found.extend(future.result())
+            if found and first_only:
+                return found[:1]
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return found
 
 
 def find_file(
         file_name: str,
-        directory_path: str
-):
+        directory_path: str,
+        max_depth: int | None = None,
+        exclude_dirs: list[str] | None = None
+) -> str | None:
     """
     The function finds the file in the directory recursively.
-    :param file_name: string, The name of the file to find.
+    :param file_name: string, The name of the file to find (glob patterns are supported).
     :param directory_path: string, The directory to search in.
-    :return:
+    :param max_depth: int, Maximum depth of subdirectories to search, None is unlimited.
+    :param exclude_dirs: list, Directory names or glob patterns to skip.
+    :return: The path of the first found file, None if not found.
+    """
+    found: list[str] = find_files(
+        directory_path, [file_name], max_depth=max_depth, exclude_dirs=exclude_dirs, first_only=True)
+    return found[0] if found else None
+
+
+def _load_index(index_file: str) -> dict:
+    try:
+        with open(index_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_index(index_file: str, data: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_file), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, index_file)
+    except OSError:
+        pass
+
+
+def find_file_cached(
+        file_name: str,
+        directory_path: str,
+        max_depth: int | None = None,
+        exclude_dirs: list[str] | None = None,
+        index_file: str | None = None
+) -> str | None:
     """
-    for dir_path, dir_names, filenames in os.walk(directory_path):
-        for filename in filenames:
-            if filename == file_name:
-                return os.path.join(dir_path, filename)
-    return None
\ No newline at end of file
+    'find_file' with a persisted index: a path found before is returned if the file still exists,
+    without walking the tree. A miss or a gone file walks the tree and updates the index.
+    Use it for repeat lookups in large install roots.
+
+    :param file_name: The name of the file to find (glob patterns are supported).
+    :param directory_path: The directory to search in.
+    :param max_depth: Maximum depth of subdirectories to search, None is unlimited.
+    :param exclude_dirs: Directory names or glob patterns to skip.
+    :param index_file: Path of the JSON index. Default is 'FIND_INDEX_FILE'.
+    :return: The path of the first found file, None if not found.
+    """
+    index_file = index_file or FIND_INDEX_FILE
+    key: str = "|".join([
+        _normcase(os.path.abspath(directory_path)), _normcase(file_name), str(max_depth),
+        ",".join(exclude_dirs or [])])
+
+    with _INDEX_LOCK:
+        indexed_path: str | None = _load_index(index_file).get(key)
+    if indexed_path and os.path.isfile(indexed_path):
+        return indexed_path
+
+    found: str | None = find_file(file_name, directory_path, max_depth=max_depth, exclude_dirs=exclude_dirs)
+    with _INDEX_LOCK:
+        data: dict = _load_index(index_file)
+        if found:
+            data[key] = found
+        else:
+            data.pop(key, None)
+        _save_index(index_file, data)
+    return found
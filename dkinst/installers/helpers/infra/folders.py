@@ -1,15 +1,132 @@
+"""
+Cleanup of empty portable installation folders.
+
+Installers that run during the process register their folders with 'track'. The cleanup checks only those,
+and lists the whole portable root only when its mtime differs from the one cached after the last cleanup
+(a folder was added or removed by something else, like a crashed run), so unchanged roots are not re-listed
+on every invocation.
+"""
+import json
 import os
+import tempfile
+import threading
+from pathlib import Path
 
 from ... import _base
 
 
+CLEANUP_STATE_FILE: str = str(Path.home() / ".dkinst" / "portable_cleanup.json")
+
+
+_LOCK = threading.Lock()
+_TRACKED: set[str] = set()
+
+
+def track(path: str | None) -> None:
+    """
+    Register a folder that dkinst created or touched in this run, the next cleanup checks it.
+
+    :param path: Folder path, like 'BaseInstaller.dir_path'. None is ignored.
+    """
+    if not path:
+        return
+    with _LOCK:
+        _TRACKED.add(os.path.abspath(path))
+
+
+def _is_empty_dir(path: str) -> bool:
+    try:
+        with os.scandir(path) as entries:
+            return next(entries, None) is None
+    except OSError:
+        return False
+
+
+def _remove_if_empty(path: str) -> None:
+    if _is_empty_dir(path):
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+
+def _get_root_mtime(root: str) -> int | None:
+    try:
+        return os.stat(root).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_cached_mtime(root: str, state_file: str) -> int | None:
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("root") != root:
+        return None
+    return data.get("mtime_ns")
+
+
+def _save_cached_mtime(root: str, mtime_ns: int | None, state_file: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(state_file), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"root": root, "mtime_ns": mtime_ns}, f)
+        os.replace(tmp_path, state_file)
+    except OSError:
+        pass
+
+
+def cleanup_empty_folders(
+        root: str,
+        full_scan: bool = False,
+        state_file: str | None = None
+) -> None:
+    """
+    Remove the empty tracked folders that are directly in the root, then the other empty folders of the root
+    if the root changed since the last cleanup.
+
+    :param root: Portable installation root.
+    :param full_scan: List the root even if its mtime didn't change.
+    :param state_file: Path of the cached root mtime. Default is 'CLEANUP_STATE_FILE'.
+    """
+    state_file = state_file or CLEANUP_STATE_FILE
+    with _LOCK:
+        tracked: list[str] = sorted(_TRACKED)
+        _TRACKED.clear()
+
+    root_mtime: int | None = _get_root_mtime(root)
+    if root_mtime is None:
+        return
+    unchanged: bool = not full_scan and _load_cached_mtime(root, state_file) == root_mtime
+
+    root_key: str = os.path.normcase(os.path.abspath(root))
+    for path in tracked:
+        if os.path.normcase(os.path.dirname(path)) == root_key:
+            _remove_if_empty(path)
+
+    if not unchanged:
+        try:
+            with os.scandir(root) as entries:
+                subdirectories: list[str] = [
+                    entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for path in subdirectories:
+            _remove_if_empty(path)
+
+    # Removing the tracked folders changes the mtime too, it's cached so the next run doesn't list the root.
+    new_mtime: int | None = _get_root_mtime(root)
+    if new_mtime != _load_cached_mtime(root, state_file):
+        _save_cached_mtime(root, new_mtime, state_file)
+
+
 def remove_empty_portable_folders() -> None:
     """Remove empty portable installation folders."""
     if os.name == 'nt':
-        path_to_check: str = _base.INSTALLATION_PATH_PORTABLE_WINDOWS
-        # Get folders in the config path.
-        if os.path.exists(path_to_check):
-            for item in os.listdir(path_to_check):
-                item_path: str = os.path.join(path_to_check, item)
-                if os.path.isdir(item_path) and not os.listdir(item_path):
-                    os.rmdir(item_path)
\ No newline at end of file
+        cleanup_empty_folders(_base.INSTALLATION_PATH_PORTABLE_WINDOWS)
+    else:
+        with _LOCK:
+            _TRACKED.clear()
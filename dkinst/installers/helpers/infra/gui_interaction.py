@@ -135,6 +135,8 @@ def click_button(
         - If pid is provided, we try pid-scoped search first.
         - If relax_pid_after is not None, after that many seconds we retry with pid=None
           (useful when installers spawn a separate UI process).
+        - For multi-step installer wizards, prefer 'gui_wizard.run_wizard', which runs all the steps
+          against one shared control index and reports per-step latency.
 
 
     Example Implementation:
@@ -0,0 +1,513 @@
+import re
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Literal, Optional, Protocol
+
+from .gui_interaction import TitleType, _normalize, _window_title_matches
+
+if os.name == "nt":
+    from pywinauto import Desktop
+
+
+"""
+==============================================
+Declarative GUI installer wizard automation.
+
+Instead of a hand-written chain of 'gui_interaction.click_button' calls (each with its own timeout
+and its own full desktop walk), the wizard is described as an ordered list of steps:
+    (window match, control, action, expected next state)
+The engine polls one shared control index per tick, so finding the control of the current step,
+checking the expected state of the previous step and looking for unexpected dialogs all cost
+a single window enumeration.
+
+Usage example:
+steps = [
+    gui_wizard.WizardStep("I Agree", window="Npcap", timeout=60.0),
+    gui_wizard.WizardStep("Install", window="Npcap", timeout=60.0),
+    gui_wizard.WizardStep("Next", window="Npcap", timeout=240.0),
+    gui_wizard.WizardStep("Finish", window="Npcap", timeout=300.0, expect=gui_wizard.WINDOW_CLOSED),
+]
+
+proc = subprocess.Popen([installer_path])
+try:
+    results = gui_wizard.run_wizard(
+        steps,
+        pid=proc.pid,
+        fail_on=[re.compile(r"error|warning", re.IGNORECASE)],
+        process_alive=lambda: proc.poll() is None,
+    )
+except gui_wizard.WizardError as e:
+    subprocess.run(["taskkill", "/PID", str(proc.pid), "/T", "/F"], capture_output=True, text=True)
+    raise RuntimeError(str(e)) from e
+
+gui_wizard.print_results(results)
+"""
+
+
+# Special 'expect' value: the window that the step acted on must disappear after the action.
+WINDOW_CLOSED: str = "<window-closed>"
+
+# Control types that the engine can act on, in the order they are preferred on exact name match.
+ACTIONABLE_CONTROL_TYPES: tuple[str, ...] = ("Button", "CheckBox", "RadioButton")
+
+
+class WizardError(Exception):
+    def __init__(self, message: str, step_index: int | None = None, results: list | None = None):
+        super().__init__(message)
+        # Index of the step that failed, None if the failure isn't bound to a step.
+        self.step_index: int | None = step_index
+        # Results of the steps that completed before the failure.
+        self.results: list[StepResult] = results or []
+
+
+class UnexpectedDialogError(WizardError):
+    pass
+
+
+@dataclass
+class ControlRecord:
+    name: str
+    control_type: str
+    visible: bool = True
+    enabled: bool = True
+    # Backend specific object (pywinauto wrapper, simulated control, etc.).
+    handle: object = None
+
+
+@dataclass
+class WindowRecord:
+    title: str
+    pid: int | None
+    controls: list[ControlRecord] = field(default_factory=list)
+    # Backend specific object (pywinauto wrapper, simulated window, etc.).
+    handle: object = None
+
+
+@dataclass
+class WizardStep:
+    # Text of the control to act on (Button/CheckBox/RadioButton). Matching is normalized: '&' accelerators,
+    # extra whitespace and case are ignored.
+    control: str
+    # Window title (str or compiled regex) the control must belong to. None matches any window.
+    window: Optional[TitleType] = None
+    window_partial: bool = True
+    # 'click': click the control.
+    # 'check': click the control only if it isn't already checked (CheckBox/RadioButton).
+    # 'wait': only wait for the control to become visible+enabled, don't act on it.
+    action: Literal["click", "check", "wait"] = "click"
+    # Expected state after the action:
+    #   None           - no check, the next step will wait for its own control.
+    #   <control text> - a control with this text must appear in the same window (the next wizard page).
+    #   WINDOW_CLOSED  - the window that was acted on must disappear.
+    expect: Optional[str] = None
+    # Seconds to wait for the control to become visible+enabled.
+    timeout: float = 60.0
+    # Seconds to wait for the 'expect' state after the action.
+    expect_timeout: float = 30.0
+
+
+@dataclass
+class StepResult:
+    index: int
+    step: WizardStep
+    window_title: str
+    # Seconds from the step start until the control was found.
+    find_seconds: float
+    # Seconds spent in the action itself.
+    action_seconds: float
+    # Seconds spent waiting for the 'expect' state.
+    expect_seconds: float
+    # Number of control index refreshes (desktop enumerations) that the step needed.
+    polls: int
+
+    @property
+    def latency(self) -> float:
+        return self.find_seconds + self.action_seconds + self.expect_seconds
+
+
+class WizardBackend(Protocol):
+    def snapshot(
+            self,
+            pid: int | None,
+            control_scope: Callable[[WindowRecord], bool] | None = None
+    ) -> list[WindowRecord]:
+        """
+        Return the current top-level windows with their actionable controls. pid=None means all processes.
+        The controls are collected only for the windows that 'control_scope' accepts (by title and pid),
+        the other windows are returned without controls. None collects the controls of all the windows.
+        """
+        ...
+
+    def perform(self, window: WindowRecord, control: ControlRecord, action: str) -> bool:
+        """Perform 'click' or 'check' on the control. Return False if the action failed."""
+        ...
+
+
+class ControlIndex:
+    """
+    Index of all actionable controls from one backend snapshot.
+    Built once per poll tick and shared by every lookup in that tick.
+    """
+    def __init__(self, windows: list[WindowRecord]):
+        self.windows: list[WindowRecord] = windows
+        # normalized control name -> [(window, control), ...]
+        self._by_name: dict[str, list[tuple[WindowRecord, ControlRecord]]] = {}
+
+        for window in windows:
+            for control in window.controls:
+                if not (control.visible and control.enabled):
+                    continue
+                self._by_name.setdefault(_normalize(control.name), []).append((window, control))
+
+    def find(
+            self,
+            control_text: str,
+            window_title: Optional[TitleType] = None,
+            window_partial: bool = True,
+    ) -> tuple[WindowRecord, ControlRecord] | None:
+        """
+        Find a visible+enabled control, using the same preference order as 'gui_interaction.find_button':
+        exact name match by control type, then partial name match on Buttons.
+        """
+        target = _normalize(control_text)
+
+        exact = [
+            (w, c) for w, c in self._by_name.get(target, [])
+            if _window_title_matches(w.title, window_title, partial=window_partial)
+        ]
+        for control_type in ACTIONABLE_CONTROL_TYPES:
+            for w, c in exact:
+                if c.control_type == control_type:
+                    return w, c
+
+        for name, pairs in self._by_name.items():
+            if target not in name:
+                continue
+            for w, c in pairs:
+                if c.control_type == "Button" and _window_title_matches(w.title, window_title, partial=window_partial):
+                    return w, c
+
+        return None
+
+    def has_window(self, window: WindowRecord) -> bool:
+        """Check if the window is still present, by backend handle if available, otherwise by title and pid."""
+        for w in self.windows:
+            if window.handle is not None and w.handle is not None:
+                if w.handle == window.handle:
+                    return True
+            elif w.title == window.title and w.pid == window.pid:
+                return True
+        return False
+
+    def find_window(self, patterns: list[TitleType]) -> WindowRecord | None:
+        """Return the first window whose title matches any of the patterns (partial match for strings)."""
+        for w in self.windows:
+            for pattern in patterns:
+                if _window_title_matches(w.title, pattern, partial=True):
+                    return w
+        return None
+
+
+class PywinautoBackend:
+    """
+    Windows backend: one UIA enumeration per snapshot.
+    The Win32 backend is the fallback, like in 'gui_interaction.find_button': it is used when the UIA
+    enumeration fails, and for the scoped windows where UIA found no actionable control.
+    """
+    def __init__(self):
+        self._desktop = Desktop(backend="uia")
+        self._win32_desktop = None
+
+    def snapshot(
+            self,
+            pid: int | None,
+            control_scope: Callable[[WindowRecord], bool] | None = None
+    ) -> list[WindowRecord]:
+        try:
+            top_windows = self._desktop.windows()
+        except Exception:
+            return self._win32_snapshot(pid, control_scope)
+
+        windows: list[WindowRecord] = []
+        without_controls: dict[object, WindowRecord] = {}
+        for w in top_windows:
+            try:
+                window_pid = getattr(w.element_info, "process_id", None)
+                if pid is not None and window_pid != pid:
+                    continue
+
+                window = WindowRecord(title=w.window_text(), pid=window_pid, handle=w.handle)
+                windows.append(window)
+                # Only the windows in scope are walked, a descendants() walk is the expensive part.
+                if control_scope is not None and not control_scope(window):
+                    continue
+
+                # Single descendants() walk instead of one walk per control type.
+                for ctrl in w.descendants():
+                    try:
+                        control_type = ctrl.element_info.control_type
+                        if control_type not in ACTIONABLE_CONTROL_TYPES:
+                            continue
+                        window.controls.append(ControlRecord(
+                            name=ctrl.window_text() or ctrl.element_info.name or "",
+                            control_type=control_type,
+                            visible=ctrl.is_visible(),
+                            enabled=ctrl.is_enabled(),
+                            handle=ctrl,
+                        ))
+                    except Exception:
+                        continue
+                if not window.controls:
+                    without_controls[window.handle] = window
+            except Exception:
+                continue
+
+        if without_controls:
+            for win32_window in self._win32_snapshot(pid, lambda x: x.handle in without_controls):
+                if win32_window.controls and win32_window.handle in without_controls:
+                    without_controls[win32_window.handle].controls = win32_window.controls
+        return windows
+
+    def _win32_snapshot(
+            self,
+            pid: int | None,
+            control_scope: Callable[[WindowRecord], bool] | None = None
+    ) -> list[WindowRecord]:
+        """Win32 backend fallback: only the direct 'Button' class children, which includes check boxes."""
+        windows: list[WindowRecord] = []
+        try:
+            if self._win32_desktop is None:
+                self._win32_desktop = Desktop(backend="win32")
+            top_windows = self._win32_desktop.windows()
+        except Exception:
+            return windows
+
+        for w in top_windows:
+            try:
+                window_pid = getattr(w.element_info, "process_id", None)
+                if pid is not None and window_pid != pid:
+                    continue
+
+                window = WindowRecord(title=w.window_text(), pid=window_pid, handle=w.handle)
+                windows.append(window)
+                if control_scope is not None and not control_scope(window):
+                    continue
+
+                for ctrl in w.children(class_name="Button"):
+                    try:
+                        window.controls.append(ControlRecord(
+                            name=ctrl.window_text() or "",
+                            control_type="Button",
+                            visible=ctrl.is_visible(),
+                            enabled=ctrl.is_enabled(),
+                            handle=ctrl,
+                        ))
+                    except Exception:
+                        continue
+            except Exception:
+                continue
+        return windows
+
+    def perform(self, window: WindowRecord, control: ControlRecord, action: str) -> bool:
+        ctrl = control.handle
+
+        if action == "check":
+            try:
+                if ctrl.get_toggle_state() == 1:
+                    return True
+            except Exception:
+                pass
+
+        try:
+            ctrl.set_focus()
+        except Exception:
+            pass
+
+        # click_input works for both ButtonWrapper and CheckBoxWrapper in practice
+        try:
+            ctrl.click_input()
+        except Exception:
+            # fallback for some controls
+            try:
+                ctrl.click()
+            except Exception:
+                return False
+        return True
+
+
+def _describe_window(window_title: Optional[TitleType]) -> str:
+    if isinstance(window_title, re.Pattern):
+        return f" (window title regex: {window_title.pattern})"
+    if isinstance(window_title, str):
+        return f" (window title: {window_title})"
+    return " (all windows)"
+
+
+def run_wizard(
+        steps: list[WizardStep],
+        backend: WizardBackend | None = None,
+        pid: int | None = None,
+        fail_on: list[TitleType] | None = None,
+        strict: bool = False,
+        process_alive: Callable[[], bool] | None = None,
+        poll_interval: float = 0.2,
+        relax_pid_after: float | None = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+) -> list[StepResult]:
+    """
+    Run the wizard steps in order.
+
+    :param steps: Ordered list of WizardStep.
+    :param backend: Object implementing WizardBackend. Default is PywinautoBackend (Windows only).
+    :param pid: Installer process ID. If provided, the search is scoped to this process first.
+    :param fail_on: Window titles (str partial match, or compiled regex) that abort the run immediately
+        when they appear, like error or 'already installed' message boxes.
+    :param strict: If True and 'pid' is provided, any window of the installer process that matches none of the
+        steps' window titles aborts the run.
+    :param process_alive: Optional callable returning False when the installer process has exited.
+        Example: lambda: proc.poll() is None
+    :param poll_interval: Seconds between control index refreshes.
+    :param relax_pid_after: After that many seconds in a step, search all processes instead of 'pid'
+        (useful when installers spawn a separate UI process). None to never relax.
+    :param clock: Monotonic clock function, replaceable for simulation.
+    :param sleep: Sleep function, replaceable for simulation.
+    :return: List of StepResult, one per step.
+    :raises UnexpectedDialogError: A 'fail_on' (or, in strict mode, unknown) window appeared.
+    :raises WizardError: A control or expected state didn't appear in time, the action failed
+        or the installer process exited.
+    """
+    if backend is None:
+        backend = PywinautoBackend()
+
+    fail_on = fail_on or []
+    known_windows: list[TitleType] = [s.window for s in steps if s.window is not None]
+    results: list[StepResult] = []
+
+    def get_control_scope(
+            window_title: Optional[TitleType],
+            window_partial: bool
+    ) -> Callable[[WindowRecord], bool] | None:
+        """Controls are needed only in the windows of the installer process and in the windows the step targets."""
+        if window_title is None:
+            return None
+        return lambda w: (
+            (pid is not None and w.pid == pid) or _window_title_matches(w.title, window_title, partial=window_partial))
+
+    def refresh(
+            effective_pid: int | None,
+            step_index: int,
+            control_scope: Callable[[WindowRecord], bool] | None = None
+    ) -> ControlIndex:
+        index = ControlIndex(backend.snapshot(effective_pid, control_scope))
+
+        unexpected = index.find_window(fail_on) if fail_on else None
+        if unexpected is None and strict and pid is not None and known_windows:
+            for w in index.windows:
+                if w.pid != pid:
+                    continue
+                if not any(_window_title_matches(w.title, k, partial=True) for k in known_windows):
+                    unexpected = w
+                    break
+
+        if unexpected is not None:
+            raise UnexpectedDialogError(
+                f'Unexpected dialog "{unexpected.title}" appeared during step {step_index + 1} '
+                f'("{steps[step_index].control}").', step_index, results)
+        return index
+
+    def check_alive(step_index: int, what: str) -> None:
+        if process_alive is not None and not process_alive():
+            raise WizardError(
+                f'Installer process exited before "{what}" was found/clicked.', step_index, results)
+
+    for step_index, step in enumerate(steps):
+        step_start = clock()
+        deadline = step_start + step.timeout
+        polls = 0
+        found: tuple[WindowRecord, ControlRecord] | None = None
+        control_scope = get_control_scope(step.window, step.window_partial)
+
+        while True:
+            check_alive(step_index, step.control)
+
+            effective_pid = pid
+            if pid is not None and relax_pid_after is not None and (clock() - step_start) >= relax_pid_after:
+                effective_pid = None
+
+            index = refresh(effective_pid, step_index, control_scope)
+            polls += 1
+            found = index.find(step.control, step.window, step.window_partial)
+            if found is not None or clock() >= deadline:
+                break
+            sleep(poll_interval)
+
+        if found is None:
+            raise WizardError(
+                f'Control "{step.control}" was not visible+enabled within {step.timeout:.0f}s'
+                f'{_describe_window(step.window)}.', step_index, results)
+
+        window, control = found
+        find_seconds = clock() - step_start
+
+        action_start = clock()
+        if step.action != "wait":
+            if not backend.perform(window, control, step.action):
+                raise WizardError(
+                    f'Failed to {step.action} control "{step.control}" in window "{window.title}".',
+                    step_index, results)
+        action_seconds = clock() - action_start
+
+        expect_start = clock()
+        if step.expect is not None:
+            expect_deadline = expect_start + step.expect_timeout
+            while True:
+                if step.expect == WINDOW_CLOSED:
+                    # The process exiting is a valid way for the last window to close.
+                    if process_alive is not None and not process_alive():
+                        break
+                    # Only the window list is needed, no control is looked up.
+                    index = refresh(None, step_index, lambda w: False)
+                    polls += 1
+                    if not index.has_window(window):
+                        break
+                else:
+                    check_alive(step_index, step.expect)
+                    expect_window = step.window if step.window is not None else window.title
+                    index = refresh(None, step_index, get_control_scope(expect_window, step.window_partial))
+                    polls += 1
+                    if index.find(step.expect, expect_window, window_partial=step.window_partial) is not None:
+                        break
+
+                if clock() >= expect_deadline:
+                    state = "window to close" if step.expect == WINDOW_CLOSED else f'control "{step.expect}"'
+                    raise WizardError(
+                        f'Expected {state} after "{step.control}" within {step.expect_timeout:.0f}s '
+                        f'(window: {window.title}).', step_index, results)
+                sleep(poll_interval)
+        expect_seconds = clock() - expect_start
+
+        results.append(StepResult(
+            index=step_index,
+            step=step,
+            window_title=window.title,
+            find_seconds=find_seconds,
+            action_seconds=action_seconds,
+            expect_seconds=expect_seconds,
+            polls=polls,
+        ))
+
+    return results
+
+
+def print_results(results: list[StepResult]) -> None:
+    """Print per-step latency of a wizard run."""
+    for r in results:
+        print(
+            f"[{r.index + 1}] {r.step.action} \"{r.step.control}\" in \"{r.window_title}\": "
+            f"{r.latency:.2f}s (find {r.find_seconds:.2f}s, action {r.action_seconds:.2f}s, "
+            f"expect {r.expect_seconds:.2f}s, polls {r.polls})"
+        )
+    if results:
+        print(f"Total: {sum(r.latency for r in results):.2f}s")
@@ -0,0 +1,289 @@
+"""
+Crash-safe journal of an install run.
+
+Every completed step of a run (plan steps of 'install/upgrade/uninstall', and the long phases inside
+helpers: downloads, extractions, build phases) is recorded with its inputs in a per-run JSON file.
+If the run fails, 'dkinst resume' executes the same command again with the journal of the failed run,
+and the steps that were completed with the same inputs (and still verify) are skipped.
+
+Helpers mark their phases with 'run_step'. Without an active journal (helper executed directly,
+'manual' method) 'run_step' just calls the function.
+
+Usage:
+    from .infra import journal
+
+    rc = journal.run_step(
+        "tesseract_ocr:vcpkg_install",
+        lambda: vcpkg_install(dependencies),
+        inputs={"dependencies": dependencies},
+        verify=lambda: os.path.isfile(exe_path))
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable
+
+from rich.console import Console
+
+from . import metrics
+
+
+console = Console()
+
+
+# Set for the elevated process to the journal directory of the user that invoked dkinst,
+# so 'dkinst resume' of that user finds the journals of the elevated runs.
+JOURNAL_DIR_ENV: str = "DKINST_JOURNAL_DIR"
+JOURNAL_DIR: str = os.environ.get(JOURNAL_DIR_ENV) or str(Path.home() / ".dkinst" / "journals")
+# Journals written by the elevated process must stay readable by the invoking user.
+JOURNAL_FILE_MODE: int = 0o644
+
+STATUS_RUNNING: str = "running"
+STATUS_FAILED: str = "failed"
+STATUS_COMPLETED: str = "completed"
+
+
+_ACTIVE_LOCK = threading.Lock()
+_ACTIVE: "Journal | None" = None
+
+
+class JournalError(Exception):
+    pass
+
+
+class Journal:
+    """
+    Journal of one run.
+
+    :param data: Journal content: 'run_id', 'argv', 'status', 'started_at', 'updated_at', 'failed_step'
+        and 'steps' ({key: {'inputs', 'status', 'rc', 'finished_at'}}).
+    :param path: Path of the journal file.
+    :param resuming: True if the journal is of a failed run that is being resumed: completed steps are skipped.
+    """
+    def __init__(
+            self,
+            data: dict,
+            path: str,
+            resuming: bool = False
+    ):
+        self.data: dict = data
+        self.path: str = path
+        self.resuming: bool = resuming
+        self._lock = threading.Lock()
+
+    @property
+    def run_id(self) -> str:
+        return self.data["run_id"]
+
+    @property
+    def argv(self) -> list[str]:
+        return list(self.data.get("argv", []))
+
+    @property
+    def status(self) -> str:
+        return self.data.get("status", STATUS_RUNNING)
+
+    @property
+    def steps(self) -> dict:
+        return self.data.setdefault("steps", {})
+
+    def save(self) -> None:
+        """Write the journal to a temp file and replace, so a crash never leaves a half-written journal."""
+        with self._lock:
+            self.data["updated_at"] = time.time()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2)
+            os.chmod(tmp_path, JOURNAL_FILE_MODE)
+            os.replace(tmp_path, self.path)
+
+    def is_completed(
+            self,
+            key: str,
+            inputs: dict | None = None
+    ) -> bool:
+        """
+        :return: True if the step was completed with the same inputs.
+        """
+        step: dict | None = self.steps.get(key)
+        return bool(step) and step.get("status") == STATUS_COMPLETED and step.get("inputs") == _normalize(inputs)
+
+    def record(
+            self,
+            key: str,
+            inputs: dict | None,
+            status: str,
+            rc: int | None = None
+    ) -> None:
+        self.steps[key] = {
+            "inputs": _normalize(inputs),
+            "status": status,
+            "rc": rc,
+            "finished_at": time.time(),
+        }
+        if status == STATUS_FAILED:
+            self.data["failed_step"] = key
+        self.save()
+
+    def finish(self, rc: int) -> None:
+        """
+        Close the run. The journal of a successful run is removed, the journal of a failed run is kept for 'resume'.
+        """
+        if rc == 0:
+            self.data["status"] = STATUS_COMPLETED
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            return
+
+        self.data["status"] = STATUS_FAILED
+        self.save()
+
+
+def _normalize(inputs: dict | None) -> dict:
+    # Round-trip through JSON, so the inputs compare equal to the ones loaded from the file (tuples -> lists, etc.).
+    return json.loads(json.dumps(inputs or {}, default=str))
+
+
+def _get_journal_path(run_id: str, journal_dir: str | None = None) -> str:
+    return str(Path(journal_dir or JOURNAL_DIR) / f"{run_id}.json")
+
+
+def new_journal(
+        argv: list[str],
+        journal_dir: str | None = None
+) -> Journal:
+    """
+    Create the journal of a new run.
+
+    :param argv: dkinst arguments of the command, executed again on resume.
+    :param journal_dir: Directory of the journals. Default is 'JOURNAL_DIR'.
+    :return: Journal.
+    """
+    run_id: str = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    data: dict = {
+        "run_id": run_id,
+        "argv": list(argv),
+        "status": STATUS_RUNNING,
+        "started_at": time.time(),
+        "failed_step": None,
+        "steps": {},
+    }
+    journal = Journal(data, _get_journal_path(run_id, journal_dir))
+    journal.save()
+    return journal
+
+
+def load_journal(
+        run_id: str,
+        journal_dir: str | None = None
+) -> Journal:
+    """
+    :param run_id: Run ID of the journal.
+    :param journal_dir: Directory of the journals. Default is 'JOURNAL_DIR'.
+    :return: Journal.
+    :raises JournalError: If there is no such journal or it can't be read.
+    """
+    path: str = _get_journal_path(run_id, journal_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        raise JournalError(f"No journal found for the run [{run_id}].")
+    except (OSError, ValueError) as e:
+        raise JournalError(f"Can't read the journal [{path}]: {e}")
+
+    if not isinstance(data, dict) or "run_id" not in data:
+        raise JournalError(f"Invalid journal [{path}].")
+    return Journal(data, path)
+
+
+def list_journals(journal_dir: str | None = None) -> list[Journal]:
+    """
+    :param journal_dir: Directory of the journals. Default is 'JOURNAL_DIR'.
+    :return: Journals of the unfinished runs, the latest first.
+    """
+    journal_dir = journal_dir or JOURNAL_DIR
+    if not os.path.isdir(journal_dir):
+        return []
+
+    journals: list[Journal] = []
+    for file_name in os.listdir(journal_dir):
+        if not file_name.endswith(".json"):
+            continue
+        try:
+            journals.append(load_journal(file_name[:-len(".json")], journal_dir))
+        except JournalError:
+            continue
+
+    journals.sort(key=lambda j: j.data.get("started_at", 0), reverse=True)
+    return journals
+
+
+def get_active() -> Journal | None:
+    return _ACTIVE
+
+
+def set_active(journal: Journal | None) -> Journal | None:
+    """
+    Set the journal of the current run.
+
+    :return: The previously active journal.
+    """
+    global _ACTIVE
+    with _ACTIVE_LOCK:
+        previous, _ACTIVE = _ACTIVE, journal
+    return previous
+
+
+def run_step(
+        key: str,
+        func: Callable[[], int | None],
+        inputs: dict | None = None,
+        verify: Callable[[], bool] | None = None
+) -> int:
+    """
+    Execute a step of the active journal.
+    When resuming, a step that was completed with the same inputs is skipped, if 'verify' confirms its result.
+
+    :param key: Unique key of the step in the run, like 'tesseract_ocr:vcpkg_install'.
+    :param func: The step. Returns the exit code, None is treated as 0. Exceptions are recorded and re-raised.
+    :param inputs: JSON-serializable inputs of the step. A completed step with different inputs is executed again.
+    :param verify: Optional check that the result of a completed step is still in place.
+    :return: Exit code of the step, 0 if skipped.
+    """
+    journal: Journal | None = get_active()
+    if journal is None:
+        rc = func()
+        return 0 if rc is None else rc
+
+    if journal.resuming and journal.is_completed(key, inputs):
+        verified: bool = True
+        if verify is not None:
+            try:
+                verified = bool(verify())
+            except Exception:
+                verified = False
+
+        metrics.count_cache("journal", hit=verified)
+        if verified:
+            console.print(f"[{key}] was completed in the failed run. Skipping.", style="cyan", markup=False)
+            return 0
+        console.print(f"[{key}] was completed in the failed run, but its result is gone. Executing again.",
+                      style="yellow", markup=False)
+
+    try:
+        rc = func()
+    except BaseException:
+        journal.record(key, inputs, STATUS_FAILED)
+        raise
+
+    rc = 0 if rc is None else rc
+    journal.record(key, inputs, STATUS_COMPLETED if rc == 0 else STATUS_FAILED, rc)
+    return rc
@@ -0,0 +1,433 @@
+"""
+Opt-in metrics of dkinst runs, for fleet dashboards of slow installers and cache efficiency.
+
+Enabled when a metrics directory is configured: 'metrics_dir' in config.toml, or the DKINST_METRICS_DIR
+environment variable (overrides the config). Each run writes:
+- 'dkinst_metrics.jsonl': appended JSON lines, one per installer step ("type": "step") and one per
+  command ("type": "run"), with the installer, method, result code, duration, bytes downloaded and
+  cache hits/misses.
+- 'dkinst.prom': Prometheus textfile-collector file (point the node_exporter
+  '--collector.textfile.directory' at the metrics directory). Counters are cumulative across runs,
+  their state is kept in 'dkinst_metrics_state.json' in the same directory.
+
+Usage:
+    with metrics.step("git", "install") as step_metrics:
+        step_metrics.rc = installer.install()
+
+    metrics.add_download_bytes(os.path.getsize(file_path))
+    metrics.count_cache("rootfs", hit=True)
+"""
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+
+from ... import _base
+
+
+METRICS_DIR_ENV: str = "DKINST_METRICS_DIR"
+JSONL_FILE_NAME: str = "dkinst_metrics.jsonl"
+PROM_FILE_NAME: str = "dkinst.prom"
+STATE_FILE_NAME: str = "dkinst_metrics_state.json"
+# Held while the state file is read, updated and written, so concurrent dkinst processes don't lose counts.
+STATE_LOCK_FILE_NAME: str = "dkinst_metrics_state.lock"
+# Mode of the written files, the textfile collector usually runs as another user.
+FILE_MODE: int = 0o644
+
+
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+
+
+@dataclass
+class StepMetrics:
+    """
+    Metrics of one installer method execution.
+
+    :param rc: Result code, set by the caller.
+    :param duration: Duration in seconds.
+    :param bytes_downloaded: Total size of the files downloaded by the step.
+    :param cache_hits: Cache name -> number of hits.
+    :param cache_misses: Cache name -> number of misses.
+    """
+    installer: str
+    method: str
+    rc: int = 1
+    duration: float = 0.0
+    bytes_downloaded: int = 0
+    cache_hits: dict[str, int] = field(default_factory=dict)
+    cache_misses: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class RunMetrics:
+    """Metrics of one dkinst command."""
+    command: str
+    rc: int = 1
+    duration: float = 0.0
+    bytes_downloaded: int = 0
+    cache_hits: dict[str, int] = field(default_factory=dict)
+    cache_misses: dict[str, int] = field(default_factory=dict)
+    steps: list[StepMetrics] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+
+
+_RUN: RunMetrics | None = None
+# Steps that are running now. Counters of threads without their own step go to the only running step.
+_ACTIVE_STEPS: list[StepMetrics] = []
+
+
+def get_metrics_dir() -> str | None:
+    """
+    :return: The configured metrics directory, or None if metrics are disabled.
+    """
+    return os.environ.get(METRICS_DIR_ENV) or _base.METRICS_DIR or None
+
+
+def is_enabled() -> bool:
+    return get_metrics_dir() is not None
+
+
+def start_run(command: str) -> None:
+    """
+    Start collecting the metrics of a command. No-op if metrics are disabled.
+
+    :param command: The dkinst command, like 'install tesseract_ocr'.
+    """
+    global _RUN
+    if not is_enabled():
+        return
+    with _LOCK:
+        _RUN = RunMetrics(command=command)
+        _ACTIVE_STEPS.clear()
+    _instrument_download()
+
+
+def _get_current_step() -> StepMetrics | None:
+    current: StepMetrics | None = getattr(_LOCAL, "step", None)
+    if current is not None:
+        return current
+    if len(_ACTIVE_STEPS) == 1:
+        return _ACTIVE_STEPS[0]
+    return None
+
+
+class _StepMeasure:
+    def __init__(
+            self,
+            installer: str,
+            method: str
+    ):
+        self.metrics: StepMetrics = StepMetrics(installer=installer, method=method)
+        self._start: float = 0.0
+        self._previous: StepMetrics | None = None
+
+    def __enter__(self) -> StepMetrics:
+        if _RUN is None:
+            return self.metrics
+
+        self._start = time.monotonic()
+        self._previous = getattr(_LOCAL, "step", None)
+        _LOCAL.step = self.metrics
+        with _LOCK:
+            _ACTIVE_STEPS.append(self.metrics)
+        return self.metrics
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if _RUN is None:
+            return
+
+        self.metrics.duration = time.monotonic() - self._start
+        _LOCAL.step = self._previous
+        with _LOCK:
+            if self.metrics in _ACTIVE_STEPS:
+                _ACTIVE_STEPS.remove(self.metrics)
+            _RUN.steps.append(self.metrics)
+
+
+def step(
+        installer: str,
+        method: str
+) -> _StepMeasure:
+    """
+    Context manager that measures an installer method execution. Set 'rc' of the returned StepMetrics.
+
+    :param installer: Installer name.
+    :param method: Installer method.
+    """
+    return _StepMeasure(installer, method)
+
+
+_INSTRUMENTED: bool = False
+
+
+def _instrument_download() -> None:
+    # Downloads are done by dkwebmod.web.download, which returns the path of the downloaded file.
+    global _INSTRUMENTED
+    if _INSTRUMENTED or _RUN is None:
+        return
+    _INSTRUMENTED = True
+    try:
+        from dkwebmod import web
+    except ImportError:
+        return
+
+    download = web.download
+
+    def counted_download(*args, **kwargs):
+        file_path = download(*args, **kwargs)
+        count_downloaded_file(file_path)
+        return file_path
+
+    web.download = counted_download
+
+
+def add_download_bytes(size: int) -> None:
+    """Count downloaded bytes to the current step and the run."""
+    if _RUN is None:
+        return
+    with _LOCK:
+        _RUN.bytes_downloaded += size
+        current: StepMetrics | None = _get_current_step()
+        if current is not None:
+            current.bytes_downloaded += size
+
+
+def count_cache(
+        cache: str,
+        hit: bool
+) -> None:
+    """
+    Count a cache lookup to the current step and the run.
+
+    :param cache: Cache name, like 'installed_state', 'journal', 'rootfs'.
+    :param hit: True for a hit, False for a miss.
+    """
+    if _RUN is None:
+        return
+    with _LOCK:
+        targets: list = [_RUN]
+        current: StepMetrics | None = _get_current_step()
+        if current is not None:
+            targets.append(current)
+        for target in targets:
+            counters: dict[str, int] = target.cache_hits if hit else target.cache_misses
+            counters[cache] = counters.get(cache, 0) + 1
+
+
+def count_downloaded_file(file_path) -> None:
+    """Count the size of a downloaded file, if the path exists."""
+    if _RUN is None or not isinstance(file_path, (str, os.PathLike)):
+        return
+    try:
+        add_download_bytes(os.path.getsize(file_path))
+    except OSError:
+        pass
+
+
+def discard_run() -> None:
+    """Stop collecting the metrics of the current run without writing them."""
+    global _RUN
+    with _LOCK:
+        _RUN = None
+        _ACTIVE_STEPS.clear()
+
+
+def finish_run(rc: int) -> None:
+    """
+    Finish the current run and write its metrics. Best-effort: failures to write are ignored.
+
+    :param rc: Exit code of the command.
+    """
+    global _RUN
+    with _LOCK:
+        run, _RUN = _RUN, None
+        _ACTIVE_STEPS.clear()
+    if run is None:
+        return
+
+    run.rc = rc
+    run.duration = time.time() - run.started_at
+
+    metrics_dir: str | None = get_metrics_dir()
+    if not metrics_dir:
+        return
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        write_jsonl(run, os.path.join(metrics_dir, JSONL_FILE_NAME))
+        write_prometheus(run, metrics_dir)
+    except OSError:
+        pass
+
+
+def write_jsonl(
+        run: RunMetrics,
+        file_path: str
+) -> None:
+    host: str = socket.gethostname()
+    lines: list[str] = []
+    for step_metrics in run.steps:
+        lines.append(json.dumps({
+            "type": "step", "host": host, "timestamp": run.started_at, "command": run.command,
+            **asdict(step_metrics)}))
+
+    run_record: dict = asdict(run)
+    del run_record["steps"]
+    lines.append(json.dumps({"type": "run", "host": host, "timestamp": run.started_at, **run_record}))
+
+    with open(file_path, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _load_state(file_path: str) -> dict:
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def _update_state(
+        state: dict,
+        run: RunMetrics
+) -> None:
+    runs: dict = state.setdefault("runs", {})
+    last: dict = state.setdefault("last", {})
+    cache: dict = state.setdefault("cache", {})
+
+    for step_metrics in run.steps:
+        result: str = "success" if step_metrics.rc == 0 else "failure"
+        key: str = f"{step_metrics.installer}|{step_metrics.method}|{result}"
+        runs[key] = runs.get(key, 0) + 1
+        last[f"{step_metrics.installer}|{step_metrics.method}"] = {
+            "rc": step_metrics.rc,
+            "duration": step_metrics.duration,
+            "bytes_downloaded": step_metrics.bytes_downloaded,
+            "timestamp": run.started_at,
+        }
+
+    for counters, result in ((run.cache_hits, "hit"), (run.cache_misses, "miss")):
+        for name, count in counters.items():
+            key = f"{name}|{result}"
+            cache[key] = cache.get(key, 0) + count
+
+    state["download_bytes_total"] = state.get("download_bytes_total", 0) + run.bytes_downloaded
+    state["last_run"] = {"rc": run.rc, "duration": run.duration, "timestamp": run.started_at}
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus(state: dict) -> str:
+    """
+    :param state: Cumulative metrics state.
+    :return: Prometheus text exposition format.
+    """
+    lines: list[str] = [
+        "# HELP dkinst_installer_runs_total Installer method executions.",
+        "# TYPE dkinst_installer_runs_total counter",
+    ]
+    for key, count in sorted(state.get("runs", {}).items()):
+        installer, method, result = key.split("|")
+        lines.append(
+            f'dkinst_installer_runs_total{{installer="{_escape_label(installer)}",method="{method}",'
+            f'result="{result}"}} {count}')
+
+    gauges: list[tuple[str, str, str]] = [
+        ("dkinst_installer_last_duration_seconds", "duration", "Duration of the last execution."),
+        ("dkinst_installer_last_result_code", "rc", "Result code of the last execution."),
+        ("dkinst_installer_last_download_bytes", "bytes_downloaded", "Bytes downloaded by the last execution."),
+        ("dkinst_installer_last_timestamp_seconds", "timestamp", "Unix time of the last execution."),
+    ]
+    for metric_name, field_name, help_text in gauges:
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} gauge")
+        for key, last in sorted(state.get("last", {}).items()):
+            installer, method = key.split("|")
+            lines.append(
+                f'{metric_name}{{installer="{_escape_label(installer)}",method="{method}"}} {last[field_name]}')
+
+    lines.append("# HELP dkinst_cache_requests_total Cache lookups by cache and result.")
+    lines.append("# TYPE dkinst_cache_requests_total counter")
+    for key, count in sorted(state.get("cache", {}).items()):
+        name, result = key.split("|")
+        lines.append(f'dkinst_cache_requests_total{{cache="{_escape_label(name)}",result="{result}"}} {count}')
+
+    lines.append("# HELP dkinst_download_bytes_total Bytes downloaded by installers.")
+    lines.append("# TYPE dkinst_download_bytes_total counter")
+    lines.append(f"dkinst_download_bytes_total {state.get('download_bytes_total', 0)}")
+
+    last_run: dict = state.get("last_run", {})
+    if last_run:
+        lines.append("# HELP dkinst_last_run_result_code Exit code of the last dkinst command.")
+        lines.append("# TYPE dkinst_last_run_result_code gauge")
+        lines.append(f"dkinst_last_run_result_code {last_run['rc']}")
+        lines.append("# HELP dkinst_last_run_timestamp_seconds Unix time of the last dkinst command.")
+        lines.append("# TYPE dkinst_last_run_timestamp_seconds gauge")
+        lines.append(f"dkinst_last_run_timestamp_seconds {last_run['timestamp']}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _atomic_write(
+        file_path: str,
+        content: str
+) -> None:
+    # The textfile collector may read at any moment, it must never see a half-written file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        # mkstemp creates the file readable by the owner only.
+        os.chmod(tmp_path, FILE_MODE)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def _state_file_lock(metrics_dir: str):
+    """Exclusive lock of the metrics state across dkinst processes."""
+    with open(os.path.join(metrics_dir, STATE_LOCK_FILE_NAME), "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK retries for 10 seconds only, then raises.
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_prometheus(
+        run: RunMetrics,
+        metrics_dir: str
+) -> None:
+    state_path: str = os.path.join(metrics_dir, STATE_FILE_NAME)
+    with _LOCK, _state_file_lock(metrics_dir):
+        state: dict = _load_state(state_path)
+        _update_state(state, run)
+        _atomic_write(state_path, json.dumps(state))
+        _atomic_write(os.path.join(metrics_dir, PROM_FILE_NAME), render_prometheus(state))
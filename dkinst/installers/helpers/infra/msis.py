@@ -3,6 +3,8 @@ import platform
 
 from rich.console import Console
 
+from . import tracing
+
 if platform.system().lower() == 'windows':
     from . import permissions, processes
 
@@ -57,6 +59,12 @@ def wait_for_msiexec_processes_to_finish(msi_file_path: str):
         raise Exception(f"MSI Installation failed. Return code: {result_code}")
 
 
+@tracing.traced(
+    "run_msi", category="command",
+    attributes=lambda *args, **kwargs: {
+        "msi_path": kwargs.get("msi_path"), "guid": kwargs.get("guid"),
+        "action": "install" if kwargs.get("install") else "uninstall"},
+    result_attributes=lambda result: {"rc": result})
 def run_msi(
         install: bool = False,
         uninstall: bool = False,
@@ -1,11 +1,12 @@
 import os
 import ctypes
-import shutil
 import sys
 import subprocess
 
 from rich.console import Console
 
+from . import executables
+
 
 console = Console()
 
@@ -30,28 +31,37 @@ def is_admin() -> bool:
     return result
 
 
-def ensure_root_or_reexec_debian() -> None:
-    """If not root, re-exec this command under sudo, preserving args."""
+def ensure_root_or_reexec_debian(env: dict[str, str] | None = None) -> None:
+    """
+    If not root, re-exec this command under sudo, preserving args.
+
+    :param env: Environment variables that the elevated process must get even if the sudo policy
+        doesn't preserve the environment.
+    """
     if os.geteuid() == 0:
         return  # already root
-    exe = shutil.which("dkinst") or sys.argv[0]
+    exe = executables.which("dkinst") or sys.argv[0]
     # make it absolute in case it was found via PATH
     exe = os.path.abspath(exe)
-    # Replace the current process with: sudo <same dkinst> <same args>
-    os.execvp("sudo", ["sudo", "-E", exe] + sys.argv[1:])
+    # Replace the current process with: sudo [env K=V ...] <same dkinst> <same args>
+    env_prefix: list[str] = ["env"] + [f"{key}={value}" for key, value in env.items()] if env else []
+    os.execvp("sudo", ["sudo", "-E"] + env_prefix + [exe] + sys.argv[1:])
 
 
-def ensure_admin_or_reexec_windows() -> None:
+def ensure_admin_or_reexec_windows(env: dict[str, str] | None = None) -> None:
     """
     On Windows, relaunch this command with elevation (UAC),
     preserving the original arguments, and end with a 'pause'
     so the new console window doesn't close immediately.
+
+    :param env: Environment variables to set for the elevated process,
+        it doesn't inherit the environment of the current one.
     """
     if os.name != "nt":
         return
 
     # Original dkinst entry point (same logic as before)
-    orig_exe = shutil.which("dkinst") or sys.argv[0]
+    orig_exe = executables.which("dkinst") or sys.argv[0]
     orig_exe = os.path.abspath(orig_exe)
 
     # Build the argument string for dkinst
@@ -63,6 +73,9 @@ def ensure_admin_or_reexec_windows() -> None:
         inner_cmd = f'"{orig_exe}" {orig_params} & pause'
     else:
         inner_cmd = f'"{orig_exe}" & pause'
+    # set "KEY=VALUE" & dkinst <args> & pause
+    for key, value in (env or {}).items():
+        inner_cmd = f'set "{key}={value}" & {inner_cmd}'
 
     # Run it via the command interpreter so & pause works
     cmd_exe = os.environ.get("COMSPEC", "cmd.exe")
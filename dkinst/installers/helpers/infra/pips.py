@@ -1,36 +1,185 @@
+"""
+pip layer of the current interpreter.
+
+The installed state is answered in-process from 'importlib.metadata', with a distribution index that is
+built once and dropped after every install/uninstall, instead of spawning 'pip show' per package.
+Several requirements are installed with one resolver run ('pip_install_many'), in the install mode
+that is picked once for the interpreter ('get_install_mode'): the environment itself inside a venv,
+'--user' outside of it. If 'uv' is on PATH inside a venv, it is used as the faster resolver backend,
+with pip as the fallback; set 'DKINST_PIP_BACKEND=pip' to always use pip.
+"""
+import importlib
+import importlib.metadata
+import os
+import re
+import site
 import subprocess
 import sys
+import threading
+
+from . import executables
+
+
+PIP_BACKEND_ENV: str = "DKINST_PIP_BACKEND"
+
+INSTALL_MODE_ENVIRONMENT: str = "environment"
+INSTALL_MODE_USER: str = "user"
+
+
+_LOCK = threading.Lock()
+# Normalized distribution name -> version.
+_INDEX: dict[str, str] | None = None
+
+
+def normalize_name(name: str) -> str:
+    """:return: The PEP 503 normalized project name, so 'Foo_Bar' and 'foo-bar' match."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_requirement(requirement: str) -> tuple[str, str | None]:
+    """
+    Split a requirement into its project name and pinned version.
+
+    :param requirement: Requirement like 'argcomplete==3.6.3', 'dkinst', 'rich[jupyter]>=13'.
+    :return: (normalized name, pinned version or None if the requirement isn't pinned with '==').
+    """
+    requirement = requirement.split(";", 1)[0].strip()
+    match = re.match(r"^([A-Za-z0-9][A-Za-z0-9._-]*)\s*(?:\[[^]]*])?\s*(.*)$", requirement)
+    if not match:
+        return normalize_name(requirement), None
+
+    name, specifier = match.groups()
+    pinned: str | None = None
+    if specifier.startswith("==") and "," not in specifier and "*" not in specifier:
+        pinned = specifier[2:].strip()
+    return normalize_name(name), pinned
+
+
+def get_distribution_index(refresh: bool = False) -> dict[str, str]:
+    """
+    :param refresh: Build the index again instead of returning the cached one.
+    :return: Dict of normalized distribution name -> version of the current interpreter.
+    """
+    global _INDEX
+    with _LOCK:
+        if _INDEX is None or refresh:
+            index: dict[str, str] = {}
+            for distribution in importlib.metadata.distributions():
+                name: str | None = distribution.metadata["Name"]
+                if name:
+                    # The first one on sys.path wins, like on import.
+                    index.setdefault(normalize_name(name), distribution.version)
+            _INDEX = index
+        return _INDEX
+
+
+def invalidate_index() -> None:
+    """Drop the distribution index, after pip changed the environment."""
+    global _INDEX
+    importlib.invalidate_caches()
+    with _LOCK:
+        _INDEX = None
+
+
+def get_installed_version(package: str) -> str | None:
+    """:return: The installed version of the package, None if not installed."""
+    name, _ = parse_requirement(package)
+    return get_distribution_index().get(name)
 
 
 def is_pip_package_installed(package: str) -> bool:
-    return (
-        subprocess.run(
-            [sys.executable, "-m", "pip", "show", package],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        ).returncode
-        == 0
-    )
+    return get_installed_version(package) is not None
 
 
-def pip_install(package: str) -> int:
-    in_venv = (
-        getattr(sys, "base_prefix", sys.prefix) != sys.prefix
-        or hasattr(sys, "real_prefix")
-    )
+def is_requirement_satisfied(requirement: str) -> bool:
+    """
+    :return: True if the requirement is pinned with '==' and that version is installed.
+        Unpinned requirements are never satisfied in advance, the resolver decides about upgrades.
+    """
+    name, pinned = parse_requirement(requirement)
+    return pinned is not None and get_distribution_index().get(name) == pinned
+
+
+def is_in_venv() -> bool:
+    return getattr(sys, "base_prefix", sys.prefix) != sys.prefix or hasattr(sys, "real_prefix")
+
+
+def get_install_mode() -> str:
+    """
+    Pick where pip installs for the current interpreter: the environment itself inside a venv
+    (or if user site-packages are disabled), '--user' outside of it.
+
+    :return: 'INSTALL_MODE_ENVIRONMENT' or 'INSTALL_MODE_USER'.
+    """
+    if is_in_venv() or not site.ENABLE_USER_SITE:
+        return INSTALL_MODE_ENVIRONMENT
+    return INSTALL_MODE_USER
+
+
+def get_backend() -> str:
+    """
+    :return: 'uv' if it is on PATH and the install goes to a venv ('uv pip' has no '--user' mode), 'pip' otherwise.
+    """
+    if os.environ.get(PIP_BACKEND_ENV, "").lower() == "pip":
+        return "pip"
+    if get_install_mode() == INSTALL_MODE_ENVIRONMENT and is_in_venv() and executables.which("uv"):
+        return "uv"
+    return "pip"
 
-    base_cmd = [sys.executable, "-m", "pip", "install", "--upgrade", package]
-    user_cmd = [sys.executable, "-m", "pip", "install", "--user", "--upgrade", package]
 
-    # Prefer non-user installs inside venv; prefer --user installs outside venv.
-    attempts = [base_cmd, user_cmd] if in_venv else [user_cmd, base_cmd]
+def build_install_command(
+        requirements: list[str],
+        backend: str,
+        install_mode: str,
+        upgrade: bool = True
+) -> list[str]:
+    """
+    :param requirements: Requirements to install in one resolver run.
+    :param backend: 'pip' or 'uv'.
+    :param install_mode: 'INSTALL_MODE_ENVIRONMENT' or 'INSTALL_MODE_USER'.
+    :param upgrade: Upgrade the requirements that are already installed.
+    :return: Command list.
+    """
+    if backend == "uv":
+        cmd: list[str] = ["uv", "pip", "install", "--python", sys.executable]
+    else:
+        cmd = [sys.executable, "-m", "pip", "install"]
+        if install_mode == INSTALL_MODE_USER:
+            cmd.append("--user")
+    if upgrade:
+        cmd.append("--upgrade")
+    return cmd + list(requirements)
 
-    last_rc = 1
-    for cmd in attempts:
-        last_rc = subprocess.run(cmd).returncode
-        if last_rc == 0:
-            return 0
-    return last_rc
+
+def pip_install_many(
+        requirements: list[str],
+        upgrade: bool = True
+) -> int:
+    """
+    Install several requirements with one resolver run. Pinned requirements that are already installed
+    are skipped, if all of them are, no process is started.
+
+    :param requirements: Requirements like 'argcomplete==3.6.3'.
+    :param upgrade: Upgrade the requirements that are already installed.
+    :return: Exit code, 0 if success.
+    """
+    pending: list[str] = [
+        requirement for requirement in dict.fromkeys(requirements) if not is_requirement_satisfied(requirement)]
+    if not pending:
+        return 0
+
+    install_mode: str = get_install_mode()
+    backend: str = get_backend()
+    rc: int = subprocess.run(build_install_command(pending, backend, install_mode, upgrade)).returncode
+    if rc != 0 and backend == "uv":
+        rc = subprocess.run(build_install_command(pending, "pip", install_mode, upgrade)).returncode
+
+    invalidate_index()
+    return rc
+
+
+def pip_install(package: str) -> int:
+    return pip_install_many([package])
 
 
 def pip_uninstall(package: str) -> int:
@@ -40,6 +189,8 @@ def pip_uninstall(package: str) -> int:
 
     if not is_pip_package_installed(package):
         return 0
-    return subprocess.run(
+    rc: int = subprocess.run(
         [sys.executable, "-m", "pip", "uninstall", "-y", package]
-    ).returncode
\ No newline at end of file
+    ).returncode
+    invalidate_index()
+    return rc
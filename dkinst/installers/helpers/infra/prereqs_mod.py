@@ -1,12 +1,11 @@
 import os
-import shutil
 import subprocess
 from pathlib import Path
 import sysconfig
 
 from rich.console import Console
 
-from . import pips
+from . import pips, executables
 
 
 console = Console()
@@ -29,7 +28,7 @@ def _cmd_prereqs() -> int:
         console.print("  Reinstall argcomplete or ensure your Python scripts dir is on PATH.", style="yellow")
         return 1
 
-    act = shutil.which("activate-global-python-argcomplete")  # optional; per-exe is fine
+    act = executables.which("activate-global-python-argcomplete")  # optional; per-exe is fine
 
     # Decide which shell(s) to target
     targets = [_detect_shell()]
@@ -70,11 +69,11 @@ def _ensure_argcomplete() -> str | None:
     Make sure argcomplete is available and return the path to
     register-python-argcomplete.
 
-    Uses pip in the current interpreter (venv-aware; falls back between
-    normal and --user installs).
+    Uses pip in the current interpreter (venv-aware, see 'pips.get_install_mode').
+    Nothing is spawned if the pinned argcomplete is already installed.
     """
     # already there?
-    reg = shutil.which("register-python-argcomplete")
+    reg = executables.which("register-python-argcomplete")
     if reg:
         return reg
 
@@ -84,7 +83,7 @@ def _ensure_argcomplete() -> str | None:
         return None
 
     # Try again via PATH, then common script locations even if not on PATH
-    reg = shutil.which("register-python-argcomplete")
+    reg = executables.which("register-python-argcomplete")
     if reg:
         return reg
 
@@ -159,9 +158,9 @@ def _register_powershell(reg_cmd: str, exe: str) -> None:
     Register a PowerShell ArgumentCompleter by appending to the user's PS profile.
     """
     hosts = []
-    if shutil.which("pwsh"):  # PowerShell 7+
+    if executables.which("pwsh"):  # PowerShell 7+
         hosts.append("pwsh")
-    if shutil.which("powershell"):  # Windows PowerShell 5.1
+    if executables.which("powershell"):  # Windows PowerShell 5.1
         hosts.append("powershell")
 
     for host in hosts:
@@ -2,12 +2,11 @@ import re
 import os
 import subprocess
 from pathlib import Path
-import shutil
 
 
 from rich.console import Console
 
-from . import prereqs_mod, pips
+from . import prereqs_mod, pips, executables
 
 
 console = Console()
@@ -140,9 +139,9 @@ def _unregister_powershell(exe: str) -> None:
     Deletes the whole -ScriptBlock {...} including nested braces.
     """
     hosts = []
-    if shutil.which("pwsh"):
+    if executables.which("pwsh"):
         hosts.append("pwsh")
-    if shutil.which("powershell"):
+    if executables.which("powershell"):
         hosts.append("powershell")
 
     if not hosts:
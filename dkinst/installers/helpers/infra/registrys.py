@@ -1,8 +1,18 @@
 import os
 import ctypes
-from typing import Literal
+import ntpath
+import re
+import json
+import bisect
+import difflib
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass, asdict
+from typing import Callable, Iterable, Literal, Protocol
 import sys
 
+from . import metrics
+
 if os.name == "nt":
     import winreg
 
@@ -121,6 +131,349 @@ def _broadcast_env_change(_ctypes):
     )
 
 
+ENVIRONMENT_KEYS: dict[str, str] = {
+    "user": r"Environment",
+    "machine": r"SYSTEM\CurrentControlSet\Control\Session Manager\Environment",
+}
+
+
+@dataclass
+class PathOperation:
+    # 'ensure_exe': make 'path' the only PATH directory that provides 'exe_name'.
+    # 'add': add 'path' if it isn't in PATH yet.
+    # 'remove': remove 'path' from PATH.
+    # 'set': replace the whole PATH value with 'path'.
+    kind: Literal["ensure_exe", "add", "remove", "set"]
+    path: str
+    exe_name: str | None = None
+    position: Literal["front", "end"] = "end"
+    # Allow replacing PATH entries under C:\Windows* that provide the same exe (not recommended).
+    include_windows_dirs: bool = False
+
+
+def normalize_path_entry(path_str: str) -> str:
+    r"""
+    Normalize a PATH entry for comparison: strip quotes and trailing slashes, expand %VARS%,
+    Windows case and separators. Uses 'ntpath', so it behaves the same on any host OS.
+    """
+    p = ntpath.expandvars((path_str or "").strip().strip('"')).replace("/", "\\")
+    while p.endswith("\\"):
+        p = p[:-1]
+    return ntpath.normcase(ntpath.normpath(p)) if p else ""
+
+
+def _windows_roots() -> list[str]:
+    roots: list[str] = []
+    for env in ("SystemRoot", "windir"):
+        v = os.environ.get(env)
+        if v:
+            roots.append(v.replace("/", "\\").rstrip("\\").lower())
+    return roots
+
+
+def _is_windows_rooted(path_str: str, roots: list[str]) -> bool:
+    expanded = ntpath.expandvars(path_str or "").replace("/", "\\").rstrip("\\").lower()
+    return any(expanded == r or expanded.startswith(r + "\\") for r in roots)
+
+
+def _dir_contains_exe(dir_candidate: str, exe_name: str) -> bool:
+    raw = (dir_candidate or "").strip().strip('"')
+    return os.path.isfile(os.path.join(os.path.expandvars(raw), exe_name))
+
+
+def compute_path_value(
+        current: str,
+        operations: list[PathOperation],
+        dir_contains_exe: Callable[[str, str], bool] | None = None,
+        windows_roots: list[str] | None = None,
+) -> tuple[str, list[str]]:
+    r"""
+    Compute the final PATH value after applying all the queued operations, in one pass.
+    Entries are deduplicated by their normalized form, keeping the first occurrence.
+    This function doesn't touch the registry or the environment.
+
+    :param current: Current PATH value (';' separated).
+    :param operations: list of PathOperation, applied in order.
+    :param dir_contains_exe: Callable (dir, exe_name) -> bool, checks if a PATH directory provides the exe.
+        Default checks the filesystem. Each (dir, exe_name) pair is probed only once.
+    :param windows_roots: Lowercase Windows directories protected from 'ensure_exe' replacement.
+        Default is taken from the SystemRoot/windir environment variables.
+    :return: tuple (new PATH value, list of removed entries that provided an 'ensure_exe' exe).
+    """
+    probe = dir_contains_exe or _dir_contains_exe
+    roots = _windows_roots() if windows_roots is None else windows_roots
+    probe_cache: dict[tuple[str, str], bool] = {}
+
+    def _provides(entry: str, exe_name: str) -> bool:
+        key = (normalize_path_entry(entry), exe_name.lower())
+        if key not in probe_cache:
+            probe_cache[key] = probe(entry, exe_name)
+        return probe_cache[key]
+
+    def _insert(items: list[str], path: str, position: str) -> list[str]:
+        return [path] + items if position == "front" else items + [path]
+
+    entries: list[str] = [p for p in (current or "").split(";") if p.strip()]
+    replaced_dirs: list[str] = []
+
+    for op in operations:
+        op_norm = normalize_path_entry(op.path)
+
+        if op.kind == "set":
+            entries = [p for p in (op.path or "").split(";") if p.strip()]
+        elif op.kind == "remove":
+            entries = [p for p in entries if normalize_path_entry(p) != op_norm]
+        elif op.kind == "add":
+            if op_norm not in {normalize_path_entry(p) for p in entries}:
+                entries = _insert(entries, op.path, op.position)
+        elif op.kind == "ensure_exe":
+            kept: list[str] = []
+            for p in entries:
+                p_norm = normalize_path_entry(p)
+                # The target directory itself is kept in place, so an already correct PATH stays unchanged.
+                if p_norm != op_norm and _provides(p, op.exe_name):
+                    if op.include_windows_dirs or not _is_windows_rooted(p, roots):
+                        replaced_dirs.append(p)
+                        continue  # drop old provider
+                kept.append(p)
+            entries = kept
+            if op_norm not in {normalize_path_entry(p) for p in entries}:
+                entries = _insert(entries, op.path, op.position)
+        else:
+            raise ValueError(f"Unknown PATH operation: {op.kind}")
+
+    out: list[str] = []
+    seen: set[str] = set()
+    for p in entries:
+        p_norm = normalize_path_entry(p)
+        if p_norm in seen:
+            continue
+        seen.add(p_norm)
+        out.append(p)
+
+    return ";".join(out).strip(";"), replaced_dirs
+
+
+class EnvironmentEditor:
+    r"""
+    Transactional editor for persisted (registry) environment variables.
+
+    PATH and variable changes are queued; 'commit()' reads each registry value once, computes the final
+    PATH once per scope, writes only the values that actually changed (each one once), broadcasts
+    WM_SETTINGCHANGE once and updates the current process environment.
+
+    Usage example:
+    with registrys.EnvironmentEditor() as env:
+        env.ensure_exe_dir_in_path(r"C:\vcpkg\installed\x64-windows\tools\tesseract\tesseract.exe")
+        env.set_variable("TESSDATA_PREFIX", r"C:\vcpkg\installed\x64-windows\share\tessdata")
+    # Committed on exit if no exception was raised.
+    """
+    def __init__(
+            self,
+            scope: Literal["user", "machine"] = "user",
+            broadcast: bool = True,
+            expand_for_process: bool = True,
+    ):
+        """
+        :param scope: Default scope for the queued changes: 'user' (no admin) or 'machine' (admin required).
+        :param broadcast: If True, send WM_SETTINGCHANGE once at commit if anything was written.
+        :param expand_for_process: If True, expand %VARS% in REG_EXPAND_SZ values for the current process only.
+        """
+        _check_scope(scope)
+        self.scope: str = scope
+        self.broadcast: bool = broadcast
+        self.expand_for_process: bool = expand_for_process
+
+        self._path_operations: dict[str, list[PathOperation]] = {}
+        # (scope, name) -> value
+        self._variables: dict[tuple[str, str], str] = {}
+        # (scope, name) -> (value, reg_type). Registry read cache for the transaction.
+        self._read_cache: dict[tuple[str, str], tuple[str | None, int | None]] = {}
+
+    def __enter__(self) -> "EnvironmentEditor":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+        return False
+
+    def ensure_exe_dir_in_path(
+            self,
+            exe_path: str,
+            scope: Literal["user", "machine"] | None = None,
+            include_windows_dirs: bool = False,
+            position: Literal["front", "end"] = "end",
+            require_existence: bool = True,
+    ) -> tuple[str, str]:
+        r"""
+        Queue: PATH should have exactly one directory providing the given executable.
+        See 'ensure_exe_dir_in_path' for the parameters.
+
+        :return: tuple (new_dir, exe_name).
+        """
+        if position not in ("end", "front"):
+            raise ValueError("position must be 'end' or 'front'")
+        if not exe_path or not isinstance(exe_path, str):
+            raise ValueError("exe_path must be a non-empty string")
+
+        norm_exe = os.path.normpath(os.path.expandvars(exe_path.strip().strip('"')))
+
+        if not norm_exe.lower().endswith(".exe"):
+            raise ValueError("exe_path must point to a .exe file")
+        if require_existence and not os.path.isfile(norm_exe):
+            raise FileNotFoundError(f"Executable not found: {norm_exe}")
+
+        new_dir = os.path.dirname(norm_exe)
+        exe_name = os.path.basename(norm_exe)
+        self._queue_path(scope, PathOperation(
+            "ensure_exe", new_dir, exe_name=exe_name, position=position, include_windows_dirs=include_windows_dirs))
+        return new_dir, exe_name
+
+    def add_path_dir(
+            self,
+            dir_path: str,
+            scope: Literal["user", "machine"] | None = None,
+            position: Literal["front", "end"] = "end",
+    ) -> None:
+        """Queue adding a directory to PATH, if it isn't there yet."""
+        if position not in ("end", "front"):
+            raise ValueError("position must be 'end' or 'front'")
+        self._queue_path(scope, PathOperation("add", dir_path, position=position))
+
+    def remove_path_dir(
+            self,
+            dir_path: str,
+            scope: Literal["user", "machine"] | None = None,
+    ) -> None:
+        """Queue removing a directory from PATH."""
+        self._queue_path(scope, PathOperation("remove", dir_path))
+
+    def set_variable(
+            self,
+            name: str,
+            value: str,
+            scope: Literal["user", "machine"] | None = None,
+    ) -> str:
+        """
+        Queue setting an environment variable. Setting 'Path' replaces the whole PATH value.
+
+        :return: The registry value name that will be written.
+        """
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("name must be a non-empty string")
+        if not isinstance(value, str):
+            raise ValueError("value must be a string")
+
+        if name.strip().lower() == "path":
+            self._queue_path(scope, PathOperation("set", value))
+            return "Path"
+
+        scope = scope or self.scope
+        _check_scope(scope)
+        var_name = name.strip()
+        self._variables[(scope, var_name)] = value
+        return var_name
+
+    def _queue_path(self, scope: str | None, operation: PathOperation) -> None:
+        scope = scope or self.scope
+        _check_scope(scope)
+        self._path_operations.setdefault(scope, []).append(operation)
+
+    def _read(self, scope: str, name: str) -> tuple[str | None, int | None]:
+        key = (scope, name.lower())
+        if key not in self._read_cache:
+            self._read_cache[key] = _read_env_value(scope, name)
+        return self._read_cache[key]
+
+    def commit(self) -> dict:
+        """
+        Apply all the queued changes.
+
+        :return: dict:
+            {
+                'written': [(scope, name), ...],
+                'broadcasted': True|False,
+                'path': {scope: {'changed': bool, 'replaced_dirs': [...], 'value': 'new PATH'}},
+            }
+        """
+        writes: dict[tuple[str, str], tuple[str, int]] = {}
+        path_results: dict[str, dict] = {}
+
+        for scope, operations in self._path_operations.items():
+            current, reg_type = self._read(scope, "Path")
+            new_value, replaced_dirs = compute_path_value(current or "", operations)
+            changed = new_value != (current or "")
+            if changed:
+                writes[(scope, "Path")] = (new_value, reg_type or winreg.REG_EXPAND_SZ)
+            path_results[scope] = {"changed": changed, "replaced_dirs": replaced_dirs, "value": new_value}
+
+        for (scope, name), value in self._variables.items():
+            reg_type = winreg.REG_EXPAND_SZ if "%" in value else winreg.REG_SZ
+            current, current_type = self._read(scope, name)
+            if current != value or current_type != reg_type:
+                writes[(scope, name)] = (value, reg_type)
+
+        for (scope, name), (value, reg_type) in writes.items():
+            _write_env_value(scope, name, value, reg_type)
+            self._read_cache[(scope, name.lower())] = (value, reg_type)
+
+        did_broadcast = False
+        if writes and self.broadcast:
+            _broadcast_env_change(ctypes)
+            did_broadcast = True
+
+        # ---------- current process environment (immediate effect) ----------
+        process_operations: list[PathOperation] = []
+        for operations in self._path_operations.values():
+            for op in operations:
+                if op.kind == "set" and self.expand_for_process:
+                    op = PathOperation("set", os.path.expandvars(op.path))
+                process_operations.append(op)
+        if process_operations:
+            os.environ["PATH"], _ = compute_path_value(os.environ.get("PATH", ""), process_operations)
+        for (scope, name), value in self._variables.items():
+            expand = self.expand_for_process and "%" in value
+            os.environ[name] = os.path.expandvars(value) if expand else value
+
+        self._path_operations.clear()
+        self._variables.clear()
+
+        return {
+            "written": list(writes.keys()),
+            "broadcasted": did_broadcast,
+            "path": path_results,
+        }
+
+
+def _check_scope(scope: str) -> None:
+    if scope not in ENVIRONMENT_KEYS:
+        raise ValueError("scope must be 'user' or 'machine'")
+
+
+def _get_env_reg_location(scope: str):
+    _check_scope(scope)
+    root = winreg.HKEY_CURRENT_USER if scope == "user" else winreg.HKEY_LOCAL_MACHINE
+    return root, ENVIRONMENT_KEYS[scope]
+
+
+def _read_env_value(scope: str, name: str) -> tuple[str | None, int | None]:
+    """Read a persisted environment variable. Returns (None, None) if it doesn't exist."""
+    root, subkey = _get_env_reg_location(scope)
+    try:
+        with winreg.OpenKey(root, subkey, 0, winreg.KEY_READ) as k:
+            value, reg_type = winreg.QueryValueEx(k, name)
+    except FileNotFoundError:
+        return None, None
+    return (value if isinstance(value, str) else None), reg_type
+
+
+def _write_env_value(scope: str, name: str, value: str, reg_type: int) -> None:
+    root, subkey = _get_env_reg_location(scope)
+    with winreg.OpenKey(root, subkey, 0, winreg.KEY_SET_VALUE) as k:
+        winreg.SetValueEx(k, name, 0, reg_type, value)
+
+
 def ensure_exe_dir_in_path(
     exe_path: str,
     scope: Literal["user", "machine"] = "user",                # 'user' (no admin) or 'machine' (admin required)
@@ -133,6 +486,9 @@ def ensure_exe_dir_in_path(
       - If any PATH entry currently provides an exe with the same filename, replace those entries with `dir(exe_path)`
       - Otherwise, append (or prepend) the new directory
 
+    For several PATH/variable changes in a row, use 'EnvironmentEditor' directly, so the registry is written
+    and WM_SETTINGCHANGE is broadcast only once.
+
     :param exe_path: Full path to the executable to ensure on PATH (e.g. C:\vcpkg\installed\x64-windows\tools\tesseract\tesseract.exe).
     :param scope: 'user' (no admin) or 'machine' (admin required).
     :param include_windows_dirs: Whether to allow replacing PATH entries under C:\Windows* (not recommended).
@@ -152,123 +508,13 @@ def ensure_exe_dir_in_path(
     print(result)
 
     """
+    editor = EnvironmentEditor(scope=scope)
+    new_dir, exe_name = editor.ensure_exe_dir_in_path(
+        exe_path, include_windows_dirs=include_windows_dirs, position=position, require_existence=require_existence)
+    path_result: dict = editor.commit()["path"][scope]
 
-    # ---------- inner helpers (no outer vars captured) ----------
-    def _norm_dir(path_str: str, _os):
-        p = (path_str or "").strip().strip('"').replace("/", "\\")
-        while p.endswith("\\"):
-            p = p[:-1]
-        return _os.path.normcase(_os.path.normpath(p))
-
-    def _comp_norm(path_str: str, _os):
-        return _norm_dir(_os.path.expandvars(path_str or ""), _os)
-
-    def _is_windows_rooted(path_str: str, _os):
-        expanded_internal = _os.path.expandvars(path_str or "").replace("/", "\\").rstrip("\\").lower()
-        roots = []
-        for env in ("SystemRoot", "windir"):
-            v = _os.environ.get(env)
-            if v:
-                roots.append(v.replace("/", "\\").rstrip("\\").lower())
-        return any(expanded_internal == r or expanded_internal.startswith(r + "\\") for r in roots)
-
-    def _read_path(_scope: str, _winreg):
-        if _scope == "user":
-            root, subkey = _winreg.HKEY_CURRENT_USER, r"Environment"
-        else:
-            root, subkey = _winreg.HKEY_LOCAL_MACHINE, r"SYSTEM\CurrentControlSet\Control\Session Manager\Environment"
-        try:
-            with _winreg.OpenKey(root, subkey, 0, _winreg.KEY_READ) as k:
-                val, reg_type = _winreg.QueryValueEx(k, "Path")
-        except FileNotFoundError:
-            val, reg_type = "", _winreg.REG_EXPAND_SZ
-        return val, reg_type, (root, subkey)
-
-    def _write_path(root_subkey, new_val_internal: str, reg_type: int, _winreg):
-        root, subkey = root_subkey
-        with _winreg.OpenKey(root, subkey, 0, _winreg.KEY_SET_VALUE) as k:
-            _winreg.SetValueEx(k, "Path", 0, reg_type or _winreg.REG_EXPAND_SZ, new_val_internal)
-
-    def _dir_contains_exe(dir_candidate: str, exe_name_internal: str, _os):
-        raw_internal = (dir_candidate or "").strip().strip('"')
-        exp = _os.path.expandvars(raw_internal)
-        return _os.path.isfile(_os.path.join(exp, exe_name_internal))
-
-
-    # ---------- validate & derive ----------
-    if position not in ("end", "front"):
-        raise ValueError("position must be 'end' or 'front'")
-    if scope not in ("user", "machine"):
-        raise ValueError("scope must be 'user' or 'machine'")
-    if not exe_path or not isinstance(exe_path, str):
-        raise ValueError("exe_path must be a non-empty string")
-
-    raw = exe_path.strip().strip('"')
-    expanded = os.path.expandvars(raw)
-    norm_exe = os.path.normpath(expanded)
-
-    if not norm_exe.lower().endswith(".exe"):
-        raise ValueError("exe_path must point to a .exe file")
-    if require_existence and not os.path.isfile(norm_exe):
-        raise FileNotFoundError(f"Executable not found: {norm_exe}")
-
-    new_dir = os.path.dirname(norm_exe)
-    exe_name = os.path.basename(norm_exe)
-    new_dir_norm = _norm_dir(new_dir, os)
-
-    # ---------- persisted PATH (registry) ----------
-    cur_path, regtype, handle = _read_path(scope, winreg)
-    parts = [p for p in cur_path.split(";") if p]
-
-    out_parts = []
-    seen_dirs = set()
-    replaced_dirs = []
-    changed = False
-
-    for p in parts:
-        comp = _comp_norm(p, os)
-        if comp in seen_dirs:
-            changed = True
-            continue
-        if _dir_contains_exe(p, exe_name, os):
-            if include_windows_dirs or not _is_windows_rooted(p, os):
-                replaced_dirs.append(p)
-                changed = True
-                continue  # drop old provider
-        out_parts.append(p)
-        seen_dirs.add(comp)
-
-    if new_dir_norm not in seen_dirs:
-        if position == "front":
-            out_parts = [new_dir] + out_parts
-        else:
-            out_parts.append(new_dir)
-        changed = True
-
-    new_val = ";".join(out_parts).strip(";")
-    if changed:
-        _write_path(handle, new_val, regtype, winreg)
-        _broadcast_env_change(ctypes)
-
-    # ---------- current process PATH (immediate effect) ----------
-    proc_parts = [p for p in os.environ.get("PATH", "").split(";") if p]
-    proc_out, proc_seen = [], set()
-    for p in proc_parts:
-        if _dir_contains_exe(p, exe_name, os) and (include_windows_dirs or not _is_windows_rooted(p, os)):
-            continue  # drop old providers
-        comp = _comp_norm(p, os)
-        if comp not in proc_seen:
-            proc_out.append(p)
-            proc_seen.add(comp)
-
-    if _comp_norm(new_dir, os) not in proc_seen:
-        if position == "front":
-            proc_out = [new_dir] + proc_out
-        else:
-            proc_out.append(new_dir)
-    os.environ["PATH"] = ";".join(proc_out).strip(";")
-
-    action = "replaced" if replaced_dirs else ("added" if changed else "unchanged")
+    replaced_dirs = path_result["replaced_dirs"]
+    action = "replaced" if replaced_dirs else ("added" if path_result["changed"] else "unchanged")
     return {
         "action": action,
         "new_dir": new_dir,
@@ -287,6 +533,7 @@ def set_environment_variable(
 ) -> dict:
     r"""
     Set an environment variable persistently (User or Machine) and update the current process.
+    The registry is written (and the change broadcast) only if the value differs from the current one.
 
     :param name: Name of the environment variable (e.g. 'Path' or 'MyVar').
     :param value: Value to set (e.g. 'C:\MyDir' or
@@ -306,71 +553,323 @@ def set_environment_variable(
         'broadcasted': True|False
       }
     """
-
-    # ---------- inner helpers (no outer vars captured) ----------
-    def _get_reg_location(_scope: str, _winreg):
-        if _scope == "user":
-            return (_winreg.HKEY_CURRENT_USER, r"Environment")
-        elif _scope == "machine":
-            return (_winreg.HKEY_LOCAL_MACHINE, r"SYSTEM\CurrentControlSet\Control\Session Manager\Environment")
-        else:
-            raise ValueError("scope must be 'user' or 'machine'")
-
-    # ---------- validate inputs ----------
-    if not isinstance(name, str) or not name.strip():
-        raise ValueError("name must be a non-empty string")
-    if not isinstance(value, str):
-        raise ValueError("value must be a string")
-    var_name = "Path" if name.strip().lower() == "path" else name.strip()
-
-    # Determine registry type: expand if the string contains %VARS%
-    reg_type = winreg.REG_EXPAND_SZ if "%" in value else winreg.REG_SZ
-
-    # ---------- write registry ----------
-    root, subkey = _get_reg_location(scope, winreg)
-    with winreg.OpenKey(root, subkey, 0, winreg.KEY_SET_VALUE) as k:
-        winreg.SetValueEx(k, var_name, 0, reg_type, value)
-
-    # ---------- broadcast change (for new processes to pick it up) ----------
-    did_broadcast = False
-    if broadcast:
-        _broadcast_env_change(ctypes)
-        did_broadcast = True
-
-    # ---------- update current process environment ----------
-    # For the running Python process, optionally expand for convenience.
-    os.environ[var_name] = os.path.expandvars(value) if (expand_for_process and reg_type == winreg.REG_EXPAND_SZ) else value
+    editor = EnvironmentEditor(scope=scope, broadcast=broadcast, expand_for_process=expand_for_process)
+    var_name = editor.set_variable(name, value)
+    result = editor.commit()
 
     return {
         "name": var_name,
         "value_set": value,
-        "reg_type": "REG_EXPAND_SZ" if reg_type == winreg.REG_EXPAND_SZ else "REG_SZ",
+        "reg_type": "REG_EXPAND_SZ" if "%" in value else "REG_SZ",
         "scope": scope,
-        "broadcasted": did_broadcast,
+        "broadcasted": result["broadcasted"],
     }
 
 
-def _iter_uninstall_keys():
-    """Iterate over relevant Windows uninstall registry keys."""
-    # Only valid on Windows where winreg is available
-    hives = [
-        (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall"),
-        (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall"),
-    ]
-    for hive, path in hives:
+UNINSTALL_ROOTS: list[tuple[str, str]] = [
+    ("HKLM", r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall"),
+    ("HKLM", r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall"),
+    ("HKCU", r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall"),
+]
+
+# Per-user, a shared temp directory would let another user plant the programs of the index.
+UNINSTALL_INDEX_CACHE_FILE: str = str(Path.home() / ".dkinst" / "uninstall_index.json")
+# Bump when the persisted format changes.
+_UNINSTALL_INDEX_FORMAT: int = 2
+
+_GUID_KEY_RE = re.compile(r"^\{[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}\}$")
+
+
+@dataclass
+class InstalledProgram:
+    display_name: str
+    version: str | None = None
+    publisher: str | None = None
+    uninstall_string: str | None = None
+    install_date: str | None = None
+    # Name of the uninstall subkey, for MSI products this is the product GUID.
+    key_name: str = ""
+    # Root that the program was found in, e.g. "HKLM\SOFTWARE\...\Uninstall".
+    root: str = ""
+
+    @property
+    def guid(self) -> str | None:
+        return self.key_name if _GUID_KEY_RE.match(self.key_name or "") else None
+
+
+class UninstallRegistryProvider(Protocol):
+    def subkey_stamps(self, hive: str, path: str) -> dict[str, int] | None:
+        """
+        Return the last-write time of every subkey of the uninstall key, None if the key is missing.
+        A subkey's last-write time changes when its values change (e.g. DisplayVersion on upgrade),
+        the parent key's doesn't.
+        """
+        ...
+
+    def read_entry(self, hive: str, path: str, subkey_name: str) -> dict | None:
+        """Return {value_name: value} of one subkey of the uninstall key, None if it can't be opened."""
+        ...
+
+    def iter_entries(self, hive: str, path: str) -> Iterable[tuple[str, dict]]:
+        """Yield (subkey_name, {value_name: value}) for every subkey of the uninstall key."""
+        ...
+
+
+class WinregUninstallProvider:
+    """Reads the uninstall keys with winreg."""
+    def __init__(self):
+        self._hives = {"HKLM": winreg.HKEY_LOCAL_MACHINE, "HKCU": winreg.HKEY_CURRENT_USER}
+
+    @staticmethod
+    def _iter_subkey_names(key) -> Iterable[str]:
+        i = 0
+        while True:
+            try:
+                yield winreg.EnumKey(key, i)
+            except OSError:
+                break
+            i += 1
+
+    def subkey_stamps(self, hive: str, path: str) -> dict[str, int] | None:
         try:
-            key = winreg.OpenKey(hive, path)
-        except Exception:
-            continue
+            key = winreg.OpenKey(self._hives[hive], path)
+        except OSError:
+            return None
+        stamps: dict[str, int] = {}
         with key:
-            i = 0
-            while True:
+            for subkey_name in self._iter_subkey_names(key):
+                try:
+                    with winreg.OpenKey(key, subkey_name) as subkey:
+                        stamps[subkey_name] = winreg.QueryInfoKey(subkey)[2]
+                except OSError:
+                    continue
+        return stamps
+
+    def read_entry(self, hive: str, path: str, subkey_name: str) -> dict | None:
+        try:
+            subkey = winreg.OpenKey(self._hives[hive], f"{path}\\{subkey_name}")
+        except OSError:
+            return None
+        values: dict = {}
+        with subkey:
+            for value_name in ("DisplayName", "DisplayVersion", "Publisher", "UninstallString", "InstallDate"):
                 try:
-                    subkey_name = winreg.EnumKey(key, i)
+                    values[value_name], _ = winreg.QueryValueEx(subkey, value_name)
                 except OSError:
-                    break
-                yield hive, path, subkey_name
-                i += 1
+                    continue
+        return values
+
+    def iter_entries(self, hive: str, path: str) -> Iterable[tuple[str, dict]]:
+        try:
+            key = winreg.OpenKey(self._hives[hive], path)
+        except OSError:
+            return
+        with key:
+            subkey_names: list[str] = list(self._iter_subkey_names(key))
+        for subkey_name in subkey_names:
+            values: dict | None = self.read_entry(hive, path, subkey_name)
+            if values is not None:
+                yield subkey_name, values
+
+
+def _normalize_program_name(name: str) -> str:
+    return re.sub(r"\s+", " ", (name or "")).strip().casefold()
+
+
+class UninstallIndex:
+    """
+    Index of installed programs from the Uninstall registry keys (HKLM, HKLM WOW6432Node and HKCU).
+    Built once and queried many times with exact, prefix, substring and fuzzy lookups.
+
+    The persisted copy is validated by the last-write time of every uninstall subkey: the programs of the
+    unchanged subkeys are reused, only the added or changed subkeys are read again.
+
+    Usage example:
+    index = registrys.get_uninstall_index()
+    program = index.find_exact("ESET Security")
+    programs = index.find_prefix("Microsoft Visual C++")
+    programs = index.find_fuzzy("Notepad++")
+    """
+    def __init__(self, programs: list[InstalledProgram], stamps: dict[str, dict[str, int] | None] | None = None):
+        self.programs: list[InstalledProgram] = programs
+        self.stamps: dict[str, dict[str, int] | None] = stamps or {}
+
+        self._by_name: dict[str, list[InstalledProgram]] = {}
+        for program in programs:
+            self._by_name.setdefault(_normalize_program_name(program.display_name), []).append(program)
+        self._sorted_names: list[str] = sorted(self._by_name)
+
+    @staticmethod
+    def read_stamps(provider: UninstallRegistryProvider) -> dict[str, dict[str, int] | None]:
+        return {f"{hive}\\{path}": provider.subkey_stamps(hive, path) for hive, path in UNINSTALL_ROOTS}
+
+    @classmethod
+    def build(cls, provider: UninstallRegistryProvider | None = None) -> "UninstallIndex":
+        """Walk all the uninstall keys once and build the index."""
+        provider = provider or WinregUninstallProvider()
+
+        # Stamps first: a subkey that changes during the walk is read again next time.
+        stamps = cls.read_stamps(provider)
+        programs: list[InstalledProgram] = []
+        for hive, path in UNINSTALL_ROOTS:
+            for key_name, values in provider.iter_entries(hive, path):
+                program = _program_from_values(values, key_name, f"{hive}\\{path}")
+                if program is not None:
+                    programs.append(program)
+
+        return cls(programs, stamps)
+
+    @classmethod
+    def load_or_build(
+            cls,
+            provider: UninstallRegistryProvider | None = None,
+            cache_path: str = UNINSTALL_INDEX_CACHE_FILE,
+    ) -> "UninstallIndex":
+        """
+        Load the persisted index and read again only the subkeys whose last-write time changed since it was saved
+        (or that were added), the removed ones are dropped. Without a usable persisted index, build and save.
+        Reading the stamps costs one key open per subkey, instead of reading the values of every subkey.
+        """
+        provider = provider or WinregUninstallProvider()
+
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != _UNINSTALL_INDEX_FORMAT:
+                raise ValueError("format")
+            cached_stamps: dict = data["stamps"]
+            cached_programs: dict[tuple[str, str], list[InstalledProgram]] = {}
+            for p in data["programs"]:
+                program = InstalledProgram(**p)
+                cached_programs.setdefault((program.root, program.key_name), []).append(program)
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            metrics.count_cache("uninstall_index", hit=False)
+            index = cls.build(provider)
+            index.save(cache_path)
+            return index
+
+        current_stamps = cls.read_stamps(provider)
+        programs: list[InstalledProgram] = []
+        reread: int = 0
+        for hive, path in UNINSTALL_ROOTS:
+            root: str = f"{hive}\\{path}"
+            root_cached_stamps: dict = cached_stamps.get(root) or {}
+            for key_name, stamp in (current_stamps.get(root) or {}).items():
+                if root_cached_stamps.get(key_name) == stamp:
+                    programs.extend(cached_programs.get((root, key_name), []))
+                    continue
+                reread += 1
+                values: dict | None = provider.read_entry(hive, path, key_name)
+                program = _program_from_values(values or {}, key_name, root)
+                if program is not None:
+                    programs.append(program)
+
+        index = cls(programs, current_stamps)
+        hit: bool = reread == 0 and current_stamps == cached_stamps
+        metrics.count_cache("uninstall_index", hit=hit)
+        if not hit:
+            index.save(cache_path)
+        return index
+
+    def save(self, cache_path: str = UNINSTALL_INDEX_CACHE_FILE) -> None:
+        """Best-effort: persist the index atomically."""
+        payload = {
+            "format": _UNINSTALL_INDEX_FORMAT,
+            "stamps": self.stamps,
+            "programs": [asdict(p) for p in self.programs],
+        }
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+
+    def find_exact(self, display_name: str) -> InstalledProgram | None:
+        """Case and whitespace insensitive exact DisplayName match."""
+        programs = self._by_name.get(_normalize_program_name(display_name))
+        return programs[0] if programs else None
+
+    def find_prefix(self, prefix: str) -> list[InstalledProgram]:
+        """All programs whose DisplayName starts with the prefix."""
+        p = _normalize_program_name(prefix)
+        result: list[InstalledProgram] = []
+        i = bisect.bisect_left(self._sorted_names, p)
+        while i < len(self._sorted_names) and self._sorted_names[i].startswith(p):
+            result.extend(self._by_name[self._sorted_names[i]])
+            i += 1
+        return result
+
+    def find_containing(self, target_names: list[str]) -> list[InstalledProgram]:
+        """All programs whose DisplayName contains any of the target names, in registry order."""
+        targets = [_normalize_program_name(n) for n in target_names]
+        return [
+            p for p in self.programs
+            if any(t in _normalize_program_name(p.display_name) for t in targets)
+        ]
+
+    def find_fuzzy(self, query: str, limit: int = 5, cutoff: float = 0.6) -> list[InstalledProgram]:
+        """Closest DisplayName matches by similarity ratio (difflib), best first."""
+        names = difflib.get_close_matches(_normalize_program_name(query), self._sorted_names, n=limit, cutoff=cutoff)
+        return [program for name in names for program in self._by_name[name]]
+
+
+def _str_or_none(value) -> str | None:
+    return None if value is None else str(value)
+
+
+def _program_from_values(
+        values: dict,
+        key_name: str,
+        root: str
+) -> InstalledProgram | None:
+    display_name = values.get("DisplayName")
+    if not display_name:
+        return None
+    return InstalledProgram(
+        display_name=str(display_name),
+        version=_str_or_none(values.get("DisplayVersion")),
+        publisher=_str_or_none(values.get("Publisher")),
+        uninstall_string=_str_or_none(values.get("UninstallString")),
+        install_date=_str_or_none(values.get("InstallDate")),
+        key_name=key_name,
+        root=root,
+    )
+
+
+_UNINSTALL_INDEX: UninstallIndex | None = None
+
+
+def get_uninstall_index(
+        refresh: bool = False,
+        persist: bool = False,
+        provider: UninstallRegistryProvider | None = None,
+) -> UninstallIndex:
+    """
+    Return the uninstall index for this run, building it on first use.
+
+    :param refresh: Rebuild the index, e.g. after installing or uninstalling a program.
+    :param persist: Use the persisted index between runs (validated by the uninstall subkeys' last-write time).
+    :param provider: Registry provider, default is winreg.
+    :return: UninstallIndex.
+    """
+    global _UNINSTALL_INDEX
+    if _UNINSTALL_INDEX is None or refresh:
+        if persist and not refresh:
+            _UNINSTALL_INDEX = UninstallIndex.load_or_build(provider)
+        else:
+            _UNINSTALL_INDEX = UninstallIndex.build(provider)
+            if persist:
+                _UNINSTALL_INDEX.save()
+    return _UNINSTALL_INDEX
+
+
+def invalidate_uninstall_index() -> None:
+    """Drop the index of this run, e.g. after a step installed or uninstalled programs."""
+    global _UNINSTALL_INDEX
+    _UNINSTALL_INDEX = None
 
 
 def find_uninstall_string(
@@ -378,31 +877,17 @@ def find_uninstall_string(
 ):
     """
     Locate program uninstall string in registry.
+    The first program whose DisplayName contains any of the target names is used.
 
     Returns the uninstall command line (string) or None if not found.
     """
 
-    for hive, parent_path, subkey_name in _iter_uninstall_keys():
-        try:
-            subkey = winreg.OpenKey(hive, parent_path + "\\" + subkey_name)
-        except Exception:
+    for program in get_uninstall_index().find_containing(target_names):
+        if not program.uninstall_string:
             continue
-        with subkey:
-            try:
-                display_name, _ = winreg.QueryValueEx(subkey, "DisplayName")
-            except Exception:
-                continue
-
-            if not any(name.lower() in display_name.lower() for name in target_names):
-                continue
-
-            try:
-                uninstall_string, _ = winreg.QueryValueEx(subkey, "UninstallString")
-            except Exception:
-                continue
 
-            print(f"[+] Found ESET installation: {display_name}")
-            print(f"[+] Uninstall string: {uninstall_string}")
-            return uninstall_string
+        print(f"[+] Found installation: {program.display_name}")
+        print(f"[+] Uninstall string: {program.uninstall_string}")
+        return program.uninstall_string
 
-    return None
\ No newline at end of file
+    return None
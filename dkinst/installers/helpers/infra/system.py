@@ -1,7 +1,9 @@
+import functools
 import os
 import platform
 
 
+@functools.cache
 def get_platform() -> str:
     """Return the current platform as a string."""
     current_platform = platform.system().lower()
@@ -16,6 +18,7 @@ def get_platform() -> str:
         return ""
 
 
+@functools.cache
 def is_debian() -> bool:
     """Check if the current Linux distribution is Debian-based."""
     if os.path.exists("/etc/os-release"):
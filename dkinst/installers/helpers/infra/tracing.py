@@ -0,0 +1,254 @@
+"""
+Lightweight tracing of the phases of a run.
+
+Spans are timed with attributes and exported in the Chrome trace event format, that can be opened
+in chrome://tracing or https://ui.perfetto.dev. Every span also carries OpenTelemetry-style
+'trace_id', 'span_id' and 'parent_span_id' attributes.
+
+Tracing is disabled by default, then 'span' and 'traced' cost one flag check.
+
+Usage:
+    dkinst --trace out.json install tesseract_ocr
+
+    from .infra import tracing
+
+    @tracing.traced("command", attributes=lambda cmd, **kwargs: {"cmd": str(cmd)})
+    def run(cmd): ...
+
+    with tracing.span("extract", archive=archive_path) as current_span:
+        ...
+        current_span.set(files=count)
+"""
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable
+
+
+_LOCK = threading.Lock()
+_LOCAL = threading.local()
+
+_ENABLED: bool = False
+_EVENTS: list[dict] = []
+_TRACE_ID: str = ""
+_EPOCH_NS: int = 0
+_INSTRUMENTED: set[str] = set()
+
+
+class Span:
+    """A timed phase. Attributes can be added while the span is open with 'set'."""
+    def __init__(
+            self,
+            name: str,
+            category: str,
+            attributes: dict
+    ):
+        self.name: str = name
+        self.category: str = category
+        self.attributes: dict = attributes
+        self.span_id: str = uuid.uuid4().hex[:16]
+        self.parent_span_id: str | None = None
+        self._start_ns: int = 0
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        stack: list[Span] = _get_stack()
+        if stack:
+            self.parent_span_id = stack[-1].span_id
+        stack.append(self)
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        end_ns: int = time.perf_counter_ns()
+        stack: list[Span] = _get_stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc_val}"
+
+        args: dict = {key: _to_json_value(value) for key, value in self.attributes.items()}
+        args.update({"trace_id": _TRACE_ID, "span_id": self.span_id, "parent_span_id": self.parent_span_id})
+        event: dict = {
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": (self._start_ns - _EPOCH_NS) / 1000,
+            "dur": (end_ns - self._start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with _LOCK:
+            _EVENTS.append(event)
+
+
+class _NoopSpan:
+    def set(self, **attributes) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _get_stack() -> list[Span]:
+    stack = getattr(_LOCAL, "stack", None)
+    if stack is None:
+        stack = _LOCAL.stack = []
+    return stack
+
+
+def _to_json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(item) for item in value]
+    return str(value)
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+def enable() -> None:
+    """Start collecting spans. The previously collected spans are dropped."""
+    global _ENABLED, _TRACE_ID, _EPOCH_NS
+    with _LOCK:
+        _EVENTS.clear()
+        _TRACE_ID = uuid.uuid4().hex
+        _EPOCH_NS = time.perf_counter_ns()
+        _ENABLED = True
+    _instrument_dependencies()
+
+
+def disable() -> None:
+    global _ENABLED
+    _ENABLED = False
+
+
+def span(
+        name: str,
+        category: str = "dkinst",
+        **attributes
+) -> Span | _NoopSpan:
+    """
+    :param name: Span name.
+    :param category: Chrome trace category, used for filtering in the viewer.
+    :param attributes: Span attributes. Values that aren't JSON types are converted to strings.
+    :return: Context manager of the span, a no-op one if tracing is disabled.
+    """
+    if not _ENABLED:
+        return _NOOP_SPAN
+    return Span(name, category, attributes)
+
+
+def traced(
+        name: str,
+        category: str = "dkinst",
+        attributes: Callable[..., dict] | None = None,
+        result_attributes: Callable[[object], dict] | None = None
+):
+    """
+    Decorator that wraps every call of the function in a span.
+
+    :param name: Span name.
+    :param category: Chrome trace category.
+    :param attributes: Optional callable that gets the call arguments and returns the span attributes.
+    :param result_attributes: Optional callable that gets the return value and returns more span attributes.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return func(*args, **kwargs)
+
+            span_attributes: dict = {}
+            if attributes is not None:
+                try:
+                    span_attributes = attributes(*args, **kwargs)
+                except Exception:
+                    span_attributes = {}
+
+            with Span(name, category, span_attributes) as current_span:
+                result = func(*args, **kwargs)
+                if result_attributes is not None:
+                    try:
+                        current_span.set(**result_attributes(result))
+                    except Exception:
+                        pass
+                return result
+        return wrapper
+    return decorator
+
+
+def instrument(
+        module,
+        function_name: str,
+        name: str,
+        category: str = "dkinst",
+        attributes: Callable[..., dict] | None = None
+) -> None:
+    """
+    Wrap a function of a third-party module in a span, once.
+
+    :param module: The module object.
+    :param function_name: Name of the function in the module.
+    :param name: Span name.
+    :param category: Chrome trace category.
+    :param attributes: Optional callable that gets the call arguments and returns the span attributes.
+    """
+    key: str = f"{module.__name__}.{function_name}"
+    with _LOCK:
+        if key in _INSTRUMENTED or not hasattr(module, function_name):
+            return
+        _INSTRUMENTED.add(key)
+    setattr(module, function_name, traced(name, category, attributes)(getattr(module, function_name)))
+
+
+def _instrument_dependencies() -> None:
+    # Downloads are done by dkwebmod, which is imported by the helpers that download.
+    try:
+        from dkwebmod import web
+    except ImportError:
+        return
+
+    instrument(
+        web, "download", "web.download", category="network",
+        attributes=lambda *args, **kwargs: {"url": args[0] if args else kwargs.get("file_url")})
+
+
+def get_events() -> list[dict]:
+    with _LOCK:
+        return list(_EVENTS)
+
+
+def write_chrome_trace(file_path: str) -> None:
+    """
+    Write the collected spans in the Chrome trace event format.
+
+    :param file_path: Path of the JSON trace file.
+    """
+    events: list[dict] = get_events()
+    thread_names: dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+    metadata: list[dict] = [
+        {
+            "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+            "args": {"name": thread_names.get(tid, str(tid))},
+        }
+        for tid in sorted({event["tid"] for event in events})
+    ]
+
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
@@ -1,11 +1,10 @@
 import os
 import subprocess
-import shutil
 import time
 
 from rich.console import Console
 
-from . import ubuntu_permissions
+from . import ubuntu_permissions, executables
 
 
 console = Console()
@@ -18,7 +17,7 @@ def is_executable_exists(package: str) -> bool:
     :return:
     """
 
-    if not shutil.which(package):
+    if not executables.which(package):
         return False
     else:
         return True
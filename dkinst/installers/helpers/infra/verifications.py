@@ -0,0 +1,343 @@
+"""
+Cache of artifact verifications, keyed by SHA-256.
+
+The hash comes from the download itself ('downloads.download' computes it while writing the file), or from
+'get_file_sha256', that hashes a file in one pass and remembers the hash by path, size and mtime.
+A verification result (like the Authenticode signature status and signer) is stored per hash and kind in
+'VERIFICATIONS_FILE', so a repeat install of the same artifact skips the PowerShell signature check.
+Only valid results are reused, and for 'MAX_AGE_SECONDS', so a revoked certificate is noticed eventually.
+A result is valid only with the expected signer, when the caller passes one, not just with the 'Valid' status.
+The store is writable by the user, so an elevated process doesn't trust it and always verifies again.
+
+Usage:
+    from .infra import verifications
+
+    result: verifications.VerificationResult = verifications.verify_authenticode(
+        exe_path, sha256=download.sha256, expected_signer="Insecure.Com LLC")
+    if not result.is_valid: ...
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable
+
+from . import executables, metrics, permissions
+
+
+VERIFICATIONS_FILE: str = str(Path.home() / ".dkinst" / "verifications.json")
+MAX_AGE_SECONDS: int = 30 * 24 * 60 * 60
+CHUNK_SIZE: int = 1024 * 1024
+
+KIND_AUTHENTICODE: str = "authenticode"
+STATUS_VALID: str = "Valid"
+
+_AUTHENTICODE_PS_SCRIPT: str = r"""
+$ErrorActionPreference = 'Stop'
+& {
+  param([Parameter(Mandatory=$true)][string]$Path)
+
+  $sig = Get-AuthenticodeSignature -LiteralPath $Path
+
+  $obj = [pscustomobject]@{
+    Status        = $sig.Status.ToString()
+    StatusMessage = $sig.StatusMessage
+    SignerSubject = if ($sig.SignerCertificate) { $sig.SignerCertificate.Subject } else { $null }
+  }
+
+  # Write exactly one JSON line to stdout
+  [Console]::WriteLine(($obj | ConvertTo-Json -Compress))
+}
+""".strip()  # CRITICAL: prevents the appended arg from landing on a new line
+
+
+class VerificationError(Exception):
+    pass
+
+
+def _parse_subject(subject: str) -> dict[str, str]:
+    """:return: Dict of attribute -> value of a certificate subject, like 'CN=Name, O="Org, Inc.", C=US'."""
+    attributes: dict[str, str] = {}
+    for match in re.finditer(r'\s*([A-Za-z.0-9]+)=("(?:[^"]|"")*"|[^,]*)\s*(?:,|$)', subject or ""):
+        value: str = match.group(2).strip()
+        if value.startswith('"') and value.endswith('"'):
+            value = value[1:-1].replace('""', '"')
+        attributes.setdefault(match.group(1).upper(), value)
+    return attributes
+
+
+def signer_matches(
+        signer: str | None,
+        expected_signer: str
+) -> bool:
+    """
+    :param signer: Signer subject of the signature, like 'CN=Insecure.Com LLC, O=Insecure.Com LLC, C=US'.
+    :param expected_signer: A full subject, or the common name (CN) only.
+    :return: True if the signer is the expected one, case-insensitive.
+    """
+    if not signer:
+        return False
+    attributes: dict[str, str] = {key: value.casefold() for key, value in _parse_subject(signer).items()}
+    if "=" in expected_signer:
+        return attributes == {key: value.casefold() for key, value in _parse_subject(expected_signer).items()}
+    return attributes.get("CN") == expected_signer.casefold()
+
+
+@dataclass
+class VerificationResult:
+    """
+    :param status: Verification status, like the Authenticode 'Valid', 'NotSigned', 'HashMismatch'.
+    :param signer: Signer subject, None if unsigned or not applicable.
+    :param message: Status message.
+    :param verified_at: Unix time of the verification.
+    :param cached: True if the result was taken from the store.
+    :param expected_signer: Signer the result was required to have, see 'signer_matches'. None for any signer.
+    """
+    status: str
+    signer: str | None = None
+    message: str | None = None
+    verified_at: float = 0.0
+    cached: bool = False
+    expected_signer: str | None = None
+
+    @property
+    def is_valid(self) -> bool:
+        if self.status != STATUS_VALID:
+            return False
+        return self.expected_signer is None or signer_matches(self.signer, self.expected_signer)
+
+
+class VerificationStore:
+    """
+    JSON store of the verification results by SHA-256 and kind, and of the file hashes by path.
+
+    :param file_path: Path of the JSON file.
+    """
+    def __init__(self, file_path: str):
+        self.file_path: str = file_path
+        self._lock = threading.Lock()
+        self._data: dict | None = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            try:
+                with open(self.file_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if not isinstance(data, dict):
+                data = {}
+            data.setdefault("results", {})
+            data.setdefault("files", {})
+            self._data = data
+        return self._data
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.file_path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, indent=2)
+            os.replace(tmp_path, self.file_path)
+        except OSError:
+            pass
+
+    def get_result(
+            self,
+            sha256: str,
+            kind: str
+    ) -> VerificationResult | None:
+        """:return: The stored result of the hash and kind, None if there is none."""
+        with self._lock:
+            entry: dict | None = self._load()["results"].get(sha256.lower(), {}).get(kind)
+        if not isinstance(entry, dict):
+            return None
+        return VerificationResult(
+            status=entry.get("status", ""), signer=entry.get("signer"), message=entry.get("message"),
+            verified_at=entry.get("verified_at", 0.0), cached=True, expected_signer=entry.get("expected_signer"))
+
+    def record_result(
+            self,
+            sha256: str,
+            kind: str,
+            result: VerificationResult
+    ) -> None:
+        entry: dict = asdict(result)
+        entry.pop("cached")
+        with self._lock:
+            self._load()["results"].setdefault(sha256.lower(), {})[kind] = entry
+            self._save()
+
+    def get_file_hash(
+            self,
+            file_path: str,
+            size: int,
+            mtime_ns: int
+    ) -> str | None:
+        """:return: The stored hash of the file if its size and mtime didn't change, None otherwise."""
+        with self._lock:
+            entry: dict | None = self._load()["files"].get(os.path.abspath(file_path))
+        if isinstance(entry, dict) and entry.get("size") == size and entry.get("mtime_ns") == mtime_ns:
+            return entry.get("sha256")
+        return None
+
+    def record_file_hash(
+            self,
+            file_path: str,
+            size: int,
+            mtime_ns: int,
+            sha256: str
+    ) -> None:
+        with self._lock:
+            self._load()["files"][os.path.abspath(file_path)] = {"size": size, "mtime_ns": mtime_ns, "sha256": sha256}
+            self._save()
+
+
+_STORE: VerificationStore | None = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> VerificationStore:
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = VerificationStore(VERIFICATIONS_FILE)
+        return _STORE
+
+
+def hash_file(file_path: str) -> str:
+    """:return: SHA-256 hex digest of the file, read once in chunks."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_file_sha256(
+        file_path: str,
+        store: VerificationStore | None = None
+) -> str:
+    """
+    SHA-256 of a file, reused from the store while the file size and mtime are the same.
+
+    :param file_path: File path.
+    :param store: Verification store, default is the one of 'VERIFICATIONS_FILE'.
+    :return: SHA-256 hex digest.
+    """
+    store = store or get_store()
+    stat_result = os.stat(file_path)
+    sha256: str | None = store.get_file_hash(file_path, stat_result.st_size, stat_result.st_mtime_ns)
+    metrics.count_cache("file_hash", sha256 is not None)
+    if sha256 is None:
+        sha256 = hash_file(file_path)
+        store.record_file_hash(file_path, stat_result.st_size, stat_result.st_mtime_ns, sha256)
+    return sha256
+
+
+def verify_file(
+        file_path: str,
+        kind: str,
+        verifier: Callable[[str], VerificationResult],
+        sha256: str | None = None,
+        max_age_seconds: int = MAX_AGE_SECONDS,
+        store: VerificationStore | None = None,
+        expected_signer: str | None = None
+) -> VerificationResult:
+    """
+    Verify a file, or reuse the stored valid result of the same content.
+    An elevated process doesn't reuse the stored results, any user process could have written them.
+
+    :param file_path: File path.
+    :param kind: Verification kind, like 'KIND_AUTHENTICODE'.
+    :param verifier: Callable(file_path) -> VerificationResult, the actual verification.
+    :param sha256: SHA-256 of the file if it is already known, like from 'downloads.download'.
+        If None, it is computed with 'get_file_sha256'.
+    :param max_age_seconds: Age after which a stored result is verified again.
+    :param store: Verification store, default is the one of 'VERIFICATIONS_FILE'.
+    :param expected_signer: Required signer, see 'signer_matches'. The result isn't valid with another signer.
+    :return: VerificationResult, 'cached' is True if the verifier wasn't called.
+    """
+    store = store or get_store()
+    elevated: bool = permissions.is_admin()
+    # The file hash is computed again too, the stored one is keyed only by path, size and mtime.
+    sha256 = sha256 or (hash_file(file_path) if elevated else get_file_sha256(file_path, store))
+
+    cached: VerificationResult | None = None if elevated else store.get_result(sha256, kind)
+    if cached is not None:
+        cached.expected_signer = expected_signer
+    hit: bool = cached is not None and cached.is_valid and time.time() - cached.verified_at < max_age_seconds
+    metrics.count_cache("verification", hit)
+    if hit:
+        return cached
+
+    result: VerificationResult = verifier(file_path)
+    result.verified_at = result.verified_at or time.time()
+    result.expected_signer = expected_signer
+    store.record_result(sha256, kind, result)
+    return result
+
+
+def get_authenticode_signature(file_path: str) -> VerificationResult:
+    """
+    Check the Authenticode signature of a file with PowerShell 'Get-AuthenticodeSignature'.
+
+    :param file_path: File path.
+    :return: VerificationResult with the signature status, message and signer subject.
+    :raises VerificationError: PowerShell isn't available or didn't return the status.
+    """
+    ps = executables.which("powershell") or executables.which("pwsh")
+    if not ps:
+        raise VerificationError("PowerShell not found (powershell/pwsh). Required for signature check.")
+
+    completed = subprocess.run(
+        [ps, "-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass",
+         "-Command", _AUTHENTICODE_PS_SCRIPT, file_path],
+        capture_output=True,
+        text=True,
+    )
+
+    if completed.returncode != 0:
+        raise VerificationError(
+            "PowerShell signature check failed.\n"
+            f"Exit: {completed.returncode}\n"
+            f"STDOUT: {completed.stdout}\n"
+            f"STDERR: {completed.stderr}"
+        )
+
+    out = completed.stdout.strip()
+    if not out:
+        # Include stderr here too; in this failure mode PowerShell often wrote the real reason to stderr
+        raise VerificationError(
+            "PowerShell returned no output for signature check.\n"
+            f"STDERR: {completed.stderr}"
+        )
+
+    # If anything extra sneaks into stdout, take the last non-empty line as the JSON payload.
+    last_line = next((line for line in reversed(out.splitlines()) if line.strip()), "")
+    data = json.loads(last_line)
+    return VerificationResult(
+        status=data.get("Status") or "", signer=data.get("SignerSubject"), message=data.get("StatusMessage"))
+
+
+def verify_authenticode(
+        file_path: str,
+        sha256: str | None = None,
+        expected_signer: str | None = None
+) -> VerificationResult:
+    """
+    'get_authenticode_signature' through the verification store, see 'verify_file'.
+
+    :param file_path: File path.
+    :param sha256: SHA-256 of the file if it is already known.
+    :param expected_signer: Required signer subject or common name, see 'signer_matches'.
+    :return: VerificationResult.
+    """
+    return verify_file(
+        file_path, KIND_AUTHENTICODE, get_authenticode_signature, sha256=sha256, expected_signer=expected_signer)
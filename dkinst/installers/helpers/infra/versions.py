@@ -0,0 +1,461 @@
+"""
+Side-by-side versioned layout of portable installations.
+
+    <root>/versions/<version>/...    Each installed version in its own folder.
+    <root>/current                   Link to the active version: symlink on POSIX, junction on Windows
+                                     (no admin rights or developer mode needed).
+    <root>/versions.json             Activation history, used by 'rollback'.
+
+A new version is staged next to the active one in '<version>.partial' and renamed when complete, so a
+'versions/<version>' folder is always whole. Files that are identical to the active version's are hardlinked
+instead of copied, so an upgrade writes only what changed. Activation switches 'current' with a rename,
+the executables and PATH entries that point into 'current' never see a half-copied folder, and rollback
+is the same switch back to the previous version.
+
+A version folder counts as staged only when it is marked complete in 'versions.json', a folder left by an
+interrupted staging (or an older layout) is staged again.
+
+Hardlinked files are shared between the versions, so a file should be replaced rather than modified in place.
+Code that writes into a version folder in place calls 'break_hardlinks' on the path first.
+"""
+import filecmp
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import Callable
+
+
+VERSIONS_DIR_NAME: str = "versions"
+CURRENT_LINK_NAME: str = "current"
+STATE_FILE_NAME: str = "versions.json"
+PARTIAL_SUFFIX: str = ".partial"
+# The active version and the one before it, for rollback.
+KEEP_VERSIONS: int = 2
+
+_LAYOUT_NAMES: set[str] = {VERSIONS_DIR_NAME, CURRENT_LINK_NAME, STATE_FILE_NAME}
+
+
+class VersionsError(Exception):
+    pass
+
+
+def get_version_dir_name(version: str) -> str:
+    """:return: The version string as a folder name, characters that aren't safe in paths are replaced."""
+    return re.sub(r"[^A-Za-z0-9._+-]", "_", version.strip()) or "unknown"
+
+
+def get_current_path(root: str) -> str:
+    return os.path.join(root, CURRENT_LINK_NAME)
+
+
+def get_version_path(root: str, version: str) -> str:
+    return os.path.join(root, VERSIONS_DIR_NAME, get_version_dir_name(version))
+
+
+def get_layout_root(path: str) -> str | None:
+    """
+    :param path: Folder path, like the parent folder of an executable.
+    :return: The layout root if the path is its 'current' link folder, None otherwise.
+    """
+    path = os.path.normpath(path)
+    if os.path.basename(path) != CURRENT_LINK_NAME:
+        return None
+    return os.path.dirname(path)
+
+
+def is_versioned(root: str) -> bool:
+    return os.path.isdir(os.path.join(root, VERSIONS_DIR_NAME))
+
+
+def has_version(root: str, version: str) -> bool:
+    """:return: True if the version is staged and marked complete."""
+    return (
+        os.path.isdir(get_version_path(root, version))
+        and get_version_dir_name(version) in _load_state(root).get("complete", []))
+
+
+def has_flat_install(root: str) -> bool:
+    """:return: True if the root has files of an install that wasn't made in the versioned layout."""
+    try:
+        with os.scandir(root) as entries:
+            return any(not _is_layout_entry(entry.name) for entry in entries)
+    except OSError:
+        return False
+
+
+def _is_layout_entry(name: str) -> bool:
+    return name in _LAYOUT_NAMES or name.startswith(f".{CURRENT_LINK_NAME}.")
+
+
+def _is_link(path: str) -> bool:
+    return os.path.islink(path) or os.path.isjunction(path)
+
+
+def _load_state(root: str) -> dict:
+    try:
+        with open(os.path.join(root, STATE_FILE_NAME), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {"history": []}
+    if not isinstance(data, dict) or not isinstance(data.get("history"), list):
+        return {"history": []}
+    return data
+
+
+def _save_state(root: str, data: dict) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, os.path.join(root, STATE_FILE_NAME))
+
+
+def _set_complete(
+        root: str,
+        version_name: str,
+        complete: bool
+) -> None:
+    state: dict = _load_state(root)
+    names: list[str] = [name for name in state.get("complete", []) if name != version_name]
+    if complete:
+        names.append(version_name)
+    state["complete"] = names
+    _save_state(root, state)
+
+
+def _recover_current(root: str) -> None:
+    """Finish a switch that was interrupted on Windows, between the two renames of '_switch_current'."""
+    current_path: str = get_current_path(root)
+    old_path: str = os.path.join(root, f".{CURRENT_LINK_NAME}.old")
+    if _is_link(old_path):
+        if os.path.lexists(current_path):
+            os.rmdir(old_path)
+        else:
+            os.rename(old_path, current_path)
+
+
+def get_current_version(root: str) -> str | None:
+    """:return: Folder name of the active version, None if the root isn't in the versioned layout."""
+    _recover_current(root)
+    current_path: str = get_current_path(root)
+    if not _is_link(current_path):
+        return None
+    target: str = os.readlink(current_path)
+    return os.path.basename(os.path.normpath(target))
+
+
+def list_versions(root: str) -> list[str]:
+    """:return: Folder names of the staged versions, the complete ones only."""
+    complete: set[str] = set(_load_state(root).get("complete", []))
+    try:
+        with os.scandir(os.path.join(root, VERSIONS_DIR_NAME)) as entries:
+            return sorted(
+                entry.name for entry in entries
+                if entry.is_dir(follow_symlinks=False) and entry.name in complete)
+    except OSError:
+        return []
+
+
+def _create_link(target: str, link_path: str) -> None:
+    if os.name == 'nt':
+        target = os.path.abspath(target)
+        try:
+            import _winapi
+            _winapi.CreateJunction(target, link_path)
+        except (ImportError, AttributeError):
+            subprocess.run(
+                ["cmd", "/c", "mklink", "/J", link_path, target],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        # Relative, so the whole root can be moved.
+        os.symlink(os.path.relpath(target, os.path.dirname(link_path)), link_path, target_is_directory=True)
+
+
+def _switch_current(root: str, version_path: str) -> None:
+    current_path: str = get_current_path(root)
+    if os.path.lexists(current_path) and not _is_link(current_path):
+        raise VersionsError(f"[{current_path}] is a folder, not a link to a version.")
+
+    tmp_link: str = os.path.join(root, f".{CURRENT_LINK_NAME}.{os.getpid()}.tmp")
+    if os.path.lexists(tmp_link):
+        if os.name == 'nt':
+            os.rmdir(tmp_link)
+        else:
+            os.remove(tmp_link)
+    _create_link(version_path, tmp_link)
+
+    if os.name != 'nt':
+        # rename(2) replaces the old symlink atomically.
+        os.replace(tmp_link, current_path)
+        return
+
+    # Windows can't rename over an existing directory entry, a junction included. The old link is renamed
+    # out of the way first, and restored by '_recover_current' if the process dies in between.
+    old_path: str = os.path.join(root, f".{CURRENT_LINK_NAME}.old")
+    if os.path.lexists(current_path):
+        os.rename(current_path, old_path)
+    try:
+        os.rename(tmp_link, current_path)
+    except OSError:
+        if os.path.lexists(old_path):
+            os.rename(old_path, current_path)
+        raise
+    if os.path.lexists(old_path):
+        # Removes the junction only, not the version it points to.
+        os.rmdir(old_path)
+
+
+def _place_file(
+        source_path: str,
+        destination_path: str,
+        reference_path: str | None,
+        move: bool
+) -> bool:
+    """
+    :return: True if the file was hardlinked to the reference file, False if it was copied or moved.
+    """
+    if reference_path is not None:
+        try:
+            identical: bool = (
+                os.path.isfile(reference_path)
+                and os.path.getsize(reference_path) == os.path.getsize(source_path)
+                and filecmp.cmp(reference_path, source_path, shallow=False))
+        except OSError:
+            identical = False
+        if identical:
+            try:
+                os.link(reference_path, destination_path)
+                return True
+            except OSError:
+                # Other volume or a filesystem without hardlinks.
+                pass
+
+    if move:
+        shutil.move(source_path, destination_path)
+    else:
+        shutil.copy2(source_path, destination_path)
+    return False
+
+
+def break_hardlinks(path: str) -> int:
+    """
+    Copy on write: give every hardlinked file under the path its own copy, so the file can be modified in place
+    without changing the same file of the other versions.
+
+    :param path: File or folder path.
+    :return: Number of the files that were copied.
+    """
+    if os.path.isfile(path):
+        file_paths: list[str] = [path]
+    else:
+        file_paths = [
+            os.path.join(directory_path, file_name)
+            for directory_path, _, file_names in os.walk(path) for file_name in file_names]
+
+    copied_count: int = 0
+    for file_path in file_paths:
+        try:
+            if os.stat(file_path, follow_symlinks=False).st_nlink < 2:
+                continue
+        except OSError:
+            continue
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copy2(file_path, tmp_path)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        copied_count += 1
+    return copied_count
+
+
+def stage_version(
+        root: str,
+        version: str,
+        source_dir: str,
+        move: bool = False,
+        force: bool = False,
+        link_filter: Callable[[str], bool] | None = None
+) -> str:
+    """
+    Put the files of a version into '<root>/versions/<version>', without activating it.
+    The files that are identical to the active version's are hardlinked.
+
+    :param root: Layout root, like 'BaseInstaller.dir_path'.
+    :param version: Version string.
+    :param source_dir: Folder with the files of the version, like an extracted archive or a build output.
+    :param move: Move the files from the source folder instead of copying them, for temporary folders.
+    :param force: Stage the version again even if it is already staged.
+    :param link_filter: Callable that gets the path of a file relative to the version folder and returns True
+        if the file may be hardlinked. Files that the application modifies in place shouldn't be.
+        None to hardlink all the identical files.
+    :return: Path of the version folder. If the version is already staged and complete, it is returned as is.
+    """
+    version_path: str = get_version_path(root, version)
+    version_name: str = os.path.basename(version_path)
+    if os.path.isdir(version_path):
+        if not force and has_version(root, version):
+            return version_path
+        _set_complete(root, version_name, False)
+
+    current_version: str | None = get_current_version(root)
+    reference_root: str | None = (
+        os.path.join(root, VERSIONS_DIR_NAME, current_version) if current_version else None)
+
+    partial_path: str = version_path + PARTIAL_SUFFIX
+    if os.path.exists(partial_path):
+        shutil.rmtree(partial_path)
+    os.makedirs(partial_path)
+
+    linked_count: int = 0
+    for directory_path, directory_names, file_names in os.walk(source_dir):
+        relative_directory: str = os.path.relpath(directory_path, source_dir)
+        destination_directory: str = os.path.normpath(os.path.join(partial_path, relative_directory))
+        for directory_name in directory_names:
+            os.makedirs(os.path.join(destination_directory, directory_name), exist_ok=True)
+        for file_name in file_names:
+            reference_path: str | None = None
+            if reference_root is not None and (
+                    link_filter is None or link_filter(os.path.normpath(os.path.join(relative_directory, file_name)))):
+                reference_path = os.path.normpath(os.path.join(reference_root, relative_directory, file_name))
+            if _place_file(
+                    os.path.join(directory_path, file_name), os.path.join(destination_directory, file_name),
+                    reference_path, move):
+                linked_count += 1
+
+    if os.path.isdir(version_path):
+        # Restaged: the incomplete or forced version is replaced. 'current' links by path, so it follows.
+        old_path: str = version_path + ".old"
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+        os.rename(version_path, old_path)
+        os.rename(partial_path, version_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.rename(partial_path, version_path)
+    _set_complete(root, version_name, True)
+    if linked_count:
+        print(f"Staged version [{version}], {linked_count} unchanged files were hardlinked to [{current_version}].")
+    return version_path
+
+
+def adopt_flat_install(
+        root: str,
+        version: str
+) -> str | None:
+    """
+    Move the files of an install that wasn't made in the versioned layout into '<root>/versions/<version>'
+    and activate it, so the next version is staged next to it and can be rolled back to it.
+
+    :param root: Layout root.
+    :param version: Version of the existing install.
+    :return: Path of the version folder, None if there was nothing to move.
+    """
+    if not has_flat_install(root):
+        return None
+
+    version_path: str = get_version_path(root, version)
+    if os.path.exists(version_path):
+        version_path = get_version_path(root, f"{get_version_dir_name(version)}_previous")
+    os.makedirs(version_path)
+    with os.scandir(root) as entries:
+        names: list[str] = [entry.name for entry in entries if not _is_layout_entry(entry.name)]
+    for name in names:
+        # Same volume, so these are renames.
+        os.rename(os.path.join(root, name), os.path.join(version_path, name))
+    _set_complete(root, os.path.basename(version_path), True)
+
+    activate(root, os.path.basename(version_path), prune=False)
+    return version_path
+
+
+def prune_versions(
+        root: str,
+        keep: int = KEEP_VERSIONS
+) -> list[str]:
+    """
+    Remove the versions that aren't among the last activated ones, and leftover partial folders.
+
+    :param root: Layout root.
+    :param keep: Number of the last activated versions to keep, the active one included.
+    :return: Folder names of the removed versions.
+    """
+    history: list[str] = _load_state(root)["history"]
+    kept: set[str] = set(history[-keep:]) if keep > 0 else set()
+    current_version: str | None = get_current_version(root)
+    if current_version:
+        kept.add(current_version)
+
+    removed: list[str] = []
+    versions_dir: str = os.path.join(root, VERSIONS_DIR_NAME)
+    try:
+        with os.scandir(versions_dir) as entries:
+            names: list[str] = [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return removed
+    for name in names:
+        if name in kept:
+            continue
+        shutil.rmtree(os.path.join(versions_dir, name), ignore_errors=True)
+        if not name.endswith(PARTIAL_SUFFIX):
+            _set_complete(root, name, False)
+            removed.append(name)
+    return removed
+
+
+def activate(
+        root: str,
+        version: str,
+        prune: bool = True
+) -> str:
+    """
+    Switch '<root>/current' to a staged version.
+
+    :param root: Layout root.
+    :param version: Version string or folder name of a staged version.
+    :param prune: Remove the old versions, see 'prune_versions'.
+    :return: Path of the activated version folder.
+    """
+    version_path: str = get_version_path(root, version)
+    if not has_version(root, version):
+        raise VersionsError(f"Version [{version}] isn't staged in [{root}].")
+
+    _recover_current(root)
+    _switch_current(root, version_path)
+
+    version_name: str = os.path.basename(version_path)
+    state: dict = _load_state(root)
+    history: list[str] = [name for name in state["history"] if name != version_name]
+    history.append(version_name)
+    state["history"] = history
+    _save_state(root, state)
+
+    if prune:
+        prune_versions(root)
+    return version_path
+
+
+def rollback(root: str) -> str:
+    """
+    Switch '<root>/current' back to the version that was active before the current one.
+
+    :param root: Layout root.
+    :return: Folder name of the activated version.
+    """
+    current_version: str | None = get_current_version(root)
+    if current_version is None:
+        raise VersionsError(f"[{root}] isn't installed in the versioned layout.")
+
+    staged: set[str] = set(list_versions(root))
+    candidates: list[str] = [
+        name for name in _load_state(root)["history"] if name != current_version and name in staged]
+    if not candidates:
+        raise VersionsError(f"No previous version to roll back to in [{root}], the active one is [{current_version}].")
+
+    activate(root, candidates[-1], prune=False)
+    return candidates[-1]
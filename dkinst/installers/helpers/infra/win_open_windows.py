@@ -2,6 +2,8 @@ import ctypes
 from ctypes import wintypes
 import time
 import os
+from dataclasses import dataclass, field
+from typing import Callable
 
 import psutil
 
@@ -67,38 +69,236 @@ else:
 """
 
 
-# noinspection PyUnresolvedReferences
-def get_open_windows() -> list[dict]:
+# Shell surfaces that are never closed: the desktop and the taskbar.
+SHELL_WINDOW_CLASSES: tuple[str, ...] = ("Progman", "WorkerW", "Shell_TrayWnd")
+# Smaller windows are helper/tool windows.
+MIN_WINDOW_WIDTH: int = 80
+MIN_WINDOW_HEIGHT: int = 40
+
+# The close loop polls the windows it asked to close at this interval,
+# and enumerates all the windows (for newly opened ones) only at the slower one.
+CLOSE_POLL_INTERVAL_SECONDS: float = 0.1
+CLOSE_ENUMERATION_INTERVAL_SECONDS: float = 1.0
+
+
+@dataclass
+class RawWindow:
     """
-    Enumerate all *actually visible* top-level windows and return a list of
-    dicts: {"hwnd", "title", "pid", "exe"}.
+    Top-level window with only the cheap attributes filled in.
+    Title and exe name are resolved lazily, only for windows that pass the cheap filters.
+    """
+    hwnd: int
+    pid: int
+    visible: bool = True
+    iconic: bool = False
+    cloaked: bool = False
+    width: int = 0
+    height: int = 0
+    title_length: int = 0
+    class_name: str = ""
+    # Callable that returns the window title for the hwnd. Synthetic records can pass: lambda hwnd: "Title".
+    title_loader: Callable[[int], str] | None = None
+    _title: str | None = field(default=None, repr=False)
+
+    @property
+    def title(self) -> str:
+        if self._title is None:
+            self._title = self.title_loader(self.hwnd).strip() if self.title_loader else ""
+        return self._title
+
+
+class ProcessNameCache:
+    """
+    (pid, create time) -> exe name cache for the session.
+    Windows of the same process (and the same windows across the close loop iterations) resolve the exe once.
+    The process create time is part of the key, Windows reuses the pids of exited processes.
+    """
+    def __init__(
+            self,
+            resolver: Callable[[int], str] | None = None,
+            create_time_resolver: Callable[[int], float | None] | None = None
+    ):
+        self._resolver: Callable[[int], str] = resolver or self._psutil_resolver
+        self._create_time_resolver: Callable[[int], float | None] = (
+                create_time_resolver or self._psutil_create_time_resolver)
+        self._names: dict[tuple[int, float | None], str] = {}
+
+    @staticmethod
+    def _psutil_resolver(pid: int) -> str:
+        try:
+            return psutil.Process(pid).name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return "unknown"
+
+    @staticmethod
+    def _psutil_create_time_resolver(pid: int) -> float | None:
+        try:
+            return psutil.Process(pid).create_time()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return None
+
+    def get(self, pid: int) -> str:
+        create_time: float | None = self._create_time_resolver(pid)
+        if create_time is None:
+            # The process is gone or inaccessible, its pid can't be told apart from a reused one.
+            return self._resolver(pid)
+
+        key: tuple[int, float] = (pid, create_time)
+        name = self._names.get(key)
+        if name is None:
+            name = self._resolver(pid)
+            self._names[key] = name
+        return name
+
+    def clear(self) -> None:
+        self._names.clear()
+
+
+# Session-wide cache, shared by all snapshots.
+PROCESS_NAME_CACHE = ProcessNameCache()
+
+
+def filter_windows(
+        raw_windows: list[RawWindow],
+        skip_hwnd: int | None = None,
+        skip_pid: int | None = None,
+) -> list[RawWindow]:
+    """
+    Keep only *actually visible* top-level windows.
 
     "Actually visible" here means:
       - Window has WS_VISIBLE
       - Not minimized (IsIconic == False)
       - Not DWM-cloaked (e.g. on another virtual desktop / UWP background)
-      - Has a non-empty title
       - Has a reasonable on-screen size
       - Not obvious shell surfaces like the desktop ("Program Manager")
+      - Has a non-empty title
+
+    All the cheap checks run first; the title is resolved only for the windows that pass them.
+
+    :param raw_windows: list of RawWindow records.
+    :param skip_hwnd: Window handle to skip (our own console window).
+    :param skip_pid: Process ID to skip (our own process).
+    :return: list of RawWindow that passed the filters.
+    """
+    result: list[RawWindow] = []
+    for w in raw_windows:
+        if skip_hwnd and w.hwnd == skip_hwnd:
+            continue
+        if not w.visible or w.iconic or w.cloaked:
+            continue
+        # Size filter – ignore tiny helper/tool windows
+        if w.width < MIN_WINDOW_WIDTH or w.height < MIN_WINDOW_HEIGHT:
+            continue
+        if w.title_length == 0:
+            continue
+        # Class filter – skip well-known shell surfaces
+        if w.class_name in SHELL_WINDOW_CLASSES:
+            continue
+        if skip_pid is not None and w.pid == skip_pid:
+            continue
+
+        # Only now pay for the title.
+        title = w.title
+        if not title or title == "Program Manager":
+            continue
+
+        result.append(w)
+    return result
+
+
+class WindowSnapshot:
+    """
+    Visible top-level windows at one point in time, keyed by HWND.
+    Exe names are resolved lazily through the session ProcessNameCache.
+    """
+    def __init__(
+            self,
+            raw_windows: list[RawWindow],
+            process_names: ProcessNameCache | None = None
+    ):
+        self._process_names: ProcessNameCache = process_names or PROCESS_NAME_CACHE
+        self._by_hwnd: dict[int, RawWindow] = {int(w.hwnd): w for w in raw_windows}
+
+    @property
+    def hwnds(self) -> set[int]:
+        return set(self._by_hwnd.keys())
+
+    def __contains__(self, hwnd: int) -> bool:
+        return int(hwnd) in self._by_hwnd
+
+    def __len__(self) -> int:
+        return len(self._by_hwnd)
+
+    def window_dict(self, hwnd: int) -> dict:
+        """Return the {"hwnd", "title", "pid", "exe"} dict of the window, resolving the exe name if needed."""
+        w = self._by_hwnd[int(hwnd)]
+        return {
+            "hwnd": w.hwnd,
+            "title": w.title,
+            "pid": w.pid,
+            "exe": self._process_names.get(w.pid),
+        }
+
+    @property
+    def windows(self) -> list[dict]:
+        return [self.window_dict(hwnd) for hwnd in self._by_hwnd]
+
+    def diff(self, previous: "WindowSnapshot | set[int]") -> tuple[list[int], list[int]]:
+        """
+        Compare with a previous snapshot (or a set of HWNDs).
+
+        :return: tuple (new_hwnds, closed_hwnds). Exe names aren't resolved here.
+        """
+        previous_hwnds: set[int] = previous.hwnds if isinstance(previous, WindowSnapshot) else set(previous)
+        new_hwnds = [hwnd for hwnd in self._by_hwnd if hwnd not in previous_hwnds]
+        closed_hwnds = [hwnd for hwnd in previous_hwnds if hwnd not in self._by_hwnd]
+        return new_hwnds, closed_hwnds
+
+
+# noinspection PyUnresolvedReferences
+def _get_window_title(hwnd: int) -> str:
+    length = user32.GetWindowTextLengthW(hwnd)
+    buf = ctypes.create_unicode_buffer(length + 1)
+    user32.GetWindowTextW(hwnd, buf, length + 1)
+    return buf.value
+
+
+# noinspection PyUnresolvedReferences
+def _is_window_open(hwnd: int) -> bool:
+    """Cheap check that a window still exists and is visible, without enumerating all the windows."""
+    return bool(user32.IsWindow(hwnd)) and bool(user32.IsWindowVisible(hwnd))
+
+
+# noinspection PyUnresolvedReferences
+def _enum_raw_windows() -> list[RawWindow]:
+    """
+    Enumerate visible top-level windows with only the cheap attributes.
+    The cheap filters of 'filter_windows' (visibility, minimized, class, size) are applied during the
+    enumeration, in that order, so the DWM, title length and pid queries run only for the remaining windows.
+    Invisible windows (the vast majority) are dropped right after IsWindowVisible.
     """
-    windows: list[dict] = []
+    windows: list[RawWindow] = []
 
     # noinspection PyArgumentList,PyUnresolvedReferences
     @EnumWindowsProc
     def _enum_proc(hwnd, lparam):
-        # Skip the console window that is running this script
-        if CURRENT_CONSOLE_HWND and hwnd == CURRENT_CONSOLE_HWND:
+        if not user32.IsWindowVisible(hwnd) or user32.IsIconic(hwnd):
             return True
 
-        # 1) Basic visibility
-        if not user32.IsWindowVisible(hwnd):
+        class_buf = ctypes.create_unicode_buffer(256)
+        class_name = class_buf.value if user32.GetClassNameW(hwnd, class_buf, 256) else ""
+        if class_name in SHELL_WINDOW_CLASSES:
             return True
 
-        # 2) Skip minimized windows – user can't see them
-        if user32.IsIconic(hwnd):  # SW_SHOWMINIMIZED
+        rect = RECT()
+        if not user32.GetWindowRect(hwnd, ctypes.byref(rect)):
+            return True
+        width, height = rect.right - rect.left, rect.bottom - rect.top
+        if width < MIN_WINDOW_WIDTH or height < MIN_WINDOW_HEIGHT:
             return True
 
-        # 3) Skip cloaked (off-desktop / UWP / other virtual desktop) windows
+        cloaked_value = 0
         if dwmapi is not None:
             cloaked = wintypes.DWORD()
             hr = dwmapi.DwmGetWindowAttribute(
@@ -107,65 +307,32 @@ def get_open_windows() -> list[dict]:
                 ctypes.byref(cloaked),
                 ctypes.sizeof(cloaked),
             )
-            if hr == 0 and cloaked.value != 0:
-                # 0 == S_OK
-                return True
-
-        # 4) Size filter – ignore tiny helper/tool windows
-        rect = RECT()
-        if not user32.GetWindowRect(hwnd, ctypes.byref(rect)):
-            return True
-        width = rect.right - rect.left
-        height = rect.bottom - rect.top
-
-        # tune thresholds if you like
-        if width < 80 or height < 40:
+            # 0 == S_OK
+            if hr == 0:
+                cloaked_value = cloaked.value
+        if cloaked_value != 0:
             return True
 
-        # 5) Title filter
-        length = user32.GetWindowTextLengthW(hwnd)
-        if length == 0:
-            return True
-
-        buf = ctypes.create_unicode_buffer(length + 1)
-        user32.GetWindowTextW(hwnd, buf, length + 1)
-        title = buf.value.strip()
-        if not title:
+        title_length = user32.GetWindowTextLengthW(hwnd)
+        if title_length == 0:
             return True
 
-        # Skip the desktop / Program Manager explicitly
-        if title == "Program Manager":
-            return True
-
-        # 6) Class filter – skip well-known shell surfaces
-        class_buf = ctypes.create_unicode_buffer(256)
-        if user32.GetClassNameW(hwnd, class_buf, 256):
-            classname = class_buf.value
-            if classname in ("Progman", "WorkerW", "Shell_TrayWnd"):
-                return True
-
-        # 7) Process info
         pid = wintypes.DWORD()
         user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
-        pid_val = pid.value
-
-        # Skip our own console window (the script that is running)
-        if pid_val == os.getpid():
-            return True
-
-        try:
-            proc = psutil.Process(pid_val)
-            exe = proc.name()
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            exe = "unknown"
 
         windows.append(
-            {
-                "hwnd": hwnd,
-                "title": title,
-                "pid": pid_val,
-                "exe": exe,
-            }
+            RawWindow(
+                hwnd=int(hwnd),
+                pid=pid.value,
+                visible=True,
+                iconic=False,
+                cloaked=False,
+                width=width,
+                height=height,
+                title_length=title_length,
+                class_name=class_name,
+                title_loader=_get_window_title,
+            )
         )
         return True  # continue enumeration
 
@@ -173,6 +340,37 @@ def get_open_windows() -> list[dict]:
     return windows
 
 
+def take_snapshot(
+        enumerator: Callable[[], list[RawWindow]] | None = None,
+        process_names: ProcessNameCache | None = None,
+) -> WindowSnapshot:
+    """
+    Take a snapshot of the *actually visible* top-level windows.
+
+    :param enumerator: Callable returning RawWindow records. Default is the Win32 EnumWindows enumeration.
+        Synthetic records can be provided for testing.
+    :param process_names: (pid, create time) -> exe cache. Default is the session-wide PROCESS_NAME_CACHE.
+    :return: WindowSnapshot.
+    """
+    if enumerator is None:
+        raw_windows = _enum_raw_windows()
+        skip_hwnd = int(CURRENT_CONSOLE_HWND) if CURRENT_CONSOLE_HWND else None
+    else:
+        raw_windows = enumerator()
+        skip_hwnd = None
+
+    return WindowSnapshot(filter_windows(raw_windows, skip_hwnd=skip_hwnd, skip_pid=os.getpid()), process_names)
+
+
+def get_open_windows() -> list[dict]:
+    """
+    Enumerate all *actually visible* top-level windows and return a list of
+    dicts: {"hwnd", "title", "pid", "exe"}.
+    See 'filter_windows' for what "actually visible" means.
+    """
+    return take_snapshot().windows
+
+
 def print_open_windows(windows: list[dict]) -> None:
     if not windows:
         print("[+] No visible top-level windows detected.")
@@ -409,7 +607,8 @@ win_open_windows.kill_new_processes(
 
 def get_window_handles_snapshot() -> set[int]:
     """Return a set of HWNDs for currently visible top-level windows."""
-    return {int(w["hwnd"]) for w in get_open_windows()}
+    # Exe names aren't needed for handles, so they are never resolved here.
+    return take_snapshot().hwnds
 
 
 def get_process_snapshot() -> dict[int, float]:
@@ -425,41 +624,80 @@ def get_process_snapshot() -> dict[int, float]:
     return snapshot
 
 
-def close_new_windows(old_handles: set[int], wait_seconds: float = 5.0) -> list[dict]:
+def close_new_windows(
+        old_handles: set[int],
+        wait_seconds: float = 5.0,
+        enumerator: Callable[[], list[RawWindow]] | None = None,
+        post_close: Callable[[int], None] | None = None,
+        is_open: Callable[[int], bool] | None = None,
+) -> list[dict]:
     """
     Close newly opened visible top-level windows (HWNDs not present in old_handles)
     by posting WM_CLOSE.
 
-    Returns a list of the new window dicts ("hwnd", "title", "pid", "exe") that
-    were detected during the close attempts.
+    The windows that were asked to close are polled with the cheap IsWindow/IsWindowVisible checks,
+    all the windows are enumerated (to find newly opened ones) only every 'CLOSE_ENUMERATION_INTERVAL_SECONDS',
+    and right away when the polled windows are gone. An enumeration diffs the HWNDs against the baseline;
+    titles and exe names are resolved only for windows seen for the first time.
+
+    :param old_handles: HWNDs that were open before, these are never closed.
+    :param wait_seconds: How long to keep closing new windows that appear.
+    :param enumerator: Optional RawWindow enumerator, see 'take_snapshot'.
+    :param post_close: Optional callable that closes a HWND. Default posts WM_CLOSE.
+    :param is_open: Optional callable that checks if a HWND is still open. Default is IsWindow/IsWindowVisible,
+        or a lookup in a new snapshot when an enumerator is provided.
+    :return: A list of the new window dicts ("hwnd", "title", "pid", "exe") that
+        were detected during the close attempts.
     """
+    if post_close is None:
+        def post_close(hwnd: int) -> None:
+            PostMessageW(hwnd, WM_CLOSE, 0, 0)
+    if is_open is None:
+        if enumerator is None:
+            is_open = _is_window_open
+        else:
+            def is_open(hwnd: int) -> bool:
+                return hwnd in take_snapshot(enumerator)
+
     deadline = time.time() + wait_seconds
-    seen_hwnds: set[int] = set()
+    # HWNDs that we posted WM_CLOSE to and are waiting for them to disappear.
+    tracked: set[int] = set()
     new_windows_all: list[dict] = []
+    next_enumeration: float = 0.0
 
     while True:
-        current = get_open_windows()
-        new_windows = [w for w in current if int(w["hwnd"]) not in old_handles]
-
-        if not new_windows:
-            return new_windows_all
-
-        to_close = []
-        for w in new_windows:
-            hwnd = int(w["hwnd"])
-            if hwnd in seen_hwnds:
+        if time.time() >= next_enumeration:
+            snapshot = take_snapshot(enumerator)
+            new_hwnds, _ = snapshot.diff(old_handles)
+
+            if not new_hwnds:
+                return new_windows_all
+
+            to_close: list[int] = []
+            for hwnd in new_hwnds:
+                if hwnd in tracked:
+                    continue
+                tracked.add(hwnd)
+                new_windows_all.append(snapshot.window_dict(hwnd))
+                to_close.append(hwnd)
+
+            for hwnd in to_close:
+                post_close(hwnd)
+
+            # Only the windows of this enumeration are polled, the earlier ones are already gone.
+            polled: set[int] = set(new_hwnds)
+            next_enumeration = time.time() + CLOSE_ENUMERATION_INTERVAL_SECONDS
+        else:
+            polled = {hwnd for hwnd in polled if is_open(hwnd)}
+            if not polled:
+                # All closed, check right away that no other new window appeared meanwhile.
+                next_enumeration = 0.0
                 continue
-            seen_hwnds.add(hwnd)
-            new_windows_all.append(w)
-            to_close.append(hwnd)
-
-        for hwnd in to_close:
-            PostMessageW(hwnd, WM_CLOSE, 0, 0)
 
         if time.time() >= deadline:
             return new_windows_all
 
-        time.sleep(0.5)
+        time.sleep(CLOSE_POLL_INTERVAL_SECONDS)
 
 
 def kill_new_processes(
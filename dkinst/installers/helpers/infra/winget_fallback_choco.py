@@ -1,4 +1,12 @@
-from typing import Literal
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Literal
 
 from rich.console import Console
 
@@ -14,14 +22,317 @@ console = Console()
 """
 This module will try to use winget to install, upgrade, and uninstall packages.
 But if winget fails, the caller will check if chocolatey is installed and if so, will use it as a fallback.
+
+The decision is made by 'FallbackEngine', which:
+- caches the availability of each package manager, and prepares (bootstraps) a manager once;
+- keeps the success history of each manager per package ID and method across runs ('FALLBACK_HISTORY_FILE'),
+  and skips a primary manager that is known to fail for the package, when the fallback is allowed;
+- optionally prepares the fallback manager in a background thread while the primary attempt runs.
+The managers are plain callables, so the engine can be exercised on Linux with fake managers.
 """
 
 
+FALLBACK_HISTORY_FILE: str = str(Path.home() / ".dkinst" / "fallback_history.json")
+# The primary manager is skipped after this many failures in a row for the package.
+KNOWN_FAILING_COUNT: int = 2
+# A known failing primary is tried again after this time, it may have been fixed meanwhile.
+KNOWN_FAILING_EXPIRY_SECONDS: int = 7 * 24 * 60 * 60
+
+
+@dataclass
+class PackageManager:
+    """
+    :param name: Manager name, like 'winget'.
+    :param method_package: Callable(method, package_id) -> (rc, output).
+    :param is_available: Callable that checks if the manager can be used.
+    :param bootstrap: Optional callable that installs the manager, returns the exit code.
+    :param is_noop: Optional callable(method, rc, output) that checks if a non-zero exit code only means
+        that the package is already in the wanted state, like winget's "No applicable update found".
+    """
+    name: str
+    method_package: Callable[[str, str], tuple[int, str]]
+    is_available: Callable[[], bool]
+    bootstrap: Callable[[], int] | None = None
+    is_noop: Callable[[str, int, str], bool] | None = None
+
+
+class FallbackHistory:
+    """
+    Success history of the managers per package ID and method, kept in a JSON file.
+
+    :param file_path: Path of the history file, None to keep the history in memory only.
+    """
+    def __init__(self, file_path: str | None = None):
+        self.file_path: str | None = file_path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = self._load()
+
+    def _load(self) -> dict[str, dict]:
+        if not self.file_path:
+            return {}
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _save(self) -> None:
+        if not self.file_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.file_path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.file_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _key(manager_name: str, package_id: str, method: str) -> str:
+        return f"{manager_name}:{method}:{package_id.lower()}"
+
+    def get(self, manager_name: str, package_id: str, method: str) -> dict:
+        """:return: {'successes', 'failures_in_row', 'last_rc', 'updated_at'}, empty if there is no history."""
+        return dict(self._entries.get(self._key(manager_name, package_id, method), {}))
+
+    def record(self, manager_name: str, package_id: str, method: str, rc: int, noop: bool = False) -> None:
+        """
+        :param noop: True if the non-zero 'rc' only means that there was nothing to do,
+            it counts as a success, not toward 'KNOWN_FAILING_COUNT'.
+        """
+        with self._lock:
+            entry: dict = self._entries.setdefault(self._key(manager_name, package_id, method), {
+                "successes": 0, "failures_in_row": 0})
+            if rc == 0 or noop:
+                entry["successes"] = entry.get("successes", 0) + 1
+                entry["failures_in_row"] = 0
+            else:
+                entry["failures_in_row"] = entry.get("failures_in_row", 0) + 1
+            entry["last_rc"] = rc
+            entry["updated_at"] = time.time()
+            self._save()
+
+    def is_known_failing(
+            self,
+            manager_name: str,
+            package_id: str,
+            method: str,
+            now: float | None = None
+    ) -> bool:
+        """
+        :return: True if the manager failed 'KNOWN_FAILING_COUNT' times in a row for the package,
+            and the last failure is not older than 'KNOWN_FAILING_EXPIRY_SECONDS'.
+        """
+        entry: dict = self.get(manager_name, package_id, method)
+        if entry.get("failures_in_row", 0) < KNOWN_FAILING_COUNT:
+            return False
+        now = time.time() if now is None else now
+        return now - entry.get("updated_at", 0) < KNOWN_FAILING_EXPIRY_SECONDS
+
+    def has_failed(self, manager_name: str, package_id: str, method: str) -> bool:
+        return self.get(manager_name, package_id, method).get("failures_in_row", 0) > 0
+
+
+def decide(
+        primary_available: bool,
+        primary_known_failing: bool,
+        force: bool
+) -> tuple[bool, bool]:
+    """
+    Decide which managers to try.
+
+    :param primary_available: True if the primary manager is available.
+    :param primary_known_failing: True if the primary manager is known to fail for the package.
+    :param force: True to use the fallback also when the available primary failed.
+    :return: (try the primary, the fallback is allowed if the primary isn't tried or fails).
+    """
+    fallback_allowed: bool = force or not primary_available
+    try_primary: bool = primary_available and not (primary_known_failing and fallback_allowed)
+    return try_primary, fallback_allowed
+
+
+class FallbackEngine:
+    """
+    Runs a package method with a primary manager and a fallback one, see the module docstring.
+
+    Usage:
+        engine = FallbackEngine(primary=winget_manager, fallback=choco_manager, history=FallbackHistory(path))
+        rc = engine.run("install", primary_package_id="Git.Git", fallback_package_id="git", force=True)
+    """
+    def __init__(
+            self,
+            primary: PackageManager,
+            fallback: PackageManager,
+            history: FallbackHistory | None = None
+    ):
+        self.primary: PackageManager = primary
+        self.fallback: PackageManager = fallback
+        self.history: FallbackHistory = history or FallbackHistory()
+        self._lock = threading.Lock()
+        self._availability: dict[str, bool] = {}
+        self._preparations: dict[str, Future] = {}
+
+    def is_available(self, manager: PackageManager) -> bool:
+        """
+        :return: Availability of the manager. Only a positive result is cached, since a missing manager
+            can be installed meanwhile (e.g. by a 'winget' dependency step of the same plan).
+        """
+        with self._lock:
+            if self._availability.get(manager.name):
+                return True
+        available: bool = bool(manager.is_available())
+        with self._lock:
+            self._availability[manager.name] = available
+        return available
+
+    def prepare_async(self, manager: PackageManager) -> Future:
+        """
+        Start preparing the manager in a background thread: check that it is available, bootstrap it if not.
+        A successful or running preparation is shared by later calls, a failed one is started again.
+
+        :return: Future of the exit code, 0 if the manager is ready.
+        """
+        with self._lock:
+            future: Future | None = self._preparations.get(manager.name)
+            if future is not None and not (future.done() and (future.exception() or future.result() != 0)):
+                return future
+            future = self._preparations[manager.name] = Future()
+
+        def prepare() -> None:
+            try:
+                future.set_result(self._prepare(manager))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=prepare, name=f"dkinst-prepare-{manager.name}", daemon=True).start()
+        return future
+
+    def prepare(self, manager: PackageManager) -> int:
+        """:return: Exit code of the preparation of the manager, 0 if the manager is ready."""
+        return self.prepare_async(manager).result()
+
+    def _prepare(self, manager: PackageManager) -> int:
+        if self.is_available(manager):
+            return 0
+        if manager.bootstrap is None:
+            return 1
+
+        rc: int = manager.bootstrap()
+        if rc == 0:
+            with self._lock:
+                self._availability[manager.name] = True
+        return rc
+
+    def _attempt(
+            self,
+            manager: PackageManager,
+            method: str,
+            package_id: str
+    ) -> int:
+        rc, output = manager.method_package(method, package_id)
+        noop: bool = rc != 0 and manager.is_noop is not None and manager.is_noop(method, rc, output)
+        self.history.record(manager.name, package_id, method, rc, noop=noop)
+        if noop:
+            printc(f"{manager.name}: [{package_id}] needs no {method}, exit code {rc}.", color="blue")
+            return 0
+        return rc
+
+    def run(
+            self,
+            method: str,
+            primary_package_id: str,
+            fallback_package_id: str,
+            force: bool = False,
+            prewarm: bool | None = None
+    ) -> int:
+        """
+        :param method: any of "install", "uninstall", "upgrade".
+        :param primary_package_id: The package ID for the primary manager.
+        :param fallback_package_id: The package ID for the fallback manager.
+        :param force: True: if the primary is available and failed, use the fallback.
+            False: only use the fallback if the primary is not available.
+        :param prewarm: True to prepare the fallback while the primary runs. None (default) prepares it only
+            if the primary already failed for the package before. Used only when the fallback is allowed.
+        :return: Exit code, 0 if success.
+        """
+        primary_available: bool = self.is_available(self.primary)
+        primary_known_failing: bool = self.history.is_known_failing(self.primary.name, primary_package_id, method)
+        try_primary, fallback_allowed = decide(primary_available, primary_known_failing, force)
+
+        if prewarm is None:
+            prewarm = self.history.has_failed(self.primary.name, primary_package_id, method)
+        if try_primary and fallback_allowed and prewarm:
+            self.prepare_async(self.fallback)
+
+        if try_primary:
+            rc: int = self._attempt(self.primary, method, primary_package_id)
+            if rc == 0:
+                return 0
+            if not fallback_allowed:
+                printc(f"Failed to {method} with {self.primary.name}.\n"
+                       f"You can use 'force=True' in order to try to {method} with {self.fallback.name}.", color="red")
+                return rc
+            printc(f"Failed to {method} with {self.primary.name}, trying {self.fallback.name}...", color="yellow")
+        elif primary_available:
+            printc(f"{self.primary.name} is known to fail to {method} [{primary_package_id}], "
+                   f"using {self.fallback.name}...", color="yellow")
+        else:
+            printc(f"{self.primary.name} is not available, using {self.fallback.name}...", color="yellow")
+
+        rc = self.prepare(self.fallback)
+        if rc != 0:
+            printc(f"Failed to install {self.fallback.name}.", color="red")
+            return rc
+
+        rc = self._attempt(self.fallback, method, fallback_package_id)
+        if rc != 0:
+            printc(f"Failed to {method} with {self.fallback.name}.", color="red")
+            return rc
+
+        return 0
+
+
+def _install_chocolatey() -> int:
+    return chocolatey.Chocolatey().install()
+
+
+def _is_chocolatey_installed() -> bool:
+    return chocolatey.Chocolatey().is_installed()
+
+
+WINGET_MANAGER = PackageManager(
+    name="WinGet",
+    method_package=lambda method, package_id: getattr(wingets, f'{method}_package')(package_id),
+    is_available=winget_installer.is_winget_installed,
+    is_noop=wingets.is_noop_result,
+)
+CHOCO_MANAGER = PackageManager(
+    name="Chocolatey",
+    method_package=lambda method, package_id: getattr(chocos, f'{method}_package')(package_id),
+    is_available=_is_chocolatey_installed,
+    bootstrap=_install_chocolatey,
+)
+
+
+_ENGINE: FallbackEngine | None = None
+
+
+def get_engine() -> FallbackEngine:
+    """:return: The WinGet -> Chocolatey engine of the run."""
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = FallbackEngine(WINGET_MANAGER, CHOCO_MANAGER, FallbackHistory(FALLBACK_HISTORY_FILE))
+    return _ENGINE
+
+
 def method_package(
         method: Literal["install", "uninstall", "upgrade"],
         winget_package_id: str,
         choco_package_name: str,
-        force: bool = False
+        force: bool = False,
+        prewarm: bool | None = None
 ) -> int:
     """
     Try to use winget to install/upgrade/uninstall a package, and if it fails, use chocolatey as a fallback.
@@ -31,41 +342,11 @@ def method_package(
     :param choco_package_name: The package name for chocolatey.
     :param force: bool,
         True: if winget is installed and failed, force install with chocolatey.
+            WinGet is skipped for a package it is known to fail for.
         False: only use chocolatey if winget is not installed.
+    :param prewarm: Prepare chocolatey while winget runs, see 'FallbackEngine.run'.
     :return: int: return code, 0 if success, non-zero if failure.
     """
-
-    # Check if winget is available.
-    is_winget_available: bool = winget_installer.is_winget_installed()
-
-    # Get method from wingets.
-    callable_wingets = getattr(wingets, f'{method}_package')
-    rc, output = callable_wingets(winget_package_id)
-    if rc == 0:
-        return 0
-
-    # if rc != 0 and 'No newer package versions are available' in output:
-    #     printc(f"No newer package versions are available for {winget_package_id}.", color="yellow")
-    #     return 0
-
-    if rc != 0 and is_winget_available and not force:
-        printc(f"Failed to {method} with WinGet.\n"
-               f"You can use 'force=True' in order to try to install with Chocolatey.", color="red")
-        return rc
-    else:
-        printc(f"Failed to {method} with WinGet, trying Chocolatey...", color="yellow")
-
-    choco_installer = chocolatey.Chocolatey()
-    rc: int = choco_installer.install()
-    if rc != 0:
-        printc("Failed to install Chocolatey.", color="red")
-        return rc
-
-    # Get method from chocos.
-    callable_chocos = getattr(chocos, f'{method}_package')
-    rc, output = callable_chocos(choco_package_name)
-    if rc != 0:
-        printc(f"Failed to {method} with Chocolatey.", color="red")
-        return rc
-
-    return 0
+    return get_engine().run(
+        method, primary_package_id=winget_package_id, fallback_package_id=choco_package_name,
+        force=force, prewarm=prewarm)
@@ -1,3 +1,25 @@
+"""
+WinGet layer.
+
+The installed packages are read in bulk: one 'winget export' JSON snapshot is parsed into
+an ID -> version index ('get_snapshot'), with 'winget list' parsing as a fallback. The snapshot is taken
+again after 'SNAPSHOT_TTL_SECONDS', since a session (daemon, interactive console) outlives the changes
+made by other tools.
+Several packages are installed/upgraded/uninstalled with one winget process where winget allows it
+('method_packages'), the results are kept for the run, so the per-installer calls of the batched
+packages don't spawn winget again.
+
+The command is taken from 'WINGET_COMMAND', so the parsing and batching can be exercised on Linux
+with a fake 'winget' shim, e.g. WINGET_COMMAND = [sys.executable, "fake_winget.py"].
+"""
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+
 from rich.console import Console
 
 from .commands import run_package_manager_command
@@ -6,47 +28,370 @@ from .commands import run_package_manager_command
 console = Console()
 
 
-def install_package(package_id: str) -> tuple[int, str]:
-    console.print(f"[blue]Installing WinGet package ID: {package_id}[/blue]")
+WINGET_COMMAND: list[str] = ["winget"]
+# 'winget install/upgrade' accept several queries starting from this version.
+MIN_BATCH_VERSION: tuple[int, int] = (1, 7)
+AGREEMENT_ARGS: list[str] = ["--accept-source-agreements", "--accept-package-agreements"]
+METHOD_ACTIONS: dict[str, str] = {
+    "install": "Installation",
+    "upgrade": "Upgrade",
+    "uninstall": "Uninstallation",
+}
+# The snapshot is taken again after this time.
+SNAPSHOT_TTL_SECONDS: float = 5 * 60
+# Exit codes of winget results where there was nothing to do, per method, as unsigned 32-bit values.
+# APPINSTALLER_CLI_ERROR_UPDATE_NOT_APPLICABLE: "No applicable update found".
+# APPINSTALLER_CLI_ERROR_PACKAGE_ALREADY_INSTALLED: "Found an existing package already installed".
+NOOP_EXIT_CODES: dict[str, set[int]] = {
+    "install": {0x8A150061},
+    "upgrade": {0x8A15002B, 0x8A150061},
+}
+# Output lines of the same results, for winget versions that exit with a generic code.
+NOOP_OUTPUT_PATTERNS: dict[str, list[str]] = {
+    "install": ["Found an existing package already installed", "No available upgrade found"],
+    "upgrade": ["No applicable update found", "No available upgrade found", "No newer package versions are available"],
+}
 
-    return run_package_manager_command(
-        [
-            "winget",
-            "install",
-            f"--id={package_id}",
-            "-e",
-            "--accept-source-agreements",
-            "--accept-package-agreements",
-        ],
-        action="Installation",
-    )
 
+_LOCK = threading.RLock()
+_SNAPSHOT: dict[str, str | None] | None = None
+# time.monotonic() of the snapshot.
+_SNAPSHOT_TAKEN_AT: float = 0.0
+_VERSION: tuple[int, ...] | None = None
+# (method, package ID lower) -> exit code of a batched run in this process.
+_BATCH_RESULTS: dict[tuple[str, str], int] = {}
 
-def upgrade_package(package_id: str) -> tuple[int, str]:
-    console.print(f"[blue]Upgrading WinGet package ID: {package_id}[/blue]")
 
-    return run_package_manager_command(
-        [
-            "winget",
-            "upgrade",
-            f"--id={package_id}",
-            "-e",
-            "--accept-source-agreements",
-            "--accept-package-agreements",
-        ],
-        action="Upgrade",
-    )
+def parse_export_json(text: str) -> dict[str, str | None]:
+    """
+    Parse the JSON of 'winget export'.
+
+    :param text: Content of the exported file:
+        {"Sources": [{"Packages": [{"PackageIdentifier": "Git.Git", "Version": "2.43.0"}, ...], ...}, ...]}
+    :return: Dict of package ID -> version (None if the export has no versions).
+    :raises ValueError: If the text isn't a winget export JSON.
+    """
+    data = json.loads(text)
+    if not isinstance(data, dict) or not isinstance(data.get("Sources"), list):
+        raise ValueError("Not a winget export JSON.")
+
+    packages: dict[str, str | None] = {}
+    for source in data["Sources"]:
+        for package in source.get("Packages", []) or []:
+            package_id = package.get("PackageIdentifier")
+            if package_id:
+                packages[package_id] = package.get("Version")
+    return packages
+
+
+def parse_list_output(text: str) -> dict[str, str | None]:
+    """
+    Parse the table of 'winget list'. Columns are located by the header line above the dashes separator.
+    Progress spinner output before the table is ignored. Rows with truncated IDs ('…') are skipped.
+
+    :param text: Output of 'winget list'.
+    :return: Dict of package ID -> version.
+    """
+    # The spinner is written with '\r', keep only the last segment of each line.
+    lines: list[str] = [line.split("\r")[-1].rstrip() for line in text.splitlines()]
+
+    separator_index: int | None = next(
+        (index for index, line in enumerate(lines) if index > 0 and re.fullmatch(r"-{10,}", line.strip())), None)
+    if separator_index is None:
+        return {}
+
+    header: str = lines[separator_index - 1]
+    columns: list[tuple[str, int]] = [(match.group(), match.start()) for match in re.finditer(r"\S+", header)]
+    if len(columns) < 3:
+        return {}
+
+    # Name, Id, Version, [Available], [Source]; localized headers keep the same order.
+    id_start: int = columns[1][1]
+    version_start: int = columns[2][1]
+    version_end: int | None = columns[3][1] if len(columns) > 3 else None
+
+    packages: dict[str, str | None] = {}
+    for line in lines[separator_index + 1:]:
+        if not line.strip() or len(line) <= id_start:
+            continue
+        package_id: str = line[id_start:version_start].strip()
+        version: str = line[version_start:version_end].strip() if version_end else line[version_start:].strip()
+        if not package_id or "…" in package_id or " " in package_id:
+            continue
+        packages[package_id] = version.split(" ")[0] or None
+    return packages
+
+
+def parse_version(text: str) -> tuple[int, ...] | None:
+    """
+    :param text: Output of 'winget --version', like 'v1.7.10861'.
+    :return: Version tuple, or None if it can't be parsed.
+    """
+    match = re.search(r"(\d+)\.(\d+)(?:\.(\d+))?", text or "")
+    if not match:
+        return None
+    return tuple(int(part) for part in match.groups() if part is not None)
+
+
+def _run_capture(args: list[str]) -> tuple[int, str]:
+    try:
+        result = subprocess.run(
+            WINGET_COMMAND + args, capture_output=True, text=True, encoding="utf-8", errors="replace",
+            stdin=subprocess.DEVNULL)
+    except (FileNotFoundError, OSError):
+        return 1, ""
+    return result.returncode, result.stdout
+
+
+def is_noop_result(
+        method: str,
+        rc: int,
+        output: str = ""
+) -> bool:
+    """
+    Check if a failing exit code of winget only means that there was nothing to do,
+    like an 'upgrade' with no applicable update, or an 'install' of an already installed package.
+
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param rc: Exit code, signed or unsigned.
+    :param output: Output of the command, can be empty (e.g. for a batched result).
+    :return: True if the package is already in the wanted state.
+    """
+    if rc == 0:
+        return False
+    if rc & 0xFFFFFFFF in NOOP_EXIT_CODES.get(method, set()):
+        return True
+    return any(pattern.lower() in (output or "").lower() for pattern in NOOP_OUTPUT_PATTERNS.get(method, []))
+
+
+def get_winget_version() -> tuple[int, ...] | None:
+    """:return: The winget version tuple, cached for the run. None if winget isn't available."""
+    global _VERSION
+    with _LOCK:
+        if _VERSION is None:
+            rc, output = _run_capture(["--version"])
+            _VERSION = parse_version(output) if rc == 0 else ()
+        return _VERSION or None
+
+
+def supports_batch() -> bool:
+    version = get_winget_version()
+    return version is not None and version[:2] >= MIN_BATCH_VERSION
+
+
+def take_snapshot() -> dict[str, str | None] | None:
+    """
+    Read all the installed packages with one winget call: 'winget export' JSON, or 'winget list' if the export fails.
+
+    :return: Dict of package ID -> version, or None if winget isn't available.
+    """
+    fd, export_path = tempfile.mkstemp(suffix=".json", prefix="dkinst_winget_export_")
+    os.close(fd)
+    try:
+        rc, _ = _run_capture(
+            ["export", "-o", export_path, "--include-versions", "--accept-source-agreements",
+             "--disable-interactivity"])
+        if rc == 0:
+            try:
+                with open(export_path, "r", encoding="utf-8-sig") as f:
+                    return parse_export_json(f.read())
+            except (OSError, ValueError):
+                pass
+    finally:
+        try:
+            os.remove(export_path)
+        except OSError:
+            pass
+
+    rc, output = _run_capture(["list", "--accept-source-agreements", "--disable-interactivity"])
+    if rc != 0 and not output:
+        return None
+    return parse_list_output(output)
+
+
+def get_snapshot(refresh: bool = False) -> dict[str, str | None]:
+    """
+    :param refresh: Take a new snapshot instead of the cached one.
+    :return: Dict of installed package ID -> version. Empty if winget isn't available.
+        The cached snapshot is used for 'SNAPSHOT_TTL_SECONDS'.
+    """
+    global _SNAPSHOT, _SNAPSHOT_TAKEN_AT
+    with _LOCK:
+        if _SNAPSHOT is None or refresh or time.monotonic() - _SNAPSHOT_TAKEN_AT > SNAPSHOT_TTL_SECONDS:
+            _SNAPSHOT = take_snapshot() or {}
+            _SNAPSHOT_TAKEN_AT = time.monotonic()
+        return _SNAPSHOT
+
+
+def invalidate_snapshot() -> None:
+    """Drop the cached snapshot and batch results, e.g. after packages were changed outside of this module."""
+    global _SNAPSHOT
+    with _LOCK:
+        _SNAPSHOT = None
+        _BATCH_RESULTS.clear()
+
+
+def _find_in_snapshot(package_id: str) -> str | None:
+    snapshot = get_snapshot()
+    lower_id: str = package_id.lower()
+    return next((pid for pid in snapshot if pid.lower() == lower_id), None)
+
+
+def is_package_installed(package_id: str) -> bool:
+    """Check in the snapshot of the run if the package is installed (case-insensitive ID)."""
+    return _find_in_snapshot(package_id) is not None
+
+
+def get_installed_version(package_id: str) -> str | None:
+    """:return: The installed version from the snapshot of the run, None if not installed or unknown."""
+    found = _find_in_snapshot(package_id)
+    return get_snapshot().get(found) if found else None
+
+
+def _update_snapshot(
+        method: str,
+        package_ids: list[str],
+        rc: int
+) -> None:
+    if rc != 0:
+        return
+    with _LOCK:
+        if _SNAPSHOT is None:
+            return
+        for package_id in package_ids:
+            existing = next((pid for pid in _SNAPSHOT if pid.lower() == package_id.lower()), None)
+            if method == "uninstall":
+                if existing:
+                    del _SNAPSHOT[existing]
+            elif method == "install" and not existing:
+                _SNAPSHOT[package_id] = None
+            elif method == "upgrade" and existing:
+                # The new version is unknown until the next snapshot.
+                _SNAPSHOT[existing] = None
+
+
+def build_command(
+        method: str,
+        package_ids: list[str]
+) -> list[str]:
+    """
+    Build the winget command of a method for one or several package IDs.
+
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param package_ids: Package IDs. Several IDs are passed as exact queries of one command.
+    :return: Command list.
+    """
+    if len(package_ids) == 1:
+        command: list[str] = WINGET_COMMAND + [method, f"--id={package_ids[0]}", "-e"]
+    else:
+        command = WINGET_COMMAND + [method, *package_ids, "-e"]
+    if method != "uninstall":
+        command += AGREEMENT_ARGS
+    return command
+
+
+def _method_package(
+        method: str,
+        package_id: str,
+        message: str
+) -> tuple[int, str]:
+    batched_rc: int | None = _BATCH_RESULTS.get((method, package_id.lower()))
+    if batched_rc is not None:
+        console.print(f"[blue]WinGet package ID: {package_id} was processed in a batch, rc: {batched_rc}[/blue]")
+        return batched_rc, ""
+
+    console.print(f"[blue]{message}: {package_id}[/blue]")
+    rc, output = run_package_manager_command(build_command(method, [package_id]), action=METHOD_ACTIONS[method])
+    _update_snapshot(method, [package_id], 0 if is_noop_result(method, rc, output) else rc)
+    return rc, output
+
+
+def install_package(package_id: str) -> tuple[int, str]:
+    return _method_package("install", package_id, "Installing WinGet package ID")
+
+
+def upgrade_package(package_id: str) -> tuple[int, str]:
+    return _method_package("upgrade", package_id, "Upgrading WinGet package ID")
 
 
 def uninstall_package(package_id: str) -> tuple[int, str]:
-    console.print(f"[blue]Uninstalling WinGet package ID: {package_id}[/blue]")
-
-    return run_package_manager_command(
-        [
-            "winget",
-            "uninstall",
-            f"--id={package_id}",
-            "-e",
-        ],
-        action="Uninstallation",
-    )
+    return _method_package("uninstall", package_id, "Uninstalling WinGet package ID")
+
+
+def plan_batches(
+        method: str,
+        package_ids: list[str],
+        snapshot: dict[str, str | None],
+        batch_supported: bool
+) -> tuple[list[str], list[list[str]]]:
+    """
+    Split the packages of a method into already-done ones and winget commands to run.
+
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param package_ids: Package IDs.
+    :param snapshot: Installed packages, ID -> version.
+    :param batch_supported: True if winget accepts several queries ('install' and 'upgrade' only).
+    :return: (IDs with nothing to do, list of ID groups, one winget command per group).
+    """
+    installed_lower: set[str] = {pid.lower() for pid in snapshot}
+    unique_ids: list[str] = list(dict.fromkeys(package_ids))
+
+    if method == "install":
+        skipped = [pid for pid in unique_ids if pid.lower() in installed_lower]
+    elif method == "uninstall":
+        skipped = [pid for pid in unique_ids if pid.lower() not in installed_lower]
+    else:
+        skipped = []
+    to_run: list[str] = [pid for pid in unique_ids if pid not in skipped]
+
+    if not to_run:
+        return skipped, []
+    if batch_supported and method in ("install", "upgrade") and len(to_run) > 1:
+        return skipped, [to_run]
+    return skipped, [[pid] for pid in to_run]
+
+
+def method_packages(
+        method: str,
+        package_ids: list[str]
+) -> dict[str, int]:
+    """
+    Install/upgrade/uninstall several packages with as few winget processes as possible:
+    packages that are already in the wanted state are skipped by the snapshot, 'install' and 'upgrade'
+    of the rest run as one command if winget supports it.
+    The results are kept for the run, so later 'install_package/upgrade_package/uninstall_package'
+    calls of the same IDs return them without running winget.
+
+    :param method: 'install', 'upgrade' or 'uninstall'.
+    :param package_ids: Package IDs.
+    :return: Dict of package ID -> exit code.
+    """
+    skipped, groups = plan_batches(method, package_ids, get_snapshot(), supports_batch())
+    results: dict[str, int] = {pid: 0 for pid in skipped}
+    for pid in skipped:
+        console.print(f"[blue]WinGet package ID: {pid} needs no {method}. Skipping.[/blue]")
+
+    for group in groups:
+        console.print(f"[blue]{METHOD_ACTIONS[method]} of WinGet package IDs: {', '.join(group)}[/blue]")
+        rc, output = run_package_manager_command(build_command(method, group), action=METHOD_ACTIONS[method])
+        if len(group) == 1 and is_noop_result(method, rc, output):
+            console.print(f"[blue]WinGet package ID: {group[0]} needs no {method}.[/blue]")
+            rc = 0
+        if rc == 0 or len(group) == 1:
+            for pid in group:
+                results[pid] = rc
+            _update_snapshot(method, group, rc)
+            continue
+
+        # The batch failed, find out which packages made it. The ones in an unknown state get no result,
+        # so they are processed again by their own call.
+        if method == "install":
+            installed_lower = {pid.lower() for pid in get_snapshot(refresh=True)}
+            for pid in group:
+                if pid.lower() in installed_lower:
+                    results[pid] = 0
+
+    with _LOCK:
+        for pid, rc in results.items():
+            _BATCH_RESULTS[(method, pid.lower())] = rc
+    return results
@@ -22,8 +22,8 @@ from .infra import system, msis, permissions, files, ubuntu_permissions, ubuntu_
 console = Console()
 
 
-VERSION: str = "1.1.0"
-# Added db tools installation on Windows.
+VERSION: str = "1.1.1"
+# Executable lookups use the persisted find index.
 
 
 def get_latest_mongodb_download_url(
@@ -147,7 +147,7 @@ def is_installed() -> Union[str, None]:
     :return: string if MongoDB executable is found, None otherwise.
     """
 
-    return files.find_file(MONGODB_EXE_NAME, WHERE_TO_SEARCH_FOR_MONGODB_EXE)
+    return files.find_file_cached(MONGODB_EXE_NAME, WHERE_TO_SEARCH_FOR_MONGODB_EXE)
 
 
 def is_db_tools_installed() -> Union[str, None]:
@@ -156,7 +156,7 @@ def is_db_tools_installed() -> Union[str, None]:
     :return: string if MongoDB Database Tools executable is found, None otherwise.
     """
 
-    return files.find_file(MONGO_DUMP_EXE_NAME, WHERE_TO_SEARCH_FOR_MONGODUMP_EXE)
+    return files.find_file_cached(MONGO_DUMP_EXE_NAME, WHERE_TO_SEARCH_FOR_MONGODUMP_EXE)
 
 
 def install_mongodb_win(
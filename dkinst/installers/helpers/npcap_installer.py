@@ -1,4 +1,3 @@
-import json
 import re
 import shutil
 import subprocess
@@ -11,17 +10,18 @@ import sys
 
 from rich.console import Console
 
-from dkwebmod import web
 from dkwebmod.user_agents import USER_AGENTS
 
-from .infra import permissions
+from .infra import permissions, downloads, verifications
 
 
 console = Console()
 
 
-VERSION: str = "1.0.0"
-# Initial version
+VERSION: str = "1.0.2"
+# Signature check results are cached by the installer SHA-256.
+# The installer must be signed by this publisher (certificate subject CN), not only have a valid signature.
+EXPECTED_SIGNER: str = "Insecure.Com LLC"
 
 DIST_URL = "https://npcap.com/dist/"
 USER_AGENT = USER_AGENTS['Chrome 142.0.0 Windows 10/11 x64']
@@ -88,62 +88,21 @@ def install_npcap(
     def version_key(v: str) -> Tuple[int, ...]:
         return tuple(int(x) for x in v.split("."))
 
-    def verify_authenticode_signature(path: str) -> None:
-        ps = shutil.which("powershell") or shutil.which("pwsh")
-        if not ps:
-            raise RuntimeError("PowerShell not found (powershell/pwsh). Required for signature check.")
+    def verify_authenticode_signature(path: str, sha256: Optional[str] = None) -> None:
+        # The result is stored by the file hash, a repeat install of the same installer skips PowerShell.
+        try:
+            result = verifications.verify_authenticode(path, sha256=sha256, expected_signer=EXPECTED_SIGNER)
+        except verifications.VerificationError as e:
+            raise RuntimeError(str(e)) from e
 
-        ps_script = r"""
-    $ErrorActionPreference = 'Stop'
-    & {
-      param([Parameter(Mandatory=$true)][string]$Path)
-
-      $sig = Get-AuthenticodeSignature -LiteralPath $Path
-
-      $obj = [pscustomobject]@{
-        Status        = $sig.Status.ToString()
-        StatusMessage = $sig.StatusMessage
-        SignerSubject = if ($sig.SignerCertificate) { $sig.SignerCertificate.Subject } else { $null }
-      }
-
-      # Write exactly one JSON line to stdout
-      [Console]::WriteLine(($obj | ConvertTo-Json -Compress))
-    }
-    """.strip()  # CRITICAL: prevents the appended arg from landing on a new line
-
-        completed = subprocess.run(
-            [ps, "-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass",
-             "-Command", ps_script, path],
-            capture_output=True,
-            text=True,
-        )
-
-        if completed.returncode != 0:
+        if not result.is_valid:
             raise RuntimeError(
-                "PowerShell signature check failed.\n"
-                f"Exit: {completed.returncode}\n"
-                f"STDOUT: {completed.stdout}\n"
-                f"STDERR: {completed.stderr}"
-            )
-
-        out = completed.stdout.strip()
-        if not out:
-            # Include stderr here too; in this failure mode PowerShell often wrote the real reason to stderr
-            raise RuntimeError(
-                "PowerShell returned no output for signature check.\n"
-                f"STDERR: {completed.stderr}"
-            )
-
-        # If anything extra sneaks into stdout, take the last non-empty line as the JSON payload.
-        last_line = next((line for line in reversed(out.splitlines()) if line.strip()), "")
-        data = json.loads(last_line)
-
-        if data.get("Status") != "Valid":
-            raise RuntimeError(
-                f"Installer signature is not valid (Status={data.get('Status')}). "
-                f"Message: {data.get('StatusMessage')}. "
-                f"Signer: {data.get('SignerSubject')}"
+                f"Installer signature is not valid (Status={result.status}). "
+                f"Message: {result.message}. "
+                f"Signer: {result.signer}, expected: {EXPECTED_SIGNER}"
             )
+        if result.cached:
+            print("The same installer was verified before, the stored result is used.")
 
     def run_installer_wait(
             file_path: str,
@@ -159,56 +118,42 @@ def install_npcap(
           we can add a more advanced wait strategy. (Npcap typically does not.)
         """
 
-        from .infra import gui_interaction
+        from .infra import gui_wizard
 
         cmd = [file_path]
         proc = subprocess.Popen(cmd)
 
         if automation:
-            # Define the required UI steps (text, timeout seconds).
+            # Define the required UI steps.
             # Adjust timeouts and labels to match the installer screens you actually see.
             steps = [
-                ("I Agree", 60.0),
-                ("Install", 60.0),
-                ("Next", 240.0),
-                ("Finish", 300.0),
+                gui_wizard.WizardStep("I Agree", window=WINDOW_TITLE, timeout=60.0),
+                gui_wizard.WizardStep("Install", window=WINDOW_TITLE, timeout=60.0),
+                gui_wizard.WizardStep("Next", window=WINDOW_TITLE, timeout=240.0),
+                gui_wizard.WizardStep("Finish", window=WINDOW_TITLE, timeout=300.0),
             ]
 
-            for text, t in steps:
-                # If installer exits early, treat as error (per your earlier requirement).
-                rc = proc.poll()
-                if rc is not None:
-                    raise RuntimeError(
-                        f'Installer exited with code {rc} before "{text}" was found/clicked.'
-                    )
-
-                clicked = gui_interaction.click_button(
-                    text,
-                    window_title=WINDOW_TITLE,
-                    window_title_partial=True,
+            try:
+                results = gui_wizard.run_wizard(
+                    steps,
                     pid=proc.pid,
-                    timeout=t,
+                    # If installer exits early, treat as error.
+                    process_alive=lambda: proc.poll() is None,
                     poll_interval=0.2,
                     relax_pid_after=5.0,  # after 5s, allow pid=None in case UI is in a spawned process
-                    focus_before_click=True,
                 )
-
-                if not clicked:
-                    # Enforce "exit with error" behavior: terminate installer and raise.
-                    # taskkill /T kills child processes as well.
+            except gui_wizard.WizardError as e:
+                # Enforce "exit with error" behavior: terminate installer and raise.
+                # taskkill /T kills child processes as well.
+                if proc.poll() is None:
                     subprocess.run(
                         ["taskkill", "/PID", str(proc.pid), "/T", "/F"],
                         capture_output=True,
                         text=True,
                     )
-                    scope = (
-                        f' (window title regex: {WINDOW_TITLE.pattern})'
-                        if isinstance(WINDOW_TITLE, re.Pattern)
-                        else f' (window title: {WINDOW_TITLE})'
-                        if isinstance(WINDOW_TITLE, str)
-                        else " (all windows)"
-                    )
-                    raise RuntimeError(f'Button "{text}" was not visible+enabled within {t:.0f}s{scope}.')
+                raise RuntimeError(str(e)) from e
+
+            gui_wizard.print_results(results)
 
         # All required buttons clicked; wait for installer completion and return its exit code.
         return proc.wait()
@@ -236,11 +181,14 @@ def install_npcap(
     download_dir = tempfile.mkdtemp(prefix="npcap-install-")
     # exe_path = os.path.join(download_dir, latest.exe_name)
     # print(f"Downloading to: {exe_path}")
-    exe_path = web.download(file_url=latest.exe_url, target_directory=download_dir, file_name=latest.exe_name)
+    # The SHA-256 is computed while downloading, it is the key of the stored signature check.
+    download = downloads.download(
+        latest.exe_url, target_directory=download_dir, file_name=latest.exe_name, headers={"User-Agent": USER_AGENT})
+    exe_path = download.file_path
 
     # Signature check
     print("Verifying Authenticode signature ...")
-    verify_authenticode_signature(exe_path)
+    verify_authenticode_signature(exe_path, sha256=download.sha256)
     print("Signature status: Valid")
 
     rc = run_installer_wait(exe_path, automation=try_automation)
@@ -8,17 +8,18 @@ from pathlib import Path
 import requests
 from rich.console import Console
 
-from dkwebmod import web
 from dkarchiver.arch_wrappers import sevenzs
 
+from .infra import versions, downloads
+
 
 console = Console()
 
 
 SCRIPT_NAME: str = "Snappy Driver Installer Lite Manager"
 AUTHOR: str = "Denis Kras"
-VERSION: str = "1.0.0"
-RELEASE_COMMENT: str = "Initial version."
+VERSION: str = "1.1.1"
+RELEASE_COMMENT: str = "The archive is hashed while downloading."
 
 DOWNLOAD_PAGE_URL: str = "https://sdi-tool.org/download/"
 DOWNLOAD_URL_TEMPLATE: str = "https://driveroff.net/drv/SDI_{version}.7z"
@@ -43,8 +44,10 @@ def get_latest_version() -> str | None:
 
 
 def get_installed_version(dir_path: str) -> str | None:
-    """Read the installed version from version.txt in the install directory."""
-    version_file: str = os.path.join(dir_path, VERSION_FILE_NAME)
+    """Read the installed version from version.txt of the active version, or of an install made before the versioned layout."""
+    version_file: str = os.path.join(versions.get_current_path(dir_path), VERSION_FILE_NAME)
+    if not os.path.isfile(version_file):
+        version_file = os.path.join(dir_path, VERSION_FILE_NAME)
     if not os.path.isfile(version_file):
         return None
     with open(version_file, "r") as f:
@@ -58,8 +61,14 @@ def _write_version_file(dir_path: str, version: str) -> None:
         f.write(version)
 
 
+def _is_driver_pack(relative_path: str) -> bool:
+    """Driver packs are replaced under a new file name when SDI updates them, so they can be hardlinked."""
+    parts: list[str] = relative_path.replace("\\", "/").split("/")
+    return len(parts) > 1 and parts[0].lower() == "drivers" and parts[-1].lower().endswith(".7z")
+
+
 def install(dir_path: str) -> int:
-    """Download and install SDI Lite to the given directory."""
+    """Download and install SDI Lite to '<dir_path>/versions/<version>' and switch '<dir_path>/current' to it."""
     version: str | None = get_latest_version()
     if not version:
         return 1
@@ -69,36 +78,44 @@ def install(dir_path: str) -> int:
 
     temp_dir: str = tempfile.mkdtemp()
     try:
-        archive_path: str = web.download(download_url, temp_dir)
+        # 7z can't be extracted while downloading, its headers are at the end. The hash is computed on the way.
+        download_result: downloads.DownloadResult = downloads.download(download_url, temp_dir)
+        archive_path: str = download_result.file_path
+        console.print(f"SHA-256: {download_result.sha256}", markup=False)
 
         # Extract archive to a temp extraction dir.
         temp_extract_dir: str = os.path.join(temp_dir, "extracted")
         sevenzs.extract_file(archive_path, temp_extract_dir)
 
         # The archive contains a top-level SDI_{version}/ folder.
-        # Move its contents into dir_path.
+        # Its contents are staged as the version folder.
         extracted_inner: str = os.path.join(temp_extract_dir, f"SDI_{version}")
         if not os.path.isdir(extracted_inner):
             # Fallback: if no inner folder, use the extraction root.
             extracted_inner = temp_extract_dir
 
-        if os.path.exists(dir_path):
-            shutil.rmtree(dir_path)
-        os.makedirs(os.path.dirname(dir_path), exist_ok=True)
-        shutil.copytree(extracted_inner, dir_path)
-
-        _write_version_file(dir_path, version)
+        _write_version_file(extracted_inner, version)
+
+        # An install made before the versioned layout becomes the previous version, so it can be rolled back to.
+        versions.adopt_flat_install(dir_path, get_installed_version(dir_path) or "previous")
+        os.makedirs(dir_path, exist_ok=True)
+        # Driver packs that didn't change are hardlinked to the active version instead of being written again.
+        # SDI rewrites its config and indexes in place, they are always copied.
+        # The version was just downloaded, a folder of the same version is replaced by it.
+        versions.stage_version(
+            dir_path, version, extracted_inner, move=True, force=True, link_filter=_is_driver_pack)
+        version_path: str = versions.activate(dir_path, version)
     finally:
         # Clean up temp directory.
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir, ignore_errors=True)
 
-    console.print(f"[green]SDI Lite {version} installed to: {dir_path}[/green]")
+    console.print(f"[green]SDI Lite {version} installed to: {version_path}[/green]")
     return 0
 
 
 def upgrade(dir_path: str) -> int:
-    """Upgrade SDI Lite: check latest version, remove old, install new."""
+    """Upgrade SDI Lite: check latest version, install new next to the old one and switch to it."""
     installed_version: str | None = get_installed_version(dir_path)
     if installed_version:
         console.print(f"Installed SDI Lite version: {installed_version}")
@@ -115,10 +132,11 @@ def upgrade(dir_path: str) -> int:
 
     console.print(f"[yellow]Upgrading from {installed_version or 'N/A'} to {latest_version}...[/yellow]")
 
-    # Remove old installation.
-    if os.path.exists(dir_path):
-        console.print(f"Removing old installation at: {dir_path}")
-        shutil.rmtree(dir_path)
+    # The old version stays in 'versions' until the next upgrade, for 'dkinst rollback snappy_driver_lite'.
+    if versions.has_version(dir_path, latest_version):
+        versions.activate(dir_path, latest_version)
+        console.print(f"[green]Switched to the already installed SDI Lite {latest_version}.[/green]")
+        return 0
 
     return install(dir_path)
 
@@ -10,7 +10,7 @@ from rich.console import Console
 
 from dkwebmod import githubw
 
-from .infra import registrys
+from .infra import registrys, journal, executables, versions
 
 
 console = Console()
@@ -18,8 +18,8 @@ console = Console()
 
 SCRIPT_NAME: str = "TesseractOCR Manager"
 AUTHOR: str = "Denis Kras"
-VERSION: str = "1.1.1"
-RELEASE_COMMENT: str = "Moved Build Tools to dependencies."
+VERSION: str = "1.2.0"
+RELEASE_COMMENT: str = "Compiled versions are installed side by side under 'versions', 'current' is switched to the new one."
 
 
 # Constants for GitHub wrapper.
@@ -107,8 +107,9 @@ def use_installer(
 
     # Add Tesseract to the PATH.
     if set_path:
-        registrys.ensure_exe_dir_in_path(f'{TESSERACT_VCPKG_TOOLS_DIR}{os.sep}tesseract.exe')
-        registrys.set_environment_variable('TESSDATA_PREFIX', WINDOWS_TESSERACT_DEFAULT_INSTALLATION_DIRECTORY + os.sep + 'tessdata')
+        with registrys.EnvironmentEditor() as env:
+            env.ensure_exe_dir_in_path(f'{TESSERACT_VCPKG_TOOLS_DIR}{os.sep}tesseract.exe')
+            env.set_variable('TESSDATA_PREFIX', WINDOWS_TESSERACT_DEFAULT_INSTALLATION_DIRECTORY + os.sep + 'tessdata')
 
 
 def get_latest_compiled_version() -> str:
@@ -140,7 +141,7 @@ def compile_exe(
         return bool(ctypes.windll.shell32.IsUserAnAdmin())
 
     def have(exe):
-        return shutil.which(exe) is not None
+        return executables.which(exe) is not None
 
     if os.name != "nt":
         console.print("This script is for Windows only.", style="red")
@@ -153,24 +154,38 @@ def compile_exe(
         console.print("Git is not installed. Please install Git for Windows.", style="red")
         return 1
 
-    if not VCPKG_DIR.exists():
-        run(f'git clone https://github.com/microsoft/vcpkg "{VCPKG_DIR}"')
-    else:
-        console.print(f"vcpkg exists in [{VCPKG_DIR}]. Updating...", style="cyan")
-        run(f'git -C "{VCPKG_DIR}" pull')
-    run(f'"{VCPKG_DIR / "bootstrap-vcpkg.bat"}"')
-
     vcpkg = VCPKG_DIR / "vcpkg.exe"
-    console.print(f"Creating {PORT} port in vcpkg...", style="cyan")
-    # run(f'"{vcpkg}" install {PORT} --disable-metrics')        # minimal, no dependencies.
-    run(f'"{vcpkg}" install ' + ' '.join(DEPENDENCIES) + ' --disable-metrics --recurse')
+
+    def bootstrap_vcpkg():
+        if not VCPKG_DIR.exists():
+            run(f'git clone https://github.com/microsoft/vcpkg "{VCPKG_DIR}"')
+        else:
+            console.print(f"vcpkg exists in [{VCPKG_DIR}]. Updating...", style="cyan")
+            run(f'git -C "{VCPKG_DIR}" pull')
+        run(f'"{VCPKG_DIR / "bootstrap-vcpkg.bat"}"')
+
+    def install_ports():
+        console.print(f"Creating {PORT} port in vcpkg...", style="cyan")
+        # run(f'"{vcpkg}" install {PORT} --disable-metrics')        # minimal, no dependencies.
+        run(f'"{vcpkg}" install ' + ' '.join(DEPENDENCIES) + ' --disable-metrics --recurse')
+
+    # Each phase is journaled, so a resumed install doesn't repeat the hours of the finished phases.
+    journal.run_step(
+        "tesseract_ocr:vcpkg_bootstrap", bootstrap_vcpkg,
+        inputs={"vcpkg_dir": str(VCPKG_DIR)},
+        verify=vcpkg.is_file)
+    journal.run_step(
+        "tesseract_ocr:vcpkg_install", install_ports,
+        inputs={"vcpkg_dir": str(VCPKG_DIR), "dependencies": DEPENDENCIES},
+        verify=TESSERACT_VCPKG_TOOLS_EXE.is_file)
     run(f'"{vcpkg}" integrate install --disable-metrics')
 
     os.makedirs(TESSDATA_DIR, exist_ok=True)
 
     if set_path:
-        registrys.ensure_exe_dir_in_path(f'{TESSERACT_VCPKG_TOOLS_DIR}{os.sep}tesseract.exe')
-        registrys.set_environment_variable('TESSDATA_PREFIX', str(TESSDATA_DIR))
+        with registrys.EnvironmentEditor() as env:
+            env.ensure_exe_dir_in_path(f'{TESSERACT_VCPKG_TOOLS_DIR}{os.sep}tesseract.exe')
+            env.set_variable('TESSDATA_PREFIX', str(TESSDATA_DIR))
 
     console.print("\nDone. Open a NEW CMD terminal and run [tesseract --version] to verify the installation.", style="green", markup=False)
     return 0
@@ -182,7 +197,7 @@ def get_environment_path() -> str | None:
     This function checks if the Tesseract command is available in the system PATH.
     Returns the path of tesseract if exists, otherwise None.
     """
-    return shutil.which("tesseract")
+    return executables.which("tesseract")
 
 
 def get_executable_version(exe_path: str) -> str:
@@ -204,6 +219,68 @@ def get_executable_version(exe_path: str) -> str:
         return ""
 
 
+def adopt_flat_installation(versions_root: str) -> None:
+    """
+    Move a Tesseract installation that was made directly in the root, before the versioned layout,
+    into the versions folder and activate it. So it isn't compiled again if it is the latest, and it can be rolled back to.
+
+    :param versions_root: Layout root, the parent of the 'current' folder of the executable.
+    """
+    if not versions.has_flat_install(versions_root):
+        return
+    flat_version: str = get_executable_version(os.path.join(versions_root, "tesseract.exe")) or "previous"
+    versions.adopt_flat_install(versions_root, flat_version)
+    print(f"Moved the existing Tesseract installation to the versions folder as: {flat_version}")
+
+
+def install_compiled_version(
+        versions_root: str,
+        version: str
+) -> str:
+    """
+    Install the compiled Tesseract from the vcpkg tools directory as a new version of the versioned layout
+    and switch '<versions_root>/current' to it. The files that didn't change since the active version are hardlinked.
+
+    :param versions_root: Layout root, the parent of the 'current' folder of the executable.
+    :param version: Compiled version.
+    :return: Path of the new version folder.
+    """
+    os.makedirs(versions_root, exist_ok=True)
+    # Just compiled, a folder of the same version is replaced by it.
+    versions.stage_version(versions_root, version, str(TESSERACT_VCPKG_TOOLS_DIR), force=True)
+    version_path: str = versions.activate(versions_root, version)
+    print(f"Tesseract {version} installed to: {version_path}")
+    return version_path
+
+
+def replace_with_compiled_version(
+        executable_parent_path: str,
+        provided_exe_version: str
+) -> None:
+    """
+    Replace the Tesseract in a custom executable directory with the compiled one from the vcpkg tools directory.
+    The existing directory is backed up next to it.
+    """
+    # Backing up the current version of Tesseract executable. But backup only if the folder exists, since if it is not it's new installation.
+    if os.path.exists(executable_parent_path):
+        parent_of_the_current_parent_path: str = os.path.dirname(executable_parent_path)
+        exe_parent_dir_name: str = os.path.basename(executable_parent_path)
+        backup_path: str = os.path.join(parent_of_the_current_parent_path, f"{exe_parent_dir_name}_{provided_exe_version}_backup")
+        # Rename the current executable directory to back up.
+        shutil.move(executable_parent_path, backup_path)
+        print(f"Backed up the current Tesseract executable to: {backup_path}")
+
+    # Create new empty directory for the new Tesseract executable.
+    os.makedirs(executable_parent_path, exist_ok=True)
+
+    # Copy all the files from the compiled Tesseract directory to the provided executable path.
+    for item in TESSERACT_VCPKG_TOOLS_DIR.iterdir():
+        if item.is_file():
+            shutil.copy(item, executable_parent_path)
+        elif item.is_dir():
+            shutil.copytree(item, os.path.join(executable_parent_path, item.name), dirs_exist_ok=True)
+
+
 def _make_parser():
     import argparse
     parser = argparse.ArgumentParser(description="Install Tesseract OCR on Windows.")
@@ -234,7 +311,10 @@ def _make_parser():
         help="Force any action without asking.")
     parser.add_argument(
         "--exe-path", type=str, default=None,
-        help="Path to the Tesseract executable if you want to set it manually. If you set any of the above installation methods, the version will checked against the latest available version in GitHub Releases, and you will be asked if you want to update it.")
+        help="Path to the Tesseract executable if you want to set it manually. If you set any of the above installation methods, the version will checked against the latest available version in GitHub Releases, and you will be asked if you want to update it.\n"
+             "If the executable is in a 'current' folder, like 'C:\\dkinst\\tesseract_ocr\\current\\tesseract.exe', "
+             "the compiled versions are installed side by side in the 'versions' folder next to it and 'current' "
+             "is switched to the new one, so it can be rolled back with: dkinst rollback tesseract_ocr")
 
     parser.add_argument(
         "-l", "--languages",
@@ -344,8 +424,13 @@ def main(
 
         executable_parent_path: str = os.path.dirname(exe_path)
         tessdata_parent_path: str = os.path.join(executable_parent_path, "tessdata")
+        # Executable in the 'current' folder of the versioned layout: '<root>/current/tesseract.exe'.
+        versions_root: str | None = versions.get_layout_root(executable_parent_path)
 
         if compile_portable:
+            if versions_root:
+                adopt_flat_installation(versions_root)
+
             latest_compiled_version: str = get_latest_compiled_version()
             provided_exe_version: str = get_executable_version(exe_path)
 
@@ -359,30 +444,21 @@ def main(
                         print("Exiting without updating the provided tesseract executable.")
                         return 0
 
-                execution_result: int = compile_exe(set_path=False)
-                if execution_result != 0:
-                    console.print("Failed to compile Tesseract from source. "
-                          "Please check the logs for more details.", style="red")
-                    return execution_result
-
-                # Backing up the current version of Tesseract executable. But backup only if the folder exists, since if it is not it's new installation.
-                if os.path.exists(executable_parent_path):
-                    parent_of_the_current_parent_path: str = os.path.dirname(executable_parent_path)
-                    exe_parent_dir_name: str = os.path.basename(executable_parent_path)
-                    backup_path: str = os.path.join(parent_of_the_current_parent_path, f"{exe_parent_dir_name}_{provided_exe_version}_backup")
-                    # Rename the current executable directory to back up.
-                    shutil.move(executable_parent_path, backup_path)
-                    print(f"Backed up the current Tesseract executable to: {backup_path}")
-
-                # Create new empty directory for the new Tesseract executable.
-                os.makedirs(executable_parent_path, exist_ok=True)
-
-                # Copy all the files from the compiled Tesseract directory to the provided executable path.
-                for item in TESSERACT_VCPKG_TOOLS_DIR.iterdir():
-                    if item.is_file():
-                        shutil.copy(item, executable_parent_path)
-                    elif item.is_dir():
-                        shutil.copytree(item, os.path.join(executable_parent_path, item.name), dirs_exist_ok=True)
+                if versions_root and versions.has_version(versions_root, latest_compiled_version):
+                    # The version was compiled before and rolled back from, switching back to it is enough.
+                    versions.activate(versions_root, latest_compiled_version)
+                    print(f"Switched to the already compiled Tesseract version: {latest_compiled_version}")
+                else:
+                    execution_result: int = compile_exe(set_path=False)
+                    if execution_result != 0:
+                        console.print("Failed to compile Tesseract from source. "
+                              "Please check the logs for more details.", style="red")
+                        return execution_result
+
+                    if versions_root:
+                        install_compiled_version(versions_root, latest_compiled_version)
+                    else:
+                        replace_with_compiled_version(executable_parent_path, provided_exe_version)
             else:
                 print(f"The provided Tesseract executable version: {provided_exe_version} "
                       f"is already the latest available version: {latest_compiled_version}. "
@@ -394,8 +470,9 @@ def main(
             # Remove the old executable from the PATH if it exists.
             if not current_environment_path or current_environment_path.lower() != exe_path.lower():
                 # Set the new Tesseract executable path and TESSDATA_PREFIX.
-                registrys.ensure_exe_dir_in_path(exe_path)
-                registrys.set_environment_variable('TESSDATA_PREFIX', tessdata_parent_path)
+                with registrys.EnvironmentEditor() as env:
+                    env.ensure_exe_dir_in_path(exe_path)
+                    env.set_variable('TESSDATA_PREFIX', tessdata_parent_path)
                 print(f"Tesseract directory path set to: {executable_parent_path}")
                 print(f"TESSDATA_PREFIX set to: {tessdata_parent_path}")
             return 0
@@ -438,6 +515,8 @@ def main(
             tessdata_path = os.path.join(tessdata_path, 'script')
 
         os.makedirs(tessdata_path, exist_ok=True)
+        # The tessdata of a version is hardlinked to the other versions, downloads overwrite files in place.
+        versions.break_hardlinks(tessdata_path)
 
         repo_path: str | None = None
         if languages == 'b':
@@ -488,6 +567,7 @@ def main(
             return 1
 
         os.makedirs(tessdata_path, exist_ok=True)
+        versions.break_hardlinks(tessdata_path)
 
         print(f"Downloading config files.")
         TESSERACT_TESSCONFIGS_GITHUB_WRAPPER.download_and_extract_branch(target_directory=tessdata_path, archive_remove_first_directory=True)
@@ -11,13 +11,20 @@ from pathlib import Path
 from .infra.printing import printc
 
 
-VERSION: str = "1.0.0"
-"""Initial"""
+VERSION: str = "1.0.2"
+"""Instances directory constant for the installed-state fingerprint."""
+
+
+DOWNLOAD_URL: str = "https://aka.ms/vs/17/release/vs_BuildTools.exe"
 
 
 VSWHERE_EXE: Path = Path(
     os.environ.get("ProgramFiles(x86)", r"C:\Program Files (x86)")
 ) / "Microsoft Visual Studio" / "Installer" / "vswhere.exe"
+# Visual Studio Installer keeps a subdirectory per installed instance here.
+INSTANCES_DIR: Path = Path(
+    os.environ.get("ProgramData", r"C:\ProgramData")
+) / "Microsoft" / "VisualStudio" / "Packages" / "_Instances"
 
 
 def is_msvc_installed() -> bool:
@@ -42,7 +49,7 @@ def run(cmd, *, ok=(0,), **kw):
 
 def install_build_tools() -> int:
     print("Installing Visual Studio 2022 Build Tools + C++ workload …")
-    url = "https://aka.ms/vs/17/release/vs_BuildTools.exe"
+    url = DOWNLOAD_URL
     with tempfile.TemporaryDirectory() as td:
         exe = Path(td) / "vs_BuildTools.exe"
         urllib.request.urlretrieve(url, exe)
@@ -9,15 +9,15 @@ from rich.console import Console
 
 from dkwebmod import githubw
 
-from .infra import system, appxs, powershells, permissions
+from .infra import system, appxs, powershells, permissions, executables, downloads
 from .infra.printing import printc
 
 
 console = Console()
 
 
-VERSION: str = "1.0.3"
-"""fixes repair install errors output"""
+VERSION: str = "1.0.4"
+"""dependencies zip is extracted while downloading"""
 
 
 AKA_MS_GETWINGET_URL: str = "https://aka.ms/getwinget"
@@ -35,7 +35,7 @@ def ensure_winget_available_in_this_process() -> None:
         return
 
     # If Python can already find it, we're done.
-    if shutil.which("winget"):
+    if executables.which("winget"):
         return
 
     # Typical install location when WinGet comes from App Installer / Store
@@ -54,7 +54,7 @@ def is_winget_installed() -> bool:
     Check if winget command exists.
     """
     print("Checking if winget is installed...")
-    file_path: str = shutil.which("winget")
+    file_path: str = executables.which("winget")
     if file_path:
         print(f"winget is installed at: {file_path}")
         return True
@@ -90,9 +90,19 @@ def install_dependencies_from_github() -> int:
 
     winget_temp_directory: str = tempfile.mkdtemp()
 
-    github_wrapper.download_and_extract_latest_release(
-        target_directory=winget_temp_directory,
-        asset_pattern='*Dependencies.zip')
+    try:
+        # Extracted while downloading, without writing the archive.
+        downloads.download_and_extract_github_release(
+            GITHUB_USERNAME, GITHUB_REPO_NAME, '*Dependencies.zip', winget_temp_directory)
+    except downloads.ChecksumMismatchError as e:
+        printc(str(e), color='red')
+        shutil.rmtree(winget_temp_directory, ignore_errors=True)
+        return 1
+    except downloads.DownloadError as e:
+        printc(f'Streaming download failed, downloading the archive: {e}', color='yellow')
+        github_wrapper.download_and_extract_latest_release(
+            target_directory=winget_temp_directory,
+            asset_pattern='*Dependencies.zip')
 
     # Get current CPU architecture.
     current_arch: str = system.get_architecture()
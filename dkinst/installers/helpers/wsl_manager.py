@@ -1,39 +1,222 @@
+import os
 import sys
 import tempfile
+import subprocess
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 
 from rich.console import Console
 
-from .infra import permissions, powershells, commands, virtualization
+from .infra import permissions, powershells, commands, virtualization, metrics
+from .. import _base
 
 
 console = Console()
 
 
-VERSION: str = "1.0.0"
+VERSION: str = "1.1.0"
+# Cached WSL state and parallel distro import from cached rootfs tarballs.
 
 
-def is_wsl_installed():
-    if not permissions.is_admin():
-        console.print("This option requires elevation.", style='red')
-        return False
-
-    # Command to check the status of the WSL feature
-    command = "Get-WindowsOptionalFeature -Online -FeatureName Microsoft-Windows-Subsystem-Linux"
+# Downloaded rootfs tarballs are kept here, so provisioning the same distro again doesn't download it again.
+ROOTFS_CACHE_DIR: str = str(Path(_base.INSTALLATION_PATH_PORTABLE_WINDOWS) / "wsl" / "rootfs")
+# Imported distros' virtual disks are created under this directory, one subdirectory per distro.
+DISTROS_INSTALL_DIR: str = str(Path(_base.INSTALLATION_PATH_PORTABLE_WINDOWS) / "wsl" / "distros")
+ROOTFS_EXTENSIONS: tuple[str, ...] = (".wsl", ".tar", ".tar.gz", ".tar.xz", ".tgz")
 
-    # Check if WSL is enabled
-    rc: int
-    stdout: str
-    stderr: str
-    rc, stdout, stderr = powershells.run_command(command)
 
-    if rc != 0:
-        raise RuntimeError(f"Failed to check WSL installation status. PowerShell command returned non-zero exit code {rc}. Stderr: {stderr}")
+def decode_wsl_output(raw: bytes | str) -> str:
+    """
+    Decode 'wsl.exe' output.
+    wsl.exe writes UTF-16LE to pipes (unless WSL_UTF8=1 is set), which shows up as NUL-interleaved text
+    when decoded as UTF-8.
+    """
+    if isinstance(raw, str):
+        return raw.replace("\x00", "").lstrip("\ufeff")
 
-    if "Enabled" in stdout:
-        return True
+    if raw.startswith(b"\xff\xfe") or (len(raw) >= 2 and raw[1:2] == b"\x00"):
+        text = raw.decode("utf-16-le", errors="replace")
     else:
+        text = raw.decode("utf-8", errors="replace")
+    return text.replace("\x00", "").lstrip("\ufeff")
+
+
+def parse_list_quiet(output: bytes | str) -> list[str]:
+    """Parse 'wsl --list --quiet' output into a list of distro names."""
+    return [line.strip() for line in decode_wsl_output(output).splitlines() if line.strip()]
+
+
+@dataclass
+class InstalledDistro:
+    name: str
+    state: str = ""
+    version: int | None = None
+    is_default: bool = False
+
+
+def parse_list_verbose(output: bytes | str) -> list[InstalledDistro]:
+    """
+    Parse 'wsl --list --verbose' output.
+
+    Example output:
+      NAME            STATE           VERSION
+    * Ubuntu-24.04    Running         2
+      docker-desktop  Stopped         2
+    """
+    distros: list[InstalledDistro] = []
+    lines = [line for line in decode_wsl_output(output).splitlines() if line.strip()]
+    for line in lines:
+        is_default = line.lstrip().startswith("*")
+        parts = line.replace("*", " ", 1).split() if is_default else line.split()
+        if not parts or (parts[0].upper() == "NAME" and not is_default):
+            continue
+        if len(parts) < 3:
+            # Not a distro row (e.g. 'Windows Subsystem for Linux has no installed distributions.').
+            continue
+        try:
+            version = int(parts[-1])
+        except ValueError:
+            continue
+        distros.append(InstalledDistro(name=" ".join(parts[:-2]), state=parts[-2], version=version, is_default=is_default))
+    return distros
+
+
+def parse_list_online(output: bytes | str) -> list[str]:
+    """
+    Parse 'wsl --list --online' output into a list of distro names (the NAME column).
+
+    Example output:
+    The following is a list of valid distributions that can be installed.
+    Install using 'wsl.exe --install <Distro>'.
+
+    NAME                            FRIENDLY NAME
+    Ubuntu                          Ubuntu
+    Debian                          Debian GNU/Linux
+    """
+    names: list[str] = []
+    in_table = False
+    for line in decode_wsl_output(output).splitlines():
+        if not line.strip():
+            continue
+        if not in_table:
+            if line.split() and line.split()[0].upper() == "NAME":
+                in_table = True
+            continue
+        names.append(line.split()[0])
+    return names
+
+
+def _run_wsl(args: list[str]) -> tuple[int, str]:
+    """Run wsl.exe and return (return code, decoded output)."""
+    env = dict(os.environ)
+    env["WSL_UTF8"] = "1"
+    try:
+        proc = subprocess.run(["wsl", *args], capture_output=True, env=env)
+    except FileNotFoundError:
+        return 1, "wsl is not installed or not in PATH."
+    return proc.returncode, decode_wsl_output(proc.stdout + proc.stderr)
+
+
+@dataclass
+class WslState:
+    """
+    WSL state snapshot. Each part is queried lazily, at most once, until the state is refreshed.
+    Build it from recorded outputs with 'from_outputs' to use it without wsl.exe.
+    """
+    _installed: list[InstalledDistro] | None = None
+    _online: list[str] | None = None
+    _feature_enabled: bool | None = None
+    # distro name -> 'lsb_release -a' output.
+    _releases: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_outputs(
+            cls,
+            list_verbose: bytes | str | None = None,
+            list_online: bytes | str | None = None,
+            releases: dict[str, bytes | str] | None = None,
+    ) -> "WslState":
+        return cls(
+            _installed=parse_list_verbose(list_verbose) if list_verbose is not None else None,
+            _online=parse_list_online(list_online) if list_online is not None else None,
+            _releases={k: decode_wsl_output(v) for k, v in (releases or {}).items()},
+        )
+
+    @property
+    def installed(self) -> list[InstalledDistro]:
+        if self._installed is None:
+            _, output = _run_wsl(["--list", "--verbose"])
+            self._installed = parse_list_verbose(output)
+        return self._installed
+
+    @property
+    def installed_names(self) -> list[str]:
+        return [d.name for d in self.installed]
+
+    @property
+    def online(self) -> list[str]:
+        if self._online is None:
+            _, output = _run_wsl(["--list", "--online"])
+            self._online = parse_list_online(output)
+        return self._online
+
+    @property
+    def feature_enabled(self) -> bool:
+        if self._feature_enabled is None:
+            # Command to check the status of the WSL feature
+            command = "Get-WindowsOptionalFeature -Online -FeatureName Microsoft-Windows-Subsystem-Linux"
+            rc, stdout, stderr = powershells.run_command(command)
+            if rc != 0:
+                raise RuntimeError(f"Failed to check WSL installation status. PowerShell command returned non-zero exit code {rc}. Stderr: {stderr}")
+            self._feature_enabled = "Enabled" in stdout
+        return self._feature_enabled
+
+    def release_info(self, distro: str) -> str:
+        if distro not in self._releases:
+            _, output = _run_wsl(["-d", distro, "lsb_release", "-a"])
+            self._releases[distro] = output
+        return self._releases[distro]
+
+    def is_ubuntu_installed(self, version: str | None = None) -> bool:
+        version = version or str()
+        names = self.installed_names
+
+        if f'Ubuntu-{version}' in names:
+            return True
+        elif 'Ubuntu' in names:
+            # Parse 'lsb_release -a' output for the version number
+            for line in self.release_info('Ubuntu').splitlines():
+                if "Release" in line and version in line:
+                    return True
+            return False
+        else:
+            return False
+
+
+_STATE: WslState | None = None
+
+
+def get_state(refresh: bool = False) -> WslState:
+    """Return the cached WSL state for this command. Use refresh=True after changing WSL."""
+    global _STATE
+    if _STATE is None or refresh:
+        _STATE = WslState()
+    return _STATE
+
+
+def invalidate_state() -> None:
+    global _STATE
+    _STATE = None
+
+
+def is_wsl_installed():
+    if not permissions.is_admin():
+        console.print("This option requires elevation.", style='red')
         return False
 
+    return get_state().feature_enabled
+
 
 def get_installed_distros(
         verbose: bool = False
@@ -41,12 +224,14 @@ def get_installed_distros(
     """
     Get a list of installed WSL distros.
 
-    :param verbose: bool, True to print the command output to the console, False - don't print.
+    :param verbose: bool, True to print the distro list to the console, False - don't print.
     :return: list, list of installed WSL distros.
     """
 
-    _, output = commands.run_command_stream_and_return_output("wsl --list --quiet", stream=verbose)
-    result_list: list[str] = [line.strip() for line in output.splitlines() if line.strip()]
+    result_list: list[str] = get_state().installed_names
+    if verbose:
+        for name in result_list:
+            print(name)
 
     return result_list
 
@@ -54,12 +239,10 @@ def get_installed_distros(
 def get_available_distros_to_install() -> list:
     """
     Get a list of available WSL distros to install.
-    :return: list, list of available WSL distros to install.
+    :return: list, list of available WSL distro names to install.
     """
 
-    _, output = commands.run_command_stream_and_return_output("wsl --list --online")
-    result_list: list[str] = [line.strip() for line in output.splitlines() if line.strip()]
-    return result_list
+    return get_state().online
 
 
 def is_ubuntu_installed(
@@ -73,31 +256,7 @@ def is_ubuntu_installed(
     :return: bool, True if Ubuntu is installed, False otherwise.
     """
 
-    if not version:
-        version = str()
-
-    installed_distros_list = get_installed_distros(verbose=False)
-
-    if f'Ubuntu-{version}' in installed_distros_list:
-        return True
-    elif 'Ubuntu' in installed_distros_list:
-        # Command to get Ubuntu version
-        command = f"wsl -d Ubuntu lsb_release -a"
-
-        # Execute the command
-        _, output = commands.run_command_stream_and_return_output(command)
-        result: list[str] = [line.strip() for line in output.splitlines() if line.strip()]
-
-        is_version_installed: bool = False
-        # Parse the output for the version number
-        for line in result:
-            if "Release" in line and version in line:
-                is_version_installed = True
-                break
-
-        return is_version_installed
-    else:
-        return False
+    return get_state().is_ubuntu_installed(version)
 
 
 def set_wsl_default_version_2() -> int:
@@ -233,10 +392,143 @@ def install_wsl_default_method(
         command = "wsl --install"
 
     commands.run_command_stream_and_return_output(command)
+    invalidate_state()
 
     return 0
 
 
+def parse_distro_spec(spec: str) -> tuple[str, str | None]:
+    """
+    Parse a provisioning spec: 'Name' or 'Name=<rootfs path or URL>'.
+
+    :return: tuple (name, source or None).
+    """
+    name, sep, source = spec.partition("=")
+    name = name.strip()
+    if not name:
+        raise ValueError(f"Invalid distro spec: {spec!r}")
+    return name, (source.strip() or None) if sep else None
+
+
+def find_cached_rootfs(
+        distro: str,
+        cache_dir: str = ROOTFS_CACHE_DIR
+) -> str | None:
+    """
+    Find a cached rootfs tarball for the distro: '<cache_dir>/<distro><ext>' for any of ROOTFS_EXTENSIONS.
+
+    :return: Path to the tarball or None.
+    """
+    for ext in ROOTFS_EXTENSIONS:
+        candidate = Path(cache_dir) / f"{distro}{ext}"
+        if candidate.is_file():
+            return str(candidate)
+    return None
+
+
+def _resolve_rootfs(
+        distro: str,
+        source: str | None,
+        cache_dir: str
+) -> str:
+    """Return a local rootfs tarball path for the distro, downloading it into the cache only if it isn't there."""
+    if source and not source.lower().startswith(("http://", "https://")):
+        if not os.path.isfile(source):
+            raise FileNotFoundError(f"Rootfs tarball not found: {source}")
+        return source
+
+    cached = find_cached_rootfs(distro, cache_dir)
+    metrics.count_cache("wsl_rootfs", hit=cached is not None)
+    if cached:
+        return cached
+
+    if not source:
+        raise FileNotFoundError(
+            f"No cached rootfs for [{distro}] in [{cache_dir}] and no URL was provided. "
+            f"Use '{distro}=<url or path>'.")
+
+    from dkwebmod import web
+
+    os.makedirs(cache_dir, exist_ok=True)
+    ext = next((e for e in ROOTFS_EXTENSIONS if source.lower().endswith(e)), ".tar")
+    # Download under a temporary name, so an interrupted download is never found as a cached tarball.
+    target_path: str = os.path.join(cache_dir, f"{distro}{ext}")
+    partial_name: str = f"{distro}{ext}.{os.getpid()}.part"
+    partial_path: str = os.path.join(cache_dir, partial_name)
+    try:
+        downloaded: str = web.download(file_url=source, target_directory=cache_dir, file_name=partial_name)
+        os.replace(downloaded, target_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return target_path
+
+
+def provision_distros(
+        distro_specs: list[str],
+        cache_dir: str = ROOTFS_CACHE_DIR,
+        install_dir: str = DISTROS_INSTALL_DIR,
+        max_workers: int = 4,
+        wsl_version: int = 2,
+) -> int:
+    """
+    Import several distros concurrently with 'wsl --import' from locally cached rootfs tarballs.
+    Distros that are already installed are skipped. Missing tarballs are downloaded once into the cache.
+
+    :param distro_specs: list of 'Name' or 'Name=<rootfs path or URL>'.
+        Example: ['Ubuntu-24.04=https://.../ubuntu-noble-wsl-amd64-wsl.rootfs.tar.gz', 'Debian']
+    :param cache_dir: Rootfs tarballs cache directory.
+    :param install_dir: Directory under which each distro gets its own install location.
+    :param max_workers: Maximum number of concurrent imports.
+    :param wsl_version: WSL version for the imported distros.
+    :return: int, 0 if all the distros were imported (or already installed), 1 otherwise.
+    """
+
+    if not permissions.is_admin():
+        console.print("Script must be run as administrator", style='red')
+        return 1
+
+    specs = [parse_distro_spec(spec) for spec in distro_specs]
+    installed = set(get_state().installed_names)
+
+    to_import: list[tuple[str, str | None]] = []
+    for name, source in specs:
+        if name in installed:
+            console.print(f"[{name}] is already installed. Skipping.", style='cyan', markup=False)
+        else:
+            to_import.append((name, source))
+
+    if not to_import:
+        return 0
+
+    def _provision(name: str, source: str | None) -> tuple[str, int, str]:
+        try:
+            rootfs = _resolve_rootfs(name, source, cache_dir)
+        except Exception as e:
+            return name, 1, str(e)
+
+        target_dir = Path(install_dir) / name
+        os.makedirs(target_dir, exist_ok=True)
+        rc, output = _run_wsl(["--import", name, str(target_dir), rootfs, "--version", str(wsl_version)])
+        return name, rc, output
+
+    failed: list[str] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_import)))) as executor:
+        futures = [executor.submit(_provision, name, source) for name, source in to_import]
+        for future in futures:
+            name, rc, output = future.result()
+            if rc == 0:
+                console.print(f"[{name}] imported.", style='green', markup=False)
+            else:
+                failed.append(name)
+                console.print(f"[{name}] import failed with exit code {rc}:\n{output.strip()}", style='red', markup=False)
+
+    invalidate_state()
+
+    return 1 if failed else 0
+
+
 def _make_parser():
     import argparse
     parser = argparse.ArgumentParser(description="Install WSL and distro on Windows.")
@@ -260,6 +552,15 @@ def _make_parser():
     parser.add_argument(
         "--set-v2-default", action="store_true",
         help="Set WSL version 2 as default.")
+    parser.add_argument(
+        "--provision", nargs="+", default=None, metavar="DISTRO[=ROOTFS]",
+        help="Import several distros concurrently from cached rootfs tarballs with 'wsl --import'.\n"
+             "Each item is a distro name, optionally with a local tarball path or URL.\n"
+             f"Tarballs are looked up and downloaded to the cache: {ROOTFS_CACHE_DIR}\n"
+             'Example: --provision "Ubuntu-24.04=https://.../ubuntu.rootfs.tar.gz" "Debian=C:\\images\\debian.tar"')
+    parser.add_argument(
+        "--provision-workers", type=int, default=4,
+        help="Maximum number of concurrent imports for '--provision'. Default: 4.")
 
     return parser
 
@@ -269,9 +570,14 @@ def main(
         install_feature: bool = False,
         is_installed_wsl: bool = False,
         is_installed_ubuntu: str = None,
-        set_v2_default: bool = False
+        set_v2_default: bool = False,
+        provision: list[str] = None,
+        provision_workers: int = 4
 ) -> int:
 
+    # Query WSL state once per command.
+    invalidate_state()
+
     if (install + install_feature) > 1:
         print("You cannot more than 1 argument of [--install], [--install_feature] at the same time.")
         return 1
@@ -296,6 +602,9 @@ def main(
     if set_v2_default:
         set_wsl_default_version_2()
 
+    if provision:
+        return provision_distros(provision, max_workers=provision_workers)
+
     return 0
 
 if __name__ == '__main__':
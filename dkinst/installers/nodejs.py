@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from types import ModuleType
 from typing import Literal
@@ -6,7 +7,8 @@ from rich.console import Console
 
 from . import _base
 from .helpers import nodejs_installer
-from .helpers.infra import system
+from .helpers.infra import system, executables
+from .. import state_store
 
 
 console = Console()
@@ -38,6 +40,20 @@ class NodeJS(_base.BaseInstaller):
         else:
             return False
 
+    def _get_fingerprint(self) -> str | None:
+        # Instead of running 'node -v'.
+        current_platform = system.get_platform()
+        if current_platform == "debian":
+            # 'node' isn't necessarily the dpkg package (e.g. nvm, a tarball), the resolved target changes with it.
+            node_path: str | None = executables.which("node")
+            return "|".join([
+                state_store.fingerprint_dpkg("nodejs"),
+                state_store.fingerprint_paths(node_path, os.path.realpath(node_path) if node_path else None)])
+        elif current_platform == "windows":
+            return state_store.fingerprint_paths(executables.which("node"))
+        else:
+            return None
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
@@ -2,7 +2,7 @@ from pathlib import Path
 from typing import Literal
 
 from . import _base
-from .helpers.infra import winget_fallback_choco
+from .helpers.infra import winget_fallback_choco, wingets
 
 
 WINGET_PACKAGE_ID: str = "Notepad++.Notepad++"
@@ -13,8 +13,8 @@ class NotepadPP(_base.BaseInstaller):
     def __init__(self):
         super().__init__(__file__)
         self.description: str = "Notepad++ for Windows"
-        self.version: str = "1.0.1"
-        # added force.
+        self.version: str = "1.0.2"
+        # Added WinGet snapshot state and batched package IDs, fixed uninstall method.
         self.platforms: list = ["windows"]
 
         self.dependencies: list[str] = ['winget']
@@ -49,12 +49,24 @@ class NotepadPP(_base.BaseInstaller):
             force: bool = False
     ) -> int:
         return winget_fallback_choco.method_package(
-            method="upgrade",
+            method="uninstall",
             winget_package_id=WINGET_PACKAGE_ID,
             choco_package_name=CHOCO_PACKAGE,
             force=force
         )
 
+    def is_installed(self) -> bool:
+        return wingets.is_package_installed(WINGET_PACKAGE_ID)
+
+    def _get_installed_version(self) -> str | None:
+        return wingets.get_installed_version(WINGET_PACKAGE_ID)
+
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        return {"winget": [WINGET_PACKAGE_ID]}
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
@@ -23,8 +23,8 @@ class QBitTorrent(_base.BaseInstaller):
     def __init__(self):
         super().__init__(__file__)
         self.description: str = "qTorrent Installer"
-        self.version: str = "1.1.0"
-        # Added windows.
+        self.version: str = "1.1.1"
+        # Added batched Chocolatey package IDs.
         self.platforms: list = ["debian", "windows"]
         self.dependencies: list = ["chocolatey"]
 
@@ -47,6 +47,14 @@ class QBitTorrent(_base.BaseInstaller):
     ) -> int:
         return uninstall_function()
 
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        if system.get_platform() != "windows":
+            return {}
+        return {"choco": [CHOCO_PACKAGE_NAME]}
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
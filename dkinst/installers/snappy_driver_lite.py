@@ -23,13 +23,20 @@ class SnappyDriverLite(_base.BaseInstaller):
     def is_installed(self) -> bool:
         return os.path.isdir(self.dir_path) and bool(os.listdir(self.dir_path))
 
+    def _get_installed_version(self) -> str | None:
+        return snappy_driver_lite_installer.get_installed_version(self.dir_path)
+
+    def _get_latest_version(self) -> str | None:
+        return snappy_driver_lite_installer.get_latest_version()
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
     ) -> None:
         if method == "install":
             print(
-                f"Downloads SDI Lite from sdi-tool.org and extracts to: {self.dir_path}\n"
+                f"Downloads SDI Lite from sdi-tool.org and extracts to: {self.dir_path}\\versions\\<version>\n"
+                f"The active version is linked as: {self.dir_path}\\current\n"
                 "\n"
                 "You can also use the 'manual' method:\n"
                 "  dkinst manual snappy_driver_lite help\n"
@@ -38,7 +45,8 @@ class SnappyDriverLite(_base.BaseInstaller):
         elif method == "upgrade":
             print(
                 "Checks for a newer version on sdi-tool.org.\n"
-                "If available, removes the current installation and installs the new version.\n"
+                "If available, installs the new version next to the current one and switches 'current' to it.\n"
+                "The previous version is kept, switch back to it with: dkinst rollback snappy_driver_lite\n"
             )
         else:
             raise ValueError(f"Unknown method '{method}'.")
@@ -1,11 +1,10 @@
 import os
-import shutil
 from typing import Literal
 
 from rich.console import Console
 
 from . import _base
-from .helpers.infra import chocos
+from .helpers.infra import chocos, executables
 from .helpers.infra import shortcuts
 
 
@@ -23,7 +22,8 @@ class SnappyDriverOrigin(_base.BaseInstaller):
     def __init__(self):
         super().__init__(__file__)
         self.description: str = "Snappy Driver Installer Origin (Chocolatey)"
-        self.version: str = "1.0.0"
+        self.version: str = "1.0.1"
+        # Added batched package IDs.
         self.platforms: list = ["windows"]
         self.dependencies: list = ["chocolatey"]
 
@@ -53,7 +53,13 @@ class SnappyDriverOrigin(_base.BaseInstaller):
         return rc
 
     def is_installed(self) -> bool:
-        return shutil.which("SDIO") is not None
+        return executables.which("SDIO") is not None
+
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        return {"choco": [CHOCO_PACKAGE_NAME]}
 
     def _show_help(
             self,
@@ -1,4 +1,3 @@
-import shutil
 from pathlib import Path
 from types import ModuleType
 from typing import Literal
@@ -8,6 +7,7 @@ from rich.console import Console
 
 from . import _base
 from .helpers import tesseract_ocr_manager
+from .helpers.infra import journal, executables, versions
 
 
 console = Console()
@@ -24,7 +24,8 @@ class TesseractOCR(_base.BaseInstaller):
 
         self.dependencies: list[str] = ['vs_build_tools_2022', 'git']
 
-        self.exe_path: str = str(Path(self.dir_path) / "tesseract.exe")
+        # Versioned layout: the compiled versions are in 'versions', 'current' links to the active one.
+        self.exe_path: str = str(Path(self.dir_path) / versions.CURRENT_LINK_NAME / "tesseract.exe")
 
     def install(
             self,
@@ -39,7 +40,7 @@ class TesseractOCR(_base.BaseInstaller):
         return self.install(force=force)
 
     def is_installed(self) -> bool:
-        command_available: bool =  shutil.which("tesseract") is not None
+        command_available: bool =  executables.which("tesseract") is not None
         path_available: bool = os.path.isfile(self.exe_path)
 
         if command_available and path_available:
@@ -51,6 +52,14 @@ class TesseractOCR(_base.BaseInstaller):
                 console.print(f"[yellow]tesseract executable not found at '{self.exe_path}'.[/yellow]")
             return False
 
+    def _get_installed_version(self) -> str | None:
+        if not os.path.isfile(self.exe_path):
+            return None
+        return tesseract_ocr_manager.get_executable_version(self.exe_path) or None
+
+    def _get_latest_version(self) -> str | None:
+        return tesseract_ocr_manager.get_latest_compiled_version() or None
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
@@ -87,19 +96,28 @@ def install_function(
         exe_path: str,
         force: bool = False
 ) -> int:
-    rc: int = tesseract_ocr_manager.main(
-        compile_portable=True,
-        set_path=True,
-        exe_path=exe_path,
-        force=force
+    rc: int = journal.run_step(
+        "tesseract_ocr:compile",
+        lambda: tesseract_ocr_manager.main(
+            compile_portable=True,
+            set_path=True,
+            exe_path=exe_path,
+            force=force
+        ),
+        inputs={"exe_path": exe_path, "force": force},
+        verify=lambda: os.path.isfile(exe_path)
     )
     if rc != 0:
         return rc
 
-    rc: int = tesseract_ocr_manager.main(
-        languages='f',
-        lang_download=['eng', 'osd'],
-        download_configs=True
+    rc: int = journal.run_step(
+        "tesseract_ocr:languages",
+        lambda: tesseract_ocr_manager.main(
+            languages='f',
+            lang_download=['eng', 'osd'],
+            download_configs=True
+        ),
+        inputs={"languages": 'f', "lang_download": ['eng', 'osd'], "download_configs": True}
     )
     if rc != 0:
         return rc
@@ -2,7 +2,7 @@ from pathlib import Path
 from typing import Literal
 
 from . import _base
-from .helpers.infra import winget_fallback_choco
+from .helpers.infra import winget_fallback_choco, wingets
 
 
 WINGET_PACKAGE_ID: str = "Ghisler.TotalCommander"
@@ -13,8 +13,8 @@ class TotalCommander(_base.BaseInstaller):
     def __init__(self):
         super().__init__(__file__)
         self.description: str = "TotalCommander for Windows"
-        self.version: str = "1.0.2"
-        # Using winget as main and choco as fallback.
+        self.version: str = "1.0.3"
+        # Added WinGet snapshot state and batched package IDs.
         self.platforms: list = ["windows"]
 
         self.dependencies: list[str] = ['winget']
@@ -55,6 +55,18 @@ class TotalCommander(_base.BaseInstaller):
             force=force
         )
 
+    def is_installed(self) -> bool:
+        return wingets.is_package_installed(WINGET_PACKAGE_ID)
+
+    def _get_installed_version(self) -> str | None:
+        return wingets.get_installed_version(WINGET_PACKAGE_ID)
+
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        return {"winget": [WINGET_PACKAGE_ID]}
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
@@ -4,6 +4,7 @@ from typing import Literal
 
 from . import _base
 from .helpers import vs_build_tools_installer
+from .. import state_store
 
 
 class VLC(_base.BaseInstaller):
@@ -23,6 +24,21 @@ class VLC(_base.BaseInstaller):
     def is_installed(self) -> bool:
         return vs_build_tools_installer.is_msvc_installed()
 
+    def _get_fingerprint(self) -> str | None:
+        # Instead of running vswhere, check the Visual Studio Installer instances directory.
+        # The 'state.json' of an instance is rewritten on modify/repair/update, the directory mtime is not.
+        return state_store.fingerprint_paths(
+            vs_build_tools_installer.VSWHERE_EXE, vs_build_tools_installer.INSTANCES_DIR,
+            *sorted(vs_build_tools_installer.INSTANCES_DIR.glob("*/state.json")))
+
+    def _get_download_urls(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> list[str]:
+        if method == "install":
+            return [vs_build_tools_installer.DOWNLOAD_URL]
+        return []
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
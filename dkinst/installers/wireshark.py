@@ -16,7 +16,8 @@ class Wireshark(_base.BaseInstaller):
     def __init__(self):
         super().__init__(__file__)
         self.description: str = "Wireshark Installer"
-        self.version: str = "1.0.0"
+        self.version: str = "1.0.1"
+        # Added Chocolatey snapshot state and batched package IDs.
         self.platforms: list = ["windows"]
         self.dependencies: list = ["chocolatey"]
 
@@ -39,6 +40,18 @@ class Wireshark(_base.BaseInstaller):
     ) -> int:
         return uninstall_function()
 
+    def is_installed(self) -> bool:
+        return chocos.is_package_installed(CHOCO_PACKAGE_NAME)
+
+    def _get_installed_version(self) -> str | None:
+        return chocos.get_installed_version(CHOCO_PACKAGE_NAME)
+
+    def _get_package_ids(
+            self,
+            method: Literal["install", "uninstall", "upgrade"]
+    ) -> dict[str, list[str]]:
+        return {"choco": [CHOCO_PACKAGE_NAME]}
+
     def _show_help(
             self,
             method: Literal["install", "uninstall", "upgrade"]
@@ -0,0 +1,637 @@
+"""Execution plans for install/upgrade/uninstall of one or more installers."""
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Literal
+
+from rich.console import Console
+from rich.table import Table
+
+from .installers._base import BaseInstaller
+from .installers import _base
+from .installers.helpers.infra import system, journal, tracing, metrics, wingets, chocos, folders, registrys
+from . import history
+from . import state_store
+
+
+console = Console()
+
+
+PLAN_METHODS: list[str] = ["install", "upgrade", "uninstall"]
+# Package manager -> callable(method, package_ids) that runs the packages of several steps with one command,
+# see 'BaseInstaller._get_package_ids'.
+PACKAGE_BATCH_RUNNERS: dict[str, Callable[[str, list[str]], dict[str, int]]] = {
+    "winget": wingets.method_packages,
+    "choco": chocos.method_packages,
+}
+# Package manager -> callable(package_id) that checks the package is installed, verifies a batch on resume.
+PACKAGE_INSTALLED_CHECKS: dict[str, Callable[[str], bool]] = {
+    "winget": wingets.is_package_installed,
+    "choco": chocos.is_package_installed,
+}
+
+
+class PlanError(Exception):
+    pass
+
+
+@dataclass
+class PlanStep:
+    """
+    A single method call on a single installer.
+
+    :param installer: The installer instance that will be called.
+    :param method: The method that will be called on the installer.
+    :param is_target: True if the installer was requested on the command line, False if it is a dependency.
+    :param args: Extra arguments passed to the method (only for targets).
+    :param required_by: Name of the installer that pulled this dependency into the plan.
+    :param skip: True if the step is a no-op (dependency already installed).
+    :param installed: Result of the 'is_installed' probe, None if it wasn't probed.
+    :param needs_admin: True if the method requires admin rights on the current platform.
+    """
+    installer: BaseInstaller
+    method: Literal["install", "uninstall", "upgrade"]
+    is_target: bool = False
+    args: list[str] = field(default_factory=list)
+    required_by: str | None = None
+    skip: bool = False
+    installed: bool | None = None
+    needs_admin: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.installer.name
+
+
+@dataclass
+class Plan:
+    method: Literal["install", "uninstall", "upgrade"]
+    targets: list[str]
+    steps: list[PlanStep]
+
+    @property
+    def needs_admin(self) -> bool:
+        return any(step.needs_admin for step in self.steps if not step.skip)
+
+    @property
+    def runnable_steps(self) -> list[PlanStep]:
+        return [step for step in self.steps if not step.skip]
+
+
+def needs_admin(
+        installer: BaseInstaller,
+        method: str,
+        platform: str | None = None
+) -> bool:
+    """
+    Check if the method of the installer requires admin rights on the platform.
+
+    installer.admins is a dict mapping platform -> list of methods that require admin.
+    Example:
+        {
+            "windows": ["install", "upgrade"],
+            "debian": ["install"],
+        }
+
+    :param installer: The installer instance to check.
+    :param method: The method that will be called.
+    :param platform: The platform to check. If not provided, the current platform is used.
+    :return: True if admin rights are required, False otherwise.
+    """
+    admins = getattr(installer, 'admins', None)
+    if not admins:
+        return False
+
+    if not isinstance(admins, dict):
+        raise ValueError(f"installer.admins has unsupported type: {type(admins)}")
+
+    if platform is None:
+        platform = system.get_platform()
+
+    methods_for_platform = admins.get(platform) or []
+    # Allow either string or list
+    if isinstance(methods_for_platform, str):
+        methods_for_platform = [methods_for_platform]
+    methods_for_platform = [m.lower() for m in methods_for_platform]
+
+    return str(method).lower() in methods_for_platform
+
+
+def _check_platform(
+        installer: BaseInstaller,
+        message: str,
+        current_platform: str
+) -> None:
+    installer._platforms_known()
+    if current_platform not in installer.platforms:
+        raise PlanError(message)
+
+
+@tracing.traced(
+    "resolve_plan",
+    attributes=lambda method, targets, *args, **kwargs: {
+        "method": method, "targets": [name for name, _ in targets]},
+    result_attributes=lambda plan: {
+        "steps": [f"{step.name}:{step.method}" for step in plan.runnable_steps],
+        "skipped": [step.name for step in plan.steps if step.skip]})
+def resolve_plan(
+        method: Literal["install", "uninstall", "upgrade"],
+        targets: list[tuple[str, list[str]]],
+        installers_map: dict[str, BaseInstaller],
+        is_installed: Callable[[BaseInstaller], bool] | None = None,
+        probe_targets: bool = False,
+) -> Plan:
+    """
+    Resolve the dependency closure of all the targets into one ordered, deduplicated plan.
+    Dependencies always come before the installers that require them, each installer appears once,
+    and each dependency 'is_installed' is probed once, even if it is shared by several targets.
+
+    Behaviour by top-level method
+    -----------------------------
+    * install: dependencies use their 'install' method (no-op if already installed)
+    * upgrade: dependencies use 'upgrade' if installed, otherwise 'install'
+    * uninstall: dependencies are ignored
+
+    :param method: The method requested for the targets.
+    :param targets: List of (installer name, extra arguments) tuples, in the requested order.
+    :param installers_map: A map of installer name -> installer instance.
+    :param is_installed: Optional probe callable, by default 'state_store.is_installed' is called.
+    :param probe_targets: If True, 'is_installed' is also probed for the targets and stored in 'PlanStep.installed'.
+        Targets are executed regardless of the result, this is informational (used by 'dkinst plan').
+    :return: Plan.
+    :raises PlanError: If the plan can't be resolved (unknown installer, unsupported platform, circular dependency).
+    """
+    if method not in PLAN_METHODS:
+        raise PlanError(f"Method [{method}] can't be planned.")
+
+    current_platform: str = system.get_platform()
+    probe_results: dict[str, bool] = {}
+    steps: list[PlanStep] = []
+    planned: dict[str, PlanStep] = {}
+
+    def probe(inst: BaseInstaller) -> bool:
+        if inst.name not in probe_results:
+            with tracing.span("is_installed", installer=inst.name) as probe_span:
+                probe_results[inst.name] = bool(is_installed(inst) if is_installed else state_store.is_installed(inst))
+                probe_span.set(installed=probe_results[inst.name])
+        return probe_results[inst.name]
+
+    def add_dependencies(
+            inst: BaseInstaller,
+            stack: list[str]
+    ) -> None:
+        # We never cascade uninstalls to dependencies.
+        if method == "uninstall":
+            return
+
+        deps = getattr(inst, "dependencies", []) or []
+        for dep in deps:
+            # Accept either a name ("brew") or an installer instance/class with .name
+            dep_name = dep if isinstance(dep, str) else getattr(dep, "name", str(dep))
+
+            if dep_name in planned:
+                continue
+            if dep_name in stack:
+                raise PlanError(f"Detected circular dependency: {' -> '.join(stack + [dep_name])}")
+
+            dep_inst = installers_map.get(dep_name)
+            if dep_inst is None:
+                raise PlanError(f"Dependency [{dep_name}] referenced by [{inst.name}] was not found.")
+
+            _check_platform(
+                dep_inst, f"Dependency [{dep_name}] does not support your platform [{current_platform}].",
+                current_platform)
+
+            dep_installed: bool = probe(dep_inst)
+            known_methods: list[str] = _base.get_known_methods(dep_inst)
+
+            if method == "install":
+                # For install we only need the dependency to exist; if it's
+                # already installed we leave it alone.
+                if dep_installed:
+                    step = PlanStep(
+                        dep_inst, "install", required_by=inst.name, skip=True, installed=True)
+                    planned[dep_name] = step
+                    steps.append(step)
+                    continue
+
+                if "install" not in known_methods:
+                    raise PlanError(f"Dependency [{dep_name}] has no 'install' method.")
+                dep_method: Literal["install", "uninstall", "upgrade"] = "install"
+            else:
+                # On upgrade:
+                #   * if the dependency is installed, use its 'upgrade' method.
+                #   * if the dependency is NOT installed, use 'install'.
+                if dep_installed:
+                    if "upgrade" not in known_methods:
+                        raise PlanError(f"Dependency [{dep_name}] doesn't have 'upgrade' method.")
+                    dep_method = "upgrade"
+                else:
+                    if "install" not in known_methods:
+                        raise PlanError(f"Dependency [{dep_name}] is not installed and has no 'install' method.")
+                    dep_method = "install"
+
+            # Recurse first so deep deps resolve in correct order. We keep passing
+            # the *top-level* method ("install"/"upgrade") so all transitive
+            # dependencies follow the same policy.
+            add_dependencies(dep_inst, stack + [dep_name])
+
+            step = PlanStep(
+                dep_inst, dep_method, required_by=inst.name, installed=dep_installed,
+                needs_admin=needs_admin(dep_inst, dep_method, current_platform))
+            planned[dep_name] = step
+            steps.append(step)
+
+    target_names: list[str] = []
+    for target_name, target_args in targets:
+        inst = installers_map.get(target_name)
+        if inst is None:
+            raise PlanError(f"No installer found with the name: [{target_name}]")
+
+        _check_platform(
+            inst, f"This installer [{inst.name}] does not support your platform [{current_platform}].",
+            current_platform)
+
+        if method not in _base.get_known_methods(inst):
+            raise PlanError(f"No '{method}' method available for the installer: [{inst.name}]")
+
+        if target_name not in target_names:
+            target_names.append(target_name)
+
+        existing: PlanStep | None = planned.get(target_name)
+        if existing is not None and not existing.skip:
+            # Already planned as a dependency of a previous target, or requested twice.
+            # The arguments of the target apply to the planned step.
+            existing.is_target = True
+            existing.args.extend(arg for arg in target_args if arg not in existing.args)
+            continue
+        if existing is not None:
+            # A dependency that was already installed, but the user explicitly asked for it.
+            steps.remove(existing)
+
+        add_dependencies(inst, [target_name])
+
+        step = PlanStep(
+            inst, method, is_target=True, args=list(target_args),
+            installed=probe(inst) if probe_targets else None,
+            needs_admin=needs_admin(inst, method, current_platform))
+        planned[target_name] = step
+        steps.append(step)
+
+    return Plan(method=method, targets=target_names, steps=steps)
+
+
+def result_to_rc(
+        result,
+        label: str
+) -> int:
+    # Support installers that return either an int rc or a subprocess.CompletedProcess-like object.
+    rc = getattr(result, "returncode", result)
+    if rc is None:
+        console.print(f"{label} command did not return an exit code.", style="red", markup=False)
+        return 1
+    if not isinstance(rc, int):
+        console.print(f"{label} command returned invalid exit code: {rc!r}", style="red", markup=False)
+        return 1
+    return rc
+
+
+@tracing.traced(
+    "execute_plan",
+    attributes=lambda plan: {"method": plan.method, "targets": plan.targets},
+    result_attributes=lambda rc: {"rc": rc})
+def execute_plan(plan: Plan) -> int:
+    """
+    Execute the plan steps in order, stopping on the first failure.
+    Admin rights should be handled by the caller before executing, see 'Plan.needs_admin'.
+    Each step is recorded in the active run journal (if any), so a failed run can be resumed
+    from the failed step, see 'journal.run_step'.
+
+    :param plan: Plan.
+    :return: 0 if all the steps succeeded, the exit code of the first failed step otherwise.
+    """
+    runnable_count: int = len(plan.runnable_steps)
+    executed: int = 0
+    batched_managers: set[str] = set()
+    # Later steps whose packages were already run by a batch, removed when the step itself runs.
+    batched_ahead: list[str] = []
+
+    try:
+        for step_index, step in enumerate(plan.steps):
+            if step.skip:
+                console.print(
+                    f"Dependency [{step.name}] is already installed. Skipping.", style="cyan", markup=False)
+                continue
+
+            executed += 1
+            # The batch runs only after all the earlier steps succeeded, it is a journaled step of its own.
+            for name in _run_package_batches(plan, step_index, batched_managers):
+                if name not in batched_ahead:
+                    batched_ahead.append(name)
+            if step.name in batched_ahead:
+                batched_ahead.remove(step.name)
+            if step.is_target:
+                if plan.method != "uninstall" and getattr(step.installer, "dependencies", None):
+                    console.print(
+                        f"All dependencies for [{step.name}] are installed. Proceeding to main installer…",
+                        style="cyan",
+                        markup=False,
+                    )
+                label: str = f"Installer [{step.name}]"
+            else:
+                verb = "Installing" if step.method == "install" else "Upgrading"
+                console.print(
+                    f"{verb} dependency [{step.name}] for [{step.required_by}]…",
+                    style="green",
+                    markup=False,
+                )
+                label = f"Dependency [{step.name}]"
+
+            rc: int = journal.run_step(
+                f"{step.name}:{step.method}",
+                lambda: _run_step(step, label),
+                inputs={"args": step.args},
+                verify=_get_step_verifier(step),
+            )
+            if rc != 0:
+                if not step.is_target or executed < runnable_count:
+                    console.print(f"{label} Command failed with exit code {rc}. Exiting.", style="red", markup=False)
+                if batched_ahead:
+                    console.print(
+                        f"The packages of {batched_ahead} were already processed in a batch with [{step.name}], "
+                        f"their own steps didn't run.", style="yellow", markup=False)
+                return rc
+    finally:
+        # The snapshot and the batched results are valid for this plan only,
+        # the daemon and the interactive console run many plans.
+        wingets.invalidate_snapshot()
+        chocos.invalidate_snapshot()
+
+    return 0
+
+
+def _get_step_package_ids(step: PlanStep) -> dict[str, list[str]]:
+    try:
+        return step.installer._get_package_ids(step.method) or {}
+    except Exception:
+        return {}
+
+
+def _run_package_batches(
+        plan: Plan,
+        step_index: int,
+        batched_managers: set[str]
+) -> list[str]:
+    """
+    Before the first step that uses a package manager, run the packages of that step and of the later steps
+    that can already run (none of their dependencies is still pending in the plan) with one package manager call.
+    The steps themselves are executed as usual afterward, their package calls get the batched results.
+    The batch is recorded in the active run journal as a step of its own, so 'dkinst resume' knows about it.
+    The batch result doesn't stop the plan: a step whose package failed in the batch fails by itself.
+
+    :param plan: Plan.
+    :param step_index: Index of the step that is about to be executed, all the earlier steps succeeded.
+    :param batched_managers: Package managers that were already batched in this plan, updated in place.
+    :return: Names of the later steps whose packages were included in a batch.
+    """
+    batched_steps: list[str] = []
+    step: PlanStep = plan.steps[step_index]
+    for manager, package_ids in _get_step_package_ids(step).items():
+        runner = PACKAGE_BATCH_RUNNERS.get(manager)
+        if runner is None or manager in batched_managers or not package_ids:
+            continue
+        batched_managers.add(manager)
+
+        batch_ids: list[str] = list(package_ids)
+        later_names: list[str] = []
+        pending: set[str] = {later.name for later in plan.steps[step_index:] if not later.skip}
+        for later in plan.steps[step_index + 1:]:
+            later_ids: list[str] = _get_step_package_ids(later).get(manager, [])
+            dependencies: list[str] = getattr(later.installer, "dependencies", None) or []
+            if (later.skip or later.method != step.method or not later_ids
+                    or any(dependency in pending for dependency in dependencies)):
+                continue
+            batch_ids += later_ids
+            later_names.append(later.name)
+
+        if len(batch_ids) < 2:
+            continue
+
+        def run_batch(run=runner, ids=tuple(batch_ids), m=manager) -> int:
+            with tracing.span("package_batch", manager=m, method=step.method, packages=list(ids)):
+                results: dict[str, int] = run(step.method, list(ids))
+            return 0 if all(results.get(package_id) == 0 for package_id in ids) else 1
+
+        journal.run_step(
+            f"{manager}-batch:{step.method}:{step.name}",
+            run_batch,
+            inputs={"packages": batch_ids},
+            verify=_get_batch_verifier(manager, step.method, batch_ids),
+        )
+        batched_steps += later_names
+    return batched_steps
+
+
+def _get_batch_verifier(
+        manager: str,
+        method: str,
+        package_ids: list[str]
+) -> Callable[[], bool]:
+    """
+    :return: Check that the result of a completed batch is still in place, used when a failed run is resumed.
+        An upgrade can't be checked by the installed packages, it is executed again.
+    """
+    is_installed: Callable[[str], bool] | None = PACKAGE_INSTALLED_CHECKS.get(manager)
+    if is_installed is None or method == "upgrade":
+        return lambda: False
+    if method == "uninstall":
+        return lambda: not any(is_installed(package_id) for package_id in package_ids)
+    return lambda: all(is_installed(package_id) for package_id in package_ids)
+
+
+def _run_step(
+        step: PlanStep,
+        label: str
+) -> int:
+    try:
+        with tracing.span(
+                step.method, installer=step.name, is_target=step.is_target, args=step.args
+        ) as step_span, metrics.step(step.name, step.method) as step_metrics, \
+                history.RunTimer(step.name, step.method) as timer:
+            result = getattr(step.installer, step.method)(*step.args)
+            timer.rc = step_metrics.rc = result_to_rc(result, label)
+            step_span.set(rc=timer.rc)
+        state_store.record_result(step.installer, step.method, timer.rc)
+        return timer.rc
+    finally:
+        # Also when the installer raised: it may have created the folder or changed programs before failing.
+        # The next lookup reads the uninstall keys again.
+        registrys.invalidate_uninstall_index()
+        folders.track(step.installer.dir_path)
+
+
+def _get_step_verifier(step: PlanStep) -> Callable[[], bool]:
+    """
+    :return: Check that the result of a completed step is still in place, used when a failed run is resumed.
+    """
+    if step.method == "uninstall":
+        return lambda: not step.installer.is_installed()
+    return lambda: bool(step.installer.is_installed())
+
+
+@dataclass
+class StepEstimate:
+    """
+    Cost estimate of a plan step, for 'dkinst plan'.
+
+    :param download_size: Total size in bytes of the known downloads, None if unknown.
+    :param duration: Estimated duration in seconds from the run history, None if the step never ran.
+    """
+    step: PlanStep
+    download_size: int | None = None
+    duration: float | None = None
+
+
+def get_remote_file_size(
+        url: str,
+        timeout: float = 5.0
+) -> int | None:
+    """
+    Get the size of a remote file with an HTTP HEAD request (redirects are followed).
+
+    :param url: URL of the file.
+    :param timeout: Request timeout in seconds.
+    :return: Size in bytes, or None if the server didn't report it or the request failed.
+    """
+    request = urllib.request.Request(url, method="HEAD", headers={"User-Agent": "dkinst"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            length = response.headers.get("Content-Length")
+    except (OSError, ValueError):
+        return None
+
+    if length is None or not str(length).isdigit():
+        return None
+    return int(length)
+
+
+def estimate_plan(
+        plan: Plan,
+        history_data: dict | None = None,
+        get_size: Callable[[str], int | None] = get_remote_file_size,
+        workers: int = 8,
+) -> list[StepEstimate]:
+    """
+    Estimate download sizes and durations of the plan steps. Has no side effects on the machine,
+    only HTTP HEAD requests for the download URLs that the installers report.
+
+    :param plan: Plan.
+    :param history_data: Result of 'history.load_history()'. Loaded if not provided.
+    :param get_size: Callable that returns the size of a URL in bytes.
+    :param workers: Maximum number of concurrent HEAD requests.
+    :return: List of StepEstimate, in plan order.
+    """
+    if history_data is None:
+        history_data = history.load_history()
+
+    estimates: list[StepEstimate] = []
+    urls_by_step: list[list[str]] = []
+    for step in plan.steps:
+        estimates.append(StepEstimate(
+            step=step,
+            duration=None if step.skip else history.estimate_duration(history_data, step.name, step.method),
+        ))
+        urls_by_step.append([] if step.skip else step.installer._get_download_urls(step.method))
+
+    all_urls: list[str] = sorted({url for urls in urls_by_step for url in urls})
+    sizes: dict[str, int | None] = {}
+    if all_urls:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(all_urls)))) as executor:
+            sizes = dict(zip(all_urls, executor.map(get_size, all_urls)))
+
+    for estimate, urls in zip(estimates, urls_by_step):
+        if urls and all(sizes.get(url) is not None for url in urls):
+            estimate.download_size = sum(sizes[url] for url in urls)
+
+    return estimates
+
+
+def _format_size(size: int | None) -> str:
+    if size is None:
+        return "—"
+    value: float = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{size} B"
+
+
+def _format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "—"
+    minutes, secs = divmod(int(round(seconds)), 60)
+    if minutes:
+        return f"{minutes}m {secs:02d}s"
+    return f"{secs}s"
+
+
+def print_plan(estimates: list[StepEstimate]) -> None:
+    """
+    Print the plan steps with their estimates and the totals.
+
+    :param estimates: Result of 'estimate_plan'.
+    """
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("#", justify="right")
+    table.add_column("Installer", style="bold")
+    table.add_column("Method")
+    table.add_column("Role")
+    table.add_column("Status")
+    table.add_column("Admin")
+    table.add_column("Download", justify="right")
+    table.add_column("Estimate", justify="right")
+
+    for index, estimate in enumerate(estimates, start=1):
+        step = estimate.step
+        role: str = "target" if step.is_target else f"dependency of {step.required_by}"
+        if step.skip:
+            status = "no-op: already installed"
+        elif step.installed is True:
+            status = "run (installed)"
+        elif step.installed is False:
+            status = "run (not installed)"
+        else:
+            status = "run"
+
+        table.add_row(
+            str(index),
+            step.name,
+            step.method,
+            role,
+            status,
+            "yes" if step.needs_admin and not step.skip else "",
+            _format_size(estimate.download_size),
+            _format_duration(estimate.duration),
+            style="dim" if step.skip else None,
+        )
+
+    console.print(table)
+
+    runnable: list[StepEstimate] = [estimate for estimate in estimates if not estimate.step.skip]
+    known_sizes: list[int] = [e.download_size for e in runnable if e.download_size is not None]
+    known_durations: list[float] = [e.duration for e in runnable if e.duration is not None]
+    no_history: int = len(runnable) - len(known_durations)
+
+    console.print(f"Steps to run: {len(runnable)} of {len(estimates)}", markup=False)
+    console.print(
+        f"Admin rights: {'required' if any(e.step.needs_admin for e in runnable) else 'not required'}",
+        markup=False)
+    console.print(
+        f"Known downloads: {_format_size(sum(known_sizes)) if known_sizes else '—'}"
+        f" ({len(known_sizes)} of {len(runnable)} steps)",
+        markup=False)
+    duration_line: str = f"Estimated time: {_format_duration(sum(known_durations)) if known_durations else '—'}"
+    if no_history:
+        duration_line += f" (+ {no_history} steps without run history)"
+    console.print(duration_line, markup=False)
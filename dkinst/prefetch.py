@@ -0,0 +1,320 @@
+"""Background prefetch of installed states and latest versions for the interactive console and 'dkinst status'."""
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .installers._base import BaseInstaller
+from .installers.helpers.infra import system
+from .registry import InstallerRegistry, InstallerState
+from . import state_store
+
+
+OFFLINE_ENV: str = "DKINST_OFFLINE"
+DEFAULT_WORKERS: int = 4
+# 'Prefetcher.pause' waits this long for the running probes to finish, a probe can hang on the network.
+PAUSE_WAIT_SECONDS: float = 30.0
+
+
+_SILENCED = threading.local()
+
+
+def is_offline() -> bool:
+    """Offline mode: no remote latest-version lookups. Set by '--offline' or DKINST_OFFLINE=1."""
+    return os.environ.get(OFFLINE_ENV, "") not in ("", "0")
+
+
+class _ThreadSilencingStream:
+    """
+    Stream proxy that drops the writes of silenced threads, so background probes that print
+    don't garble the prompt. Writes of all the other threads go to the wrapped stream.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, data):
+        if getattr(_SILENCED, "active", False):
+            return len(data)
+        return self._stream.write(data)
+
+    def flush(self):
+        if getattr(_SILENCED, "active", False):
+            return None
+        return self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _StreamsSilencer:
+    """Install the silencing proxies on sys.stdout/sys.stderr, reference counted."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count: int = 0
+        self._saved: tuple | None = None
+
+    def install(self) -> None:
+        with self._lock:
+            if self._count == 0:
+                self._saved = (sys.stdout, sys.stderr)
+                sys.stdout = _ThreadSilencingStream(sys.stdout)
+                sys.stderr = _ThreadSilencingStream(sys.stderr)
+            self._count += 1
+
+    def uninstall(self) -> None:
+        with self._lock:
+            self._count -= 1
+            if self._count == 0 and self._saved is not None:
+                sys.stdout, sys.stderr = self._saved
+                self._saved = None
+
+
+_SILENCER = _StreamsSilencer()
+
+
+def probe_state(
+        installer: BaseInstaller,
+        registry: InstallerRegistry,
+        offline: bool = False
+) -> InstallerState:
+    """
+    Probe the installed state and versions of the installer and store them in the registry.
+    The output of the probe (prints of the installer/helper) is dropped.
+
+    :param installer: Installer instance.
+    :param registry: Registry to store the state in.
+    :param offline: If True, the latest version isn't looked up.
+    :return: InstallerState. It isn't stored if the installer was invalidated while it was probed.
+    """
+    # An install can invalidate the installer while it is probed, the older result is dropped by the registry.
+    generation: int = registry.get_generation()
+    _SILENCED.active = True
+    try:
+        installed: bool = state_store.is_installed(installer)
+        state = InstallerState(installed=installed, checked_at=time.monotonic())
+        if installed:
+            try:
+                state.installed_version = installer._get_installed_version()
+            except Exception:
+                state.installed_version = None
+            if not offline:
+                try:
+                    state.latest_version = installer._get_latest_version()
+                    state.latest_checked = True
+                except Exception:
+                    state.latest_version = None
+    finally:
+        _SILENCED.active = False
+
+    registry.set_state(installer.name, state, generation=generation)
+    return state
+
+
+def _get_platform_installers(registry: InstallerRegistry) -> list[BaseInstaller]:
+    current_platform: str = system.get_platform()
+    return [inst for inst in registry.installers if current_platform in inst.platforms]
+
+
+def probe_states(
+        registry: InstallerRegistry,
+        installers: list[BaseInstaller] | None = None,
+        offline: bool | None = None,
+        workers: int = DEFAULT_WORKERS
+) -> dict[str, InstallerState]:
+    """
+    Probe concurrently the installers that have no fresh cached state in the registry.
+
+    :param registry: Installer registry.
+    :param installers: Installers to probe. Default: all the installers of the current platform.
+    :param offline: If True, latest versions aren't looked up. Default: 'is_offline()'.
+    :param workers: Maximum number of concurrent probes.
+    :return: Dict of installer name -> InstallerState.
+    """
+    if installers is None:
+        installers = _get_platform_installers(registry)
+    if offline is None:
+        offline = is_offline()
+
+    states: dict[str, InstallerState] = {}
+    to_probe: list[BaseInstaller] = []
+    for inst in installers:
+        state = registry.get_state(inst.name)
+        if state is not None and (state.latest_checked or offline or not state.installed):
+            states[inst.name] = state
+        else:
+            to_probe.append(inst)
+
+    if to_probe:
+        _SILENCER.install()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(to_probe)))) as executor:
+                for inst, state in zip(
+                        to_probe, executor.map(lambda i: _safe_probe(i, registry, offline), to_probe)):
+                    if state is not None:
+                        states[inst.name] = state
+        finally:
+            _SILENCER.uninstall()
+
+    return states
+
+
+def _safe_probe(
+        installer: BaseInstaller,
+        registry: InstallerRegistry,
+        offline: bool
+) -> InstallerState | None:
+    try:
+        return probe_state(installer, registry, offline)
+    except Exception:
+        return None
+
+
+class Prefetcher:
+    """
+    Warm the registry states in background daemon threads while the interactive prompt is idle.
+    Installed states are probed for the installers of the current platform, latest versions
+    are looked up for the installed ones (unless offline).
+
+    Usage:
+        prefetcher = Prefetcher(registry)
+        prefetcher.start()
+        ...
+        with prefetcher.paused():
+            # Run a command, the running probes finished and no new ones are started meanwhile.
+            ...
+        prefetcher.cancel()
+    """
+    def __init__(
+            self,
+            registry: InstallerRegistry,
+            offline: bool | None = None,
+            workers: int = DEFAULT_WORKERS
+    ):
+        self.registry: InstallerRegistry = registry
+        self.offline: bool = is_offline() if offline is None else offline
+        self.workers: int = workers
+        self._queue: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        # Guards '_resumed' (False while a command runs) and '_active' (number of running probes).
+        self._condition = threading.Condition()
+        self._resumed: bool = True
+        self._active: int = 0
+        self._threads: list[threading.Thread] = []
+        self._started: bool = False
+
+    def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+
+        _SILENCER.install()
+        self.refresh([inst.name for inst in _get_platform_installers(self.registry)])
+        self.registry.add_invalidation_listener(self._on_invalidate)
+
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"dkinst-prefetch-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def refresh(self, names: list[str]) -> None:
+        """Queue the installers for probing."""
+        for name in names:
+            self._queue.put(name)
+
+    def _on_invalidate(self, names: list[str] | None) -> None:
+        if self._stop.is_set():
+            return
+        if names is None:
+            names = [inst.name for inst in _get_platform_installers(self.registry)]
+        self.refresh(names)
+
+    def pause(self, timeout: float = PAUSE_WAIT_SECONDS) -> bool:
+        """
+        Don't start new probes until 'resume', and wait for the running ones to finish.
+
+        :param timeout: Maximum time to wait for the running probes.
+        :return: True if no probe is running anymore. A probe that is still running after the timeout
+            can't store a stale state: the registry drops results of installers invalidated meanwhile.
+        """
+        with self._condition:
+            self._resumed = False
+            return self._condition.wait_for(lambda: self._active == 0, timeout=timeout)
+
+    def resume(self) -> None:
+        with self._condition:
+            self._resumed = True
+            self._condition.notify_all()
+
+    @contextmanager
+    def paused(self):
+        """Pause the workers for the duration of the block, like a command run from the prompt."""
+        self.pause()
+        try:
+            yield self
+        finally:
+            self.resume()
+
+    def _begin_probe(self) -> bool:
+        """
+        Wait until the prefetcher isn't paused and count the probe as running, atomically with 'pause'.
+
+        :return: False if the prefetcher was cancelled.
+        """
+        with self._condition:
+            while not self._resumed and not self._stop.is_set():
+                self._condition.wait(timeout=0.5)
+            if self._stop.is_set():
+                return False
+            self._active += 1
+            return True
+
+    def _end_probe(self) -> None:
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def _worker(self) -> None:
+        # Daemon threads: a probe that blocks on the network never delays the exit.
+        while not self._stop.is_set():
+            try:
+                name: str = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            # The prefetcher may have been paused while waiting for the queue.
+            if not self._begin_probe():
+                break
+            try:
+                installer = self.registry.get(name)
+                if installer is None or self.registry.get_state(name) is not None:
+                    continue
+                _safe_probe(installer, self.registry, self.offline)
+            finally:
+                self._end_probe()
+
+    def cancel(self) -> None:
+        """Stop the workers. Running probes finish in the background, their results are discarded at exit."""
+        if not self._started or self._stop.is_set():
+            return
+        self._stop.set()
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=0.1)
+        _SILENCER.uninstall()
+
+
+def describe_state(state: InstallerState | None) -> str:
+    """Short state description for the completion menu."""
+    if state is None:
+        return ""
+    if not state.installed:
+        return "not installed"
+    if state.update_available:
+        return f"update {state.installed_version} → {state.latest_version}"
+    if state.installed_version:
+        return f"installed {state.installed_version}"
+    return "installed"
@@ -0,0 +1,506 @@
+"""Declarative machine profiles for 'dkinst apply <profile.toml>'."""
+import os
+import tomllib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Literal
+
+from rich.console import Console
+from rich.table import Table
+
+from .installers._base import BaseInstaller
+from .installers import _base
+from .installers.helpers.infra import system, metrics, folders, registrys
+from . import planner
+from . import history
+from . import state_store
+
+
+console = Console()
+
+
+DEFAULT_WORKERS: int = 4
+# Lock of the system installer of the platform, held by every converge step that isn't 'parallel_safe'.
+# Two apt installs fail on the dpkg lock, two MSI installs fail with msiexec 1618.
+SYSTEM_INSTALLER_LOCKS: dict[str, str] = {"debian": "apt", "windows": "system-installer"}
+PROFILE_STATES: list[str] = ["present", "absent"]
+PROFILE_ITEM_KEYS: list[str] = ["state", "args", "manual", "version"]
+
+
+PROFILE_EXAMPLE: str = """
+Profile example (TOML):
+
+    [settings]
+    workers = 4                         # Probes run concurrently, installs only for parallel-safe installers.
+
+    [installers.git]                    # Install if it is not installed.
+
+    [installers.chocolatey]
+    version = "2.4.3"                   # Upgrade if the installed version differs.
+
+    [installers.tesseract_ocr]
+    manual = ["--compile-portable", "--set-path"]     # Converge with the helper arguments of the 'manual' method.
+
+    [installers.eset_internet_security]
+    args = ["language", "french"]       # Extra arguments passed to install/upgrade.
+
+    [installers.vlc]
+    state = "absent"                    # Uninstall if it is installed.
+"""
+
+
+class ProfileError(Exception):
+    pass
+
+
+@dataclass
+class ProfileItem:
+    """
+    :param name: Installer name.
+    :param state: 'present' to install, 'absent' to uninstall.
+    :param args: Extra arguments passed to the install/upgrade/uninstall method.
+    :param manual: If provided, the item is converged with the 'manual' method and these helper arguments.
+    :param version: Desired version. Compared with 'BaseInstaller._get_installed_version()' if the installer supports it.
+    """
+    name: str
+    state: Literal["present", "absent"] = "present"
+    args: list[str] = field(default_factory=list)
+    manual: list[str] | None = None
+    version: str | None = None
+
+
+@dataclass
+class Profile:
+    path: str
+    items: list[ProfileItem]
+    workers: int = DEFAULT_WORKERS
+
+
+@dataclass
+class ItemDiff:
+    """
+    Difference between the profile item and the current state of the machine.
+
+    :param action: The method that will converge the item, None if it is already converged.
+    :param reason: Human-readable reason for the action.
+    """
+    item: ProfileItem
+    installer: BaseInstaller
+    installed: bool
+    installed_version: str | None = None
+    action: Literal["install", "upgrade", "uninstall", "manual"] | None = None
+    reason: str = ""
+
+
+@dataclass
+class ConvergeStep:
+    """
+    A single call executed while converging the profile.
+
+    :param name: Installer name.
+    :param method: The method that is executed, used for the run history.
+    :param label: Human-readable description of the step.
+    :param call: Callable that executes the step and returns an exit code.
+    :param after: Names of the steps that must succeed before this one starts (dependencies).
+    :param locks: Names this step holds while running. Steps with shared locks never run concurrently,
+        so installers that share a dependency (like a package manager) are executed one at a time.
+    :param needs_admin: True if the step requires admin rights on the current platform.
+    :param installer: The installer instance, its state is recorded in the state store after the step.
+    """
+    name: str
+    method: str
+    label: str
+    call: Callable[[], object]
+    after: set[str] = field(default_factory=set)
+    locks: set[str] = field(default_factory=set)
+    needs_admin: bool = False
+    installer: BaseInstaller | None = None
+
+
+def _as_str_list(
+        value,
+        key: str,
+        name: str
+) -> list[str]:
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list) or not all(isinstance(x, str) for x in value):
+        raise ProfileError(f"Profile item [{name}] key '{key}' must be a string or a list of strings.")
+    return list(value)
+
+
+def parse_profile(
+        data: dict,
+        path: str = ""
+) -> Profile:
+    """
+    Parse a profile dictionary (loaded TOML) into a Profile.
+
+    :param data: Profile dictionary.
+    :param path: Path of the profile file, for messages.
+    :return: Profile.
+    """
+    installers_table = data.get("installers")
+    if not isinstance(installers_table, dict) or not installers_table:
+        raise ProfileError(f"Profile [{path}] has no [installers] table.")
+
+    settings: dict = data.get("settings", {}) or {}
+    workers = settings.get("workers", DEFAULT_WORKERS)
+    if not isinstance(workers, int) or workers < 1:
+        raise ProfileError(f"Profile [{path}] setting 'workers' must be a positive integer.")
+
+    items: list[ProfileItem] = []
+    for name, options in installers_table.items():
+        if options is None:
+            options = {}
+        if not isinstance(options, dict):
+            raise ProfileError(f"Profile item [{name}] must be a table.")
+
+        unknown_keys: list[str] = [key for key in options if key not in PROFILE_ITEM_KEYS]
+        if unknown_keys:
+            raise ProfileError(f"Profile item [{name}] has unknown keys: {', '.join(unknown_keys)}")
+
+        state = options.get("state", "present")
+        if state not in PROFILE_STATES:
+            raise ProfileError(f"Profile item [{name}] state must be one of: {', '.join(PROFILE_STATES)}")
+
+        version = options.get("version", None)
+        if version is not None:
+            version = str(version).strip()
+
+        manual = options.get("manual", None)
+        if manual is not None:
+            manual = _as_str_list(manual, "manual", name)
+            if state == "absent":
+                raise ProfileError(f"Profile item [{name}] can't use 'manual' with state 'absent'.")
+
+        items.append(ProfileItem(
+            name=name,
+            state=state,
+            args=_as_str_list(options.get("args", []), "args", name),
+            manual=manual,
+            version=version,
+        ))
+
+    return Profile(path=path, items=items, workers=workers)
+
+
+def load_profile(file_path: str) -> Profile:
+    """
+    Load a profile TOML file.
+
+    :param file_path: Path to the profile file.
+    :return: Profile.
+    """
+    if not os.path.isfile(file_path):
+        raise ProfileError(f"Profile file not found: {file_path}")
+
+    try:
+        with open(file_path, "rb") as f:
+            data: dict = tomllib.load(f)
+    except tomllib.TOMLDecodeError as e:
+        raise ProfileError(f"Profile [{file_path}] is not a valid TOML file: {e}") from e
+
+    return parse_profile(data, file_path)
+
+
+def _normalize_version(version: str) -> str:
+    return version.strip().lower().removeprefix("v")
+
+
+def diff_profile(
+        profile: Profile,
+        installers_map: dict[str, BaseInstaller],
+        probe_cache: dict[str, bool] | None = None,
+) -> list[ItemDiff]:
+    """
+    Compare the profile with the current state of the machine.
+    The 'is_installed()' and version probes of all the items run concurrently.
+
+    :param profile: Profile.
+    :param installers_map: A map of installer name -> installer instance.
+    :param probe_cache: Optional dict that is filled with the 'is_installed' results, name -> bool.
+        Pass the same dict to 'build_converge_steps' so the probes aren't repeated during dependency resolution.
+    :return: List of ItemDiff, in profile order.
+    """
+    current_platform: str = system.get_platform()
+
+    for item in profile.items:
+        inst = installers_map.get(item.name)
+        if inst is None:
+            raise ProfileError(f"No installer found with the name: [{item.name}]")
+
+        inst._platforms_known()
+        if current_platform not in inst.platforms:
+            raise ProfileError(f"This installer [{inst.name}] does not support your platform [{current_platform}].")
+
+        known_methods: list[str] = _base.get_known_methods(inst)
+        if item.manual is not None and "manual" not in known_methods:
+            raise ProfileError(f"No 'manual' method available for the installer: [{inst.name}]")
+        if item.state == "absent" and "uninstall" not in known_methods:
+            raise ProfileError(f"No 'uninstall' method available for the installer: [{inst.name}]")
+
+    def probe(item: ProfileItem) -> tuple[bool, str | None]:
+        inst = installers_map[item.name]
+        installed: bool = state_store.is_installed(inst)
+        installed_version: str | None = None
+        if installed and item.version:
+            installed_version = inst._get_installed_version()
+        return installed, installed_version
+
+    with ThreadPoolExecutor(max_workers=max(1, min(profile.workers, len(profile.items)))) as executor:
+        probes: list[tuple[bool, str | None]] = list(executor.map(probe, profile.items))
+
+    diffs: list[ItemDiff] = []
+    for item, (installed, installed_version) in zip(profile.items, probes):
+        if probe_cache is not None:
+            probe_cache[item.name] = installed
+
+        diff = ItemDiff(
+            item=item, installer=installers_map[item.name],
+            installed=installed, installed_version=installed_version)
+
+        if item.state == "absent":
+            if installed:
+                diff.action, diff.reason = "uninstall", "installed"
+            else:
+                diff.reason = "not installed"
+        elif not installed:
+            diff.action = "manual" if item.manual is not None else "install"
+            diff.reason = "not installed"
+        elif not item.version:
+            diff.reason = "installed"
+        elif installed_version is None:
+            diff.reason = "installed, version can't be queried"
+        elif _normalize_version(installed_version) != _normalize_version(item.version):
+            diff.action = "manual" if item.manual is not None else "upgrade"
+            diff.reason = f"version {installed_version} -> {item.version}"
+        else:
+            diff.reason = f"version {installed_version}"
+
+        diffs.append(diff)
+
+    return diffs
+
+
+def print_diff(diffs: list[ItemDiff]) -> None:
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Name", style="bold")
+    table.add_column("State")
+    table.add_column("Action")
+    table.add_column("Reason")
+
+    for diff in diffs:
+        table.add_row(
+            diff.item.name,
+            diff.item.state,
+            diff.action or "—",
+            diff.reason,
+            style=None if diff.action else "dim",
+        )
+
+    console.print(table)
+
+
+def _run_manual(
+        installer: BaseInstaller,
+        manual_args: list[str]
+) -> int:
+    helper_parser = _base._get_helper_parser(installer)
+    if helper_parser is None:
+        console.print(f"No manual argparser available for [{installer.name}].", style='red', markup=False)
+        return 1
+
+    helper_parser.prog = f"{helper_parser.prog} manual {installer.name}"
+    try:
+        parsed = helper_parser.parse_args(manual_args)
+    except SystemExit:
+        # argparse already printed usage/error.
+        return 2
+    return installer.helper.main(**vars(parsed))
+
+
+def _get_dependency_closure(
+        installer: BaseInstaller,
+        installers_map: dict[str, BaseInstaller]
+) -> set[str]:
+    closure: set[str] = set()
+    stack: list[BaseInstaller] = [installer]
+    while stack:
+        inst = stack.pop()
+        for dep in getattr(inst, "dependencies", []) or []:
+            dep_name = dep if isinstance(dep, str) else getattr(dep, "name", str(dep))
+            if dep_name in closure:
+                continue
+            closure.add(dep_name)
+            if dep_name in installers_map:
+                stack.append(installers_map[dep_name])
+    return closure
+
+
+def _get_step_locks(
+        installer: BaseInstaller,
+        installers_map: dict[str, BaseInstaller]
+) -> set[str]:
+    locks: set[str] = _get_dependency_closure(installer, installers_map) | {installer.name}
+    if not getattr(installer, "parallel_safe", False):
+        locks.add(SYSTEM_INSTALLER_LOCKS.get(system.get_platform(), "system-installer"))
+    return locks
+
+
+def build_converge_steps(
+        diffs: list[ItemDiff],
+        installers_map: dict[str, BaseInstaller],
+        probe_cache: dict[str, bool] | None = None,
+) -> list[ConvergeStep]:
+    """
+    Resolve the items that differ from the profile, with their dependencies, into converge steps.
+    Dependencies are resolved with the same plan logic as 'dkinst install/upgrade', and shared
+    dependencies appear once.
+
+    :param diffs: Result of 'diff_profile'.
+    :param installers_map: A map of installer name -> installer instance.
+    :param probe_cache: The 'is_installed' results from 'diff_profile', name -> bool.
+    :return: List of ConvergeStep in dependency order.
+    """
+    probe_cache = probe_cache if probe_cache is not None else {}
+
+    def cached_is_installed(inst: BaseInstaller) -> bool:
+        if inst.name not in probe_cache:
+            probe_cache[inst.name] = state_store.is_installed(inst)
+        return probe_cache[inst.name]
+
+    steps: dict[str, ConvergeStep] = {}
+    # Names of the steps that were built for a profile item, not only as a dependency of one.
+    item_step_names: set[str] = set()
+    for diff in diffs:
+        if diff.action is None:
+            continue
+
+        item = diff.item
+        # The 'manual' method needs the dependencies as 'install' does.
+        plan_method: Literal["install", "uninstall", "upgrade"] = (
+            "install" if diff.action == "manual" else diff.action)
+        plan: planner.Plan = planner.resolve_plan(
+            plan_method, [(item.name, item.args)], installers_map, is_installed=cached_is_installed)
+
+        for plan_step in plan.runnable_steps:
+            if plan_step.name in steps:
+                # An earlier item may have pulled this item in as a dependency, its own step
+                # (method, args, manual) replaces the dependency step, in the same position.
+                if not plan_step.is_target or plan_step.name in item_step_names:
+                    continue
+
+            inst: BaseInstaller = plan_step.installer
+            if plan_step.is_target and diff.action == "manual":
+                call = (lambda i=inst, a=item.manual: _run_manual(i, a))
+                label = f"Running 'manual' for [{inst.name}] {' '.join(item.manual)}".rstrip()
+                step_needs_admin: bool = planner.needs_admin(inst, "manual")
+            else:
+                call = (lambda i=inst, m=plan_step.method, a=tuple(plan_step.args): getattr(i, m)(*a))
+                if plan_step.is_target:
+                    label = f"Running '{plan_step.method}' for [{inst.name}] ({diff.reason})"
+                else:
+                    label = f"Running '{plan_step.method}' for dependency [{inst.name}] of [{plan_step.required_by}]"
+                step_needs_admin = plan_step.needs_admin
+
+            steps[inst.name] = ConvergeStep(
+                name=inst.name,
+                method="manual" if plan_step.is_target and diff.action == "manual" else plan_step.method,
+                label=label,
+                call=call,
+                locks=_get_step_locks(inst, installers_map),
+                needs_admin=step_needs_admin,
+                installer=inst,
+            )
+            if plan_step.is_target:
+                item_step_names.add(inst.name)
+
+    # Wait only for the dependencies that are part of this run.
+    for step in steps.values():
+        inst = installers_map[step.name]
+        step.after = {
+            dep if isinstance(dep, str) else getattr(dep, "name", str(dep))
+            for dep in getattr(inst, "dependencies", []) or []
+        } & steps.keys()
+
+    return list(steps.values())
+
+
+def _run_step(step: ConvergeStep) -> int:
+    try:
+        with metrics.step(step.name, step.method) as step_metrics, history.RunTimer(step.name, step.method) as timer:
+            timer.rc = step_metrics.rc = planner.result_to_rc(step.call(), f"Installer [{step.name}]")
+        if step.installer is not None:
+            state_store.record_result(step.installer, step.method, timer.rc)
+        return timer.rc
+    finally:
+        # Also when the installer raised, see 'planner._run_step'.
+        if step.installer is not None:
+            registrys.invalidate_uninstall_index()
+            folders.track(step.installer.dir_path)
+
+
+def converge(
+        steps: list[ConvergeStep],
+        workers: int = DEFAULT_WORKERS
+) -> int:
+    """
+    Execute the converge steps. A step starts when its dependencies succeeded and none of its locks
+    are held by a running step. All the steps hold the system installer lock of the platform, so installs
+    run one at a time, except for the installers that are 'parallel_safe'.
+    After the first failure no new steps are started.
+
+    :param steps: List of ConvergeStep in dependency order.
+    :param workers: Maximum number of concurrent steps.
+    :return: 0 if all the steps succeeded, the exit code of the first failed step otherwise.
+    """
+    pending: list[ConvergeStep] = list(steps)
+    running: dict = {}
+    held_locks: set[str] = set()
+    succeeded: set[str] = set()
+    rc: int = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while pending or running:
+            if rc == 0:
+                for step in list(pending):
+                    if len(running) >= workers:
+                        break
+                    if not step.after <= succeeded or step.locks & held_locks:
+                        continue
+
+                    pending.remove(step)
+                    held_locks |= step.locks
+                    console.print(f"{step.label}…", style="green", markup=False)
+                    running[executor.submit(_run_step, step)] = step
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                held_locks -= step.locks
+
+                try:
+                    step_rc: int = future.result()
+                except Exception as e:
+                    console.print(f"Installer [{step.name}] raised: {e!r}", style="red", markup=False)
+                    step_rc = 1
+
+                if step_rc != 0:
+                    console.print(
+                        f"Installer [{step.name}] Command failed with exit code {step_rc}.",
+                        style="red", markup=False)
+                    if rc == 0:
+                        rc = step_rc
+                else:
+                    succeeded.add(step.name)
+
+    if pending:
+        console.print(
+            f"Not started because of the failure: {', '.join(step.name for step in pending)}",
+            style="yellow", markup=False)
+
+    return rc
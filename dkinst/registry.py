@@ -0,0 +1,215 @@
+"""Installer registry that is reused across the commands of one session (interactive console, daemon)."""
+import argparse
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from .installers._base import BaseInstaller
+from .installers import _base
+from .installers.helpers.infra import metrics, wingets, chocos, registrys
+from . import state_store
+
+
+# Cached installed states older than this are probed again.
+STATE_MAX_AGE: float = 10 * 60
+
+
+@dataclass
+class InstallerState:
+    """
+    Cached state of an installer.
+
+    :param installed: Result of 'is_installed()'.
+    :param installed_version: Result of '_get_installed_version()', None if unknown.
+    :param latest_version: Result of '_get_latest_version()', None if unknown or not checked.
+    :param checked_at: time.monotonic() of the 'is_installed()' probe.
+    :param latest_checked: True if the latest version was looked up.
+    """
+    installed: bool
+    installed_version: str | None = None
+    latest_version: str | None = None
+    checked_at: float = 0.0
+    latest_checked: bool = False
+
+    @property
+    def update_available(self) -> bool:
+        return bool(
+            self.installed and self.installed_version and self.latest_version
+            and self.installed_version.strip().lower().removeprefix("v")
+            != self.latest_version.strip().lower().removeprefix("v")
+        )
+
+
+class InstallerRegistry:
+    """
+    Cache of installer instances, their known methods, helper parsers and installed states.
+
+    The instances are created once per session. An instance is re-created only when its installer
+    state changes (after install/upgrade/uninstall/manual of that installer), see 'invalidate'.
+    Known methods and helper parsers depend only on the installer class, so they are kept for the whole session.
+    Installed states are dropped on invalidation, or re-probed when they are older than 'STATE_MAX_AGE'.
+
+    Usage:
+        registry = InstallerRegistry(cli._get_installers)
+        git = registry.get("git")
+        methods = registry.known_methods(git)
+        ...
+        registry.invalidate(["git"])
+    """
+    def __init__(self, loader: Callable[[], list[BaseInstaller]]):
+        """
+        :param loader: Callable that returns new instances of all the installers.
+        """
+        self._loader: Callable[[], list[BaseInstaller]] = loader
+        self._lock = threading.RLock()
+        self._installers: dict[str, BaseInstaller] | None = None
+        self._known_methods: dict[str, list[str]] = {}
+        self._helper_parsers: dict[str, argparse.ArgumentParser | None] = {}
+        self._states: dict[str, InstallerState] = {}
+        # Callables that are called with the invalidated installer names (None for all), e.g. to drop cached states.
+        self._invalidation_listeners: list[Callable[[list[str] | None], None]] = []
+        # Invalidation counter, and its value at the last invalidation of all / of each installer.
+        # A state probed before the last invalidation of its installer is stale, see 'set_state'.
+        self._generation: int = 0
+        self._all_invalidated_at: int = 0
+        self._invalidated_at: dict[str, int] = {}
+
+    def _load(self) -> dict[str, BaseInstaller]:
+        with self._lock:
+            if self._installers is None:
+                self._installers = {inst.name: inst for inst in self._loader()}
+            return self._installers
+
+    @property
+    def installers(self) -> list[BaseInstaller]:
+        return list(self._load().values())
+
+    @property
+    def installers_map(self) -> dict[str, BaseInstaller]:
+        return dict(self._load())
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._load().keys())
+
+    def get(self, name: str) -> BaseInstaller | None:
+        return self._load().get(name)
+
+    def known_methods(self, installer: BaseInstaller) -> list[str]:
+        """Memoized '_base.get_known_methods'."""
+        with self._lock:
+            if installer.name not in self._known_methods:
+                self._known_methods[installer.name] = _base.get_known_methods(installer)
+            return list(self._known_methods[installer.name])
+
+    def helper_parser(self, installer: BaseInstaller) -> argparse.ArgumentParser | None:
+        """
+        Cached helper parser of the 'manual' method, with the program name that includes the installer name.
+
+        :return: ArgumentParser or None if the installer has no helper parser.
+        """
+        with self._lock:
+            if installer.name not in self._helper_parsers:
+                parser = _base._get_helper_parser(installer, self.known_methods(installer))
+                if parser is not None:
+                    # Change the command line program name to include the installer name.
+                    parser.prog = f"{parser.prog} manual {installer.name}"
+                self._helper_parsers[installer.name] = parser
+            return self._helper_parsers[installer.name]
+
+    def helper_args(self, installer: BaseInstaller) -> list[str]:
+        """Same as '_base._extract_helper_args', using the cached helper parser."""
+        parser = self.helper_parser(installer)
+        if not parser:
+            return []
+
+        tokens: list[str] = []
+        for act in parser._actions:
+            if act.option_strings:
+                tokens.append("/".join(act.option_strings))
+            else:
+                tokens.append(act.dest)
+        return tokens
+
+    def get_state(self, name: str) -> InstallerState | None:
+        """
+        :return: The cached state of the installer, or None if it wasn't probed or is too old.
+        """
+        with self._lock:
+            state = self._states.get(name)
+            if state is None or (time.monotonic() - state.checked_at) > STATE_MAX_AGE:
+                return None
+            return state
+
+    def get_generation(self) -> int:
+        """:return: The invalidation generation, take it before probing and pass it to 'set_state'."""
+        with self._lock:
+            return self._generation
+
+    def set_state(
+            self,
+            name: str,
+            state: InstallerState,
+            generation: int | None = None
+    ) -> bool:
+        """
+        :param generation: 'get_generation()' from before the probe. The state is dropped if the installer was
+            invalidated since, e.g. a background probe that started before an install finished after it.
+            None to always store the state.
+        :return: True if the state was stored.
+        """
+        with self._lock:
+            if generation is not None and generation < max(
+                    self._all_invalidated_at, self._invalidated_at.get(name, 0)):
+                return False
+            self._states[name] = state
+            return True
+
+    def is_installed(self, installer: BaseInstaller) -> bool:
+        """
+        Cached 'installer.is_installed()'. Can be passed as the probe of 'planner.resolve_plan'.
+        On a miss, the persistent state store is consulted before the live probe.
+        """
+        state = self.get_state(installer.name)
+        metrics.count_cache("installed_state", hit=state is not None)
+        if state is not None:
+            return state.installed
+
+        generation: int = self.get_generation()
+        installed: bool = state_store.is_installed(installer)
+        self.set_state(
+            installer.name, InstallerState(installed=installed, checked_at=time.monotonic()), generation=generation)
+        return installed
+
+    def add_invalidation_listener(self, listener: Callable[[list[str] | None], None]) -> None:
+        self._invalidation_listeners.append(listener)
+
+    def invalidate(self, names: Iterable[str] | None = None) -> None:
+        """
+        Re-create the instances of installers whose state changed.
+        The package manager snapshots and the uninstall index are dropped too, the installers may have changed them.
+
+        :param names: Installer names. If None, all the instances are re-created on next access.
+        """
+        invalidated: list[str] | None = None
+        with self._lock:
+            self._generation += 1
+            if names is None:
+                self._all_invalidated_at = self._generation
+                self._installers = None
+                self._states.clear()
+            else:
+                names = list(names)
+                for name in names:
+                    self._invalidated_at[name] = self._generation
+                    self._states.pop(name, None)
+                invalidated = [name for name in names if self._installers and name in self._installers]
+                for name in invalidated:
+                    self._installers[name] = type(self._installers[name])()
+        wingets.invalidate_snapshot()
+        chocos.invalidate_snapshot()
+        registrys.invalidate_uninstall_index()
+
+        for listener in self._invalidation_listeners:
+            listener(invalidated)
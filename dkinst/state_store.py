@@ -0,0 +1,277 @@
+"""
+Installed-state store: what dkinst installed, upgraded or uninstalled, kept in SQLite across runs.
+
+Each record has the installed state, version, path, timestamp and a cheap fingerprint of the installation,
+see 'BaseInstaller._get_fingerprint' (executable mtime/size, dpkg info file, etc.).
+'is_installed' returns the stored state while the fingerprint still matches, and falls back to the
+live probe (choco/winget/apt/registry/subprocess) only when it changed, so the dependency checks
+of repeated runs don't spawn the probes again.
+
+Installers without a fingerprint are always probed live.
+"""
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .installers._base import BaseInstaller
+from .installers.helpers.infra import metrics
+from .history import STATE_DIR
+
+
+STATE_DB_FILE: str = str(Path(STATE_DIR) / "state.db")
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS installers (
+    name TEXT PRIMARY KEY,
+    installed INTEGER NOT NULL,
+    version TEXT,
+    path TEXT,
+    fingerprint TEXT,
+    method TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+_LOCK = threading.Lock()
+
+
+@dataclass
+class StateRecord:
+    """
+    :param name: Installer name.
+    :param installed: Installed state.
+    :param version: Installed version, None if unknown.
+    :param path: Installation path, None if unknown.
+    :param fingerprint: Fingerprint of the installation when the record was written.
+    :param method: The dkinst method that wrote the record, or 'probe' for a live probe.
+    :param updated_at: Unix time of the record.
+    """
+    name: str
+    installed: bool
+    version: str | None
+    path: str | None
+    fingerprint: str | None
+    method: str
+    updated_at: float
+
+
+def fingerprint_paths(*paths: str | os.PathLike | None) -> str:
+    """
+    Cheap fingerprint of files or directories: path, mtime and size of each, 'missing' for the ones that don't exist.
+    A directory mtime changes when entries are added or removed.
+
+    :param paths: Paths. None entries (e.g. a 'shutil.which' miss) are fingerprinted as 'missing'.
+    :return: Fingerprint string.
+    """
+    parts: list[str] = []
+    for path in paths:
+        if path is None:
+            parts.append("missing")
+            continue
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            parts.append(f"{path}:missing")
+            continue
+        parts.append(f"{path}:{stat_result.st_mtime_ns}:{stat_result.st_size}")
+    return "|".join(parts)
+
+
+def fingerprint_dpkg(package: str) -> str:
+    """
+    Cheap fingerprint of a dpkg package: the package file list in '/var/lib/dpkg/info', which is rewritten
+    on every install, upgrade and removal of the package.
+
+    :param package: Package name.
+    :return: Fingerprint string.
+    """
+    info_dir: Path = Path("/var/lib/dpkg/info")
+    candidates: list[Path] = [info_dir / f"{package}.list"]
+    candidates += sorted(info_dir.glob(f"{package}:*.list"))
+    existing: list[Path] = [path for path in candidates if path.exists()]
+    return "dpkg:" + fingerprint_paths(*(existing or candidates[:1]))
+
+
+class StateStore:
+    """
+    SQLite store of the installer states. A connection is opened per operation, so the store can be used
+    from the prefetch and converge threads.
+
+    Usage:
+        store = StateStore()
+        record = store.get("git")
+        store.record("git", installed=True, fingerprint=fingerprint_paths(git_path), method="install")
+    """
+    def __init__(self, db_path: str | None = None):
+        """
+        :param db_path: Path to the SQLite file. Default is 'STATE_DB_FILE'.
+        """
+        self.db_path: str = db_path or STATE_DB_FILE
+        self._initialized: bool = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        if not self._initialized:
+            with connection:
+                connection.execute(_SCHEMA)
+            self._initialized = True
+        return connection
+
+    def get(self, name: str) -> StateRecord | None:
+        try:
+            connection = self._connect()
+        except (OSError, sqlite3.Error):
+            return None
+        try:
+            row = connection.execute(
+                "SELECT name, installed, version, path, fingerprint, method, updated_at "
+                "FROM installers WHERE name = ?", (name,)).fetchone()
+        except sqlite3.Error:
+            return None
+        finally:
+            connection.close()
+
+        if row is None:
+            return None
+        return StateRecord(
+            name=row[0], installed=bool(row[1]), version=row[2], path=row[3],
+            fingerprint=row[4], method=row[5], updated_at=row[6])
+
+    def record(
+            self,
+            name: str,
+            installed: bool,
+            fingerprint: str | None,
+            method: str,
+            version: str | None = None,
+            path: str | None = None
+    ) -> None:
+        """Best-effort: write the state of the installer."""
+        with _LOCK:
+            try:
+                connection = self._connect()
+            except (OSError, sqlite3.Error):
+                return
+            try:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO installers "
+                        "(name, installed, version, path, fingerprint, method, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (name, int(installed), version, path, fingerprint, method, time.time()))
+            except sqlite3.Error:
+                pass
+            finally:
+                connection.close()
+
+    def forget(self, name: str) -> None:
+        """Best-effort: remove the state of the installer, the next check probes it live."""
+        with _LOCK:
+            try:
+                connection = self._connect()
+            except (OSError, sqlite3.Error):
+                return
+            try:
+                with connection:
+                    connection.execute("DELETE FROM installers WHERE name = ?", (name,))
+            except sqlite3.Error:
+                pass
+            finally:
+                connection.close()
+
+
+_STORE: StateStore | None = None
+
+
+def get_store() -> StateStore:
+    """:return: The default StateStore of the user."""
+    global _STORE
+    if _STORE is None:
+        _STORE = StateStore()
+    return _STORE
+
+
+def _get_fingerprint(installer: BaseInstaller) -> str | None:
+    try:
+        return installer._get_fingerprint()
+    except Exception:
+        return None
+
+
+def _get_path(installer: BaseInstaller) -> str | None:
+    path: str | None = installer.exe_path or installer.dir_path
+    return path if path and os.path.exists(path) else None
+
+
+def is_installed(
+        installer: BaseInstaller,
+        store: StateStore | None = None
+) -> bool:
+    """
+    'installer.is_installed()' short-circuited by the state store: the stored state is returned while
+    the fingerprint of the installation matches, otherwise the live probe is executed and stored.
+
+    :param installer: Installer instance.
+    :param store: StateStore. Default is 'get_store()'.
+    :return: True if installed.
+    """
+    fingerprint: str | None = _get_fingerprint(installer)
+    if fingerprint is None:
+        return bool(installer.is_installed())
+
+    store = store or get_store()
+    record: StateRecord | None = store.get(installer.name)
+    hit: bool = record is not None and record.fingerprint == fingerprint
+    metrics.count_cache("state_store", hit=hit)
+    if hit:
+        return record.installed
+
+    installed: bool = bool(installer.is_installed())
+    store.record(
+        installer.name, installed, fingerprint, method="probe",
+        version=record.version if record and installed else None,
+        path=_get_path(installer) if installed else None)
+    return installed
+
+
+def record_result(
+        installer: BaseInstaller,
+        method: str,
+        rc: int,
+        store: StateStore | None = None
+) -> None:
+    """
+    Record the state after an install/upgrade/uninstall of the installer.
+    A failed method leaves the installation in an unknown state, so its record is removed.
+
+    :param installer: Installer instance.
+    :param method: The executed method.
+    :param rc: Exit code of the method.
+    :param store: StateStore. Default is 'get_store()'.
+    """
+    store = store or get_store()
+    if rc != 0 or method not in ("install", "upgrade", "uninstall"):
+        store.forget(installer.name)
+        return
+
+    fingerprint: str | None = _get_fingerprint(installer)
+    if fingerprint is None:
+        store.forget(installer.name)
+        return
+
+    installed: bool = method != "uninstall"
+    version: str | None = None
+    if installed:
+        try:
+            version = installer._get_installed_version()
+        except Exception:
+            version = None
+
+    store.record(
+        installer.name, installed, fingerprint, method=method,
+        version=version, path=_get_path(installer) if installed else None)
@@ -10,10 +10,15 @@ from rich.console import Console
 from . import __version__
 from .installers.helpers.infra import system
 from .installers.helpers.infra import pips
+from .installers.helpers.infra import downloads
 
 console = Console()
 
 
+GITHUB_USER_NAME: str = "denis-kras"
+GITHUB_REPO_NAME: str = "dkinst"
+
+
 def _is_frozen() -> bool:
     return getattr(sys, "frozen", False)
 
@@ -35,10 +40,18 @@ def _update_frozen_executable(github_wrapper) -> int:
 
     try:
         console.print("Downloading latest release...", style="cyan")
-        github_wrapper.download_and_extract_latest_release(
-            target_directory=tmp_dir,
-            asset_pattern=asset_pattern,
-        )
+        try:
+            # Extracted while downloading, checked against the SHA-256 digest of the release asset.
+            downloads.download_and_extract_github_release(
+                GITHUB_USER_NAME, GITHUB_REPO_NAME, asset_pattern, tmp_dir)
+        except downloads.ChecksumMismatchError:
+            raise
+        except downloads.DownloadError as exc:
+            console.print(f"Streaming download failed, downloading the archive: {exc}", style="yellow", markup=False)
+            github_wrapper.download_and_extract_latest_release(
+                target_directory=tmp_dir,
+                asset_pattern=asset_pattern,
+            )
 
         current_exe = sys.executable
         platform = system.get_platform()
@@ -112,7 +125,7 @@ def cmd_update_version(force: bool = False) -> int:
     if _is_frozen():
         from dkwebmod.githubw import GitHubWrapper
 
-        gw = GitHubWrapper(user_name="denis-kras", repo_name="dkinst")
+        gw = GitHubWrapper(user_name=GITHUB_USER_NAME, repo_name=GITHUB_REPO_NAME)
         try:
             latest_version_str = gw.get_latest_release_version()
         except Exception as exc:
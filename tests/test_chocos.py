@@ -0,0 +1,79 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from dkinst.installers.helpers.infra import chocos
+
+
+FIXTURES_DIR: Path = Path(__file__).parent / "fixtures"
+
+
+def _read_fixture(file_name: str) -> str:
+    return (FIXTURES_DIR / file_name).read_text(encoding="utf-8")
+
+
+def test_parse_limit_output():
+    packages = chocos.parse_limit_output(_read_fixture("choco_list_limit_output.txt"))
+    assert packages == {
+        "chocolatey": "2.2.2",
+        "chocolatey-core.extension": "1.4.0",
+        "git": "2.43.0",
+        "git.install": "2.43.0",
+        "nodejs-lts": "20.11.0",
+        "7zip.install": "23.1.0",
+    }
+
+
+def test_parse_limit_output_empty():
+    assert chocos.parse_limit_output("") == {}
+
+
+@pytest.mark.parametrize("file_name, expected", [
+    ("git.nuspec", ("git", "2.43.0")),
+    # Older schema namespace.
+    ("7zip.install.nuspec", ("7zip.install", "23.1.0")),
+])
+def test_parse_nuspec(file_name, expected):
+    assert chocos.parse_nuspec(_read_fixture(file_name)) == expected
+
+
+def test_parse_nuspec_dependency_id_isnt_the_package_id():
+    # 'git.nuspec' has a <dependency id="git.install"> after its own <id>.
+    assert chocos.parse_nuspec(_read_fixture("git.nuspec"))[0] == "git"
+
+
+@pytest.mark.parametrize("text", ["", "<package><metadata></metadata></package>", "<package"])
+def test_parse_nuspec_invalid(text):
+    assert chocos.parse_nuspec(text) is None
+
+
+def test_read_lib_packages(tmp_path):
+    for file_name in ("git.nuspec", "7zip.install.nuspec"):
+        package_dir: Path = tmp_path / file_name.removesuffix(".nuspec")
+        package_dir.mkdir()
+        shutil.copy(FIXTURES_DIR / file_name, package_dir / file_name)
+    # A broken install without a '.nuspec' is skipped.
+    (tmp_path / "broken").mkdir()
+
+    assert chocos.read_lib_packages(str(tmp_path)) == {"git": "2.43.0", "7zip.install": "23.1.0"}
+
+
+def test_read_lib_packages_missing_dir(tmp_path):
+    assert chocos.read_lib_packages(str(tmp_path / "lib")) is None
+
+
+SNAPSHOT: dict[str, tuple[str, str | None]] = {
+    "git": ("git", "2.43.0"),
+    "7zip.install": ("7zip.install", "23.1.0"),
+}
+
+
+@pytest.mark.parametrize("method, package_ids, expected", [
+    ("install", ["Git", "nodejs-lts", "python"], (["Git"], ["nodejs-lts", "python"])),
+    ("install", ["git", "git"], (["git"], [])),
+    ("upgrade", ["git", "python"], ([], ["git", "python"])),
+    ("uninstall", ["git", "python", "7zip.install"], (["python"], ["git", "7zip.install"])),
+])
+def test_plan_batch(method, package_ids, expected):
+    assert chocos.plan_batch(method, package_ids, SNAPSHOT) == expected
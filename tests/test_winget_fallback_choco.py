@@ -0,0 +1,60 @@
+import pytest
+
+from dkinst.installers.helpers.infra import winget_fallback_choco
+from dkinst.installers.helpers.infra.winget_fallback_choco import FallbackEngine, FallbackHistory, PackageManager
+
+
+@pytest.mark.parametrize("primary_available, primary_known_failing, force, expected", [
+    # (try the primary, the fallback is allowed)
+    (True, False, False, (True, False)),
+    (True, False, True, (True, True)),
+    # A known failing primary is still tried when there is no fallback to use instead.
+    (True, True, False, (True, False)),
+    (True, True, True, (False, True)),
+    (False, False, False, (False, True)),
+    (False, False, True, (False, True)),
+    (False, True, False, (False, True)),
+    (False, True, True, (False, True)),
+])
+def test_decide(primary_available, primary_known_failing, force, expected):
+    assert winget_fallback_choco.decide(primary_available, primary_known_failing, force) == expected
+
+
+def _make_manager(name: str, rc: int, available: bool = True, calls: list | None = None) -> PackageManager:
+    def method_package(method: str, package_id: str) -> tuple[int, str]:
+        if calls is not None:
+            calls.append((name, method, package_id))
+        return rc, ""
+
+    return PackageManager(name=name, method_package=method_package, is_available=lambda: available)
+
+
+@pytest.mark.parametrize("primary_rc, primary_available, force, expected_rc, expected_calls", [
+    (0, True, False, 0, [("winget", "install", "Git.Git")]),
+    (1, True, False, 1, [("winget", "install", "Git.Git")]),
+    (1, True, True, 0, [("winget", "install", "Git.Git"), ("choco", "install", "git")]),
+    (0, False, False, 0, [("choco", "install", "git")]),
+])
+def test_engine_run(primary_rc, primary_available, force, expected_rc, expected_calls):
+    calls: list = []
+    engine = FallbackEngine(
+        primary=_make_manager("winget", primary_rc, primary_available, calls),
+        fallback=_make_manager("choco", 0, calls=calls),
+        history=FallbackHistory(),
+    )
+    assert engine.run("install", "Git.Git", "git", force=force, prewarm=False) == expected_rc
+    assert calls == expected_calls
+
+
+def test_engine_skips_known_failing_primary():
+    calls: list = []
+    history = FallbackHistory()
+    for _ in range(winget_fallback_choco.KNOWN_FAILING_COUNT):
+        history.record("winget", "Git.Git", "install", 1)
+    engine = FallbackEngine(
+        primary=_make_manager("winget", 1, calls=calls),
+        fallback=_make_manager("choco", 0, calls=calls),
+        history=history,
+    )
+    assert engine.run("install", "Git.Git", "git", force=True, prewarm=False) == 0
+    assert calls == [("choco", "install", "git")]
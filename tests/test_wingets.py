@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pytest
+
+from dkinst.installers.helpers.infra import wingets
+
+
+FIXTURES_DIR: Path = Path(__file__).parent / "fixtures"
+
+
+def _read_fixture(file_name: str) -> str:
+    return (FIXTURES_DIR / file_name).read_text(encoding="utf-8")
+
+
+def test_parse_list_output():
+    packages = wingets.parse_list_output(_read_fixture("winget_list.txt"))
+    assert packages == {
+        "Git.Git": "2.43.0",
+        "Microsoft.VisualStudioCode": "1.85.1",
+        "Python.Python.3.12": "3.12.1",
+        "Microsoft.EdgeWebView2Runtime": "120.0.2210.91",
+        "7zip.7zip": "23.01",
+    }
+
+
+def test_parse_list_output_skips_truncated_ids():
+    packages = wingets.parse_list_output(_read_fixture("winget_list.txt"))
+    assert not any("…" in package_id for package_id in packages)
+
+
+def test_parse_list_output_without_table():
+    assert wingets.parse_list_output("No installed package found matching input criteria.\n") == {}
+    assert wingets.parse_list_output("") == {}
+
+
+def test_parse_export_json():
+    packages = wingets.parse_export_json(_read_fixture("winget_export.json"))
+    assert packages == {
+        "Git.Git": "2.43.0",
+        "Microsoft.VisualStudioCode": "1.85.1",
+        "7zip.7zip": "23.01",
+        "9NBLGGH4NNS1": None,
+    }
+
+
+@pytest.mark.parametrize("text", ['{"Packages": []}', "[]"])
+def test_parse_export_json_invalid(text):
+    with pytest.raises(ValueError):
+        wingets.parse_export_json(text)
+
+
+SNAPSHOT: dict[str, str | None] = {"Git.Git": "2.43.0", "7zip.7zip": "23.01"}
+
+
+@pytest.mark.parametrize("method, package_ids, batch_supported, expected", [
+    # Installed packages are skipped, case-insensitively, the rest run in one command.
+    ("install", ["git.git", "Python.Python.3.12", "Microsoft.VisualStudioCode"], True,
+     (["git.git"], [["Python.Python.3.12", "Microsoft.VisualStudioCode"]])),
+    # One command per package without batch support.
+    ("install", ["Python.Python.3.12", "Microsoft.VisualStudioCode"], False,
+     ([], [["Python.Python.3.12"], ["Microsoft.VisualStudioCode"]])),
+    # A single package isn't a batch.
+    ("install", ["Python.Python.3.12"], True, ([], [["Python.Python.3.12"]])),
+    # Everything is already installed.
+    ("install", ["Git.Git", "7zip.7zip"], True, (["Git.Git", "7zip.7zip"], [])),
+    # Upgrade doesn't skip by the snapshot.
+    ("upgrade", ["Git.Git", "7zip.7zip"], True, ([], [["Git.Git", "7zip.7zip"]])),
+    # Uninstall skips the packages that aren't installed and never runs as a batch.
+    ("uninstall", ["Git.Git", "Python.Python.3.12", "7zip.7zip"], True,
+     (["Python.Python.3.12"], [["Git.Git"], ["7zip.7zip"]])),
+    # Duplicate IDs run once.
+    ("install", ["Python.Python.3.12", "Python.Python.3.12"], True, ([], [["Python.Python.3.12"]])),
+])
+def test_plan_batches(method, package_ids, batch_supported, expected):
+    assert wingets.plan_batches(method, package_ids, SNAPSHOT, batch_supported) == expected